@@ -105,6 +105,30 @@ def start_web_server():
     except Exception as e:
         logger.error(f"Webサーバーの起動中にエラーが発生しました: {e}", exc_info=True)
 
+def start_delta_compactor():
+    """
+    RAGデータベースの差分テーブルの定期統合をバックグラウンドで開始します
+    
+    統合の要否を確認する間隔は環境変数RAG_DELTA_COMPACTION_INTERVAL（デフォルト: 60秒、delta_compactorのCLIと同じ）で指定します。
+    0以下の場合は開始しません。
+    
+    Returns:
+        DeltaCompactor: 開始した統合処理。開始しなかった場合はNone
+    """
+    interval = float(os.getenv('RAG_DELTA_COMPACTION_INTERVAL', '60'))
+    if interval <= 0:
+        return None
+    
+    try:
+        from src.rag.delta_compactor import DeltaCompactor, create_rag_database
+        compactor = DeltaCompactor(create_rag_database(), interval_seconds=interval)
+        compactor.start_background()
+        logger.info(f"差分テーブルの統合を {interval} 秒間隔で開始しました")
+        return compactor
+    except Exception as e:
+        logger.error(f"差分テーブルの統合の開始中にエラーが発生しました: {e}", exc_info=True)
+        return None
+
 def main():
     """
     メイン関数
@@ -151,6 +175,9 @@ def main():
         thread.start()
         logger.info(f"{thread.name}を開始しました")
     
+    # 差分テーブルの定期統合を開始
+    delta_compactor = start_delta_compactor() if threads else None
+    
     # 起動するサーバーがない場合
     if not threads:
         logger.warning("起動するサーバーが指定されていません。--help オプションでヘルプを表示します。")
@@ -167,6 +194,9 @@ def main():
     finally:
         logger.info("アプリケーションを終了します...")
         
+        if delta_compactor is not None:
+            delta_compactor.stop(timeout=5)
+        
         # 共有リソースのクリーンアップ
         try:
             resource_manager = get_resource_manager()
@@ -1,9 +1,42 @@
 # -*- coding: utf-8 -*-
 # base_database.py
+import numpy as np
 import psycopg2
+from psycopg2.extensions import AsIs, adapt, register_adapter
 from contextlib import contextmanager
 from src.utils.logger_util import setup_logger
 
+
+def to_pgvector_literal(vector):
+    """
+    埋め込みベクトルをpgvectorのテキスト形式（'[0.1,0.2,...]'）に変換する
+    
+    float32の値を最短の表現で文字列にするため、Pythonのfloatのリストを経由しない
+    
+    Args:
+        vector (np.ndarray): 1次元の埋め込みベクトル
+        
+    Returns:
+        str: pgvectorのテキスト形式
+    """
+    return "[" + ",".join(np.asarray(vector, dtype=np.float32).astype(str)) + "]"
+
+
+def _adapt_ndarray(array):
+    """
+    psycopg2のパラメータとして渡されたnumpy配列を変換する
+    
+    1次元の浮動小数点数の配列はVECTOR型のカラムに書き込めるpgvectorのテキスト形式にし、
+    それ以外の配列は従来どおりリストとしてARRAYに変換する
+    """
+    if array.ndim == 1 and array.dtype.kind == "f":
+        return AsIs("'" + to_pgvector_literal(array) + "'")
+    return adapt(array.tolist())
+
+
+# 埋め込みベクトルをnumpy配列のままクエリのパラメータに渡せるようにする
+register_adapter(np.ndarray, _adapt_ndarray)
+
 class BaseDatabase:
     def __init__(self, db_config):
         """
@@ -132,3 +165,27 @@ class BaseDatabase:
         """
         result = self.execute_query(query, (table_name,))
         return result[0][0] if result else False
+    
+    def get_vector_dimension(self, table_name, column_name="embedding"):
+        """
+        VECTOR型のカラムの次元数を取得する
+        
+        Args:
+            table_name (str): テーブル名
+            column_name (str): カラム名
+            
+        Returns:
+            int: 次元数。テーブルやカラムが存在しない場合、次元数が指定されていない場合はNone
+        """
+        # pgvectorではVECTOR(n)のnがatttypmodに格納される
+        query = """
+        SELECT a.atttypmod
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = %s AND a.attname = %s AND NOT a.attisdropped;
+        """
+        result = self.execute_query(query, (table_name, column_name))
+        if not result or result[0][0] is None or result[0][0] <= 0:
+            return None
+        return result[0][0]
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+ビルドマニフェストモジュール
+
+ソース → Markdown → ベクトル → RAG の各段階で作成した成果物を記録します。
+入力ファイルごとに内容のハッシュ、更新日時、サイズ、生成に使用した設定、出力（Markdownのパスやチャンクのid）を保持し、
+インクリメンタルビルドでは記録と異なる入力だけを再処理します。
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.utils.logger_util import setup_logger
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+# マニフェストの段階
+STAGE_MARKDOWN = "markdown"
+STAGE_VECTORS = "vectors"
+STAGE_RAG = "rag"
+STAGES = (STAGE_MARKDOWN, STAGE_VECTORS, STAGE_RAG)
+
+# 再処理が必要な理由（check()の戻り値）
+REASON_NEW = "新規"
+REASON_PARAMS_CHANGED = "設定変更"
+REASON_MODIFIED = "変更"
+
+
+def file_content_hash(path: str, block_size: int = 1024 * 1024) -> str:
+    """
+    ファイルの内容のSHA-256ハッシュを返します。
+
+    Args:
+        path: ファイルパス
+        block_size: 1回に読み込むバイト数
+
+    Returns:
+        16進数のハッシュ文字列
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """
+    ビルドマニフェストクラス
+
+    JSONファイルに段階ごとの成果物を記録します。更新日時とサイズが記録と同じファイルはハッシュを計算せずに
+    最新とみなし、異なる場合だけ内容のハッシュを比較します（更新日時だけが変わったファイルは再処理しません）。
+
+    Attributes:
+        path: マニフェストファイルのパス
+        nodes: 段階ごとの {入力のキー: 記録} の辞書
+        costs: 段階ごとの処理量と処理時間の累計（コストの推定に使用）
+        source_indexes: ソースディレクトリごとのソースファイル索引（src/rag/source_index.pyを参照）
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        BuildManifestのコンストラクタ
+
+        Args:
+            path: マニフェストファイルのパス（Noneの場合は環境変数BUILD_MANIFEST_PATH、未設定の場合は./data/build_manifest.json）
+        """
+        self.path = path or os.getenv('BUILD_MANIFEST_PATH', './data/build_manifest.json')
+        self.nodes: Dict[str, Dict[str, Dict[str, Any]]] = {stage: {} for stage in STAGES}
+        self.costs: Dict[str, Dict[str, float]] = {}
+        self.source_indexes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        """
+        マニフェストファイルを読み込みます。ファイルがない場合や壊れている場合は空のマニフェストになります。
+        """
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != self.VERSION:
+                logger.warning(f"ビルドマニフェスト '{self.path}' のバージョンが異なるため使用しません")
+                return
+            for stage in STAGES:
+                self.nodes[stage] = data.get("stages", {}).get(stage, {})
+            self.costs = data.get("costs", {})
+            self.source_indexes = data.get("source_indexes", {})
+        except Exception as e:
+            logger.warning(f"ビルドマニフェスト '{self.path}' の読み込みに失敗しました: {e}")
+
+    def save(self) -> None:
+        """
+        マニフェストファイルを保存します。途中で中断しても壊れないよう、一時ファイルに書き込んでから置き換えます。
+        """
+        with self._lock:
+            data = {"version": self.VERSION, "updated_at": time.time(), "stages": self.nodes, "costs": self.costs,
+                    "source_indexes": self.source_indexes}
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+
+    def get(self, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        """
+        入力の記録を返します。
+
+        Args:
+            stage: 段階
+            key: 入力のキー（絶対パス）
+
+        Returns:
+            記録。記録がない場合はNone
+        """
+        return self.nodes[stage].get(key)
+
+    def keys(self, stage: str) -> List[str]:
+        """
+        段階に記録されている入力のキーの一覧を返します。
+        """
+        return list(self.nodes[stage].keys())
+
+    def check(self, stage: str, key: str, path: str, params: Optional[str] = None) -> Optional[str]:
+        """
+        入力が記録から変わっているかを判定します。
+
+        Args:
+            stage: 段階
+            key: 入力のキー
+            path: 入力のファイルパス
+            params: 出力に影響する設定（モデル名やチャンクサイズなど）を表す文字列
+
+        Returns:
+            再処理が必要な理由（REASON_NEW、REASON_PARAMS_CHANGED、REASON_MODIFIED）。最新の場合はNone
+        """
+        entry = self.get(stage, key)
+        if entry is None:
+            return REASON_NEW
+        if entry.get("params") != params:
+            return REASON_PARAMS_CHANGED
+
+        stat = os.stat(path)
+        if entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size:
+            return None
+        if entry.get("hash") != file_content_hash(path):
+            return REASON_MODIFIED
+
+        # 内容が同じで更新日時だけが変わった場合は、次回からハッシュを計算しないよう記録を更新する
+        with self._lock:
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+        return None
+
+    def record(self, stage: str, key: str, path: Optional[str], outputs: List[Any], params: Optional[str] = None,
+               content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        入力と出力を記録します。
+
+        Args:
+            stage: 段階
+            key: 入力のキー
+            path: 入力のファイルパス（ファイルでない入力の場合はNone）
+            outputs: 出力（Markdownのパス、チャンクのidなど）
+            params: 出力に影響する設定を表す文字列
+            content_hash: 入力のハッシュ（Noneの場合はファイルから計算）
+
+        Returns:
+            記録
+        """
+        entry: Dict[str, Any] = {"params": params, "outputs": list(outputs), "built_at": time.time()}
+        if path is not None:
+            stat = os.stat(path)
+            entry.update({
+                "hash": content_hash or file_content_hash(path),
+                "mtime": stat.st_mtime,
+                "size": stat.st_size,
+            })
+        elif content_hash is not None:
+            entry["hash"] = content_hash
+        with self._lock:
+            self.nodes[stage][key] = entry
+        return entry
+
+    def remove(self, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        """
+        入力の記録を削除します。
+
+        Returns:
+            削除した記録。記録がない場合はNone
+        """
+        with self._lock:
+            return self.nodes[stage].pop(key, None)
+
+    def record_cost(self, stage: str, units: float, seconds: float) -> None:
+        """
+        段階の処理量と処理時間を累計に加えます。
+
+        Args:
+            stage: 段階
+            units: 処理量（入力のバイト数など）
+            seconds: 処理時間（秒）
+        """
+        if units <= 0:
+            return
+        with self._lock:
+            cost = self.costs.setdefault(stage, {"units": 0.0, "seconds": 0.0})
+            cost["units"] += units
+            cost["seconds"] += seconds
+
+    def estimate_seconds(self, stage: str, units: float) -> Optional[float]:
+        """
+        これまでの実績から処理時間を推定します。
+
+        Args:
+            stage: 段階
+            units: 処理量
+
+        Returns:
+            推定の処理時間（秒）。実績がない場合はNone
+        """
+        cost = self.costs.get(stage)
+        if not cost or cost.get("units", 0) <= 0:
+            return None
+        return units * cost["seconds"] / cost["units"]
@@ -0,0 +1,584 @@
+# -*- coding: utf-8 -*-
+"""
+文書変換パイプラインモジュール
+
+ソースファイルのMarkdown変換とLLMによる整形を、ファイルごとに順番に行う代わりに並行に実行します。
+
+- 解析段階: プロセスプールでmarkitdownによる変換とclean_textを行います（CPUを使用する処理がGILで直列化されないため）
+- 整形段階: asyncioのセマフォで同時に実行するOllamaへの要求の数を制限しながら、organize_text_with_llmを呼び出します
+
+PDF、PowerPoint（.pptx）、Excel（.xlsx）はページ（スライド、シート）ごとに変換し、解析と整形を数ページずつ進めて
+Markdownファイルに追記します（ページの区切りの行でページ番号を残します）。ファイル全体を1つの文字列にしないため、
+大きなファイルでも使用するメモリは一度に処理するページの分だけです。
+
+失敗したファイルは待ち時間を延ばしながら再試行し、進捗を定期的にログに出力します。変換が完了したファイルは
+状態ファイル（JSON Lines）に追記するため、中断した場合でも次回の実行では完了したファイルを変換し直しません。
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from src.rag.markdown_converter import MarkdownConverter
+from src.utils.chunk_processor import clean_text, format_page_marker, organize_text_with_llm, organize_windows
+from src.utils.llm_cache import LLMOutputCache
+from src.utils.text_window import estimate_tokens, stitch_outputs
+from src.utils.logger_util import setup_logger
+
+# 見出し、表、箇条書き、番号付きリストの行
+_STRUCTURED_LINE = re.compile(r'^(#{1,6}\s|\||[-*+]\s|\d+[.)]\s)')
+
+# 解析段階のプロセスごとのMarkdownコンバーター
+_worker_converter: Optional[MarkdownConverter] = None
+
+
+def _init_parse_worker() -> None:
+    """
+    解析段階のプロセスの初期化処理。プロセスごとにMarkdownコンバーターを1つだけ作成します。
+    """
+    global _worker_converter
+    _worker_converter = MarkdownConverter()
+
+
+def llm_skip_reason(file_path: str, markdown: str, skip_extensions: Set[str], structured_ratio: float) -> Optional[str]:
+    """
+    LLMによる整形を省略する理由を返します。整形が必要な場合はNoneを返します。
+
+    - 拡張子がskip_extensionsに含まれるファイル（Markdown、CSV、JSONなど、すでに構造化されたテキスト）
+    - 見出し・表・箇条書きの行の割合がstructured_ratio以上のMarkdown（structured_ratioが0の場合は判定しません）
+
+    Args:
+        file_path: ソースファイルのパス
+        markdown: markitdownで変換したMarkdown
+        skip_extensions: 整形を省略する拡張子（小文字、"."を含む）
+        structured_ratio: 構造化されたMarkdownとみなす行の割合
+
+    Returns:
+        省略する理由。整形する場合はNone
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in skip_extensions:
+        return f"拡張子 {extension}"
+    if structured_ratio <= 0:
+        return None
+    lines = [line.strip() for line in markdown.splitlines() if line.strip()]
+    if len(lines) < 5:
+        return None
+    structured = sum(1 for line in lines if _STRUCTURED_LINE.match(line))
+    if structured / len(lines) >= structured_ratio:
+        return f"構造化済み（{structured}/{len(lines)}行）"
+    return None
+
+
+def _parse_document(file_path: str, skip_extensions: Set[str], structured_ratio: float) -> Tuple[str, Optional[str]]:
+    """
+    解析段階の処理。ソースファイルをMarkdownに変換します。
+
+    Returns:
+        (テキスト, LLMによる整形を省略する理由)。整形する場合はクリーンアップしたテキストを、
+        省略する場合は構造を残すためMarkdownをそのまま返します
+
+    Raises:
+        ValueError: ファイルを変換できない場合
+    """
+    if _worker_converter is None:
+        _init_parse_worker()
+    markdown_content = _worker_converter.convert_file_to_markdown(file_path)
+    if markdown_content is None:
+        raise ValueError("Markdownに変換できませんでした")
+    reason = llm_skip_reason(file_path, markdown_content, skip_extensions, structured_ratio)
+    if reason is not None:
+        return markdown_content, reason
+    return clean_text(markdown_content), None
+
+
+def _count_sections(file_path: str) -> Optional[int]:
+    """
+    解析段階の処理。ソースファイルのページ（スライド、シート）の数を返します。ページごとに変換できない場合はNoneを返します。
+    """
+    if _worker_converter is None:
+        _init_parse_worker()
+    return _worker_converter.count_sections(file_path)
+
+
+def _parse_sections(file_path: str, start: int, count: int, skip_extensions: Set[str],
+                    structured_ratio: float) -> List[Tuple[int, str, Optional[str]]]:
+    """
+    解析段階の処理。ソースファイルのページをstart番目からcount個だけMarkdownに変換します。
+
+    Returns:
+        (ページ番号, テキスト, LLMによる整形を省略する理由) のリスト。テキストは_parse_documentと同じく、
+        整形する場合はクリーンアップしたテキスト、省略する場合はMarkdownをそのまま返します
+    """
+    if _worker_converter is None:
+        _init_parse_worker()
+    sections = []
+    for number, markdown in _worker_converter.convert_sections(file_path, start, count):
+        reason = llm_skip_reason(file_path, markdown, skip_extensions, structured_ratio)
+        sections.append((number, markdown if reason is not None else clean_text(markdown), reason))
+    return sections
+
+
+def _file_signature(file_path: Path) -> Dict[str, int]:
+    """
+    ソースファイルの更新日時とサイズを返します。
+    """
+    stat = file_path.stat()
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+class ConversionState:
+    """
+    変換の状態ファイル
+
+    変換が完了したファイルと失敗したファイルを1行ずつ追記します。読み込み時は同じファイルの最後の行を使用し、
+    書き込みの途中で中断した最後の行は無視します。
+
+    Attributes:
+        path: 状態ファイルのパス
+        entries: {ソースファイルのキー: 記録} の辞書
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        ConversionStateのコンストラクタ
+
+        Args:
+            path: 状態ファイルのパス（Noneの場合は環境変数CONVERSION_STATE_PATH、未設定の場合は./data/conversion_state.jsonl）
+        """
+        self.logger = setup_logger("conversion_pipeline")
+        self.path = path or os.getenv('CONVERSION_STATE_PATH', './data/conversion_state.jsonl')
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self) -> None:
+        """
+        状態ファイルを読み込みます。ファイルがない場合は空の状態になります。
+        """
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.entries[entry['key']] = entry
+        except Exception as e:
+            self.logger.warning(f"変換の状態ファイル '{self.path}' の読み込みに失敗しました: {e}")
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        self.entries[entry['key']] = entry
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def completed_output(self, key: str, file_path: Path, params: str) -> Optional[str]:
+        """
+        前回の実行で変換が完了していれば、保存したMarkdownファイルのパスを返します。
+
+        ソースファイルの更新日時・サイズ、変換時の設定のいずれかが変わった場合や、Markdownファイルがない場合はNoneを返します。
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry.get('status') != "done" or entry.get('params') != params:
+            return None
+        try:
+            if _file_signature(file_path) != entry.get('signature'):
+                return None
+        except OSError:
+            return None
+        output = entry.get('output')
+        return output if output and os.path.exists(output) else None
+
+    def mark_done(self, key: str, signature: Dict[str, int], params: str, output: str) -> None:
+        """
+        変換が完了したファイルを記録します。
+        """
+        self._append({'key': key, 'status': "done", 'signature': signature, 'params': params, 'output': output,
+                      'finished_at': time.time()})
+
+    def mark_failed(self, key: str, params: str, attempts: int, error: str) -> None:
+        """
+        変換に失敗したファイルを記録します。失敗したファイルは次回の実行で変換し直します。
+        """
+        self._append({'key': key, 'status': "failed", 'params': params, 'attempts': attempts, 'error': error,
+                      'finished_at': time.time()})
+
+    def clear(self) -> None:
+        """
+        状態ファイルを削除します。
+        """
+        self.entries = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _Progress:
+    """
+    進捗バーをログに出力するクラス。出力は一定の間隔ごとに行います。
+    """
+
+    WIDTH = 30
+
+    def __init__(self, logger, total: int, interval: float):
+        self.logger = logger
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last = 0.0
+
+    def update(self, failed: bool = False, force: bool = False) -> None:
+        self.done += 1
+        if failed:
+            self.failed += 1
+        now = time.monotonic()
+        if not force and self.done < self.total and now - self._last < self.interval:
+            return
+        self._last = now
+        ratio = self.done / self.total if self.total else 1.0
+        filled = int(self.WIDTH * ratio)
+        elapsed = now - self.started
+        remaining = elapsed / self.done * (self.total - self.done) if self.done else 0.0
+        self.logger.info(f"変換の進捗: [{'#' * filled}{'-' * (self.WIDTH - filled)}] {self.done}/{self.total} "
+                         f"({ratio * 100:.1f}%) 失敗 {self.failed} 経過 {elapsed:.0f}秒 残り約 {remaining:.0f}秒")
+
+
+class ConversionPipeline:
+    """
+    ソースファイルのMarkdown変換を並行実行するパイプライン
+
+    Attributes:
+        parse_workers: 解析段階のプロセス数
+        llm_concurrency: 同時に実行するLLMへの要求の数
+        max_retries: ファイルごとの再試行の回数（ページごとに変換する場合は数ページごとの再試行の回数）
+        retry_delay: 最初の再試行までの待ち時間（秒、再試行のたびに2倍になります）
+        streaming: PDF、PowerPoint、Excelをページごとに変換するかどうか
+        stream_pages: ページごとに変換する場合に、一度に解析するページの数
+    """
+
+    def __init__(self,
+                 model: str = "gemma3:12b",
+                 temperature: float = 0.0,
+                 num_ctx: int = 2048,
+                 num_predict: int = 1024,
+                 parse_workers: Optional[int] = None,
+                 llm_concurrency: Optional[int] = None,
+                 max_retries: Optional[int] = None,
+                 retry_delay: Optional[float] = None,
+                 progress_interval: Optional[float] = None,
+                 state: Optional[ConversionState] = None,
+                 llm_cache: Optional[LLMOutputCache] = None,
+                 use_cache: bool = True,
+                 streaming: Optional[bool] = None,
+                 stream_pages: Optional[int] = None):
+        """
+        ConversionPipelineのコンストラクタ
+
+        Args:
+            model: 整形に使用するLLMモデル
+            temperature: LLMの温度パラメータ
+            num_ctx: コンテキストウィンドウサイズ
+            num_predict: 予測トークン数
+            parse_workers: 解析段階のプロセス数（Noneの場合は環境変数CONVERSION_PARSE_WORKERS、未設定の場合はCPU数の半分）
+            llm_concurrency: 同時に実行するLLMへの要求の数（Noneの場合は環境変数CONVERSION_LLM_CONCURRENCY、未設定の場合は2）
+            max_retries: ファイルごとの再試行の回数（Noneの場合は環境変数CONVERSION_MAX_RETRIES、未設定の場合は2）
+            retry_delay: 最初の再試行までの待ち時間（Noneの場合は環境変数CONVERSION_RETRY_DELAY、未設定の場合は5秒）
+            progress_interval: 進捗を出力する間隔（Noneの場合は環境変数CONVERSION_PROGRESS_INTERVAL、未設定の場合は10秒）
+            state: 変換の状態ファイル（Noneの場合は既定のパスから読み込みます）
+            llm_cache: LLM出力キャッシュ（Noneの場合は環境変数の設定から作成します）
+            use_cache: LLM出力キャッシュを使用するかどうか
+            streaming: PDF、PowerPoint、Excelをページごとに変換するかどうか（Noneの場合は環境変数CONVERSION_STREAMING、未設定の場合はTrue）
+            stream_pages: 一度に解析するページの数（Noneの場合は環境変数CONVERSION_STREAM_PAGES、未設定の場合は8）
+        """
+        self.logger = setup_logger("conversion_pipeline")
+        self.model = model
+        self.temperature = temperature
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.parse_workers = max(1, parse_workers or int(os.getenv('CONVERSION_PARSE_WORKERS', '0')) or (os.cpu_count() or 2) // 2)
+        self.llm_concurrency = max(1, llm_concurrency or int(os.getenv('CONVERSION_LLM_CONCURRENCY', '2')))
+        self.max_retries = max(0, max_retries if max_retries is not None else int(os.getenv('CONVERSION_MAX_RETRIES', '2')))
+        self.retry_delay = retry_delay if retry_delay is not None else float(os.getenv('CONVERSION_RETRY_DELAY', '5'))
+        self.progress_interval = progress_interval if progress_interval is not None else \
+            float(os.getenv('CONVERSION_PROGRESS_INTERVAL', '10'))
+        self.state = state or ConversionState()
+        if use_cache:
+            self.llm_cache = llm_cache if llm_cache is not None else LLMOutputCache.from_env()
+        else:
+            self.llm_cache = None
+        self.skip_extensions = {
+            extension.strip().lower()
+            for extension in os.getenv('LLM_SKIP_EXTENSIONS', '.md,.markdown,.csv,.json').split(',') if extension.strip()
+        }
+        self.structured_ratio = float(os.getenv('LLM_SKIP_STRUCTURED_RATIO', '0.6'))
+        self.streaming = streaming if streaming is not None else os.getenv('CONVERSION_STREAMING', 'true').lower() == 'true'
+        self.stream_pages = max(1, stream_pages or int(os.getenv('CONVERSION_STREAM_PAGES', '8')))
+
+    def _organize(self, text: str) -> str:
+        """
+        整形段階の処理（LLM用のスレッドで実行されます）。textは_organize_textで分割した1つのウィンドウです
+        """
+        return organize_text_with_llm(
+            text=text,
+            model=self.model,
+            temperature=self.temperature,
+            num_ctx=self.num_ctx,
+            num_predict=self.num_predict,
+            windowed=False,
+            cache=self.llm_cache
+        )
+
+    def _create_parse_executor(self):
+        """
+        解析段階のエグゼキューターを作成します。
+        """
+        return ProcessPoolExecutor(max_workers=self.parse_workers, initializer=_init_parse_worker)
+
+    async def _retry(self, item: Dict[str, Any], operation: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        operationを実行し、失敗した場合は待ち時間を延ばしながら再試行します。
+
+        Raises:
+            ValueError: ファイルを変換できない場合（再試行しません）
+            Exception: 再試行の回数を超えて失敗した場合
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await operation()
+            except ValueError:
+                raise
+            except Exception as e:
+                item['attempts'] = max(item.get('attempts', 1), attempt)
+                if attempt > self.max_retries:
+                    raise
+                delay = self.retry_delay * (2 ** (attempt - 1))
+                self.logger.warning(f"ソースファイル '{item['path']}' の変換に失敗しました（{attempt}回目）。"
+                                    f"{delay:.0f}秒後に再試行します: {e}")
+                await asyncio.sleep(delay)
+
+    async def _organize_text(self, text: str, skip_reason: Optional[str], llm_executor,
+                             semaphore: asyncio.Semaphore) -> str:
+        """
+        テキストをLLMで整形します。整形を省略する場合や空のテキストの場合はそのまま返します。
+
+        長いテキストはウィンドウに分割し、各ウィンドウを他のファイルの要求と同じセマフォで制限しながら整形します。
+        organize_text_with_llmはウィンドウを順に整形するため、パイプラインではウィンドウの分割をここで行い、
+        長いテキストのウィンドウも並行に整形します。
+        """
+        if skip_reason is not None or not text.strip():
+            return text
+        loop = asyncio.get_running_loop()
+
+        async def organize(window: str) -> str:
+            async with semaphore:
+                return await loop.run_in_executor(llm_executor, self._organize, window)
+
+        windows = organize_windows(text, self.num_ctx, self.num_predict)
+        if len(windows) == 1:
+            return await organize(windows[0])
+        self.logger.info(f"テキスト（推定 {estimate_tokens(text)} トークン）を {len(windows)} 個のウィンドウに分割して整形します")
+        outputs = await asyncio.gather(*(organize(window) for window in windows))
+        return stitch_outputs(list(outputs))
+
+    async def _convert(self, item: Dict[str, Any], parse_executor, llm_executor,
+                       semaphore: asyncio.Semaphore) -> Path:
+        """
+        1つのソースファイルを変換します。解析に成功したテキストは再試行時にも再利用します。
+
+        Raises:
+            ValueError: ファイルを変換できない場合（再試行しません）
+            Exception: 再試行の回数を超えて失敗した場合
+        """
+        loop = asyncio.get_running_loop()
+        file_path: Path = item['path']
+        output_file: Path = item['output']
+
+        if self.streaming and file_path.suffix.lower() in MarkdownConverter.SECTION_EXTENSIONS:
+            sections = await self._retry(item, lambda: loop.run_in_executor(parse_executor, _count_sections, str(file_path)))
+            if sections is not None:
+                return await self._convert_sections(item, sections, parse_executor, llm_executor, semaphore)
+
+        parsed: Optional[Tuple[str, Optional[str]]] = None
+
+        async def convert_document() -> Path:
+            nonlocal parsed
+            if parsed is None:
+                parsed = await loop.run_in_executor(parse_executor, _parse_document, str(file_path),
+                                                    self.skip_extensions, self.structured_ratio)
+            text, skip_reason = parsed
+            if skip_reason is not None:
+                self.logger.info(f"ソースファイル '{file_path}' はLLMによる整形を省略します（{skip_reason}）")
+                item['llm_skipped'] = True
+            organized_text = await self._organize_text(text, skip_reason, llm_executor, semaphore)
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(output_file, "w", encoding="utf-8") as f:
+                f.write(organized_text)
+            return output_file
+
+        return await self._retry(item, convert_document)
+
+    async def _convert_sections(self, item: Dict[str, Any], sections: int, parse_executor, llm_executor,
+                                semaphore: asyncio.Semaphore) -> Path:
+        """
+        ソースファイルをstream_pagesページずつ解析・整形し、ページの区切りの行とともにMarkdownファイルに追記します。
+        書き込みは一時ファイル（.part）に行い、全てのページの変換が完了してから保存先のファイルに置き換えます。
+        再試行は失敗した数ページ分だけ行います。
+
+        Raises:
+            ValueError: ファイルを変換できない場合（再試行しません）
+            Exception: 再試行の回数を超えて失敗した場合
+        """
+        loop = asyncio.get_running_loop()
+        file_path: Path = item['path']
+        output_file: Path = item['output']
+        part_file = output_file.with_name(output_file.name + ".part")
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+        self.logger.info(f"ソースファイル '{file_path}' を {sections} ページに分けて変換します。")
+
+        skipped = 0
+        try:
+            with open(part_file, "w", encoding="utf-8") as f:
+                for start in range(0, sections, self.stream_pages):
+                    parsed: Optional[List[Tuple[int, str, Optional[str]]]] = None
+
+                    async def convert_batch() -> List[Tuple[int, str]]:
+                        nonlocal parsed
+                        if parsed is None:
+                            parsed = await loop.run_in_executor(parse_executor, _parse_sections, str(file_path), start,
+                                                                self.stream_pages, self.skip_extensions, self.structured_ratio)
+                        outputs = await asyncio.gather(*(self._organize_text(text, reason, llm_executor, semaphore)
+                                                         for _, text, reason in parsed))
+                        return [(number, output) for (number, _, _), output in zip(parsed, outputs)]
+
+                    batch = await self._retry(item, convert_batch)
+                    skipped += sum(1 for _, _, reason in parsed if reason is not None)
+                    for number, output in batch:
+                        if output.strip():
+                            f.write(f"{format_page_marker(number)}\n\n{output.strip()}\n\n")
+                    f.flush()
+                    item['pages'] = item.get('pages', 0) + len(batch)
+                    self.logger.debug(f"ソースファイル '{file_path}' の {start + len(batch)}/{sections} ページを変換しました")
+            os.replace(part_file, output_file)
+        except BaseException:
+            if part_file.exists():
+                part_file.unlink()
+            raise
+
+        if sections and skipped == sections:
+            self.logger.info(f"ソースファイル '{file_path}' はLLMによる整形を省略しました（全てのページが構造化済み）")
+            item['llm_skipped'] = True
+        return output_file
+
+    async def _run(self, items: List[Dict[str, Any]], params: str,
+                   on_file_done: Optional[Callable[[Dict[str, Any], Path], None]],
+                   stats: Dict[str, Any]) -> None:
+        """
+        ファイルの変換を並行に実行します。同時に処理するファイルの数を解析段階のプロセス数とLLMの同時実行数の和に
+        制限するため、解析済みで整形を待つテキストがメモリに溜まり続けることはありません。
+        """
+        progress = _Progress(self.logger, len(items), self.progress_interval)
+        pending: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            pending.put_nowait(item)
+        semaphore = asyncio.Semaphore(self.llm_concurrency)
+
+        async def worker(parse_executor, llm_executor) -> None:
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                file_path: Path = item['path']
+                key = str(file_path.resolve())
+                try:
+                    signature = _file_signature(file_path)
+                    output_file = await self._convert(item, parse_executor, llm_executor, semaphore)
+                except Exception as e:
+                    self.logger.error(f"ソースファイル '{file_path}' の変換中にエラーが発生しました: {e}")
+                    self.state.mark_failed(key, params, item.get('attempts', 1), str(e))
+                    stats['failed'] += 1
+                    progress.update(failed=True)
+                    continue
+
+                self.state.mark_done(key, signature, params, str(output_file.absolute()))
+                stats['files'] += 1
+                stats['bytes'] += item.get('bytes', 0)
+                if item.get('llm_skipped'):
+                    stats['llm_skipped'] += 1
+                stats['pages'] += item.get('pages', 0)
+                self.logger.info(f"Processed and saved: {output_file}")
+                if on_file_done is not None:
+                    on_file_done(item, output_file)
+                progress.update()
+
+        workers = min(len(items), self.parse_workers + self.llm_concurrency)
+        with self._create_parse_executor() as parse_executor, \
+                ThreadPoolExecutor(max_workers=self.llm_concurrency, thread_name_prefix="conversion-llm") as llm_executor:
+            await asyncio.gather(*(worker(parse_executor, llm_executor) for _ in range(workers)))
+
+    def run(self, items: List[Dict[str, Any]], params: str,
+            on_file_done: Optional[Callable[[Dict[str, Any], Path], None]] = None) -> Dict[str, Any]:
+        """
+        ソースファイルを変換します。
+
+        前回の実行で変換が完了したファイル（状態ファイルに記録があり、ソースファイルと設定が変わっていないもの）は
+        変換せずにon_file_doneだけを呼び出します。全てのファイルの変換に成功した場合は状態ファイルを削除します。
+
+        Args:
+            items: 変換するファイル（path: ソースファイルのパス、output: 保存先のMarkdownファイルのパス、bytes: ファイルサイズ）
+            params: 変換時の設定（markdown_build_paramsの値）
+            on_file_done: 変換が完了したファイルごとに (item, 保存したMarkdownファイルのパス) で呼び出す関数
+
+        Returns:
+            Dict[str, Any]: files（変換したファイル数）、resumed（前回の実行で変換済みだったファイル数）、
+            failed（失敗したファイル数）、bytes（変換したファイルの合計サイズ）、seconds（処理時間）、
+            pages（ページごとに変換したページ数）、llm_skipped（LLMによる整形を省略したファイル数）、cache_hits / cache_misses（LLM出力キャッシュの
+            ヒット数とミス数）、saved_seconds（キャッシュヒットで省略したLLMの呼び出し時間）
+        """
+        started = time.perf_counter()
+        stats: Dict[str, Any] = {'files': 0, 'resumed': 0, 'failed': 0, 'bytes': 0, 'seconds': 0.0, 'pages': 0,
+                                 'llm_skipped': 0, 'cache_hits': 0, 'cache_misses': 0, 'saved_seconds': 0.0}
+        cache_before = self.llm_cache.stats() if self.llm_cache is not None else None
+
+        remaining = []
+        for item in items:
+            output = self.state.completed_output(str(item['path'].resolve()), item['path'], params)
+            if output is None:
+                remaining.append(item)
+                continue
+            stats['resumed'] += 1
+            if on_file_done is not None:
+                on_file_done(item, Path(output))
+        if stats['resumed']:
+            self.logger.info(f"前回の実行で変換済みの {stats['resumed']} ファイルを再利用します。")
+
+        if remaining:
+            self.logger.info(f"{len(remaining)} ファイルを変換します（解析 {self.parse_workers} プロセス、"
+                             f"LLMの同時実行数 {self.llm_concurrency}）。")
+            asyncio.run(self._run(remaining, params, on_file_done, stats))
+
+        if stats['failed'] == 0:
+            self.state.clear()
+        stats['seconds'] = time.perf_counter() - started
+        if cache_before is not None:
+            cache_after = self.llm_cache.stats()
+            stats['cache_hits'] = cache_after['hits'] - cache_before['hits']
+            stats['cache_misses'] = cache_after['misses'] - cache_before['misses']
+            stats['saved_seconds'] = cache_after['saved_seconds'] - cache_before['saved_seconds']
+        self.logger.info(f"変換が完了しました: {stats['files']} ファイル、再利用 {stats['resumed']} ファイル、"
+                         f"失敗 {stats['failed']} ファイル、ページごとに変換 {stats['pages']} ページ（{stats['seconds']:.1f}秒）")
+        self.logger.info(f"LLMによる整形: 省略 {stats['llm_skipped']} ファイル、キャッシュヒット {stats['cache_hits']} 回、"
+                         f"キャッシュミス {stats['cache_misses']} 回、キャッシュで節約した時間 {stats['saved_seconds']:.1f}秒")
+        return stats
@@ -95,11 +95,13 @@ def create_rag_table(db_name=None, user=None, password=None, host=None, port=Non
             port=port
         )
         cur = conn.cursor()
-        create_table_query = '''
+        # ベクトルの次元数は埋め込みモデルに合わせる（デフォルト: multilingual-e5-largeの1024）
+        dimension = int(os.getenv('EMBEDDING_DIMENSION', '1024'))
+        create_table_query = f'''
         CREATE TABLE IF NOT EXISTS rag_documents (
             id SERIAL PRIMARY KEY,
             chunk_text TEXT NOT NULL,
-            embedding VECTOR(1024) NOT NULL,
+            embedding VECTOR({dimension}) NOT NULL,
             filename TEXT NOT NULL,
             filepath TEXT NOT NULL,
             original_filepath TEXT,
@@ -133,15 +135,18 @@ def create_vector_table(db_name=None, user=None, password=None, host=None, port=
             port=port
         )
         cur = conn.cursor()
-        create_table_query = '''
+        # ベクトルの次元数は埋め込みモデルに合わせる（デフォルト: multilingual-e5-largeの1024）
+        dimension = int(os.getenv('EMBEDDING_DIMENSION', '1024'))
+        create_table_query = f'''
         CREATE TABLE IF NOT EXISTS vector_embeddings (
             id SERIAL PRIMARY KEY,
             chunk_text TEXT NOT NULL,
-            embedding VECTOR(1024) NOT NULL,
+            embedding VECTOR({dimension}) NOT NULL,
             filename TEXT NOT NULL,
             filepath TEXT NOT NULL,
             original_filepath TEXT,
             chunk_index INTEGER,
+            chunk_hash TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         '''
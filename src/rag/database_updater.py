@@ -11,15 +11,18 @@
 import os
 import sys
 import argparse
-from typing import Dict, Any, List, Tuple, Optional, Set
+from typing import Dict, Any, Iterator, List, Tuple, Optional, Set
 
 # プロジェクトのルートディレクトリをパスに追加
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.rag.vector_database import VectorDatabase
 from src.rag.rag_database import RAGDatabase
-from src.utils.chunk_processor import chunk_splitter
-from src.utils.embedding_generator import EmbeddingGenerator
+from src.rag.ingestion_pipeline import IngestionPipeline
+from src.rag.source_index import get_source_index, persist_source_index
+from src.utils.chunk_processor import chunk_splitter, iter_pages
+from src.utils.token_chunker import TokenChunker
+from src.utils.model_registry import get_model_registry
 from src.utils.logger_util import setup_logger
 
 # ロガーの設定
@@ -70,6 +73,130 @@ def check_table_exists(db_config: Dict[str, Any], table_name: str) -> bool:
         logger.error(f"テーブル '{table_name}' の存在確認中にエラーが発生しました: {e}")
         return False
 
+def find_original_filepath(file_path: str, markdown_dir: str) -> str:
+    """
+    Markdownファイルに対応する元のソースファイルのパスを検索します。
+    
+    Args:
+        file_path (str): Markdownファイルのパス
+        markdown_dir (str): Markdownファイルのディレクトリパス
+        
+    Returns:
+        str: 元ファイルの相対パス（見つからない場合はMarkdownファイルの相対パス）
+    """
+    original_filepath = None
+    try:
+        # ファイル名から拡張子を除いたベース名を取得
+        file_basename = os.path.basename(file_path)
+        base_filename_without_ext = os.path.splitext(file_basename)[0]
+
+        logger.info(f"元ファイルの検索を開始: ファイル名={file_basename}, ベース名={base_filename_without_ext}")
+
+        # ソースディレクトリのパスを取得
+        source_dir = os.path.join(os.path.dirname(os.path.dirname(markdown_dir)), "source")
+
+        # ソースディレクトリが存在するか確認
+        if not os.path.exists(source_dir):
+            logger.warning(f"ソースディレクトリ '{source_dir}' が存在しません。")
+            # ディレクトリが存在しない場合は、Markdownファイルの相対パスを設定
+            original_filepath = os.path.relpath(file_path, os.path.dirname(os.path.dirname(markdown_dir)))
+            logger.info(f"ソースディレクトリが存在しないため、フォールバックとして設定した相対パス: {original_filepath}")
+        else:
+            # source_matching.pyのアルゴリズムを、ソースファイル索引を使用して適用する
+            source_index = get_source_index(source_dir)
+            found = False
+
+            # 方法1: 完全一致で検索
+            if source_index.exists(f"markdown/{file_basename}"):
+                source_file = os.path.join(source_dir, "markdown", file_basename)
+                original_filepath = os.path.relpath(source_file, os.path.dirname(os.path.dirname(markdown_dir)))
+                logger.info(f"完全一致で見つかりました: original_filepath={original_filepath}")
+                found = True
+
+            # 方法2: ベース名で検索
+            if not found:
+                source_file = source_index.find_by_stem(base_filename_without_ext, directory="markdown")
+                if source_file:
+                    original_filepath = os.path.relpath(source_file, os.path.dirname(os.path.dirname(markdown_dir)))
+                    logger.info(f"ベース名一致で見つかりました: original_filepath={original_filepath}")
+                    found = True
+
+            # 方法3: 全サブディレクトリを検索
+            if not found:
+                source_file = source_index.find_by_stem(base_filename_without_ext)
+                if source_file:
+                    original_filepath = os.path.relpath(source_file, os.path.dirname(os.path.dirname(markdown_dir)))
+                    logger.info(f"サブディレクトリ内で見つかりました: original_filepath={original_filepath}")
+                    found = True
+
+            # どの方法でも見つからなかった場合
+            if not found:
+                logger.warning(f"ファイル '{file_basename}' に対応するソースファイルが見つかりませんでした。")
+                original_filepath = os.path.relpath(file_path, os.path.dirname(os.path.dirname(markdown_dir)))
+                logger.warning(f"元ファイルが見つからなかったため、フォールバックとして設定した相対パス: {original_filepath}")
+
+            # デバッグ用に最終的な値をログ出力
+            logger.info(f"最終的なoriginal_filepath: {original_filepath}")
+    except Exception as e:
+        logger.error(f"元ファイルパスの取得中にエラーが発生しました: {e}")
+        # エラーが発生した場合は、Markdownファイルの相対パスを設定
+        original_filepath = os.path.relpath(file_path, os.path.dirname(markdown_dir))
+
+    # original_filepathが必ず設定されていることを確認
+    if original_filepath is None or original_filepath == "":
+        # 最終手段として、Markdownファイルの相対パスを設定
+        original_filepath = os.path.relpath(file_path, os.path.dirname(os.path.dirname(markdown_dir)))
+        logger.warning(f"original_filepathが未設定のため、最終的に相対パスを設定: {original_filepath}")
+
+    # 文字列型であることを確認
+    if not isinstance(original_filepath, str):
+        logger.error(f"original_filepathが文字列型ではありません: {type(original_filepath)}")
+        original_filepath = str(original_filepath)
+
+    # 空文字列でないことを確認
+    if not original_filepath.strip():
+        logger.error("original_filepathが空文字列です")
+        original_filepath = f"data/markdowns/{os.path.basename(file_path)}"
+
+    logger.info(f"データベースに保存するoriginal_filepath: '{original_filepath}'")
+    return original_filepath
+
+def prepare_markdown_chunks(file_path: str, markdown_dir: str, chunker: Optional[TokenChunker] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Markdownファイルをページごとに読み込んでチャンクに分割し、データベースに格納する形式にして順に返します。埋め込みベクトルは生成しません。
+    
+    Args:
+        file_path (str): Markdownファイルのパス
+        markdown_dir (str): Markdownファイルのディレクトリパス
+        chunker (Optional[TokenChunker]): トークン数で分割するチャンク分割器（Noneの場合は500文字ごとに分割）
+        
+    Yields:
+        List[Dict[str, Any]]: 1ページ分のチャンクのリスト（区切りの行がないファイルはファイル全体で1ページ、ページ番号はNone）
+    """
+    original_filepath = None
+    file_name = os.path.basename(file_path)
+    chunk_index = 0
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for page_number, content in iter_pages(f):
+            texts = chunk_splitter(content, chunk_size=500, chunk_overlap=100, chunker=chunker)
+            if not texts:
+                continue
+            # 元ファイルのパスはファイルごとに1回だけ検索する
+            if original_filepath is None:
+                original_filepath = find_original_filepath(file_path, markdown_dir)
+            yield [
+                {
+                    'chunk_text': chunk,
+                    'filename': file_name,
+                    'filepath': file_path,
+                    'chunk_index': chunk_index + i,
+                    'page_number': page_number,
+                    'original_filepath': original_filepath
+                }
+                for i, chunk in enumerate(texts)
+            ]
+            chunk_index += len(texts)
+
 def update_vector_database(db_config: Dict[str, Any], markdown_dir: str, reset_table: bool = False) -> VectorDatabase:
     """
     ベクトルデータベースを更新し、新しいMarkdownファイルを処理します。
@@ -83,7 +210,8 @@ def update_vector_database(db_config: Dict[str, Any], markdown_dir: str, reset_t
         VectorDatabase: 更新されたベクトルデータベース
     """
     # ベクトルデータベースの初期化
-    vector_db = VectorDatabase(db_config)
+    model_name = os.getenv('EMBEDDING_MODEL', 'intfloat/multilingual-e5-large')
+    vector_db = VectorDatabase(db_config, model_name=model_name)
     
     # テーブルが存在することを確認
     logger.info("ベクトルデータベーステーブルを作成します（存在しない場合）...")
@@ -118,152 +246,27 @@ def update_vector_database(db_config: Dict[str, Any], markdown_dir: str, reset_t
     
     logger.info(f"{len(new_files)}個の新しいMarkdownファイルを処理します。")
     
-    # エンベディングジェネレータの初期化
-    embedding_generator = EmbeddingGenerator()
+    # エンベディングジェネレータの取得（プロセス内で共有されているモデルを使用する）
+    embedding_generator = get_model_registry().acquire(model_name)
+    try:
+        vector_db.check_embedding_dimension(embedding_generator.dimension)
+    except ValueError:
+        get_model_registry().release(embedding_generator)
+        raise
     
-    # 各Markdownファイルを処理
-    total_chunks = 0
-    for file_path in new_files:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # ファイル名を取得
-            file_name = os.path.basename(file_path)
-            
-            # テキストをチャンクに分割
-            chunks = chunk_splitter(content, chunk_size=500, chunk_overlap=100)
-            
-            # 各チャンクを処理
-            for i, chunk in enumerate(chunks):
-                # 埋め込みベクトルを生成
-                embedding = embedding_generator.generate_embedding(chunk)
-                
-                # 元ファイルのパスを取得する
-                original_filepath = None
-                try:
-                    # ファイル名から拡張子を除いたベース名を取得
-                    file_basename = os.path.basename(file_path)
-                    base_filename_without_ext = os.path.splitext(file_basename)[0]
-                    
-                    logger.info(f"元ファイルの検索を開始: ファイル名={file_basename}, ベース名={base_filename_without_ext}")
-                    
-                    # ソースディレクトリのパスを取得
-                    source_dir = os.path.join(os.path.dirname(os.path.dirname(markdown_dir)), "source")
-                    
-                    # ソースディレクトリが存在するか確認
-                    if not os.path.exists(source_dir):
-                        logger.warning(f"ソースディレクトリ '{source_dir}' が存在しません。")
-                        # ディレクトリが存在しない場合は、Markdownファイルの相対パスを設定
-                        original_filepath = os.path.relpath(file_path, os.path.dirname(os.path.dirname(markdown_dir)))
-                        logger.info(f"ソースディレクトリが存在しないため、フォールバックとして設定した相対パス: {original_filepath}")
-                    else:
-                        # source_matching.pyのアルゴリズムを使用して元ファイルを検索
-                        found = False
-                        
-                        # 方法1: 完全一致で検索
-                        markdown_source_dir = os.path.join(source_dir, "markdown")
-                        if os.path.exists(markdown_source_dir):
-                            source_file = os.path.join(markdown_source_dir, file_basename)
-                            logger.info(f"完全一致でチェック: {source_file}")
-                            
-                            if os.path.exists(source_file):
-                                original_filepath = os.path.relpath(source_file, os.path.dirname(os.path.dirname(markdown_dir)))
-                                logger.info(f"完全一致で見つかりました: original_filepath={original_filepath}")
-                                found = True
-                        
-                        # 方法2: ベース名で検索
-                        if not found and os.path.exists(markdown_source_dir):
-                            try:
-                                files_in_markdown_dir = [f for f in os.listdir(markdown_source_dir) if os.path.isfile(os.path.join(markdown_source_dir, f))]
-                                logger.debug(f"markdownディレクトリ内のファイル: {files_in_markdown_dir}")
-                                
-                                for source_file_name in files_in_markdown_dir:
-                                    source_base_name = os.path.splitext(source_file_name)[0]
-                                    logger.debug(f"比較: {source_base_name} vs {base_filename_without_ext}")
-                                    
-                                    if source_base_name == base_filename_without_ext:
-                                        source_file = os.path.join(markdown_source_dir, source_file_name)
-                                        original_filepath = os.path.relpath(source_file, os.path.dirname(os.path.dirname(markdown_dir)))
-                                        logger.info(f"ベース名一致で見つかりました: original_filepath={original_filepath}")
-                                        found = True
-                                        break
-                            except Exception as e:
-                                logger.error(f"markdownディレクトリの読み取り中にエラーが発生しました: {e}")
-                        
-                        # 方法3: 全サブディレクトリを検索
-                        if not found:
-                            for root, dirs, files in os.walk(source_dir):
-                                if found:
-                                    break
-                                
-                                for file in files:
-                                    source_base_name = os.path.splitext(file)[0]
-                                    if source_base_name == base_filename_without_ext:
-                                        source_file = os.path.join(root, file)
-                                        original_filepath = os.path.relpath(source_file, os.path.dirname(os.path.dirname(markdown_dir)))
-                                        logger.info(f"サブディレクトリ内で見つかりました: original_filepath={original_filepath}")
-                                        found = True
-                                        break
-                        
-                        # どの方法でも見つからなかった場合
-                        if not found:
-                            logger.warning(f"ファイル '{file_basename}' に対応するソースファイルが見つかりませんでした。")
-                            original_filepath = os.path.relpath(file_path, os.path.dirname(os.path.dirname(markdown_dir)))
-                            logger.warning(f"元ファイルが見つからなかったため、フォールバックとして設定した相対パス: {original_filepath}")
-                        
-                        # デバッグ用に最終的な値をログ出力
-                        logger.info(f"最終的なoriginal_filepath: {original_filepath}")
-                except Exception as e:
-                    logger.error(f"元ファイルパスの取得中にエラーが発生しました: {e}")
-                    # エラーが発生した場合は、Markdownファイルの相対パスを設定
-                    original_filepath = os.path.relpath(file_path, os.path.dirname(markdown_dir))
-                
-                # デバッグ用にoriginal_filepathの値を確認
-                logger.debug(f"チャンク {i} のoriginal_filepath: {original_filepath}")
-                
-                # チャンクとその埋め込みベクトルをデータベースに保存
-                # original_filepathが必ず設定されていることを確認
-                if original_filepath is None or original_filepath == "":
-                    # 最終手段として、Markdownファイルの相対パスを設定
-                    original_filepath = os.path.relpath(file_path, os.path.dirname(os.path.dirname(markdown_dir)))
-                    logger.warning(f"original_filepathが未設定のため、最終的に相対パスを設定: {original_filepath}")
-                
-                # 文字列型であることを確認
-                if not isinstance(original_filepath, str):
-                    logger.error(f"original_filepathが文字列型ではありません: {type(original_filepath)}")
-                    original_filepath = str(original_filepath)
-                
-                # 空文字列でないことを確認
-                if not original_filepath.strip():
-                    logger.error("original_filepathが空文字列です")
-                    original_filepath = f"data/markdowns/{os.path.basename(file_path)}"
-                
-                # 保存前に最終確認
-                logger.info(f"データベースに保存するoriginal_filepath: '{original_filepath}'")
-                
-                # データベースに保存
-                try:
-                    chunk_id = vector_db.store_markdown_chunk(
-                        chunk_text=chunk,
-                        embedding=embedding,
-                        filename=os.path.basename(file_path),
-                        filepath=file_path,
-                        original_filepath=original_filepath,
-                        chunk_index=i
-                    )
-                    logger.info(f"チャンクを保存しました。ID: {chunk_id}, original_filepath: '{original_filepath}'")
-                except Exception as e:
-                    logger.error(f"チャンクの保存中にエラーが発生しました: {e}")
-                    # エラーの詳細情報を表示
-                    import traceback
-                    logger.error(traceback.format_exc())
-            
-            total_chunks += len(chunks)
-            logger.info(f"ファイル '{file_name}' を処理しました。{len(chunks)}個のチャンクを格納しました。")
-            
-        except Exception as e:
-            logger.error(f"ファイル '{file_path}' の処理中にエラーが発生しました: {e}")
+    # 読み込み・埋め込み・書き込みを並行して処理
+    try:
+        # チャンクは埋め込みモデルのトークナイザーで数えたトークン数で分割する（CHUNKER=characterの場合は文字数）
+        chunker = vector_db.get_token_chunker()
+        pipeline = IngestionPipeline(lambda file_path: prepare_markdown_chunks(file_path, markdown_dir, chunker), embedding_generator, vector_db)
+        stats = pipeline.run(new_files)
+        total_chunks = stats['chunks']
+        
+        # 作成したソースファイル索引をビルドマニフェストに保存し、次回の実行やサーバーで再利用する
+        persist_source_index(get_source_index(os.path.join(os.path.dirname(os.path.dirname(markdown_dir)), "source")))
+    finally:
+        # モデルの参照を解放（モデル自体はレジストリに保持され、次回の更新で再利用される）
+        get_model_registry().release(embedding_generator)
     
     logger.info(f"合計 {total_chunks} 個のチャンクを処理しました。")
     return vector_db
@@ -286,17 +289,21 @@ def update_rag_database(db_config: Dict[str, Any], vector_db: VectorDatabase, re
     if reset_table:
         logger.info("RAGデータベーステーブルをリセットします...")
         rag_db.reset_table()
+        
+        # ベクトルデータベースからデータを取り込む
+        logger.info("ベクトルデータベースからデータを取り込んでいます...")
+        doc_count = rag_db.build_from_vector_database()
+        logger.info(f"合計 {doc_count} 個のドキュメントを取り込みました。")
+        
+        # 検索インデックスの作成
+        logger.info("検索インデックスを作成しています...")
+        rag_db.create_search_index()
     else:
-        logger.info("既存のRAGデータベーステーブルを使用します。")
-    
-    # ベクトルデータベースからデータを取り込む
-    logger.info("ベクトルデータベースからデータを取り込んでいます...")
-    doc_count = rag_db.build_from_vector_database()
-    logger.info(f"合計 {doc_count} 個のドキュメントを取り込みました。")
-    
-    # 検索インデックスの作成
-    logger.info("検索インデックスを作成しています...")
-    rag_db.create_search_index()
+        # 差分だけを差分テーブルに取り込み、インデックスの再作成は閾値を超えた場合のみ行う
+        logger.info("既存のRAGデータベーステーブルにベクトルデータベースとの差分を取り込んでいます...")
+        stats = rag_db.sync_from_vector_database()
+        logger.info(f"追加 {stats['added']} 件、削除 {stats['removed']} 件、位置の更新 {stats['updated']} 件のドキュメントを反映しました。")
+        rag_db.compact_delta()
     
     return rag_db
 
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+差分統合モジュール
+
+RAGデータベースの差分テーブルとトゥームストーンを定期的にメインテーブルへ統合します。
+
+新しいチャンクはまず差分テーブルに書き込まれ、検索時にメインテーブルのインデックス検索の結果と
+マージされるため、取り込み直後から検索対象になります。差分テーブルが大きくなると全件検索のコストが
+増えるため、閾値を超えた時点でメインテーブルに統合し、検索インデックスを再作成します。
+"""
+
+import os
+import sys
+import argparse
+import threading
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.rag.rag_database import RAGDatabase
+from src.rag.database_updater import setup_db_config
+from src.utils.logger_util import setup_logger
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+
+class DeltaCompactor:
+    """
+    差分テーブルの統合をバックグラウンドで定期実行するクラス
+
+    検索処理と接続を共有しないよう、専用のRAGDatabase接続を使用します。
+
+    Attributes:
+        rag_db: 統合対象のRAGデータベース
+        interval_seconds: 統合の要否を確認する間隔（秒）
+    """
+
+    def __init__(self, rag_db: RAGDatabase, interval_seconds: float = 60.0):
+        """
+        DeltaCompactorの初期化
+
+        Args:
+            rag_db (RAGDatabase): 統合対象のRAGデータベース
+            interval_seconds (float): 統合の要否を確認する間隔（秒）
+        """
+        self.rag_db = rag_db
+        self.interval_seconds = interval_seconds
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self, force: bool = False) -> bool:
+        """
+        差分の統合を1回実行します。
+
+        Args:
+            force (bool): 閾値に関係なく統合するかどうか
+
+        Returns:
+            bool: 統合を実行したかどうか
+        """
+        try:
+            return self.rag_db.compact_delta(force=force)
+        except Exception as e:
+            logger.error(f"差分の統合中にエラーが発生しました: {e}", exc_info=True)
+            return False
+
+    def run(self) -> None:
+        """
+        停止されるまで一定間隔で差分の統合を実行します。
+        """
+        logger.info(f"差分の統合を {self.interval_seconds} 秒間隔で実行します（閾値: {self.rag_db.delta_threshold}）。")
+        while not self._stop_event.is_set():
+            self.run_once()
+            self._stop_event.wait(self.interval_seconds)
+        logger.info("差分の統合を停止しました。")
+
+    def start_background(self) -> threading.Thread:
+        """
+        差分の統合をバックグラウンドスレッドで開始します。
+
+        Returns:
+            threading.Thread: 統合処理を実行しているスレッド
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name="DeltaCompactorThread", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        バックグラウンドの統合処理を停止します。
+
+        Args:
+            timeout (Optional[float]): スレッドの終了を待つ最大時間（秒）
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def create_rag_database() -> RAGDatabase:
+    """
+    環境変数の設定からRAGデータベースの接続を作成します。
+
+    Returns:
+        RAGDatabase: RAGデータベース
+    """
+    db_config = setup_db_config()
+    db_config['dbname'] = os.getenv('RAG_DB', 'rag_db')
+    return RAGDatabase(db_config)
+
+
+def main():
+    """
+    メイン関数
+    """
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='RAGデータベース差分統合ツール')
+    parser.add_argument('--once', action='store_true', help='1回だけ統合して終了する')
+    parser.add_argument('--force', action='store_true', help='閾値に関係なく統合する')
+    parser.add_argument('--sync', action='store_true', help='統合の前にベクトルデータベースとの差分を取り込む')
+    parser.add_argument('--interval', type=float, default=float(os.getenv('RAG_DELTA_COMPACTION_INTERVAL', '60')),
+                        help='統合の要否を確認する間隔（秒） (デフォルト: 60)')
+    args = parser.parse_args()
+
+    rag_db = create_rag_database()
+    compactor = DeltaCompactor(rag_db, interval_seconds=args.interval)
+
+    try:
+        if args.sync:
+            rag_db.sync_from_vector_database()
+
+        if args.once:
+            compactor.run_once(force=args.force)
+            stats = rag_db.get_delta_stats()
+            print(f"差分テーブル: {stats['delta_rows']} 件、トゥームストーン: {stats['tombstones']} 件")
+        else:
+            compactor.run()
+    except KeyboardInterrupt:
+        logger.info("キーボード割り込みを受信しました。終了します。")
+    except Exception as e:
+        logger.error(f"エラーが発生しました: {e}", exc_info=True)
+        sys.exit(1)
+    finally:
+        rag_db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+埋め込みモデル移行モジュール
+
+検索を止めずに埋め込みモデルを切り替えるための機能を提供します。
+以下の手順で移行します：
+1. 新しいモデル用の埋め込みカラムをrag_documentsテーブルに追加（バージョン登録）
+2. 旧バージョンで検索を続けたまま、新しいカラムをバックグラウンドで少しずつ埋める
+3. 検索インデックスを作成し、バージョンをreadyにする
+4. バージョンを1つのトランザクションでアクティブに切り替える（カットオーバー）
+
+カットオーバー後は、RAGSystemがアクティブなバージョンのモデルでクエリを埋め込み、
+同じバージョンのカラムを検索します。
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from typing import Dict, Any, Optional
+
+from dotenv import load_dotenv
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.rag.rag_database import RAGDatabase
+from src.rag.database_updater import setup_db_config
+from src.utils.embedding_generator import EmbeddingGenerator
+from src.utils.embedding_scheduler import generate_bulk_embeddings
+from src.utils.model_registry import get_model_registry
+from src.utils.logger_util import setup_logger
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+
+class EmbeddingMigrator:
+    """
+    埋め込みモデルの移行を行うクラス
+
+    Attributes:
+        rag_db: 移行対象のRAGデータベース
+        model_name: 移行先の埋め込みモデル名
+        batch_size: 1回の埋め込み生成で処理するチャンク数
+        throttle_seconds: バッチ間の待機時間（秒）。検索処理への負荷を抑えるために使用します
+    """
+
+    def __init__(self,
+                 rag_db: RAGDatabase,
+                 model_name: str,
+                 batch_size: int = 64,
+                 throttle_seconds: float = 0.5,
+                 embedding_generator: Optional[EmbeddingGenerator] = None):
+        """
+        EmbeddingMigratorの初期化
+
+        Args:
+            rag_db (RAGDatabase): 移行対象のRAGデータベース
+            model_name (str): 移行先の埋め込みモデル名
+            batch_size (int): 1回の埋め込み生成で処理するチャンク数
+            throttle_seconds (float): バッチ間の待機時間（秒）
+            embedding_generator (Optional[EmbeddingGenerator]): 移行先モデルの埋め込み生成器。Noneの場合は必要時に生成
+        """
+        self.rag_db = rag_db
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.throttle_seconds = throttle_seconds
+        self.embedding_generator = embedding_generator
+        self._acquired_generator = False
+        self.version: Optional[Dict[str, Any]] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _init_embedding_generator(self) -> None:
+        """
+        移行先モデルの埋め込み生成器を初期化します
+        """
+        if self.embedding_generator is None:
+            logger.info(f"移行先の埋め込みモデル '{self.model_name}' を読み込んでいます...")
+            self.embedding_generator = get_model_registry().acquire(self.model_name)
+            self._acquired_generator = True
+
+    def _release_embedding_generator(self) -> None:
+        """
+        モデルレジストリから取得した埋め込み生成器の参照を解放します
+        """
+        if self._acquired_generator:
+            get_model_registry().release(self.embedding_generator)
+            self.embedding_generator = None
+            self._acquired_generator = False
+
+    def prepare(self) -> Dict[str, Any]:
+        """
+        移行先モデルのバージョンを登録します。既に登録済みの場合はそのバージョンを再利用します。
+
+        Returns:
+            Dict[str, Any]: 移行先のバージョン情報
+        """
+        self.rag_db.create_version_table()
+
+        version = self.rag_db.get_embedding_version(self.model_name)
+        if version is not None:
+            logger.info(f"登録済みの埋め込みバージョン {version['version_id']} (status: {version['status']}) を使用します。")
+            self.version = version
+            return version
+
+        self._init_embedding_generator()
+        version = self.rag_db.register_embedding_version(self.model_name, self.embedding_generator.dimension)
+        if version is None:
+            raise RuntimeError(f"埋め込みモデル '{self.model_name}' のバージョン登録に失敗しました")
+
+        self.version = version
+        return version
+
+    def fill(self, max_batches: Optional[int] = None) -> int:
+        """
+        移行先のカラムが未生成のチャンクを、バッチごとに埋め込んで書き込みます。
+
+        各バッチはコミットされるため、途中で停止しても次回は続きから再開できます。
+
+        Args:
+            max_batches (Optional[int]): 処理する最大バッチ数。Noneの場合は未生成のチャンクがなくなるまで処理
+
+        Returns:
+            int: 埋め込みを書き込んだチャンク数
+        """
+        if self.version is None:
+            self.prepare()
+        self._init_embedding_generator()
+
+        column_name = self.version['column_name']
+        remaining = self.rag_db.count_unembedded_chunks(column_name)
+        logger.info(f"カラム '{column_name}' の未生成チャンク数: {remaining}")
+
+        filled = 0
+        batches = 0
+        while not self._stop_event.is_set():
+            if max_batches is not None and batches >= max_batches:
+                break
+
+            rows = self.rag_db.fetch_unembedded_chunks(column_name, self.batch_size)
+            if not rows:
+                break
+
+            ids = [row[0] for row in rows]
+            texts = [row[1] for row in rows]
+            embeddings = generate_bulk_embeddings(self.embedding_generator, texts)
+            filled += self.rag_db.update_version_embeddings(column_name, list(zip(ids, embeddings)))
+            batches += 1
+
+            logger.info(f"カラム '{column_name}' に {filled}/{remaining} 件の埋め込みを書き込みました。")
+
+            # 検索処理への影響を抑えるため、バッチ間で待機する
+            if self.throttle_seconds > 0:
+                self._stop_event.wait(self.throttle_seconds)
+
+        return filled
+
+    def finalize(self) -> bool:
+        """
+        移行先のカラムに検索インデックスを作成し、バージョンをreadyにします。
+
+        未生成のチャンクが残っている場合は何もしません。
+
+        Returns:
+            bool: readyになったかどうか
+        """
+        if self.version is None:
+            self.prepare()
+
+        column_name = self.version['column_name']
+        remaining = self.rag_db.count_unembedded_chunks(column_name)
+        if remaining > 0:
+            logger.warning(f"カラム '{column_name}' に未生成のチャンクが {remaining} 件残っているため、readyにできません。")
+            return False
+
+        if self.version['status'] == 'building':
+            if not self.rag_db.create_search_index(column_name):
+                return False
+            self.rag_db.set_embedding_version_status(self.version['version_id'], 'ready')
+            self.version['status'] = 'ready'
+
+        logger.info(f"埋め込みバージョン {self.version['version_id']} の準備が完了しました。")
+        return True
+
+    def cutover(self) -> bool:
+        """
+        移行先のバージョンをアクティブに切り替えます。
+
+        切り替え直前に、移行中に追加されたチャンクの埋め込みを追いつかせます。
+        追いつかせるために取得した埋め込み生成器の参照は、終了時に解放します。
+
+        Returns:
+            bool: 切り替えに成功したかどうか
+        """
+        try:
+            self.fill()
+        finally:
+            self._release_embedding_generator()
+        if not self.finalize():
+            return False
+
+        if not self.rag_db.activate_embedding_version(self.version['version_id']):
+            return False
+
+        self.version['status'] = 'active'
+        logger.info(f"埋め込みモデルを '{self.model_name}' に切り替えました。")
+        logger.info("以降の取り込みでも同じモデルを使用するため、.envのEMBEDDING_MODELを更新してください。")
+        return True
+
+    def migrate(self, cutover: bool = False) -> bool:
+        """
+        登録、埋め込みの生成、インデックス作成を順に実行します。
+
+        Args:
+            cutover (bool): 完了後にアクティブなバージョンを切り替えるかどうか
+
+        Returns:
+            bool: 成功したかどうか
+        """
+        try:
+            self.prepare()
+            self.fill()
+        finally:
+            self._release_embedding_generator()
+        if self._stop_event.is_set():
+            logger.info("移行処理が停止されました。再実行すると続きから再開します。")
+            return False
+        if cutover:
+            return self.cutover()
+        return self.finalize()
+
+    def start_background(self, cutover: bool = False) -> threading.Thread:
+        """
+        移行処理をバックグラウンドスレッドで開始します。
+
+        Args:
+            cutover (bool): 完了後にアクティブなバージョンを切り替えるかどうか
+
+        Returns:
+            threading.Thread: 移行処理を実行しているスレッド
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        def run():
+            try:
+                self.migrate(cutover=cutover)
+            except Exception as e:
+                logger.error(f"バックグラウンドの埋め込み移行中にエラーが発生しました: {e}", exc_info=True)
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=run, name="EmbeddingMigratorThread", daemon=True)
+        self._thread.start()
+        logger.info(f"埋め込みモデル '{self.model_name}' への移行をバックグラウンドで開始しました。")
+        return self._thread
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        バックグラウンドの移行処理を停止します。処理中のバッチはコミットされてから停止します。
+
+        Args:
+            timeout (Optional[float]): スレッドの終了を待つ最大時間（秒）
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def main():
+    """
+    メイン関数
+    """
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='埋め込みモデル移行ツール')
+    subparsers = parser.add_subparsers(dest="command", help="実行するコマンド")
+
+    subparsers.add_parser("status", help="埋め込みバージョンの一覧を表示する")
+
+    migrate_parser = subparsers.add_parser("migrate", help="新しいモデルの埋め込みをバックグラウンドで生成する")
+    migrate_parser.add_argument('--model', type=str, required=True, help='移行先の埋め込みモデル名')
+    migrate_parser.add_argument('--batch-size', type=int, default=64, help='1バッチあたりのチャンク数 (デフォルト: 64)')
+    migrate_parser.add_argument('--throttle', type=float, default=0.5, help='バッチ間の待機時間（秒） (デフォルト: 0.5)')
+    migrate_parser.add_argument('--cutover', action='store_true', help='完了後にアクティブなバージョンを切り替える')
+
+    cutover_parser = subparsers.add_parser("cutover", help="準備済みのモデルにアクティブなバージョンを切り替える")
+    cutover_parser.add_argument('--model', type=str, required=True, help='切り替え先の埋め込みモデル名')
+
+    drop_parser = subparsers.add_parser("drop", help="退役したバージョンのカラムを削除する")
+    drop_parser.add_argument('--version-id', type=int, required=True, help='削除するバージョンID')
+
+    args = parser.parse_args()
+
+    db_config = setup_db_config()
+    db_config['dbname'] = os.getenv('RAG_DB', 'rag_db')
+    rag_db = RAGDatabase(db_config)
+
+    try:
+        if args.command == "status":
+            rag_db.create_version_table()
+            for version in rag_db.list_embedding_versions():
+                print(f"{version['version_id']}: {version['model_name']} "
+                      f"(カラム: {version['column_name']}, 次元数: {version['dimension']}, status: {version['status']})")
+        elif args.command == "migrate":
+            migrator = EmbeddingMigrator(rag_db, args.model, batch_size=args.batch_size, throttle_seconds=args.throttle)
+            if not migrator.migrate(cutover=args.cutover):
+                sys.exit(1)
+        elif args.command == "cutover":
+            migrator = EmbeddingMigrator(rag_db, args.model)
+            if not migrator.cutover():
+                sys.exit(1)
+        elif args.command == "drop":
+            if not rag_db.drop_embedding_version(args.version_id):
+                sys.exit(1)
+        else:
+            parser.print_help()
+            sys.exit(1)
+    except Exception as e:
+        logger.error(f"エラーが発生しました: {e}", exc_info=True)
+        sys.exit(1)
+    finally:
+        rag_db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+インクリメンタルビルドモジュール
+
+ソース → Markdown → ベクトル → RAG の依存関係をビルドマニフェストで追跡し、
+変更された入力から下流の成果物だけを作り直します。
+ソースファイルが削除された場合は、生成したMarkdown、ベクトルデータベースのチャンク、
+RAGデータベースのドキュメントを順に削除します。
+
+使用例:
+    uv run python -m src.rag.incremental_build --dry-run
+    uv run python -m src.rag.incremental_build
+"""
+
+import os
+import sys
+import time
+import glob
+import hashlib
+import pathlib
+import argparse
+from typing import Any, Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.rag.build_manifest import (
+    BuildManifest, STAGE_MARKDOWN, STAGE_VECTORS, STAGE_RAG, REASON_PARAMS_CHANGED, file_content_hash
+)
+from src.rag.conversion_pipeline import ConversionPipeline
+from src.rag.markdowns_maker import markdown_build_params, plan_documents
+from src.rag.vector_database import VectorDatabase
+from src.rag.rag_database import RAGDatabase
+from src.rag.source_index import get_source_index, persist_source_index
+from src.rag.database_updater import setup_db_config
+from src.utils.logger_util import setup_logger
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+
+def _ids_fingerprint(ids: List[int]) -> str:
+    """
+    チャンクのidのリストのハッシュを返します。RAG段階の入力の比較に使用します。
+    """
+    return hashlib.sha256(",".join(map(str, ids)).encode("utf-8")).hexdigest()
+
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    """
+    推定時間を表示用の文字列にします。
+    """
+    if seconds is None:
+        return "推定不可（実績なし）"
+    if seconds >= 60:
+        return f"約{seconds / 60:.1f}分"
+    return f"約{seconds:.0f}秒"
+
+
+class IncrementalBuilder:
+    """
+    インクリメンタルビルドを行うクラス
+
+    各段階の入力（ソースファイル、Markdownファイル、ベクトルデータベースのチャンク）を
+    ビルドマニフェストの記録と比較し、古くなったものだけを処理します。
+
+    Attributes:
+        manifest: ビルドマニフェスト
+        vector_db: ベクトルデータベース
+        source_dir: ソースディレクトリ
+        markdown_dir: Markdownディレクトリ
+    """
+
+    def __init__(self,
+                 vector_db_config: Dict[str, Any],
+                 rag_db_config: Dict[str, Any],
+                 source_dir: str = "./data/source",
+                 markdown_dir: str = "./data/markdowns",
+                 manifest: Optional[BuildManifest] = None,
+                 model: str = "gemma3:12b",
+                 temperature: float = 0.0,
+                 num_ctx: int = 2048,
+                 num_predict: int = 1024,
+                 chunk_size: int = 500,
+                 chunk_overlap: int = 100,
+                 workers: int = 1):
+        """
+        インクリメンタルビルドの初期化
+
+        Args:
+            vector_db_config (Dict[str, Any]): ベクトルデータベース接続設定
+            rag_db_config (Dict[str, Any]): RAGデータベース接続設定
+            source_dir (str): ソースディレクトリ
+            markdown_dir (str): Markdownディレクトリ
+            manifest (Optional[BuildManifest]): ビルドマニフェスト。Noneの場合は既定のパスから読み込み
+            model (str): Markdownの整形に使用するLLMモデル
+            temperature (float): LLMの温度
+            num_ctx (int): LLMのコンテキスト長
+            num_predict (int): LLMの最大生成トークン数
+            chunk_size (int): チャンクのサイズ
+            chunk_overlap (int): チャンクの重複サイズ
+            workers (int): 埋め込みベクトル生成のワーカープロセス数
+        """
+        self.manifest = manifest or BuildManifest()
+        self.source_dir = source_dir
+        self.markdown_dir = os.path.abspath(markdown_dir)
+        self.rag_db_config = rag_db_config
+        self.vector_db_config = vector_db_config
+        self.dimension = int(os.getenv('EMBEDDING_DIMENSION', '1024'))
+        self.model = model
+        self.temperature = temperature
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.vector_db = VectorDatabase(
+            db_config=vector_db_config,
+            dimension=self.dimension,
+            markdown_dir=self.markdown_dir,
+            model_name=os.getenv('EMBEDDING_MODEL', "intfloat/multilingual-e5-large"),
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            workers=workers
+        )
+
+    @property
+    def markdown_params(self) -> str:
+        """
+        Markdownの内容に影響する設定
+        """
+        return markdown_build_params(self.model, self.temperature, self.num_ctx, self.num_predict)
+
+    def _markdown_files(self) -> Set[str]:
+        """
+        Markdownディレクトリ内の.mdファイルの絶対パスを返します。
+        """
+        return {str(pathlib.Path(f).absolute()) for f in glob.glob(os.path.join(self.markdown_dir, "**/*.md"), recursive=True)}
+
+    def _plan_vectors(self, pending_outputs: Set[str], removed_outputs: Set[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        ベクトル化し直すMarkdownファイルと、チャンクを削除するMarkdownファイルを求めます。
+
+        マニフェストに記録がなく、ベクトルデータベースに格納済みのファイルは、格納済みのチャンクのidを
+        マニフェストに登録します（マニフェスト導入前に格納したファイルを再処理しないため）。
+
+        Args:
+            pending_outputs (Set[str]): Markdown段階で作り直される予定のファイル（ドライラン用）
+            removed_outputs (Set[str]): Markdown段階で削除される予定のファイル（ドライラン用）
+
+        Returns:
+            build（path、reason、bytes）とdelete（key、outputs）の辞書
+        """
+        current = (self._markdown_files() - removed_outputs) | pending_outputs
+        processed = set(self.vector_db.get_processed_files())
+        params = self.vector_db.build_params
+
+        plan: Dict[str, List[Dict[str, Any]]] = {'build': [], 'delete': []}
+        for key in sorted(current):
+            size = os.path.getsize(key) if os.path.exists(key) else 0
+            if key in pending_outputs:
+                plan['build'].append({'path': key, 'reason': "上流の変更", 'bytes': size})
+                continue
+
+            entry = self.manifest.get(STAGE_VECTORS, key)
+            if entry is None and key in processed:
+                self.manifest.record(STAGE_VECTORS, key, key, self.vector_db.get_file_vector_ids(key), params)
+                continue
+
+            reason = self.manifest.check(STAGE_VECTORS, key, key, params)
+            if reason is not None:
+                plan['build'].append({'path': key, 'reason': reason, 'bytes': size})
+
+        for key in self.manifest.keys(STAGE_VECTORS):
+            if key not in current:
+                plan['delete'].append({'key': key, 'outputs': self.manifest.get(STAGE_VECTORS, key)['outputs']})
+
+        # マニフェスト導入前に削除されたMarkdownファイルのチャンクも削除する
+        recorded = set(self.manifest.keys(STAGE_VECTORS))
+        for key in sorted(processed - current - recorded):
+            if key.startswith(self.markdown_dir + os.sep):
+                plan['delete'].append({'key': key, 'outputs': []})
+        return plan
+
+    def _rag_is_stale(self) -> bool:
+        """
+        RAGデータベースに取り込んだチャンクが、ベクトルデータベースのチャンクと異なるかを判定します。
+        """
+        vector_nodes = self.manifest.nodes[STAGE_VECTORS]
+        rag_nodes = self.manifest.nodes[STAGE_RAG]
+        if set(vector_nodes) != set(rag_nodes):
+            return True
+        return any(rag_nodes[key].get('hash') != _ids_fingerprint(entry['outputs']) for key, entry in vector_nodes.items())
+
+    def plan(self) -> Dict[str, Any]:
+        """
+        ビルドで行う処理を求めます。データベースとファイルは変更しません
+        （マニフェスト導入前の成果物の登録と、更新日時だけが変わったファイルの記録の更新は行います）。
+
+        Returns:
+            Dict[str, Any]: markdown、vectors、rag（sync: RAGデータベースを同期するかどうか）、estimate（推定コスト）
+        """
+        markdown_plan = plan_documents(self.source_dir, self.markdown_dir, self.manifest, self.markdown_params)
+        pending_outputs = {str(item['output'].absolute()) for item in markdown_plan['build']}
+        removed_outputs = {output for item in markdown_plan['delete'] for output in item['outputs']}
+        vectors_plan = self._plan_vectors(pending_outputs, removed_outputs)
+        rag_sync = bool(vectors_plan['build'] or vectors_plan['delete']) or self._rag_is_stale()
+
+        markdown_bytes = sum(item['bytes'] for item in markdown_plan['build'])
+        vector_bytes = sum(item['bytes'] for item in vectors_plan['build'])
+        estimate = {
+            'markdown_bytes': markdown_bytes,
+            'markdown_seconds': self.manifest.estimate_seconds(STAGE_MARKDOWN, markdown_bytes) if markdown_bytes else 0.0,
+            'vector_bytes': vector_bytes,
+            'vector_seconds': self.manifest.estimate_seconds(STAGE_VECTORS, vector_bytes) if vector_bytes else 0.0,
+            'upstream_files': len(pending_outputs),
+        }
+        return {'markdown': markdown_plan, 'vectors': vectors_plan, 'rag': {'sync': rag_sync}, 'estimate': estimate}
+
+    def _build_markdown(self, markdown_plan: Dict[str, List[Dict[str, Any]]], stats: Dict[str, int]) -> None:
+        """
+        Markdown段階を実行します。削除されたソースファイルのMarkdownを削除し、古くなったファイルを変換し直します。
+        """
+        for item in markdown_plan['delete']:
+            for output in item['outputs']:
+                if os.path.exists(output):
+                    os.remove(output)
+                    logger.info(f"ソースファイルが削除されたため、Markdownファイル '{output}' を削除しました。")
+            self.manifest.remove(STAGE_MARKDOWN, item['key'])
+            stats['markdown_deleted'] += 1
+
+        def on_file_done(item: Dict[str, Any], output_file: pathlib.Path) -> None:
+            key = str(item['path'].resolve())
+            # 出力先が変わった場合は古いMarkdownを削除する
+            output = str(output_file.absolute())
+            previous = self.manifest.get(STAGE_MARKDOWN, key)
+            for old_output in (previous or {}).get('outputs', []):
+                if old_output != output and os.path.exists(old_output):
+                    os.remove(old_output)
+            self.manifest.record(STAGE_MARKDOWN, key, str(item['path']), [output], self.markdown_params)
+            stats['markdown_built'] += 1
+
+        if not markdown_plan['build']:
+            return
+        for item in markdown_plan['build']:
+            logger.info(f"ソースファイル '{item['path']}' をMarkdownに変換します（{item['reason']}）")
+        pipeline = ConversionPipeline(self.model, self.temperature, self.num_ctx, self.num_predict)
+        conversion_stats = pipeline.run(markdown_plan['build'], self.markdown_params, on_file_done)
+        self.manifest.record_cost(STAGE_MARKDOWN, conversion_stats['bytes'], conversion_stats['seconds'])
+        stats['failed'] += conversion_stats['failed']
+
+    def _build_vectors(self, vectors_plan: Dict[str, List[Dict[str, Any]]], stats: Dict[str, int]) -> None:
+        """
+        ベクトル段階を実行します。削除されたMarkdownファイルのチャンクを削除し、古くなったファイルのチャンクを置き換えます。
+        """
+        for item in vectors_plan['delete']:
+            count = self.vector_db.delete_file_vectors(item['key'])
+            self.manifest.remove(STAGE_VECTORS, item['key'])
+            logger.info(f"Markdownファイル '{item['key']}' が削除されたため、{count} 個のチャンクを削除しました。")
+            stats['vector_files_deleted'] += 1
+
+        params = self.vector_db.build_params
+        for item in vectors_plan['build']:
+            path = item['path']
+            logger.info(f"Markdownファイル '{path}' をベクトル化しています（{item['reason']}）...")
+            try:
+                started = time.perf_counter()
+                # 処理中にファイルが変更された場合に次回のビルドで検出できるよう、処理前の内容のハッシュを記録する
+                content_hash = file_content_hash(path)
+                # 内容が変わっていないチャンクは埋め込みベクトルを再利用する（設定変更の場合は生成し直す）
+                ids = self.vector_db.update_file_chunks(path, reuse_embeddings=(item['reason'] != REASON_PARAMS_CHANGED))
+                self.manifest.record_cost(STAGE_VECTORS, item['bytes'], time.perf_counter() - started)
+                self.manifest.record(STAGE_VECTORS, path, path, ids, params, content_hash)
+                stats['vector_files_built'] += 1
+                stats['chunks'] += len(ids)
+            except Exception as e:
+                logger.error(f"Markdownファイル '{path}' のベクトル化中にエラーが発生しました: {e}")
+                stats['failed'] += 1
+
+    def _build_rag(self) -> Dict[str, int]:
+        """
+        RAG段階を実行します。ベクトルデータベースとの差分をRAGデータベースに取り込みます。
+        """
+        rag_db = RAGDatabase(db_config=self.rag_db_config, dimension=self.dimension, vector_db_config=self.vector_db_config)
+        try:
+            sync_stats = rag_db.sync_from_vector_database()
+            rag_db.compact_delta()
+        finally:
+            rag_db.disconnect()
+
+        self.manifest.nodes[STAGE_RAG] = {}
+        for key, entry in self.manifest.nodes[STAGE_VECTORS].items():
+            self.manifest.record(STAGE_RAG, key, None, entry['outputs'], content_hash=_ids_fingerprint(entry['outputs']))
+        return sync_stats
+
+    def build(self, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        古くなった成果物だけを作り直します。
+
+        Args:
+            dry_run (bool): Trueの場合は処理内容を求めるだけで、ビルドは行いません
+
+        Returns:
+            Dict[str, Any]: dry_runの場合はplan()の結果、それ以外は処理件数
+        """
+        plan = self.plan()
+        if dry_run:
+            return plan
+
+        stats = {'markdown_built': 0, 'markdown_deleted': 0, 'vector_files_built': 0, 'vector_files_deleted': 0,
+                 'chunks': 0, 'rag_added': 0, 'rag_removed': 0, 'rag_updated': 0, 'failed': 0}
+        try:
+            # 1. ソース → Markdown
+            self._build_markdown(plan['markdown'], stats)
+            self.manifest.save()
+
+            # 2. Markdown → ベクトル（Markdown段階の結果を反映して求め直す）
+            self.vector_db.create_table()
+            vectors_plan = self._plan_vectors(set(), set())
+            try:
+                self._build_vectors(vectors_plan, stats)
+            finally:
+                self.vector_db.close_embedding_generator()
+            self.manifest.save()
+
+            # 3. ベクトル → RAG
+            if vectors_plan['build'] or vectors_plan['delete'] or self._rag_is_stale():
+                sync_stats = self._build_rag()
+                stats['rag_added'] = sync_stats['added']
+                stats['rag_removed'] = sync_stats['removed']
+                stats['rag_updated'] = sync_stats['updated']
+            else:
+                logger.info("RAGデータベースは最新です。")
+        finally:
+            # 元ファイルの検索に使用したソースファイル索引も保存し、次回のビルドやサーバーで再利用する
+            persist_source_index(get_source_index(os.path.join(os.path.dirname(self.markdown_dir), "source")), self.manifest)
+            self.manifest.save()
+            self.vector_db.disconnect()
+
+        logger.info(f"ビルドが完了しました: {stats}")
+        return stats
+
+
+def format_build_plan(plan: Dict[str, Any]) -> str:
+    """
+    ドライランの結果を表示用の文字列にします。
+
+    Args:
+        plan (Dict[str, Any]): IncrementalBuilder.plan()の結果
+
+    Returns:
+        str: 表示用の文字列
+    """
+    lines = ["[ソース → Markdown]"]
+    for item in plan['markdown']['build']:
+        lines.append(f"  変換: {item['path']} ({item['reason']}, {item['bytes']:,} バイト)")
+    for item in plan['markdown']['delete']:
+        lines.append(f"  削除: {item['key']} → {', '.join(item['outputs'])}")
+
+    lines.append("[Markdown → ベクトル]")
+    for item in plan['vectors']['build']:
+        lines.append(f"  ベクトル化: {item['path']} ({item['reason']})")
+    for item in plan['vectors']['delete']:
+        lines.append(f"  チャンク削除: {item['key']} ({len(item['outputs'])} 件)")
+
+    lines.append("[ベクトル → RAG]")
+    lines.append("  差分を同期" if plan['rag']['sync'] else "  最新")
+
+    estimate = plan['estimate']
+    lines.append("[推定コスト]")
+    lines.append(f"  Markdown変換: {len(plan['markdown']['build'])} ファイル, {estimate['markdown_bytes']:,} バイト, "
+                 f"{_format_seconds(estimate['markdown_seconds'])}")
+    vector_note = f"（うち {estimate['upstream_files']} ファイルは変換後のサイズで決まるため含まない）" if estimate['upstream_files'] else ""
+    lines.append(f"  ベクトル化: {len(plan['vectors']['build'])} ファイル, {estimate['vector_bytes']:,} バイト, "
+                 f"{_format_seconds(estimate['vector_seconds'])}{vector_note}")
+    return "\n".join(lines)
+
+
+def main():
+    """
+    メイン関数
+    """
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='変更されたファイルだけをMarkdown化・ベクトル化し、RAGデータベースに反映します')
+    parser.add_argument('--dry-run', action='store_true', help='作り直す対象と推定コストを表示するだけで、ビルドは行わない')
+    parser.add_argument('--source-dir', type=str, default=os.getenv('SOURCE_DIR', './data/source'),
+                        help='ソースディレクトリ (デフォルト: 環境変数SOURCE_DIRまたは./data/source)')
+    parser.add_argument('--markdown-dir', type=str, default=os.getenv('MD_DIR', './data/markdowns'),
+                        help='Markdownファイルのディレクトリパス (デフォルト: 環境変数MD_DIRまたは./data/markdowns)')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='ビルドマニフェストのパス (デフォルト: 環境変数BUILD_MANIFEST_PATHまたは./data/build_manifest.json)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('EMBEDDING_WORKERS', '1')),
+                        help='埋め込みベクトル生成のワーカープロセス数 (デフォルト: 環境変数EMBEDDING_WORKERS、未設定の場合は1)')
+    args = parser.parse_args()
+
+    vector_db_config = setup_db_config()
+    vector_db_config['dbname'] = os.getenv('VECTOR_DB', 'vector_db')
+    rag_db_config = setup_db_config()
+    rag_db_config['dbname'] = os.getenv('RAG_DB', 'rag_db')
+
+    builder = IncrementalBuilder(
+        vector_db_config,
+        rag_db_config,
+        source_dir=args.source_dir,
+        markdown_dir=args.markdown_dir,
+        manifest=BuildManifest(args.manifest),
+        model=os.getenv('LLM_MODEL', 'gemma3:12b'),
+        workers=args.workers
+    )
+
+    try:
+        if args.dry_run:
+            print(format_build_plan(builder.build(dry_run=True)))
+        else:
+            builder.build()
+    except Exception as e:
+        logger.error(f"ビルド中にエラーが発生しました: {e}", exc_info=True)
+        sys.exit(1)
+    finally:
+        builder.vector_db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
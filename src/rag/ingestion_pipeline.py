@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+取り込みパイプラインモジュール
+
+Markdownファイルの読み込み・クリーニング・チャンク化、埋め込みベクトルの生成、データベースへの書き込みを
+上限付きのキューでつないだ段階として並行に実行します。
+
+- 読み込み段階: スレッドプールでファイルの読み込みとチャンク化を行い、ページごとのチャンクを順に下流に渡します
+- 埋め込み段階: 複数のファイル・ページのチャンクをまとめたバッチで埋め込みベクトルを生成します
+- 書き込み段階: 呼び出し元のスレッドで複数行のINSERTを行い、一定の行数ごとにファイルの区切りでコミットします
+
+キューが一杯になると上流の段階は待機するため、埋め込みや書き込みが遅い場合でもメモリ使用量は一定に保たれます。
+大きなファイルも全てのチャンクを読み込む前に埋め込みと書き込みを始めます。
+"""
+
+import os
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.utils.embedding_scheduler import generate_bulk_embeddings
+from src.utils.logger_util import setup_logger
+
+# 段階の終了を表す値
+_END = object()
+
+
+class IngestionPipeline:
+    """
+    段階的に並行実行する取り込みパイプライン
+
+    Attributes:
+        io_workers: 読み込み段階のスレッド数
+        embed_batch_size: 1回の埋め込み生成でまとめるチャンク数
+        commit_rows: コミットする行数の目安（ファイルの途中ではコミットしません）
+        queue_size: 段階の間のキューの大きさ
+    """
+
+    def __init__(self,
+                 prepare: Callable[[str], Iterable[List[Dict[str, Any]]]],
+                 embedding_generator: Any,
+                 vector_db: Any,
+                 io_workers: Optional[int] = None,
+                 embed_batch_size: Optional[int] = None,
+                 commit_rows: Optional[int] = None,
+                 queue_size: Optional[int] = None):
+        """
+        IngestionPipelineのコンストラクタ
+
+        Args:
+            prepare: ファイルパスを受け取り、埋め込みベクトル以外を設定したチャンクのリストをページなどの単位で順に返す関数（読み込み段階で呼び出されます）
+            embedding_generator: generate_embeddings()を持つ埋め込みベクトル生成器（EmbeddingGeneratorまたはEmbeddingPool）
+            vector_db: チャンクを書き込むVectorDatabase
+            io_workers: 読み込み段階のスレッド数（Noneの場合は環境変数INGESTION_IO_WORKERS、未設定の場合は4）
+            embed_batch_size: 1回の埋め込み生成でまとめるチャンク数（Noneの場合は環境変数INGESTION_EMBED_BATCH_SIZE、未設定の場合は256）
+            commit_rows: コミットする行数の目安（Noneの場合は環境変数INGESTION_COMMIT_ROWS、未設定の場合は1000）
+            queue_size: 段階の間のキューの大きさ（Noneの場合は環境変数INGESTION_QUEUE_SIZE、未設定の場合は8）
+        """
+        self.logger = setup_logger("ingestion_pipeline")
+        self.prepare = prepare
+        self.embedding_generator = embedding_generator
+        self.vector_db = vector_db
+        self.io_workers = max(1, io_workers or int(os.getenv('INGESTION_IO_WORKERS', '4')))
+        self.embed_batch_size = max(1, embed_batch_size or int(os.getenv('INGESTION_EMBED_BATCH_SIZE', '256')))
+        self.commit_rows = max(1, commit_rows or int(os.getenv('INGESTION_COMMIT_ROWS', '1000')))
+        self.queue_size = max(1, queue_size or int(os.getenv('INGESTION_QUEUE_SIZE', '8')))
+
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def _put(self, target: queue.Queue, item: Any) -> bool:
+        """
+        キューに格納します。キューが一杯の場合は空くまで待ちますが、パイプラインが停止した場合は諦めます。
+
+        Returns:
+            格納できたかどうか
+        """
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue) -> Any:
+        """
+        キューから取り出します。パイプラインが停止した場合は_ENDを返します。
+        """
+        while not self._stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _fail(self, error: BaseException) -> None:
+        """
+        最初に発生したエラーを記録し、全ての段階を停止します。
+        """
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _read_worker(self, paths: "queue.Queue[str]", prepared: queue.Queue) -> None:
+        """
+        読み込み段階: ファイルを読み込んでチャンク化し、prepareが返す単位ごとに下流に渡します。
+
+        下流には (ファイルパス, チャンク, ファイルの最後の部分かどうか) を渡します。
+        最後の部分を判定するため1つ先まで読み込みます。失敗したファイルはチャンクをNoneとして渡します。
+        """
+        try:
+            while not self._stop.is_set():
+                try:
+                    file_path = paths.get_nowait()
+                except queue.Empty:
+                    break
+                if not self._read_file(file_path, prepared):
+                    break
+        finally:
+            self._put(prepared, _END)
+
+    def _read_file(self, file_path: str, prepared: queue.Queue) -> bool:
+        """
+        1ファイルのチャンクを下流に渡します。
+
+        Returns:
+            パイプラインが停止せずに渡し終えたかどうか
+        """
+        previous: Optional[List[Dict[str, Any]]] = None
+        try:
+            for chunks in self.prepare(file_path):
+                if previous is not None and not self._put(prepared, (file_path, previous, False)):
+                    return False
+                previous = chunks
+        except Exception as e:
+            self.logger.error(f"ファイル '{file_path}' の読み込み中にエラーが発生しました: {e}")
+            return self._put(prepared, (file_path, None, True))
+        return self._put(prepared, (file_path, previous if previous is not None else [], True))
+
+    def _embed_worker(self, prepared: queue.Queue, embedded: queue.Queue) -> None:
+        """
+        埋め込み段階: 複数のファイルのチャンクをまとめて埋め込みベクトルを生成し、ファイルごとの部分に分けて下流に渡します。
+        """
+        finished_readers = 0
+        # (ファイルパス, チャンク, ファイルの最後の部分かどうか)
+        parts: List[Tuple[str, Optional[List[Dict[str, Any]]], bool]] = []
+        pending = 0
+        try:
+            while finished_readers < self.io_workers:
+                item = self._get(prepared)
+                if item is _END:
+                    if self._stop.is_set():
+                        return
+                    finished_readers += 1
+                    continue
+
+                file_path, chunks, is_last = item
+                if not chunks:
+                    # 失敗したファイル（None）と空のファイルは、同じファイルの前の部分より先に届かないよう順番を保って渡す
+                    parts.append((file_path, chunks, is_last))
+                    continue
+
+                start = 0
+                while start < len(chunks):
+                    size = min(len(chunks) - start, self.embed_batch_size - pending)
+                    parts.append((file_path, chunks[start:start + size], is_last and start + size == len(chunks)))
+                    pending += size
+                    start += size
+                    if pending >= self.embed_batch_size:
+                        self._embed_parts(parts, embedded)
+                        parts, pending = [], 0
+
+            if parts:
+                self._embed_parts(parts, embedded)
+        except Exception as e:
+            self.logger.error(f"埋め込みベクトルの生成中にエラーが発生しました: {e}", exc_info=True)
+            self._fail(e)
+        finally:
+            self._put(embedded, _END)
+
+    def _embed_parts(self, parts: List[Tuple[str, Optional[List[Dict[str, Any]]], bool]], embedded: queue.Queue) -> None:
+        """
+        1バッチ分のチャンクの埋め込みベクトルを生成して下流に渡します。
+        """
+        texts = [chunk['chunk_text'] for _, chunks, _ in parts for chunk in chunks or []]
+        embeddings = generate_bulk_embeddings(self.embedding_generator, texts) if texts else []
+        offset = 0
+        for file_path, chunks, is_last in parts:
+            for chunk, embedding in zip(chunks or [], embeddings[offset:offset + len(chunks or [])]):
+                chunk['embedding'] = embedding
+            offset += len(chunks or [])
+            if not self._put(embedded, (file_path, chunks, is_last)):
+                return
+
+    def run(self, file_paths: List[str],
+            on_file_done: Optional[Callable[[str, List[int]], None]] = None) -> Dict[str, Any]:
+        """
+        ファイルを取り込みます。書き込み段階は呼び出し元のスレッドで実行します。
+
+        コミットはファイルの区切りでのみ行うため、中断した場合でも途中までのチャンクだけが格納されたファイルは残りません。
+
+        Args:
+            file_paths: 取り込むファイルのパス
+            on_file_done: ファイルのチャンクをコミットした後に (ファイルパス, チャンクのIDリスト) で呼び出す関数
+
+        Returns:
+            Dict[str, Any]: files（取り込んだファイル数）、chunks（格納したチャンク数）、failed（失敗したファイル数）、seconds（処理時間）
+
+        Raises:
+            Exception: 埋め込みベクトルの生成または書き込みに失敗した場合（未コミットの行はロールバック済み）
+        """
+        started = time.perf_counter()
+        stats: Dict[str, Any] = {'files': 0, 'chunks': 0, 'failed': 0, 'seconds': 0.0}
+        if not file_paths:
+            return stats
+
+        self._stop.clear()
+        self._error = None
+        paths: "queue.Queue[str]" = queue.Queue()
+        for file_path in file_paths:
+            paths.put(file_path)
+        prepared: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        embedded: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._read_worker, args=(paths, prepared), name=f"ingestion-read-{i}", daemon=True)
+            for i in range(self.io_workers)
+        ]
+        threads.append(threading.Thread(target=self._embed_worker, args=(prepared, embedded), name="ingestion-embed", daemon=True))
+        for thread in threads:
+            thread.start()
+
+        # コミット待ちのファイルと、途中まで書き込んだファイル
+        uncommitted: List[Tuple[str, List[int]]] = []
+        file_ids: Dict[str, List[int]] = {}
+        rows_since_commit = 0
+
+        def commit() -> None:
+            nonlocal uncommitted, rows_since_commit
+            self.vector_db.commit()
+            if on_file_done is not None:
+                for file_path, ids in uncommitted:
+                    on_file_done(file_path, ids)
+            uncommitted, rows_since_commit = [], 0
+
+        try:
+            while True:
+                item = self._get(embedded)
+                if item is _END:
+                    break
+                file_path, chunks, is_last = item
+                if chunks is None:
+                    # 途中まで書き込んだファイルは、未コミットの行を削除して他のファイルだけをコミットする
+                    partial_ids = file_ids.pop(file_path, [])
+                    if partial_ids:
+                        self.vector_db.delete_chunk_rows(partial_ids, commit=False)
+                        rows_since_commit -= len(partial_ids)
+                        stats['chunks'] -= len(partial_ids)
+                    stats['failed'] += 1
+                    continue
+
+                ids = self.vector_db.insert_chunk_rows(chunks, commit=False) if chunks else []
+                file_ids.setdefault(file_path, []).extend(ids)
+                rows_since_commit += len(ids)
+                stats['chunks'] += len(ids)
+                if not is_last:
+                    continue
+
+                stats['files'] += 1
+                uncommitted.append((file_path, file_ids.pop(file_path)))
+                self.logger.info(f"ファイル '{file_path}' の {len(uncommitted[-1][1])} 個のチャンクを書き込みました。")
+                if rows_since_commit >= self.commit_rows and not file_ids:
+                    commit()
+
+            if self._error is not None:
+                raise self._error
+            commit()
+        except BaseException as e:
+            self._fail(e)
+            self.vector_db.rollback()
+            raise
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            stats['seconds'] = time.perf_counter() - started
+
+        self.logger.info(f"取り込みが完了しました: {stats['files']} ファイル、{stats['chunks']} チャンク、"
+                         f"失敗 {stats['failed']} ファイル（{stats['seconds']:.1f}秒）")
+        return stats
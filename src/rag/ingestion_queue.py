@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+分散取り込みキューモジュール
+
+Markdownファイルのベクトル化を複数のワーカー（複数ホスト可）で並行して行うための
+PostgreSQLベースのジョブキューを提供します。
+1ファイルが1ジョブに対応し、ワーカーは SELECT ... FOR UPDATE SKIP LOCKED でジョブを取得します。
+ジョブにはリース期限があり、ワーカーが停止して期限切れになったジョブは自動的に再試行されます。
+
+ワーカーは全ホストで同じパスにMarkdownディレクトリをマウントしてください。
+ジョブにはMarkdownディレクトリからの相対パスが記録され、各ワーカーが自身のディレクトリで解決します。
+"""
+
+import os
+import sys
+import glob
+import time
+import socket
+import pathlib
+import argparse
+import threading
+from typing import Dict, Any, List, Optional
+
+from dotenv import load_dotenv
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.rag.base_database import BaseDatabase
+from src.rag.vector_database import VectorDatabase
+from src.rag.database_updater import setup_db_config
+from src.utils.logger_util import setup_logger
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+
+class IngestionQueue(BaseDatabase):
+    """
+    取り込みジョブを管理するキュー
+
+    ベクトルデータベースと同じデータベースにingestion_jobsテーブルを作成します。
+    ジョブの状態は pending → running → done / failed と遷移します。
+    """
+
+    def __init__(self, db_config: Dict[str, Any], max_attempts: int = 3):
+        """
+        取り込みキューの初期化
+
+        Args:
+            db_config (dict): データベース接続設定
+            max_attempts (int): 1ジョブあたりの最大試行回数
+        """
+        super().__init__(db_config)
+        self.logger = setup_logger(self.__class__.__name__)
+        self.table_name = "ingestion_jobs"
+        self.max_attempts = max_attempts
+
+    def create_table(self) -> None:
+        """
+        ジョブテーブルを作成します。
+        """
+        query = f'''
+        CREATE TABLE IF NOT EXISTS {self.table_name} (
+            id SERIAL PRIMARY KEY,
+            relative_path TEXT NOT NULL UNIQUE,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT {int(self.max_attempts)},
+            lease_owner TEXT,
+            lease_expires_at TIMESTAMP,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        '''
+        self.execute_query(query, fetch=False)
+        self.execute_query(
+            f"CREATE INDEX IF NOT EXISTS {self.table_name}_state_idx ON {self.table_name} (state, lease_expires_at);",
+            fetch=False
+        )
+        self.logger.info(f"テーブル '{self.table_name}' を作成しました。")
+
+    def enqueue(self, relative_paths: List[str], force: bool = False) -> int:
+        """
+        ジョブを登録します。
+
+        Args:
+            relative_paths (list): Markdownディレクトリからの相対パスのリスト
+            force (bool): Trueの場合、完了済み・失敗済みのジョブもpendingに戻します
+
+        Returns:
+            int: pendingになったジョブの数
+        """
+        if not relative_paths:
+            return 0
+
+        if force:
+            query = f'''
+            INSERT INTO {self.table_name} (relative_path, max_attempts) VALUES (%s, %s)
+            ON CONFLICT (relative_path) DO UPDATE
+            SET state = 'pending', attempts = 0, lease_owner = NULL, lease_expires_at = NULL,
+                last_error = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE {self.table_name}.state <> 'running'
+            RETURNING id;
+            '''
+        else:
+            query = f'''
+            INSERT INTO {self.table_name} (relative_path, max_attempts) VALUES (%s, %s)
+            ON CONFLICT (relative_path) DO NOTHING
+            RETURNING id;
+            '''
+
+        count = 0
+        with self.get_cursor() as cursor:
+            try:
+                for relative_path in relative_paths:
+                    cursor.execute(query, (relative_path, self.max_attempts))
+                    if cursor.fetchone():
+                        count += 1
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                self.logger.error(f"ジョブの登録中にエラーが発生しました: {e}")
+                raise
+
+        self.logger.info(f"{count} 件のジョブを登録しました。")
+        return count
+
+    def claim(self, worker_id: str, lease_seconds: int = 300) -> Optional[Dict[str, Any]]:
+        """
+        処理可能なジョブを1件取得し、リースを設定します。
+
+        pendingのジョブに加え、リース期限が切れたrunningのジョブも取得対象になります。
+        FOR UPDATE SKIP LOCKED により、複数のワーカーが同時に呼び出しても同じジョブは取得されません。
+
+        Args:
+            worker_id (str): ワーカーの識別子
+            lease_seconds (int): リースの有効期間（秒）
+
+        Returns:
+            Optional[Dict[str, Any]]: 取得したジョブ（id, relative_path, attempts）。ない場合はNone
+        """
+        query = f'''
+        UPDATE {self.table_name}
+        SET state = 'running',
+            attempts = attempts + 1,
+            lease_owner = %s,
+            lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = (
+            SELECT id FROM {self.table_name}
+            WHERE (state = 'pending' OR (state = 'running' AND lease_expires_at < CURRENT_TIMESTAMP))
+              AND attempts < max_attempts
+            ORDER BY id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING id, relative_path, attempts;
+        '''
+        with self.get_cursor() as cursor:
+            try:
+                cursor.execute(query, (worker_id, lease_seconds))
+                row = cursor.fetchone()
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                self.logger.error(f"ジョブの取得中にエラーが発生しました: {e}")
+                raise
+
+        if row is None:
+            return None
+        return {'id': row[0], 'relative_path': row[1], 'attempts': row[2]}
+
+    def extend_lease(self, job_id: int, worker_id: str, lease_seconds: int = 300) -> bool:
+        """
+        処理中のジョブのリースを延長します。
+
+        Args:
+            job_id (int): ジョブID
+            worker_id (str): ワーカーの識別子
+            lease_seconds (int): 延長後のリースの有効期間（秒）
+
+        Returns:
+            bool: まだリースを保持していればTrue
+        """
+        query = f'''
+        UPDATE {self.table_name}
+        SET lease_expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s), updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND lease_owner = %s AND state = 'running'
+        RETURNING id;
+        '''
+        result = self.execute_query(query, (lease_seconds, job_id, worker_id))
+        self.commit()
+        return bool(result)
+
+    def complete(self, job_id: int, worker_id: str) -> bool:
+        """
+        ジョブを完了にします。
+
+        Args:
+            job_id (int): ジョブID
+            worker_id (str): ワーカーの識別子
+
+        Returns:
+            bool: 完了にできた場合はTrue（リースを失っていた場合はFalse）
+        """
+        query = f'''
+        UPDATE {self.table_name}
+        SET state = 'done', lease_owner = NULL, lease_expires_at = NULL, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND lease_owner = %s AND state = 'running'
+        RETURNING id;
+        '''
+        result = self.execute_query(query, (job_id, worker_id))
+        self.commit()
+        return bool(result)
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> None:
+        """
+        ジョブの失敗を記録します。試行回数が上限に達していない場合はpendingに戻して再試行します。
+
+        Args:
+            job_id (int): ジョブID
+            worker_id (str): ワーカーの識別子
+            error (str): エラーメッセージ
+        """
+        query = f'''
+        UPDATE {self.table_name}
+        SET state = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+            lease_owner = NULL, lease_expires_at = NULL, last_error = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND lease_owner = %s;
+        '''
+        self.execute_query(query, (error[:2000], job_id, worker_id), fetch=False)
+
+    def reap_expired(self) -> int:
+        """
+        リース期限が切れ、試行回数も上限に達したジョブをfailedにします。
+
+        試行回数が残っているジョブはclaimで自動的に再取得されるため、ここでは変更しません。
+
+        Returns:
+            int: failedにしたジョブの数
+        """
+        query = f'''
+        UPDATE {self.table_name}
+        SET state = 'failed', lease_owner = NULL, lease_expires_at = NULL,
+            last_error = COALESCE(last_error, 'リース期限切れ'), updated_at = CURRENT_TIMESTAMP
+        WHERE state = 'running' AND lease_expires_at < CURRENT_TIMESTAMP AND attempts >= max_attempts
+        RETURNING id;
+        '''
+        result = self.execute_query(query)
+        self.commit()
+        return len(result) if result else 0
+
+    def get_status_counts(self) -> Dict[str, int]:
+        """
+        状態ごとのジョブ数を取得します。
+
+        Returns:
+            Dict[str, int]: 状態ごとのジョブ数
+        """
+        query = f"SELECT state, COUNT(*) FROM {self.table_name} GROUP BY state ORDER BY state;"
+        return {state: count for state, count in self.execute_query(query)}
+
+    def has_unfinished_jobs(self) -> bool:
+        """
+        未完了（pendingまたはrunning）のジョブがあるかどうかを返します。
+
+        Returns:
+            bool: 未完了のジョブがある場合はTrue
+        """
+        query = f'''
+        SELECT EXISTS (
+            SELECT 1 FROM {self.table_name}
+            WHERE state IN ('pending', 'running') AND attempts < max_attempts
+        );
+        '''
+        result = self.execute_query(query)
+        return bool(result and result[0][0])
+
+
+def enqueue_markdown_directory(queue: IngestionQueue, vector_db: VectorDatabase, force: bool = False) -> int:
+    """
+    Markdownディレクトリ内の未処理ファイルをジョブとして登録します。
+
+    Args:
+        queue (IngestionQueue): 取り込みキュー
+        vector_db (VectorDatabase): ベクトルデータベース
+        force (bool): Trueの場合、処理済みのファイルも再登録します
+
+    Returns:
+        int: 登録したジョブの数
+    """
+    markdown_dir = vector_db.markdown_dir
+    md_files = glob.glob(os.path.join(markdown_dir, "**/*.md"), recursive=True)
+    processed_files = set() if force else set(vector_db.get_processed_files())
+
+    relative_paths = []
+    for file_path in md_files:
+        abs_path = str(pathlib.Path(file_path).absolute())
+        if abs_path in processed_files:
+            continue
+        relative_paths.append(pathlib.Path(os.path.relpath(file_path, markdown_dir)).as_posix())
+
+    logger.info(f"{len(relative_paths)} 個のMarkdownファイルをジョブとして登録します。")
+    return queue.enqueue(relative_paths, force=force)
+
+
+class IngestionWorker:
+    """
+    取り込みキューからジョブを取得して処理するワーカー
+
+    読み込み・クリーニング・チャンク分割・埋め込み生成・書き込みを1ジョブずつ行います。
+    処理中は別スレッドでリースを延長し続けます。
+    """
+
+    def __init__(self,
+                 queue: IngestionQueue,
+                 vector_db: VectorDatabase,
+                 worker_id: Optional[str] = None,
+                 lease_seconds: int = 300):
+        """
+        ワーカーの初期化
+
+        Args:
+            queue (IngestionQueue): 取り込みキュー
+            vector_db (VectorDatabase): 書き込み先のベクトルデータベース
+            worker_id (Optional[str]): ワーカーの識別子。Noneの場合は"ホスト名:PID"
+            lease_seconds (int): リースの有効期間（秒）
+        """
+        self.queue = queue
+        self.vector_db = vector_db
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self._stop_event = threading.Event()
+
+    def _heartbeat(self, job_id: int, done: threading.Event) -> None:
+        """
+        処理が終わるまでリースを延長し続けます。
+
+        Args:
+            job_id (int): ジョブID
+            done (threading.Event): 処理の完了を通知するイベント
+        """
+        interval = max(self.lease_seconds / 3, 1)
+        while not done.wait(interval):
+            try:
+                if not self.queue.extend_lease(job_id, self.worker_id, self.lease_seconds):
+                    logger.warning(f"ジョブ {job_id} のリースを失いました。")
+                    return
+            except Exception as e:
+                logger.warning(f"ジョブ {job_id} のリース延長中にエラーが発生しました: {e}")
+
+    def process_job(self, job: Dict[str, Any]) -> int:
+        """
+        1件のジョブを処理します。
+
+        Args:
+            job (Dict[str, Any]): claimで取得したジョブ
+
+        Returns:
+            int: 格納したチャンク数
+        """
+        file_path = os.path.join(self.vector_db.markdown_dir, job['relative_path'])
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"ファイル '{file_path}' が見つかりません")
+
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job['id'], done), daemon=True)
+        heartbeat.start()
+        try:
+            # 内容が変わっていないチャンクは埋め込みベクトルを再利用する
+            return len(self.vector_db.update_file_chunks(file_path))
+        finally:
+            # キューの接続を共有しているため、完了を記録する前にハートビートを止める
+            done.set()
+            heartbeat.join()
+
+    def run(self, poll_interval: float = 5.0, exit_when_empty: bool = False, max_jobs: Optional[int] = None) -> int:
+        """
+        ジョブを取得して処理し続けます。
+
+        Args:
+            poll_interval (float): ジョブがない場合の待機時間（秒）
+            exit_when_empty (bool): 未完了のジョブがなくなったら終了するかどうか
+            max_jobs (Optional[int]): 処理する最大ジョブ数
+
+        Returns:
+            int: 処理したジョブの数
+        """
+        logger.info(f"取り込みワーカー '{self.worker_id}' を開始します。")
+        processed_jobs = 0
+
+        while not self._stop_event.is_set():
+            if max_jobs is not None and processed_jobs >= max_jobs:
+                break
+
+            job = self.queue.claim(self.worker_id, self.lease_seconds)
+            if job is None:
+                self.queue.reap_expired()
+                if exit_when_empty and not self.queue.has_unfinished_jobs():
+                    break
+                self._stop_event.wait(poll_interval)
+                continue
+
+            logger.info(f"ジョブ {job['id']} ('{job['relative_path']}', 試行 {job['attempts']} 回目) を処理しています...")
+            try:
+                chunk_count = self.process_job(job)
+                if self.queue.complete(job['id'], self.worker_id):
+                    logger.info(f"ジョブ {job['id']} が完了しました。{chunk_count} 個のチャンクを格納しました。")
+                else:
+                    logger.warning(f"ジョブ {job['id']} は処理中にリースを失ったため、完了を記録しませんでした。")
+            except Exception as e:
+                logger.error(f"ジョブ {job['id']} の処理中にエラーが発生しました: {e}", exc_info=True)
+                self.queue.fail(job['id'], self.worker_id, str(e))
+            processed_jobs += 1
+
+        logger.info(f"取り込みワーカー '{self.worker_id}' を終了します。処理したジョブ数: {processed_jobs}")
+        return processed_jobs
+
+    def stop(self) -> None:
+        """
+        処理中のジョブが終わった時点でワーカーを停止します。
+        """
+        self._stop_event.set()
+
+
+def main():
+    """
+    メイン関数
+    """
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='分散取り込みキュー')
+    parser.add_argument('--markdown-dir', type=str, default=os.getenv('MD_DIR', './data/markdowns'),
+                        help='Markdownファイルのディレクトリパス (デフォルト: 環境変数MD_DIRまたは./data/markdowns)')
+    subparsers = parser.add_subparsers(dest="command", help="実行するコマンド")
+
+    enqueue_parser = subparsers.add_parser("enqueue", help="未処理のMarkdownファイルをジョブとして登録する")
+    enqueue_parser.add_argument('--force', action='store_true', help='処理済みのファイルも再登録する')
+    enqueue_parser.add_argument('--max-attempts', type=int, default=3, help='1ジョブあたりの最大試行回数 (デフォルト: 3)')
+
+    worker_parser = subparsers.add_parser("worker", help="ジョブを取得して処理するワーカーを起動する")
+    worker_parser.add_argument('--worker-id', type=str, default=None, help='ワーカーの識別子 (デフォルト: ホスト名:PID)')
+    worker_parser.add_argument('--lease', type=int, default=300, help='リースの有効期間（秒） (デフォルト: 300)')
+    worker_parser.add_argument('--poll-interval', type=float, default=5.0, help='ジョブがない場合の待機時間（秒） (デフォルト: 5)')
+    worker_parser.add_argument('--exit-when-empty', action='store_true', help='未完了のジョブがなくなったら終了する')
+
+    subparsers.add_parser("status", help="状態ごとのジョブ数を表示する")
+
+    args = parser.parse_args()
+
+    db_config = setup_db_config()
+    db_config['dbname'] = os.getenv('VECTOR_DB', 'vector_db')
+
+    queue = IngestionQueue(db_config, max_attempts=getattr(args, 'max_attempts', 3))
+    vector_db = VectorDatabase(
+        db_config=db_config,
+        markdown_dir=args.markdown_dir,
+        model_name=os.getenv('EMBEDDING_MODEL', "intfloat/multilingual-e5-large")
+    )
+
+    try:
+        queue.create_table()
+        if args.command == "enqueue":
+            vector_db.create_table()
+            count = enqueue_markdown_directory(queue, vector_db, force=args.force)
+            print(f"{count} 件のジョブを登録しました。")
+        elif args.command == "worker":
+            worker = IngestionWorker(queue, vector_db, worker_id=args.worker_id, lease_seconds=args.lease)
+            try:
+                worker.run(poll_interval=args.poll_interval, exit_when_empty=args.exit_when_empty)
+            except KeyboardInterrupt:
+                logger.info("キーボード割り込みを受信しました。ワーカーを終了します。")
+        elif args.command == "status":
+            for state, count in queue.get_status_counts().items():
+                print(f"{state}: {count}")
+        else:
+            parser.print_help()
+            sys.exit(1)
+    except Exception as e:
+        logger.error(f"エラーが発生しました: {e}", exc_info=True)
+        sys.exit(1)
+    finally:
+        queue.disconnect()
+        vector_db.disconnect()
+
+
+if __name__ == "__main__":
+    main()
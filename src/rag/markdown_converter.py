@@ -2,7 +2,7 @@
 import os
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 # 仮想環境のサイトパッケージディレクトリをパスに追加
 venv_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.venv', 'Lib', 'site-packages')
@@ -56,6 +56,144 @@ class MarkdownConverter:
         self.model = model
         self.converter = markitdown.MarkItDown(model=model) if model else markitdown.MarkItDown()
 
+    # ページ・スライド・シートごとに変換できる拡張子
+    SECTION_EXTENSIONS = {".pdf", ".pptx", ".xlsx"}
+
+    def count_sections(self, file_path: str) -> Optional[int]:
+        """
+        ファイルのセクション（PDFのページ、PowerPointのスライド、Excelのシート）の数を返します。
+
+        Args:
+            file_path: ファイルのパス。
+
+        Returns:
+            セクションの数。セクションごとに変換できない形式の場合や、必要なライブラリがない場合はNone。
+        """
+        ext = Path(file_path).suffix.lower()
+        if ext not in self.SECTION_EXTENSIONS:
+            return None
+        try:
+            if ext == ".pdf":
+                from pdfminer.pdfparser import PDFParser
+                from pdfminer.pdfdocument import PDFDocument
+                from pdfminer.pdfpage import PDFPage
+                with open(file_path, "rb") as f:
+                    document = PDFDocument(PDFParser(f))
+                    return sum(1 for _ in PDFPage.create_pages(document))
+            if ext == ".pptx":
+                from pptx import Presentation
+                return len(Presentation(file_path).slides)
+            from openpyxl import load_workbook
+            workbook = load_workbook(file_path, read_only=True, data_only=True)
+            try:
+                return len(workbook.sheetnames)
+            finally:
+                workbook.close()
+        except Exception as e:
+            self.logger.warning(f"セクションごとに変換できないため、ファイル全体を変換します: {file_path} - {str(e)}")
+            return None
+
+    def convert_sections(self, file_path: str, start: int, count: int) -> List[Tuple[int, str]]:
+        """
+        ファイルのセクションをstart番目（0から数える）からcount個だけMarkdown形式に変換する。
+        ファイル全体を読み込まないため、大きなファイルでも使用するメモリは変換するセクションの分だけです。
+
+        Args:
+            file_path: 変換するファイルのパス。
+            start: 最初のセクションの位置（0から数える）。
+            count: 変換するセクションの数。
+
+        Returns:
+            (ページ番号（1から数える）, Markdown形式の文字列) のリスト。
+
+        Raises:
+            Exception: 変換に失敗した場合。
+        """
+        ext = Path(file_path).suffix.lower()
+        if ext == ".pdf":
+            sections = self._convert_pdf_pages(file_path, start, count)
+        elif ext == ".pptx":
+            sections = self._convert_pptx_slides(file_path, start, count)
+        elif ext == ".xlsx":
+            sections = self._convert_xlsx_sheets(file_path, start, count)
+        else:
+            raise ValueError(f"セクションごとに変換できないファイル形式です: {file_path}")
+        return [(number, markdown.replace("\x00", "")) for number, markdown in sections]
+
+    @staticmethod
+    def _convert_pdf_pages(file_path: str, start: int, count: int) -> List[Tuple[int, str]]:
+        """
+        PDFのページをテキストに変換します。
+        """
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LTTextContainer
+
+        sections = []
+        for offset, page in enumerate(extract_pages(file_path, page_numbers=range(start, start + count))):
+            text = "".join(element.get_text() for element in page if isinstance(element, LTTextContainer))
+            sections.append((start + offset + 1, text.strip()))
+        return sections
+
+    @staticmethod
+    def _markdown_table(rows: List[List[str]]) -> str:
+        """
+        行のリストをMarkdownの表にします。最初の行を見出しとします。
+        """
+        if not rows:
+            return ""
+        width = max(len(row) for row in rows)
+        rows = [[cell.replace("|", "\\|").replace("\n", " ") for cell in row] + [""] * (width - len(row)) for row in rows]
+        lines = ["| " + " | ".join(rows[0]) + " |", "| " + " | ".join(["---"] * width) + " |"]
+        lines.extend("| " + " | ".join(row) + " |" for row in rows[1:])
+        return "\n".join(lines)
+
+    def _convert_pptx_slides(self, file_path: str, start: int, count: int) -> List[Tuple[int, str]]:
+        """
+        PowerPointのスライドをMarkdownに変換します。タイトルを見出しとし、テキスト、表、ノートを含めます。
+        """
+        from pptx import Presentation
+
+        slides = Presentation(file_path).slides
+        sections = []
+        for index in range(start, min(start + count, len(slides))):
+            slide = slides[index]
+            parts = []
+            title = slide.shapes.title
+            if title is not None and title.has_text_frame and title.text_frame.text.strip():
+                parts.append(f"# {title.text_frame.text.strip()}")
+            for shape in slide.shapes:
+                if shape == title:
+                    continue
+                if getattr(shape, "has_table", False) and shape.has_table:
+                    rows = [[cell.text for cell in row.cells] for row in shape.table.rows]
+                    parts.append(self._markdown_table(rows))
+                elif shape.has_text_frame and shape.text_frame.text.strip():
+                    parts.append(shape.text_frame.text.strip())
+            if slide.has_notes_slide and slide.notes_slide.notes_text_frame is not None:
+                notes = slide.notes_slide.notes_text_frame.text.strip()
+                if notes:
+                    parts.append(f"### ノート\n{notes}")
+            sections.append((index + 1, "\n\n".join(parts)))
+        return sections
+
+    def _convert_xlsx_sheets(self, file_path: str, start: int, count: int) -> List[Tuple[int, str]]:
+        """
+        Excelのシートをシート名の見出しとMarkdownの表に変換します。シートは行ごとに読み込みます。
+        """
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sections = []
+            for index in range(start, min(start + count, len(workbook.sheetnames))):
+                sheet = workbook[workbook.sheetnames[index]]
+                rows = [["" if value is None else str(value) for value in row]
+                        for row in sheet.iter_rows(values_only=True) if any(value is not None for value in row)]
+                sections.append((index + 1, f"## {sheet.title}\n{self._markdown_table(rows)}"))
+            return sections
+        finally:
+            workbook.close()
+
     def convert_file_to_markdown(self, file_path: str) -> Optional[str]:
         """
         指定されたファイルをMarkdown形式に変換する。
@@ -1,10 +1,79 @@
 # -*- coding: utf-8 -*-
 import os
+import argparse
 from pathlib import Path
-from src.rag.markdown_converter import MarkdownConverter
-from src.utils.chunk_processor import clean_text, organize_text_with_llm
+from typing import Any, Dict, List, Optional
+from src.rag.build_manifest import BuildManifest, STAGE_MARKDOWN
+from src.rag.conversion_pipeline import ConversionPipeline
 from src.utils.logger_util import setup_logger
 
+
+def markdown_build_params(model: str, temperature: float, num_ctx: int, num_predict: int) -> str:
+    """
+    Markdownの内容に影響する設定を、ビルドマニフェストに記録する文字列にします。
+    """
+    return f"model={model};temperature={temperature};num_ctx={num_ctx};num_predict={num_predict}"
+
+
+def markdown_output_path(file_path: Path, source_path: Path, markdown_path: Path) -> Path:
+    """
+    ソースファイルから生成するMarkdownファイルのパスを返します。
+
+    source/markdown/内のファイルはmarkdownsディレクトリ直下に、それ以外は元のディレクトリ構造を維持して保存します。
+    """
+    relative_path = Path(os.path.relpath(file_path, start=source_path))
+    if str(relative_path).startswith('markdown'):
+        base_name = os.path.splitext(os.path.basename(str(relative_path)))[0]
+        return markdown_path / f"{base_name}.md"
+    return markdown_path / relative_path.with_suffix('.md')
+
+
+def plan_documents(source_dir: str, markdown_dir: str, manifest: BuildManifest, params: str) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    ビルドマニフェストと比較して、Markdownに変換し直すソースファイルと削除されたソースファイルを求めます。
+
+    マニフェストに記録がなく、出力先のMarkdownファイルが既に存在するソースファイルは、
+    変換済みとしてマニフェストに登録します（マニフェスト導入前に変換したファイルを変換し直さないため）。
+
+    Args:
+        source_dir: ソースディレクトリ
+        markdown_dir: Markdownディレクトリ
+        manifest: ビルドマニフェスト
+        params: Markdownの内容に影響する設定（markdown_build_paramsの値）
+
+    Returns:
+        build（変換するファイル: path、output、reason、bytes）と
+        delete（削除されたファイル: key、outputs）の辞書
+    """
+    source_path = Path(source_dir)
+    markdown_path = Path(markdown_dir)
+    source_files = [f for f in source_path.rglob("*") if f.is_file()] if source_path.exists() else []
+
+    plan: Dict[str, List[Dict[str, Any]]] = {'build': [], 'delete': []}
+    current_keys = set()
+    for file_path in source_files:
+        key = str(file_path.resolve())
+        current_keys.add(key)
+        output_file = markdown_output_path(file_path, source_path, markdown_path)
+
+        entry = manifest.get(STAGE_MARKDOWN, key)
+        if entry is None and output_file.exists():
+            manifest.record(STAGE_MARKDOWN, key, str(file_path), [str(output_file.absolute())], params)
+            continue
+
+        reason = manifest.check(STAGE_MARKDOWN, key, str(file_path), params)
+        if reason is None and not all(os.path.exists(output) for output in entry['outputs']):
+            reason = "出力なし"
+        if reason is not None:
+            plan['build'].append({'path': file_path, 'output': output_file, 'reason': reason,
+                                  'bytes': file_path.stat().st_size})
+
+    for key in manifest.keys(STAGE_MARKDOWN):
+        if key not in current_keys:
+            plan['delete'].append({'key': key, 'outputs': manifest.get(STAGE_MARKDOWN, key)['outputs']})
+    return plan
+
+
 def process_documents(
     source_dir: str = "./data/source",
     markdown_dir: str = "./data/markdowns",
@@ -13,7 +82,29 @@ def process_documents(
     num_ctx: int = 2048,
     num_predict: int = 1024,
     debug: bool = False,
+    manifest: Optional[BuildManifest] = None,
+    parse_workers: Optional[int] = None,
+    llm_concurrency: Optional[int] = None,
+    max_retries: Optional[int] = None,
+    streaming: Optional[bool] = None,
 ):
+    """
+    ソースファイルをMarkdownに変換します。
+
+    ビルドマニフェストに記録された内容のハッシュと比較し、新規・変更されたファイルと
+    変換時の設定が変わったファイルだけを変換します。削除されたソースファイルの
+    Markdownは削除しません（インクリメンタルビルドの`build`コマンドで削除されます）。
+
+    変換は文書変換パイプライン（conversion_pipeline.py）で並行に実行します。中断した場合は、
+    次回の実行で変換が完了したファイルを再利用します。
+
+    Args:
+        manifest: ビルドマニフェスト（Noneの場合は既定のパスから読み込み、処理後に保存）
+        parse_workers: markitdownで解析するプロセス数（Noneの場合は環境変数CONVERSION_PARSE_WORKERS）
+        llm_concurrency: 同時に実行するLLMへの要求の数（Noneの場合は環境変数CONVERSION_LLM_CONCURRENCY）
+        max_retries: ファイルごとの再試行の回数（Noneの場合は環境変数CONVERSION_MAX_RETRIES）
+        streaming: PDF、PowerPoint、Excelをページごとに変換するかどうか（Noneの場合は環境変数CONVERSION_STREAMING）
+    """
     # ロガーの設定
     logger = setup_logger(__name__)
     
@@ -21,104 +112,53 @@ def process_documents(
     if debug:
         logger.debug("デバッグモードが有効です")
 
-    source_path = Path(source_dir)
-    markdown_path = Path(markdown_dir)
-    markdown_path.mkdir(parents=True, exist_ok=True)
-
-    # 既存のマークダウンファイル名（拡張子なし）を取得
-    existing_md_files = {f.stem for f in markdown_path.glob("*.md")}
+    Path(markdown_dir).mkdir(parents=True, exist_ok=True)
 
-    # ソースディレクトリ内のファイルを再帰的に取得
-    source_files = [f for f in source_path.rglob("*") if f.is_file()]
+    save_manifest = manifest is None
+    if manifest is None:
+        manifest = BuildManifest()
+    params = markdown_build_params(model, temperature, num_ctx, num_predict)
 
     # 変換対象のファイルを特定
-    files_to_process = [f for f in source_files if f.stem not in existing_md_files]
+    files_to_process = plan_documents(source_dir, markdown_dir, manifest, params)['build']
     
     logger.info(f"変換対象ファイル数: {len(files_to_process)}")
     if debug:
-        for f in files_to_process:
-            logger.debug(f"  変換対象ファイル: {f}")
-
-    converter = MarkdownConverter()
-
-    for file_path in files_to_process:
-        try:
-            # ファイルをマークダウンに変換
-            markdown_content = converter.convert_file_to_markdown(file_path)
-
-            # テキストをクリーンアップ
-            cleaned_text = clean_text(markdown_content)
-
-            # LLMでテキストを整形
-            if debug:
-                logger.debug(f"LLMでテキストを整形します")
-            organized_text = organize_text_with_llm(
-                text=cleaned_text,
-                model=model,
-                temperature=temperature,
-                num_ctx=num_ctx,
-                num_predict=num_predict
-            )
-            
-            # マークダウンファイルとして保存
-            # ソースファイルの相対パスを取得
-            relative_path = Path(os.path.relpath(file_path, start=source_path))
-            if debug:
-                logger.debug(f"ソースファイルの相対パス: {relative_path}")
-            
-            # ソースファイルがsource/markdown/内にある場合は、markdownsディレクトリ直下に保存する
-            if str(relative_path).startswith('markdown'):
-                # 'markdown/'を除去して、markdowns直下に保存
-                file_name = os.path.basename(str(relative_path))
-                # ファイル名から拡張子を除去し、.mdを追加
-                base_name = os.path.splitext(file_name)[0]
-                output_file = markdown_path / f"{base_name}.md"
-                if debug:
-                    logger.debug(f"markdownディレクトリ内のファイルを処理: {file_name}")
-            else:
-                # それ以外のファイルは元のディレクトリ構造を維持
-                output_file = markdown_path / relative_path.with_suffix('.md')
-                if debug:
-                    logger.debug(f"通常パスで処理: {relative_path}")
-            
-            if debug:
-                logger.debug(f"保存先ファイルパス: {output_file}")
-                logger.debug(f"保存先ディレクトリ: {output_file.parent}")
-            
-            # 保存先ディレクトリが存在するか確認
-            if not output_file.parent.exists():
-                if debug:
-                    logger.debug(f"保存先ディレクトリが存在しないため作成します: {output_file.parent}")
-                
-            output_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            # ファイルに書き込み
-            try:
-                with open(output_file, "w", encoding="utf-8") as f:
-                    f.write(organized_text)
-                if debug:
-                    logger.debug(f"ファイルに書き込み成功: {output_file}")
-            except Exception as e:
-                logger.error(f"ファイル書き込み中にエラーが発生しました: {e}")
-                raise
-
-            logger.info(f"Processed and saved: {output_file}")
-
-        except FileNotFoundError as e:
-            logger.error(f"File not found: {file_path} - {e}")
-        except ValueError as e:
-            logger.error(f"Value error processing {file_path}: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error processing {file_path}: {e}")
+        for item in files_to_process:
+            logger.debug(f"  変換対象ファイル: {item['path']} ({item['reason']})")
+
+    def on_file_done(item: Dict[str, Any], output_file: Path) -> None:
+        manifest.record(STAGE_MARKDOWN, str(item['path'].resolve()), str(item['path']), [str(output_file.absolute())], params)
+
+    pipeline = ConversionPipeline(model, temperature, num_ctx, num_predict, parse_workers=parse_workers,
+                                  llm_concurrency=llm_concurrency, max_retries=max_retries, streaming=streaming)
+    try:
+        stats = pipeline.run(files_to_process, params, on_file_done)
+        manifest.record_cost(STAGE_MARKDOWN, stats['bytes'], stats['seconds'])
+    finally:
+        if save_manifest:
+            manifest.save()
 
 def main():
     # ロガーの設定
     logger = setup_logger(__name__)
     
+    parser = argparse.ArgumentParser(description='ソースファイルをMarkdownに変換します')
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help='markitdownで解析するプロセス数（デフォルト: 環境変数CONVERSION_PARSE_WORKERS）')
+    parser.add_argument('--llm-concurrency', type=int, default=None,
+                        help='同時に実行するLLMへの要求の数（デフォルト: 環境変数CONVERSION_LLM_CONCURRENCY）')
+    parser.add_argument('--max-retries', type=int, default=None,
+                        help='ファイルごとの再試行の回数（デフォルト: 環境変数CONVERSION_MAX_RETRIES）')
+    parser.add_argument('--no-streaming', action='store_true',
+                        help='PDF、PowerPoint、Excelをページごとに変換せず、ファイル全体を一度に変換する')
+    parser.add_argument('--debug', action='store_true', help='詳細なログを出力する')
+    args = parser.parse_args()
+
     try:
-        # debugパラメータを指定することで詳細なログを出力可能
-        # デフォルトはデバッグモード無効
-        process_documents(debug=False)
+        process_documents(debug=args.debug, parse_workers=args.parse_workers,
+                          llm_concurrency=args.llm_concurrency, max_retries=args.max_retries,
+                          streaming=False if args.no_streaming else None)
     except Exception as e:
         logger.error(f"error in markdown_maker: {e}")
         # スタックトレースも出力
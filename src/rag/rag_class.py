@@ -38,7 +38,8 @@ from src.rag.database_updater import (
 )
 from src.rag.rag_database import RAGDatabase
 from src.rag.vector_database import VectorDatabase
-from src.utils.embedding_generator import EmbeddingGenerator
+from src.utils.embedding_scheduler import get_embedding_scheduler, is_embedding_scheduler_enabled
+from src.utils.model_registry import get_model_registry
 from src.utils.logger_util import setup_logger
 
 # ロガーの設定
@@ -95,6 +96,12 @@ class RAGSystem:
         # 埋め込みジェネレーター
         self.embedding_generator = None
         
+        # 同時に届いた検索クエリをまとめてエンコードするかどうか
+        self.use_embedding_scheduler = is_embedding_scheduler_enabled()
+        
+        # 直近の検索で使用した検索プラン
+        self.last_search_plan: Optional[Dict[str, Any]] = None
+        
         logger.info(f"RAGシステムを初期化しました。ソースディレクトリ: {source_dir}, Markdownディレクトリ: {markdown_dir}")
     
     def generate_markdowns(self, 
@@ -192,12 +199,37 @@ class RAGSystem:
             logger.error(f"データベースの更新中にエラーが発生しました: {e}", exc_info=True)
             raise
     
-    def _init_embedding_generator(self) -> None:
+    def _init_embedding_generator(self, model_name: Optional[str] = None) -> None:
         """
         埋め込みベクトル生成器を初期化します
+        
+        Args:
+            model_name (Optional[str]): 使用するモデル名。Noneの場合はself.embedding_modelを使用。
+                既存の生成器と異なるモデルが指定された場合は生成器を切り替えます
         """
-        if self.embedding_generator is None:
-            self.embedding_generator = EmbeddingGenerator(model_name=self.embedding_model)
+        model_name = model_name or self.embedding_model
+        if self.embedding_generator is None or self.embedding_generator.model_name != model_name:
+            if self.embedding_generator is not None:
+                logger.info(f"埋め込みモデルを '{self.embedding_generator.model_name}' から '{model_name}' に切り替えます。")
+                get_model_registry().release(self.embedding_generator)
+            # プロセス内で共有されているモデルを取得する（読み込まれていない場合のみ読み込む）
+            self.embedding_generator = get_model_registry().acquire(model_name)
+            self.embedding_model = model_name
+    
+    def _resolve_embedding_version(self) -> Dict[str, Any]:
+        """
+        検索に使用する埋め込みバージョンを取得し、クエリ側の埋め込み生成器をそのモデルに合わせます
+        
+        Returns:
+            Dict[str, Any]: アクティブな埋め込みバージョン
+        """
+        self._init_rag_database()
+        version = self.rag_db.get_active_embedding_version()
+        self._init_embedding_generator(version['model_name'])
+        if version.get('dimension') and self.embedding_generator.dimension != version['dimension']:
+            raise ValueError(f"埋め込みモデル '{version['model_name']}' の次元数 {self.embedding_generator.dimension} が"
+                             f"カラム '{version['column_name']}' の次元数 {version['dimension']} と一致しません。")
+        return version
     
     def _init_rag_database(self) -> None:
         """
@@ -206,14 +238,20 @@ class RAGSystem:
         if self.rag_db is None:
             self.rag_db = RAGDatabase(self.db_config)
     
-    def search(self, query: str, limit: int = 5, similarity_threshold: float = 0.0) -> List[Dict[str, Any]]:
+    def search(self, query: str, limit: int = 5, similarity_threshold: float = 0.0,
+               strategy: str = "auto", recall_target: Optional[float] = None) -> List[Dict[str, Any]]:
         """
         RAGデータベースで検索を実行します
         
+        全件検索とインデックス検索のどちらを使うかは、テーブルの規模と要求される再現率から
+        RAGDatabase.plan_searchが決定します。決定したプランはself.last_search_planに保存されます。
+        
         Args:
             query (str): 検索クエリ
             limit (int): 結果の最大数
             similarity_threshold (float): 類似度の閾値
+            strategy (str): "auto"、"exact"、"ann"のいずれか
+            recall_target (Optional[float]): 要求される再現率。Noneの場合はRAGDatabaseの既定値
             
         Returns:
             List[Dict[str, Any]]: 検索結果
@@ -221,28 +259,35 @@ class RAGSystem:
         logger.info(f"検索を実行します。クエリ: {query}")
         
         try:
-            # 埋め込みベクトル生成器の初期化（既に初期化されている場合はスキップ）
-            if self.embedding_generator is None:
-                self._init_embedding_generator()
-            
-            # RAGデータベースの初期化
-            self._init_rag_database()
+            # アクティブな埋め込みバージョンを取得し、同じモデルでクエリを埋め込む
+            embedding_version = self._resolve_embedding_version()
             
-            # クエリの埋め込みベクトルを生成
-            query_embedding = self.embedding_generator.generate_embedding(query)
+            # クエリの埋め込みベクトルを生成（スケジューラーが同時に届いたクエリをまとめてエンコードする）
+            if self.use_embedding_scheduler:
+                query_embedding = get_embedding_scheduler(self.embedding_generator).generate_embedding(query)
+            else:
+                query_embedding = self.embedding_generator.generate_embedding(query)
             
             # 検索を実行
-            results = self.rag_db.search_similar(
+            results, plan = self.rag_db.search_with_plan(
                 query_embedding=query_embedding,
                 limit=limit,
-                similarity_threshold=similarity_threshold
+                similarity_threshold=similarity_threshold,
+                embedding_version=embedding_version,
+                strategy=strategy,
+                recall_target=recall_target
             )
+            self.last_search_plan = plan
+            logger.info(f"検索プラン: {plan['strategy']} (probes: {plan['probes']}, 理由: {plan['reason']}, {plan['elapsed_ms']}ms)")
             
             # 結果を整形
             formatted_results = []
             for result in results:
                 # 結果のカラム数に応じて処理を分ける
-                if len(result) == 7:  # original_filepathが含まれている場合
+                page_number = None
+                if len(result) == 8:  # original_filepathとpage_numberが含まれている場合
+                    doc_id, text, filename, filepath, original_filepath, chunk_index, page_number, similarity = result
+                elif len(result) == 7:  # original_filepathが含まれている場合
                     doc_id, text, filename, filepath, original_filepath, chunk_index, similarity = result
                 else:  # 従来の形式
                     doc_id, text, filename, filepath, chunk_index, similarity = result
@@ -255,6 +300,7 @@ class RAGSystem:
                     'filepath': filepath,
                     'original_filepath': original_filepath,
                     'chunk_index': chunk_index,
+                    'page_number': page_number,
                     'similarity': similarity
                 })
             
@@ -277,50 +323,7 @@ class RAGSystem:
             List[Dict[str, Any]]: 検索結果
         """
         logger.info(f"正確な検索を実行します。クエリ: {query}")
-        
-        try:
-            # 埋め込みベクトル生成器の初期化（既に初期化されている場合はスキップ）
-            if self.embedding_generator is None:
-                self._init_embedding_generator()
-            
-            # RAGデータベースの初期化
-            self._init_rag_database()
-            
-            # クエリの埋め込みベクトルを生成
-            query_embedding = self.embedding_generator.generate_embedding(query)
-            
-            # 検索を実行
-            results = self.rag_db.search_similar_exact(
-                query_embedding=query_embedding,
-                limit=limit,
-                similarity_threshold=similarity_threshold
-            )
-            
-            # 結果を整形
-            formatted_results = []
-            for result in results:
-                # 結果のカラム数に応じて処理を分ける
-                if len(result) == 7:  # original_filepathが含まれている場合
-                    doc_id, text, filename, filepath, original_filepath, chunk_index, similarity = result
-                else:  # 従来の形式
-                    doc_id, text, filename, filepath, chunk_index, similarity = result
-                    original_filepath = None
-                
-                formatted_results.append({
-                    'id': doc_id,
-                    'text': text,
-                    'filename': filename,
-                    'filepath': filepath,
-                    'original_filepath': original_filepath,
-                    'chunk_index': chunk_index,
-                    'similarity': similarity
-                })
-            
-            logger.info(f"検索結果: {len(formatted_results)}件")
-            return formatted_results
-        except Exception as e:
-            logger.error(f"検索中にエラーが発生しました: {e}", exc_info=True)
-            raise
+        return self.search(query, limit=limit, similarity_threshold=similarity_threshold, strategy="exact")
     
     def get_document_count(self) -> int:
         """
@@ -349,6 +352,7 @@ class RAGSystem:
         logger.info("リソースのクリーンアップを開始します。")
         
         if self.embedding_generator is not None:
+            get_model_registry().release(self.embedding_generator)
             self.embedding_generator = None
         
         if self.vector_db is not None:
@@ -397,6 +401,8 @@ def main():
                         help='類似度の閾値 (デフォルト: 0.0)')
     parser.add_argument('--exact-search', action='store_true',
                         help='正確な検索を実行する')
+    parser.add_argument('--recall', type=float, default=None,
+                        help='要求される再現率。検索方式の自動選択に使用 (デフォルト: RAG_RECALL_TARGET)')
     
     args = parser.parse_args()
     
@@ -433,14 +439,23 @@ def main():
                 results = rag_system.search(
                     query=args.search,
                     limit=args.limit,
-                    similarity_threshold=args.threshold
+                    similarity_threshold=args.threshold,
+                    recall_target=args.recall
                 )
             
+            # 検索プランの表示
+            plan = rag_system.last_search_plan
+            if plan:
+                print(f"\n検索プラン: {plan['strategy']} (probes: {plan['probes']}, 行数: {plan['row_count']}, "
+                      f"差分: {plan['delta_rows']}, 理由: {plan['reason']}, {plan['elapsed_ms']}ms)")
+            
             # 検索結果の表示
             print(f"\n検索結果 ({len(results)}件):")
             for i, result in enumerate(results, 1):
                 print(f"\n結果 {i} (類似度: {result['similarity']:.4f}):")
                 print(f"ファイル: {result['filename']} ({result['filepath']})")
+                if result.get('page_number') is not None:
+                    print(f"ページ: {result['page_number']}")
                 print(f"テキスト: {result['text'][:200]}...")
         
     except Exception as e:
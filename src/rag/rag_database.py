@@ -1,12 +1,36 @@
 # -*- coding: utf-8 -*-
 # rag_database.py
-from src.rag.base_database import BaseDatabase
+from src.rag.base_database import BaseDatabase, to_pgvector_literal
 import numpy as np
 import psycopg2
 import os
+import re
+import time
 from psycopg2.extras import execute_batch
 from typing import Dict, List, Tuple, Any, Optional, Union
 from src.utils.logger_util import setup_logger
+from src.utils.lru_cache import LRUCache
+from src.utils.embedding_scheduler import generate_bulk_embeddings
+from src.utils.model_registry import get_model_registry
+
+# チャンク本文とメタデータのプロセス内キャッシュ（RAGDatabaseのインスタンス間で共有）
+_payload_cache: Optional[LRUCache] = None
+
+
+def get_payload_cache() -> LRUCache:
+    """
+    チャンク本文とメタデータのプロセス内キャッシュを取得します。
+    
+    最大件数は環境変数RAG_PAYLOAD_CACHE_SIZE（デフォルト: 2048）で指定します。
+    
+    Returns:
+        LRUCache: ペイロードキャッシュ
+    """
+    global _payload_cache
+    if _payload_cache is None:
+        _payload_cache = LRUCache(int(os.getenv('RAG_PAYLOAD_CACHE_SIZE', '2048')))
+    return _payload_cache
+
 
 class RAGDatabase(BaseDatabase):
     """
@@ -16,7 +40,7 @@ class RAGDatabase(BaseDatabase):
     埋め込みベクトルをL2ノルム正規化した上で格納します
     """
     
-    def __init__(self, db_config, dimension=1024, vector_db_config=None):
+    def __init__(self, db_config, dimension=1024, vector_db_config=None, embedding_model=None):
         """
         RAGデータベースの初期化
         
@@ -24,11 +48,38 @@ class RAGDatabase(BaseDatabase):
             db_config (dict): データベース接続設定
             dimension (int): ベクトルの次元数
             vector_db_config (dict, optional): ベクトルデータベースの接続設定。Noneの場合は環境変数から取得
+            embedding_model (str, optional): embeddingカラムのベクトルを生成したモデル名。Noneの場合は環境変数から取得
         """
         super().__init__(db_config)
         self.logger = setup_logger(self.__class__.__name__)
         self.table_name = "rag_documents"
         self.dimension = dimension
+        self.embedding_model = embedding_model or os.getenv('EMBEDDING_MODEL', 'intfloat/multilingual-e5-large')
+        
+        # 埋め込みモデルのバージョン管理テーブル
+        # 検索時に毎回問い合わせないよう、アクティブなバージョンは短時間キャッシュする
+        self.version_table_name = "embedding_versions"
+        self.version_cache_ttl = float(os.getenv('EMBEDDING_VERSION_CACHE_TTL', '5'))
+        self._active_version = None
+        self._active_version_loaded_at = 0.0
+        
+        # インデックス作成後に追加されたチャンクを格納する差分テーブルと、削除済みIDを記録するトゥームストーンテーブル
+        # 差分テーブルは小さいため全件検索し、メインテーブルのインデックス検索の結果とマージする
+        self.delta_table_name = f"{self.table_name}_delta"
+        self.tombstone_table_name = "rag_tombstones"
+        self.delta_threshold = int(os.getenv('RAG_DELTA_THRESHOLD', '1000'))
+        self._delta_table_exists = None
+        self._delta_table_checked_at = 0.0
+        
+        # 検索プランナーの設定
+        # 行数がexact_scan_max_rows以下の場合は全件検索の方が速く、再現率も落ちない
+        self.exact_scan_max_rows = int(os.getenv('RAG_EXACT_SCAN_MAX_ROWS', '20000'))
+        self.default_recall_target = float(os.getenv('RAG_RECALL_TARGET', '0.9'))
+        self.planner_stats_ttl = float(os.getenv('RAG_PLANNER_STATS_TTL', '30'))
+        self._planner_stats: Dict[str, Dict[str, Any]] = {}
+        
+        # ペイロードキャッシュのキーに含めるテーブルのOID（テーブルを作成・再作成したときだけ取得し直す）
+        self._table_oid = None
         
         # ベクトルデータベースの接続設定
         if vector_db_config is None:
@@ -54,17 +105,37 @@ class RAGDatabase(BaseDatabase):
             CREATE TABLE IF NOT EXISTS {self.table_name} (
                 id SERIAL PRIMARY KEY,
                 chunk_text TEXT NOT NULL,
-                embedding VECTOR({self.dimension}) NOT NULL,
+                embedding VECTOR({self.dimension}),
                 filename TEXT NOT NULL,
                 filepath TEXT NOT NULL,
                 original_filepath TEXT,
                 chunk_index INTEGER,
+                source_id INTEGER,
+                page_number INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
             '''
             self.execute_query(query, fetch=False)
+            # 既存のテーブルにはpage_numberカラムがない場合があるため追加する（ページごとに変換したファイルの元のページ番号）
+            self.execute_query(f"ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS page_number INTEGER;", fetch=False)
+            # 退役したバージョンのカラムには新しいチャンクのベクトルを書き込まないため、embeddingカラムもNULLを許可する
+            self.execute_query(f"ALTER TABLE {self.table_name} ALTER COLUMN embedding DROP NOT NULL;", fetch=False)
+            self._apply_narrow_storage(self.table_name)
             self.commit()
+            self._table_oid = None
             self.logger.info(f"テーブル '{self.table_name}' を作成しました。")
+            
+            # 埋め込みモデルのバージョン管理テーブルを作成し、登録済みのバージョンのカラムを追加する
+            self.create_version_table()
+            version_columns = self.execute_query(f'''
+            SELECT column_name, dimension FROM {self.version_table_name}
+            WHERE status <> 'dropped' AND column_name <> 'embedding';
+            ''')
+            for column_name, dimension in version_columns:
+                self.execute_query(f"ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS {column_name} VECTOR({int(dimension)});", fetch=False)
+            
+            # 差分テーブルとトゥームストーンテーブルを作成
+            self.create_delta_table()
             return True
         except Exception as e:
             self.logger.error(f"テーブル作成中にエラーが発生しました: {e}")
@@ -72,17 +143,45 @@ class RAGDatabase(BaseDatabase):
         
         # 注意: インデックスはデータ挿入後に作成するため、ここでは作成しません
     
+    def _apply_narrow_storage(self, table_name: str) -> None:
+        """
+        チャンク本文をTOASTテーブルに格納し、ヒープにはIDとベクトルの参照だけが残るようにします。
+        
+        全件検索のシーケンシャルスキャンやインデックス検索のヒープ参照で本文のページを読まずに済むため、
+        バッファキャッシュをベクトルに使えます。本文は上位k件のペイロード取得時にのみ読み込まれます。
+        設定は以降に書き込まれる行に適用されます。
+        
+        Args:
+            table_name (str): 対象のテーブル名
+        """
+        self.execute_query(f"ALTER TABLE {table_name} ALTER COLUMN chunk_text SET STORAGE EXTERNAL;", fetch=False)
+        self.execute_query(f"ALTER TABLE {table_name} SET (toast_tuple_target = 128);", fetch=False)
+    
     def reset_table(self):
         """
         テーブルをリセットする（全データを削除し、テーブルを再作成する）
         """
         try:
+            # 差分テーブルとトゥームストーンもリセットする
+            # 差分テーブルのIDのデフォルト値はメインテーブルのシーケンスを参照しているため、メインテーブルより先に削除する
+            self.execute_query(f"DROP TABLE IF EXISTS {self.delta_table_name};", fetch=False)
+            self.execute_query(f"DROP TABLE IF EXISTS {self.tombstone_table_name};", fetch=False)
+            self._delta_table_exists = None
+            
             # テーブルを削除
             drop_query = f"DROP TABLE IF EXISTS {self.table_name};"
             self.execute_query(drop_query, fetch=False)
             # execute_queryは内部でコミットを行うようになったので、ここでのコミットは不要
+            self._table_oid = None
             self.logger.info(f"テーブル '{self.table_name}' を削除しました。")
             
+            # バージョン管理テーブルは残し、テーブルの再作成時にバージョン付きカラムを追加し直す
+            # （アクティブなバージョンを維持するため、再構築後もembeddingカラムに戻らない）
+            self._active_version = None
+            self._planner_stats = {}
+            # 再作成後のテーブルではIDが再利用されるため、このプロセスのペイロードキャッシュも破棄する
+            get_payload_cache().clear()
+            
             # テーブルを再作成
             self.create_table()
             return True
@@ -90,50 +189,41 @@ class RAGDatabase(BaseDatabase):
             self.logger.error(f"テーブルのリセット中にエラーが発生しました: {e}")
             return False
     
-    def _normalize_embedding(self, embedding) -> List[float]:
+    def _normalize_embedding(self, embedding) -> np.ndarray:
         """
         埋め込みベクトルをL2ノルムで正規化します。
-        文字列形式の埋め込みベクトルも処理できます。
+        文字列形式（pgvectorのテキスト形式、カンマ区切り）の埋め込みベクトルも処理できます。
         
         Args:
-            embedding (Union[List[float], str]): 正規化する埋め込みベクトル。
+            embedding (Union[np.ndarray, List[float], str]): 正規化する埋め込みベクトル。
             
         Returns:
-            List[float]: 正規化された埋め込みベクトル。
+            np.ndarray: 正規化された埋め込みベクトル（float32）。そのままクエリのパラメータに渡せます。
         """
         try:
-            # 文字列形式の場合は変換
+            # 文字列形式の場合はPythonのfloatを経由せずに変換
             if isinstance(embedding, str):
-                # 文字列から配列に変換
-                if embedding.startswith('[') and embedding.endswith(']'):
-                    # JSON形式の場合
-                    import json
-                    embedding = json.loads(embedding)
-                else:
-                    # カンマ区切りの場合
-                    embedding = [float(x.strip()) for x in embedding.strip('[]').split(',')]
-            
-            # numpy配列に変換
-            embedding_array = np.array(embedding, dtype=np.float32)
+                embedding_array = np.fromstring(embedding.strip().strip('[]'), dtype=np.float32, sep=',')
+            else:
+                # float32の配列はコピーせずにそのまま使用
+                embedding_array = np.asarray(embedding, dtype=np.float32)
             
             # ゼロベクトルのチェック
             norm = np.linalg.norm(embedding_array)
             if norm < 1e-10:  # ほぼゼロの場合
                 self.logger.warning("ゼロベクトルが検出されました。正規化をスキップします。")
-                return embedding_array.tolist()
+                return embedding_array
             
             # L2正規化
-            normalized = embedding_array / norm
-            
-            return normalized.tolist()
+            return embedding_array / norm
         except Exception as e:
             self.logger.error(f"埋め込みベクトルの正規化中にエラーが発生しました: {e}")
             # エラーが発生した場合は元のベクトルをそのまま返す
-            if isinstance(embedding, list):
-                return embedding
+            if isinstance(embedding, (list, np.ndarray)):
+                return np.asarray(embedding)
             else:
                 # 変換できない場合はゼロベクトルを返す
-                return [0.0] * self.dimension
+                return np.zeros(self.dimension, dtype=np.float32)
     
     def build_from_vector_database(self):
         """
@@ -197,34 +287,36 @@ class RAGDatabase(BaseDatabase):
                 filepath_column = "filepath" if "filepath" in column_names else "source_filepath"
                 has_chunk_index = "chunk_index" in column_names
                 has_original_filepath = "original_filepath" in column_names
+                # page_numberカラムがない古いテーブルではNULLとして取得する
+                page_number_column = "page_number" if "page_number" in column_names else "NULL"
                 
                 self.logger.info(f"使用するカラム名: ファイル名={filename_column}, パス={filepath_column}, chunk_index存在={has_chunk_index}, original_filepath存在={has_original_filepath}")
                 
                 # クエリを構築
                 if has_chunk_index and has_original_filepath:
                     query = f"""
-                        SELECT id, chunk_text, embedding, {filename_column}, {filepath_column}, chunk_index, original_filepath 
+                        SELECT id, chunk_text, embedding, {filename_column}, {filepath_column}, chunk_index, original_filepath, {page_number_column}
                         FROM vector_embeddings
                         ORDER BY id
                         LIMIT %s OFFSET %s
                     """
                 elif has_chunk_index:
                     query = f"""
-                        SELECT id, chunk_text, embedding, {filename_column}, {filepath_column}, chunk_index 
+                        SELECT id, chunk_text, embedding, {filename_column}, {filepath_column}, chunk_index, {page_number_column}
                         FROM vector_embeddings
                         ORDER BY id
                         LIMIT %s OFFSET %s
                     """
                 elif has_original_filepath:
                     query = f"""
-                        SELECT id, chunk_text, embedding, {filename_column}, {filepath_column}, original_filepath 
+                        SELECT id, chunk_text, embedding, {filename_column}, {filepath_column}, original_filepath, {page_number_column}
                         FROM vector_embeddings
                         ORDER BY id
                         LIMIT %s OFFSET %s
                     """
                 else:
                     query = f"""
-                        SELECT id, chunk_text, embedding, {filename_column}, {filepath_column} 
+                        SELECT id, chunk_text, embedding, {filename_column}, {filepath_column}, {page_number_column}
                         FROM vector_embeddings
                         ORDER BY id
                         LIMIT %s OFFSET %s
@@ -237,6 +329,7 @@ class RAGDatabase(BaseDatabase):
                 # バッチ処理用のデータを準備
                 batch_data = []
                 for vector in vectors_batch:
+                    *vector, page_number = vector
                     # カラムの組み合わせによって処理を分ける
                     if has_chunk_index and has_original_filepath:
                         vec_id, chunk_text, embedding, filename, filepath, chunk_index, original_filepath = vector
@@ -251,25 +344,22 @@ class RAGDatabase(BaseDatabase):
                         chunk_index = None
                         original_filepath = None
                     
-                    # 埋め込みベクトルを正規化
-                    normalized_embedding = self._normalize_embedding(embedding)
-                    batch_data.append((chunk_text, normalized_embedding, filename, filepath, original_filepath, chunk_index))
+                    batch_data.append((chunk_text, embedding, filename, filepath, original_filepath, chunk_index, vec_id, page_number))
                 
-                # バッチで挿入
+                # 埋め込みベクトルを正規化し、登録済みの各バージョンのカラムも含めてバッチで挿入
+                query, batch_data = self._build_insert(self.table_name, batch_data)
                 with self.get_cursor() as cursor:
-                    query = f'''
-                    INSERT INTO {self.table_name} (chunk_text, embedding, filename, filepath, original_filepath, chunk_index)
-                    VALUES (%s, %s, %s, %s, %s, %s);
-                    '''
-                    execute_batch(cursor, query, batch_data, page_size=100)
+                    execute_batch(cursor, query + ";", batch_data, page_size=100)
                     self.connection.commit()
                 
                 processed_count += len(vectors_batch)
             
-            # データ挿入後にインデックスを作成
+            # データ挿入後にインデックスを作成（buildingのバージョンはEmbeddingMigratorのfinalizeで作成する）
             if processed_count > 0:
                 self.logger.info("データ挿入完了後に検索インデックスを作成します。")
-                self.create_search_index()
+                for version in self._writable_embedding_versions():
+                    if version['status'] in ('active', 'ready'):
+                        self.create_search_index(version['column_name'])
             
             self.logger.info(f"{processed_count}件のドキュメントをRAGデータベースに格納しました。")
             return processed_count
@@ -284,18 +374,23 @@ class RAGDatabase(BaseDatabase):
             if vector_conn:
                 vector_conn.close()
     
-    def create_search_index(self):
+    def create_search_index(self, embedding_column: str = "embedding"):
         """
         検索用のIVFFLATインデックスを作成します。
         データ量に応じてクラスタ数(lists)を動的に設定します。
+        
+        Args:
+            embedding_column (str): インデックスを作成する埋め込みベクトルのカラム名。
         """
+        index_name = f"{self.table_name}_{embedding_column}_idx"
+        new_index_name = f"{index_name}_new"
         try:
-            # 既存のインデックスを削除
-            drop_index_query = f"DROP INDEX IF EXISTS {self.table_name}_embedding_idx;"
+            # 作成途中で残ったインデックスを削除
+            drop_index_query = f"DROP INDEX IF EXISTS {new_index_name};"
             self.execute_query(drop_index_query, fetch=False)
             
             # データ量を取得して最適なクラスタ数を計算
-            count_query = f"SELECT COUNT(*) FROM {self.table_name};"
+            count_query = f"SELECT COUNT(*) FROM {self.table_name} WHERE {embedding_column} IS NOT NULL;"
             count_result = self.execute_query(count_query)
             row_count = count_result[0][0] if count_result else 0
             
@@ -313,43 +408,804 @@ class RAGDatabase(BaseDatabase):
             self.logger.info(f"データ量 {row_count} 件に対して {lists} クラスタでインデックスを作成します。")
             
             # 新しいインデックスを作成
+            # 新しいインデックスを別名で作成してから入れ替えるため、再作成中も既存のインデックスで検索できる
             index_query = f'''
-            CREATE INDEX {self.table_name}_embedding_idx 
+            CREATE INDEX {new_index_name} 
             ON {self.table_name} 
-            USING ivfflat (embedding vector_cosine_ops)
+            USING ivfflat ({embedding_column} vector_cosine_ops)
             WITH (lists = {lists});
             '''
             self.execute_query(index_query, fetch=False)
-            self.logger.info(f"テーブル '{self.table_name}' にivfflat検索インデックスを作成しました。")
+            
+            with self.get_cursor() as cursor:
+                try:
+                    cursor.execute(f"DROP INDEX IF EXISTS {index_name};")
+                    cursor.execute(f"ALTER INDEX {new_index_name} RENAME TO {index_name};")
+                    self.connection.commit()
+                except Exception:
+                    self.connection.rollback()
+                    raise
+            self._planner_stats.pop(embedding_column, None)
+            self.logger.info(f"テーブル '{self.table_name}' のカラム '{embedding_column}' にivfflat検索インデックスを作成しました。")
             return True
         except Exception as e:
             self.logger.error(f"検索インデックスの作成中にエラーが発生しました: {e}")
             return False
     
-    def insert_document(self, text, embedding, filename, filepath, chunk_index=None):
+    def create_version_table(self):
+        """
+        埋め込みモデルのバージョン管理テーブルを作成します。
+        
+        各バージョンはrag_documentsテーブル上の1つの埋め込みカラムに対応し、
+        statusが'active'のバージョンだけが検索に使用されます。
+        テーブルが空の場合は、既存のembeddingカラムをアクティブなバージョンとして登録します。
+        
+        Returns:
+            bool: 成功したかどうか。
+        """
+        try:
+            query = f'''
+            CREATE TABLE IF NOT EXISTS {self.version_table_name} (
+                version_id SERIAL PRIMARY KEY,
+                model_name TEXT NOT NULL,
+                dimension INTEGER NOT NULL,
+                column_name TEXT NOT NULL UNIQUE,
+                status TEXT NOT NULL DEFAULT 'building',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                activated_at TIMESTAMP
+            );
+            '''
+            self.execute_query(query, fetch=False)
+            
+            # 既存のembeddingカラムを初期バージョンとして登録
+            seed_query = f'''
+            INSERT INTO {self.version_table_name} (model_name, dimension, column_name, status, activated_at)
+            SELECT %s, %s, 'embedding', 'active', CURRENT_TIMESTAMP
+            WHERE NOT EXISTS (SELECT 1 FROM {self.version_table_name});
+            '''
+            self.execute_query(seed_query, (self.embedding_model, self.dimension), fetch=False)
+            self._active_version = None
+            return True
+        except Exception as e:
+            self.logger.error(f"バージョン管理テーブルの作成中にエラーが発生しました: {e}")
+            return False
+    
+    def _default_embedding_version(self) -> Dict[str, Any]:
+        """
+        バージョン管理テーブルが存在しない場合に使用する既定のバージョン情報を返します。
+        
+        Returns:
+            Dict[str, Any]: embeddingカラムを指すバージョン情報。
+        """
+        return {
+            'version_id': None,
+            'model_name': self.embedding_model,
+            'dimension': self.dimension,
+            'column_name': 'embedding',
+            'status': 'active',
+        }
+    
+    def _writable_embedding_versions(self) -> List[Dict[str, Any]]:
+        """
+        新しいチャンクのベクトルを書き込む埋め込みバージョン（active、ready、building）を取得します。
+        
+        退役したバージョンのカラムはNULLのまま残し、再びアクティブにする際にEmbeddingMigratorで埋めます。
+        
+        Returns:
+            List[Dict[str, Any]]: バージョン情報のリスト。バージョン管理テーブルがない場合は既定のバージョンのみ。
+        """
+        if not self.table_exists(self.version_table_name):
+            return [self._default_embedding_version()]
+        versions = [version for version in self.list_embedding_versions()
+                    if version['status'] in ('active', 'ready', 'building')]
+        return versions or [self._default_embedding_version()]
+    
+    def _embed_for_versions(self, texts: List[str], source_embeddings: List[Any]) -> Dict[str, List[np.ndarray]]:
+        """
+        新しいチャンクについて、書き込み対象の全ての埋め込みバージョンのカラムのベクトルを生成します。
+        
+        ベクトルデータベースのベクトルを生成したモデル（embedding_model）のバージョンにはそのベクトルを使用し、
+        それ以外のモデルのバージョンはチャンク本文をそのモデルで埋め込みます。
+        カットオーバー後に追加されたチャンクもアクティブなバージョンのカラムが埋まるため、すぐに検索対象になります。
+        
+        Args:
+            texts (List[str]): チャンク本文のリスト。
+            source_embeddings (List[Any]): ベクトルデータベースの埋め込みベクトルのリスト。
+            
+        Returns:
+            Dict[str, List[np.ndarray]]: カラム名ごとの正規化済みベクトルのリスト。
+        """
+        vectors_by_model: Dict[str, List[np.ndarray]] = {
+            self.embedding_model: [self._normalize_embedding(embedding) for embedding in source_embeddings]
+        }
+        columns: Dict[str, List[np.ndarray]] = {}
+        for version in self._writable_embedding_versions():
+            model_name = version['model_name']
+            if model_name not in vectors_by_model:
+                self.logger.info(f"{len(texts)} 件のチャンクをバージョン {version['version_id']} のモデル '{model_name}' で埋め込みます。")
+                registry = get_model_registry()
+                generator = registry.acquire(model_name)
+                try:
+                    embeddings = generate_bulk_embeddings(generator, texts)
+                finally:
+                    registry.release(generator)
+                vectors_by_model[model_name] = [self._normalize_embedding(embedding) for embedding in embeddings]
+            columns[version['column_name']] = vectors_by_model[model_name]
+        return columns
+    
+    def _build_insert(self, table_name: str, rows: List[Tuple]) -> Tuple[str, List[Tuple]]:
+        """
+        チャンクを挿入するクエリとパラメータを、書き込み対象の埋め込みバージョンのカラムを含めて構築します。
+        
+        埋め込みの生成に時間がかかることがあるため、トランザクションを開始する前に呼び出してください。
+        
+        Args:
+            table_name (str): 挿入先のテーブル名。
+            rows (List[Tuple]): (chunk_text, 埋め込みベクトル, filename, filepath, original_filepath, chunk_index, source_id, page_number)のリスト。
+            
+        Returns:
+            Tuple[str, List[Tuple]]: INSERTクエリ（末尾のセミコロンなし）とパラメータのリスト。
+        """
+        vectors = self._embed_for_versions([row[0] for row in rows], [row[1] for row in rows])
+        embedding_columns = list(vectors)
+        columns = ", ".join(["chunk_text", *embedding_columns, "filename", "filepath", "original_filepath", "chunk_index", "source_id",
+                             "page_number"])
+        placeholders = ", ".join(["%s"] * (len(embedding_columns) + 7))
+        query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+        batch_data = [
+            (row[0], *(vectors[column][i] for column in embedding_columns), *row[2:])
+            for i, row in enumerate(rows)
+        ]
+        return query, batch_data
+    
+    def get_active_embedding_version(self, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        検索に使用するアクティブな埋め込みバージョンを取得します。
+        
+        モデル名とカラム名を1回の問い合わせで取得するため、クエリの埋め込みに使うモデルと
+        検索対象のカラムが食い違うことはありません。
+        
+        Args:
+            use_cache (bool): キャッシュされた値を使用するかどうか。
+            
+        Returns:
+            Dict[str, Any]: version_id, model_name, dimension, column_name, statusを含む辞書。
+        """
+        now = time.monotonic()
+        if use_cache and self._active_version is not None and now - self._active_version_loaded_at < self.version_cache_ttl:
+            return self._active_version
+        
+        version = self._default_embedding_version()
+        try:
+            if self.table_exists(self.version_table_name):
+                query = f'''
+                SELECT version_id, model_name, dimension, column_name, status
+                FROM {self.version_table_name}
+                WHERE status = 'active'
+                ORDER BY activated_at DESC NULLS LAST
+                LIMIT 1;
+                '''
+                result = self.execute_query(query)
+                if result:
+                    version_id, model_name, dimension, column_name, status = result[0]
+                    version = {
+                        'version_id': version_id,
+                        'model_name': model_name,
+                        'dimension': dimension,
+                        'column_name': column_name,
+                        'status': status,
+                    }
+        except Exception as e:
+            self.logger.warning(f"アクティブな埋め込みバージョンの取得に失敗したため既定値を使用します: {e}")
+        
+        self._active_version = version
+        self._active_version_loaded_at = now
+        return version
+    
+    def list_embedding_versions(self) -> List[Dict[str, Any]]:
+        """
+        登録されている埋め込みバージョンの一覧を取得します。
+        
+        Returns:
+            List[Dict[str, Any]]: バージョン情報のリスト。
+        """
+        try:
+            query = f'''
+            SELECT version_id, model_name, dimension, column_name, status, created_at, activated_at
+            FROM {self.version_table_name}
+            ORDER BY version_id;
+            '''
+            columns = ['version_id', 'model_name', 'dimension', 'column_name', 'status', 'created_at', 'activated_at']
+            return [dict(zip(columns, row)) for row in self.execute_query(query)]
+        except Exception as e:
+            self.logger.error(f"埋め込みバージョン一覧の取得中にエラーが発生しました: {e}")
+            return []
+    
+    def get_embedding_version(self, model_name: str) -> Optional[Dict[str, Any]]:
+        """
+        指定したモデルの最新の埋め込みバージョンを取得します。
+        
+        Args:
+            model_name (str): モデル名。
+            
+        Returns:
+            Optional[Dict[str, Any]]: バージョン情報。登録されていない場合はNone。
+        """
+        for version in reversed(self.list_embedding_versions()):
+            if version['model_name'] == model_name and version['status'] != 'dropped':
+                return version
+        return None
+    
+    def register_embedding_version(self, model_name: str, dimension: int) -> Optional[Dict[str, Any]]:
+        """
+        新しい埋め込みバージョンを登録し、対応するカラムをrag_documentsテーブルに追加します。
+        
+        追加されたカラムはNULLで初期化され、statusは'building'になります。
+        既存のカラムや検索には影響しません。
+        
+        Args:
+            model_name (str): 新しい埋め込みモデル名。
+            dimension (int): 新しいモデルのベクトル次元数。
+            
+        Returns:
+            Optional[Dict[str, Any]]: 登録されたバージョン情報。エラー時はNone。
+        """
+        with self.get_cursor() as cursor:
+            try:
+                cursor.execute(f"SELECT nextval(pg_get_serial_sequence('{self.version_table_name}', 'version_id'));")
+                version_id = cursor.fetchone()[0]
+                column_name = f"embedding_v{version_id}"
+                
+                cursor.execute(f'''
+                INSERT INTO {self.version_table_name} (version_id, model_name, dimension, column_name, status)
+                VALUES (%s, %s, %s, %s, 'building');
+                ''', (version_id, model_name, dimension, column_name))
+                cursor.execute(f"ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS {column_name} VECTOR({int(dimension)});")
+                if self._has_delta_table():
+                    cursor.execute(f"ALTER TABLE {self.delta_table_name} ADD COLUMN IF NOT EXISTS {column_name} VECTOR({int(dimension)});")
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                self.logger.error(f"埋め込みバージョンの登録中にエラーが発生しました: {e}")
+                return None
+        
+        self.logger.info(f"埋め込みバージョン {version_id} (モデル: {model_name}, カラム: {column_name}) を登録しました。")
+        return {
+            'version_id': version_id,
+            'model_name': model_name,
+            'dimension': dimension,
+            'column_name': column_name,
+            'status': 'building',
+        }
+    
+    def fetch_unembedded_chunks(self, embedding_column: str, batch_size: int = 64) -> List[Tuple[int, str]]:
+        """
+        指定したカラムの埋め込みベクトルがまだ生成されていないチャンクを取得します。
+        
+        Args:
+            embedding_column (str): 埋め込みベクトルのカラム名。
+            batch_size (int): 取得する最大件数。
+            
+        Returns:
+            List[Tuple[int, str]]: (id, chunk_text)のリスト。
+        """
+        query = f'''
+        SELECT id, chunk_text FROM {self.table_name}
+        WHERE {embedding_column} IS NULL
+        '''
+        if self._has_delta_table():
+            query += f'''
+            UNION ALL
+            SELECT id, chunk_text FROM {self.delta_table_name}
+            WHERE {embedding_column} IS NULL
+            '''
+        query += "ORDER BY id LIMIT %s;"
+        return self.execute_query(query, (batch_size,))
+    
+    def count_unembedded_chunks(self, embedding_column: str) -> int:
+        """
+        指定したカラムの埋め込みベクトルが未生成のチャンク数を取得します。
+        
+        Args:
+            embedding_column (str): 埋め込みベクトルのカラム名。
+            
+        Returns:
+            int: 未生成のチャンク数。
+        """
+        query = f"SELECT COUNT(*) FROM {self.table_name} WHERE {embedding_column} IS NULL;"
+        result = self.execute_query(query)
+        count = result[0][0] if result else 0
+        if self._has_delta_table():
+            query = f"SELECT COUNT(*) FROM {self.delta_table_name} WHERE {embedding_column} IS NULL;"
+            result = self.execute_query(query)
+            count += result[0][0] if result else 0
+        return count
+    
+    def update_version_embeddings(self, embedding_column: str, rows: List[Tuple[int, np.ndarray]]) -> int:
+        """
+        指定したカラムに埋め込みベクトルを書き込みます。ベクトルはL2ノルム正規化されます。
+        
+        Args:
+            embedding_column (str): 埋め込みベクトルのカラム名。
+            rows (List[Tuple[int, np.ndarray]]): (id, 埋め込みベクトル)のリスト。
+            
+        Returns:
+            int: 更新した件数。
+        """
+        if not rows:
+            return 0
+        
+        batch_data = [(self._normalize_embedding(embedding), doc_id) for doc_id, embedding in rows]
+        with self.get_cursor() as cursor:
+            try:
+                # IDはメインテーブルと差分テーブルで共通の連番なので、どちらか一方だけが更新される
+                query = f"UPDATE {self.table_name} SET {embedding_column} = %s WHERE id = %s;"
+                execute_batch(cursor, query, batch_data, page_size=100)
+                if self._has_delta_table():
+                    query = f"UPDATE {self.delta_table_name} SET {embedding_column} = %s WHERE id = %s;"
+                    execute_batch(cursor, query, batch_data, page_size=100)
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                self.logger.error(f"埋め込みベクトルの更新中にエラーが発生しました: {e}")
+                raise
+        return len(batch_data)
+    
+    def set_embedding_version_status(self, version_id: int, status: str) -> bool:
+        """
+        埋め込みバージョンのstatusを変更します。アクティブ化にはactivate_embedding_versionを使用してください。
+        
+        Args:
+            version_id (int): バージョンID。
+            status (str): 新しいstatus（'building', 'ready', 'retired'）。
+            
+        Returns:
+            bool: 成功したかどうか。
+        """
+        try:
+            query = f"UPDATE {self.version_table_name} SET status = %s WHERE version_id = %s AND status <> 'active';"
+            self.execute_query(query, (status, version_id), fetch=False)
+            return True
+        except Exception as e:
+            self.logger.error(f"埋め込みバージョン {version_id} のstatus変更中にエラーが発生しました: {e}")
+            return False
+    
+    def activate_embedding_version(self, version_id: int) -> bool:
+        """
+        埋め込みバージョンを1つのトランザクションでアクティブに切り替えます。
+        
+        現在のアクティブなバージョンは'retired'になりますが、カラムは残るため、
+        キャッシュが切れるまでの間に旧バージョンで検索しているプロセスにも影響しません。
+        
+        Args:
+            version_id (int): アクティブにするバージョンID。'ready'または'retired'である必要があります。
+            
+        Returns:
+            bool: 切り替えに成功したかどうか。
+        """
+        with self.get_cursor() as cursor:
+            try:
+                # 同時に切り替えが走らないよう、バージョン管理テーブルをロックする
+                cursor.execute(f"LOCK TABLE {self.version_table_name} IN EXCLUSIVE MODE;")
+                cursor.execute(f"SELECT status FROM {self.version_table_name} WHERE version_id = %s;", (version_id,))
+                row = cursor.fetchone()
+                if row is None or row[0] not in ('ready', 'retired'):
+                    raise ValueError(f"バージョン {version_id} は切り替え可能な状態ではありません（status: {row[0] if row else None}）")
+                
+                cursor.execute(f"UPDATE {self.version_table_name} SET status = 'retired' WHERE status = 'active';")
+                cursor.execute(f'''
+                UPDATE {self.version_table_name}
+                SET status = 'active', activated_at = CURRENT_TIMESTAMP
+                WHERE version_id = %s;
+                ''', (version_id,))
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                self.logger.error(f"埋め込みバージョン {version_id} への切り替え中にエラーが発生しました: {e}")
+                return False
+        
+        self._active_version = None
+        self.logger.info(f"埋め込みバージョン {version_id} をアクティブにしました。")
+        return True
+    
+    def drop_embedding_version(self, version_id: int) -> bool:
+        """
+        退役した埋め込みバージョンのカラムとインデックスを削除します。
+        
+        Args:
+            version_id (int): 削除するバージョンID。'retired'である必要があります。
+            
+        Returns:
+            bool: 成功したかどうか。
+        """
+        with self.get_cursor() as cursor:
+            try:
+                cursor.execute(f"SELECT column_name, status FROM {self.version_table_name} WHERE version_id = %s FOR UPDATE;", (version_id,))
+                row = cursor.fetchone()
+                if row is None or row[1] != 'retired':
+                    raise ValueError(f"バージョン {version_id} は退役していないため削除できません")
+                column_name = row[0]
+                if column_name == 'embedding':
+                    # embeddingカラムはベクトルデータベースからの取り込みで使用されるため削除しない
+                    raise ValueError("初期バージョンのembeddingカラムは削除できません")
+                
+                cursor.execute(f"DROP INDEX IF EXISTS {self.table_name}_{column_name}_idx;")
+                cursor.execute(f"ALTER TABLE {self.table_name} DROP COLUMN IF EXISTS {column_name};")
+                if self._has_delta_table():
+                    cursor.execute(f"ALTER TABLE {self.delta_table_name} DROP COLUMN IF EXISTS {column_name};")
+                cursor.execute(f"UPDATE {self.version_table_name} SET status = 'dropped' WHERE version_id = %s;", (version_id,))
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                self.logger.error(f"埋め込みバージョン {version_id} の削除中にエラーが発生しました: {e}")
+                return False
+        
+        self.logger.info(f"埋め込みバージョン {version_id} のカラムを削除しました。")
+        return True
+    
+    def create_delta_table(self):
+        """
+        差分テーブルとトゥームストーンテーブルを作成します。
+        
+        差分テーブルはメインテーブルと同じカラム構成で、IDはメインテーブルと同じシーケンスから採番されるため、
+        両テーブルをまたいでIDが一意になります。
+        
+        Returns:
+            bool: 作成に成功したかどうか
+        """
+        try:
+            # 登録済みバージョンのカラムを引き継ぐため、バージョン管理テーブルを先に用意する
+            self.create_version_table()
+            
+            with self.get_cursor() as cursor:
+                try:
+                    # 既存のテーブルにはsource_idカラムがない場合があるため追加する
+                    cursor.execute(f"ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS source_id INTEGER;")
+                    
+                    # LIKE ... INCLUDING DEFAULTS により、IDのデフォルト値（メインテーブルのシーケンス）も引き継ぐ
+                    cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {self.delta_table_name}
+                    (LIKE {self.table_name} INCLUDING DEFAULTS INCLUDING STORAGE);
+                    ''')
+                    cursor.execute(f"ALTER TABLE {self.delta_table_name} ALTER COLUMN embedding DROP NOT NULL;")
+                    cursor.execute(f"ALTER TABLE {self.delta_table_name} ADD COLUMN IF NOT EXISTS page_number INTEGER;")
+                    cursor.execute(f"ALTER TABLE {self.delta_table_name} SET (toast_tuple_target = 128);")
+                    cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {self.tombstone_table_name} (
+                        doc_id INTEGER PRIMARY KEY,
+                        deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                    ''')
+                    
+                    # 登録済みの埋め込みバージョンのカラムを差分テーブルにも追加
+                    cursor.execute(f'''
+                    SELECT column_name, dimension FROM {self.version_table_name}
+                    WHERE status <> 'dropped' AND column_name <> 'embedding';
+                    ''')
+                    for column_name, dimension in cursor.fetchall():
+                        cursor.execute(f"ALTER TABLE {self.delta_table_name} ADD COLUMN IF NOT EXISTS {column_name} VECTOR({int(dimension)});")
+                    self.connection.commit()
+                except Exception:
+                    self.connection.rollback()
+                    raise
+            
+            self._delta_table_exists = True
+            self._delta_table_checked_at = time.monotonic()
+            self.logger.info(f"差分テーブル '{self.delta_table_name}' とトゥームストーンテーブル '{self.tombstone_table_name}' を作成しました。")
+            return True
+        except Exception as e:
+            self.logger.error(f"差分テーブルの作成中にエラーが発生しました: {e}")
+            return False
+    
+    def _has_delta_table(self) -> bool:
+        """
+        差分テーブルが存在するかどうかを返します。
+        
+        結果はplanner_stats_ttl秒キャッシュします。起動後に他のプロセス（取り込みや差分統合）が差分テーブルを作成した場合も、
+        キャッシュが切れた時点で差分テーブルを検索・統合の対象にします。
+        
+        Returns:
+            bool: 差分テーブルとトゥームストーンテーブルが存在するかどうか
+        """
+        now = time.monotonic()
+        if self._delta_table_exists is None or now - self._delta_table_checked_at >= self.planner_stats_ttl:
+            query = '''
+            SELECT COUNT(*) FROM information_schema.tables
+            WHERE table_name IN (%s, %s);
+            '''
+            result = self.execute_query(query, (self.delta_table_name, self.tombstone_table_name))
+            self._delta_table_exists = bool(result) and result[0][0] == 2
+            self._delta_table_checked_at = now
+        return self._delta_table_exists
+    
+    def _build_merged_search_query(self, select_columns: str, embedding_column: str, vector_str: str,
+                                   similarity_threshold: Optional[float], search_limit: int) -> str:
+        """
+        メインテーブルと差分テーブルの検索結果をマージする検索クエリを構築します。
+        
+        メインテーブルはトゥームストーンに登録されたIDを除外して検索し、差分テーブルは全件を検索します。
+        
+        Args:
+            select_columns (str): 取得するカラム（類似度を除く）
+            embedding_column (str): 検索対象の埋め込みカラム
+            vector_str (str): PGVECTOR形式のクエリベクトル
+            similarity_threshold (Optional[float]): 類似度の最小閾値。Noneの場合は絞り込まない
+            search_limit (int): 取得する最大件数
+            
+        Returns:
+            str: 検索クエリ
+        """
+        distance = f"{embedding_column} <=> {vector_str}"
+        similarity = f"1 - ({distance})"
+        condition = f"{embedding_column} IS NOT NULL"
+        if similarity_threshold is not None:
+            condition += f" AND {similarity} >= {similarity_threshold}"
+        
+        # ivfflatインデックスは距離の昇順でのみ使用されるため、類似度ではなく距離で並べる
+        if not self._has_delta_table():
+            return f'''
+            SELECT {select_columns}, {similarity} as similarity
+            FROM {self.table_name}
+            WHERE {condition}
+            ORDER BY {distance}
+            LIMIT {search_limit};
+            '''
+        
+        return f'''
+        (SELECT {select_columns}, {similarity} as similarity
+         FROM {self.table_name}
+         WHERE {condition}
+           AND NOT EXISTS (SELECT 1 FROM {self.tombstone_table_name} t WHERE t.doc_id = {self.table_name}.id)
+         ORDER BY {distance}
+         LIMIT {search_limit})
+        UNION ALL
+        (SELECT {select_columns}, {similarity} as similarity
+         FROM {self.delta_table_name}
+         WHERE {condition}
+         ORDER BY {distance}
+         LIMIT {search_limit})
+        ORDER BY similarity DESC
+        LIMIT {search_limit};
+        '''
+    
+    def get_delta_stats(self) -> Dict[str, int]:
+        """
+        差分テーブルの行数とトゥームストーンの件数を取得します。
+        
+        Returns:
+            Dict[str, int]: delta_rows（差分テーブルの行数）とtombstones（トゥームストーンの件数）
+        """
+        if not self._has_delta_table():
+            return {'delta_rows': 0, 'tombstones': 0}
+        
+        delta_result = self.execute_query(f"SELECT COUNT(*) FROM {self.delta_table_name};")
+        tombstone_result = self.execute_query(f"SELECT COUNT(*) FROM {self.tombstone_table_name};")
+        return {
+            'delta_rows': delta_result[0][0] if delta_result else 0,
+            'tombstones': tombstone_result[0][0] if tombstone_result else 0
+        }
+    
+    def sync_from_vector_database(self) -> Dict[str, int]:
+        """
+        ベクトルデータベースとの差分だけをRAGデータベースに反映します。
+        
+        ベクトルデータベースに追加されたチャンクは正規化して差分テーブルに挿入し、
+        削除されたチャンクはトゥームストーンに登録します（差分テーブルの行は直接削除します）。
+        内容が変わらずにファイル内の位置だけが変わったチャンク（ベクトルデータベースで行が再利用されたもの）は、
+        埋め込みベクトルはそのままでchunk_indexとpage_numberだけを更新します。
+        メインテーブルのインデックスは再作成しないため、取り込んだチャンクはすぐに検索対象になります。
+        
+        テーブルが存在しない場合や、source_idを持たない古いテーブルの場合は全件再構築を行います。
+        
+        Returns:
+            Dict[str, int]: added（追加件数）、removed（削除件数）、updated（chunk_index・page_numberの更新件数）
+        """
+        stats = {'added': 0, 'removed': 0, 'updated': 0}
+        
+        table_check = self.execute_query(f'''
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_name = '{self.table_name}' AND column_name = 'source_id';
+        ''')
+        if not table_check or table_check[0][0] == 0:
+            self.logger.info("source_idを持つRAGテーブルが存在しないため、全件再構築を行います。")
+            stats['added'] = self.build_from_vector_database()
+            return stats
+        
+        if not self._has_delta_table() and not self.create_delta_table():
+            return stats
+        
+        # 全件再構築したテーブルにsource_idが設定されていない場合は差分を計算できない
+        missing_result = self.execute_query(f"SELECT COUNT(*) FROM {self.table_name} WHERE source_id IS NULL;")
+        if missing_result and missing_result[0][0] > 0:
+            self.logger.info("source_idが未設定のドキュメントがあるため、全件再構築を行います。")
+            stats['added'] = self.build_from_vector_database()
+            return stats
+        
+        vector_conn = None
+        vector_cursor = None
+        
+        try:
+            vector_conn = psycopg2.connect(**self.vector_db_config)
+            vector_cursor = vector_conn.cursor()
+            
+            vector_cursor.execute("SELECT id, chunk_index, page_number FROM vector_embeddings;")
+            vector_positions = {row[0]: (row[1], row[2]) for row in vector_cursor.fetchall()}
+            vector_ids = set(vector_positions)
+            
+            main_rows = self.execute_query(f'''
+            SELECT id, source_id, chunk_index, page_number FROM {self.table_name} m
+            WHERE NOT EXISTS (SELECT 1 FROM {self.tombstone_table_name} t WHERE t.doc_id = m.id);
+            ''') or []
+            delta_rows = self.execute_query(f"SELECT id, source_id, chunk_index, page_number FROM {self.delta_table_name};") or []
+            
+            known_ids = {row[1] for row in main_rows} | {row[1] for row in delta_rows}
+            added_ids = sorted(vector_ids - known_ids)
+            removed_ids = known_ids - vector_ids
+            
+            # 位置（chunk_indexとpage_number）だけが変わったチャンク
+            moved_main = [(*vector_positions[row[1]], row[0]) for row in main_rows
+                          if row[1] in vector_positions and (row[2], row[3]) != vector_positions[row[1]]]
+            moved_delta = [(*vector_positions[row[1]], row[0]) for row in delta_rows
+                           if row[1] in vector_positions and (row[2], row[3]) != vector_positions[row[1]]]
+            
+            if not added_ids and not removed_ids and not moved_main and not moved_delta:
+                self.logger.info("ベクトルデータベースとの差分はありません。")
+                return stats
+            
+            # 追加されたチャンクを取得
+            batch_data = []
+            batch_size = 1000
+            for offset in range(0, len(added_ids), batch_size):
+                vector_cursor.execute('''
+                SELECT id, chunk_text, embedding, filename, filepath, original_filepath, chunk_index, page_number
+                FROM vector_embeddings
+                WHERE id = ANY(%s)
+                ORDER BY id;
+                ''', (added_ids[offset:offset + batch_size],))
+                for vec_id, chunk_text, embedding, filename, filepath, original_filepath, chunk_index, page_number in vector_cursor.fetchall():
+                    batch_data.append((chunk_text, embedding, filename, filepath, original_filepath, chunk_index, vec_id, page_number))
+            
+            # 正規化し、アクティブなバージョンなど書き込み対象の全てのカラムのベクトルを用意する
+            if batch_data:
+                insert_query, batch_data = self._build_insert(self.delta_table_name, batch_data)
+            
+            removed_main_ids = [row[0] for row in main_rows if row[1] in removed_ids]
+            removed_delta_ids = [row[0] for row in delta_rows if row[1] in removed_ids]
+            
+            # 追加と削除を1つのトランザクションで反映する
+            with self.get_cursor() as cursor:
+                try:
+                    if batch_data:
+                        execute_batch(cursor, insert_query + ";", batch_data, page_size=100)
+                    if removed_main_ids:
+                        execute_batch(
+                            cursor,
+                            f"INSERT INTO {self.tombstone_table_name} (doc_id) VALUES (%s) ON CONFLICT (doc_id) DO NOTHING;",
+                            [(doc_id,) for doc_id in removed_main_ids],
+                            page_size=100
+                        )
+                    if removed_delta_ids:
+                        cursor.execute(f"DELETE FROM {self.delta_table_name} WHERE id = ANY(%s);", (removed_delta_ids,))
+                    if moved_main:
+                        execute_batch(cursor, f"UPDATE {self.table_name} SET chunk_index = %s, page_number = %s WHERE id = %s;", moved_main, page_size=100)
+                    if moved_delta:
+                        execute_batch(cursor, f"UPDATE {self.delta_table_name} SET chunk_index = %s, page_number = %s WHERE id = %s;", moved_delta, page_size=100)
+                    self.connection.commit()
+                except Exception:
+                    self.connection.rollback()
+                    raise
+            
+            stats['added'] = len(batch_data)
+            stats['removed'] = len(removed_main_ids) + len(removed_delta_ids)
+            stats['updated'] = len(moved_main) + len(moved_delta)
+            
+            # chunk_index・page_numberを更新したドキュメントのペイロードをキャッシュから削除する
+            if stats['updated']:
+                cache = get_payload_cache()
+                cache_prefix = self._payload_cache_prefix()
+                for _, _, doc_id in moved_main + moved_delta:
+                    cache.pop(cache_prefix + (doc_id,))
+            
+            self.logger.info(f"差分を反映しました: 追加 {stats['added']} 件、削除 {stats['removed']} 件、位置の更新 {stats['updated']} 件")
+            return stats
+            
+        except Exception as e:
+            self.logger.error(f"ベクトルデータベースとの差分同期中にエラーが発生しました: {e}")
+            return stats
+        finally:
+            if vector_cursor:
+                vector_cursor.close()
+            if vector_conn:
+                vector_conn.close()
+    
+    def compact_delta(self, force: bool = False) -> bool:
+        """
+        差分テーブルとトゥームストーンをメインテーブルに統合し、検索インデックスを再作成します。
+        
+        差分テーブルの行数とトゥームストーンの件数の合計がdelta_threshold以上の場合のみ実行します。
+        統合は1つのトランザクションで行うため、検索中のクエリが中途半端な状態を参照することはありません。
+        
+        Args:
+            force (bool): 閾値に関係なく統合するかどうか
+            
+        Returns:
+            bool: 統合を実行したかどうか
+        """
+        if not self._has_delta_table():
+            return False
+        
+        stats = self.get_delta_stats()
+        pending = stats['delta_rows'] + stats['tombstones']
+        if pending == 0 or (not force and pending < self.delta_threshold):
+            self.logger.debug(f"差分の統合は不要です（差分 {stats['delta_rows']} 件、トゥームストーン {stats['tombstones']} 件、閾値 {self.delta_threshold}）。")
+            return False
+        
+        self.logger.info(f"差分を統合します（差分 {stats['delta_rows']} 件、トゥームストーン {stats['tombstones']} 件）。")
+        
+        try:
+            with self.get_cursor() as cursor:
+                try:
+                    # 統合中に差分テーブルへの書き込みが割り込まないようにロックする
+                    cursor.execute(f"LOCK TABLE {self.delta_table_name}, {self.tombstone_table_name} IN EXCLUSIVE MODE;")
+                    
+                    cursor.execute('''
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_name = %s
+                    ORDER BY ordinal_position;
+                    ''', (self.delta_table_name,))
+                    columns = ", ".join(row[0] for row in cursor.fetchall())
+                    
+                    cursor.execute(f'''
+                    DELETE FROM {self.table_name} m
+                    USING {self.tombstone_table_name} t
+                    WHERE m.id = t.doc_id;
+                    ''')
+                    cursor.execute(f'''
+                    INSERT INTO {self.table_name} ({columns})
+                    SELECT {columns} FROM {self.delta_table_name};
+                    ''')
+                    cursor.execute(f"DELETE FROM {self.delta_table_name};")
+                    cursor.execute(f"DELETE FROM {self.tombstone_table_name};")
+                    self.connection.commit()
+                except Exception:
+                    self.connection.rollback()
+                    raise
+        except Exception as e:
+            self.logger.error(f"差分の統合中にエラーが発生しました: {e}")
+            return False
+        
+        # 統合したデータでインデックスのクラスタを再学習する（作成後に入れ替えるため検索は止まらない）
+        for version in self.list_embedding_versions() or [self._default_embedding_version()]:
+            if version['status'] in ('active', 'ready'):
+                self.create_search_index(version['column_name'])
+        
+        self._planner_stats = {}
+        self.logger.info("差分の統合が完了しました。")
+        return True
+    
+    def insert_document(self, text, embedding, filename, filepath, chunk_index=None, page_number=None):
         """
         ドキュメントをRAGテーブルに挿入します。
         
         Args:
             text (str): テキストチャンク。
-            embedding (list): ベクトル埋め込み。
+            embedding (np.ndarray): EMBEDDING_MODELで生成したベクトル埋め込み。
             filename (str): ファイル名。
             filepath (str): ファイルパス。
             chunk_index (int, optional): チャンクのインデックス。
+            page_number (int, optional): 元のファイルのページ番号。
             
         Returns:
             int: 挿入されたドキュメントのID。エラー時はNone。
         """
         try:
-            # 埋め込みベクトルを正規化
-            normalized_embedding = self._normalize_embedding(embedding)
+            # メインテーブルのインデックスを再作成しなくても検索できるよう、差分テーブルに挿入する
+            target_table = self.delta_table_name if self._has_delta_table() else self.table_name
             
-            query = f'''
-            INSERT INTO {self.table_name} (chunk_text, embedding, filename, filepath, chunk_index)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING id;
-            '''
-            result = self.execute_query(query, (text, normalized_embedding, filename, filepath, chunk_index))
+            # 埋め込みベクトルを正規化し、書き込み対象の全ての埋め込みバージョンのカラムに書き込む
+            query, params = self._build_insert(target_table, [(text, embedding, filename, filepath, None, chunk_index, None, page_number)])
+            result = self.execute_query(query + " RETURNING id;", params[0])
+            self.commit()
             
             if result:
                 doc_id = result[0][0]
@@ -360,214 +1216,336 @@ class RAGDatabase(BaseDatabase):
             self.logger.error(f"ドキュメントの挿入中にエラーが発生しました: {e}")
             return None
     
-    def search_similar(self, query_embedding: List[float], limit: int = 5, probes: Optional[int] = None, similarity_threshold: float = 0.0) -> List[Tuple]:
+    def _get_planner_stats(self, embedding_column: str, use_cache: bool = True) -> Dict[str, Any]:
         """
-        ivfflatインデックスを使用して類似ドキュメントを高速に検索します。
+        検索プランの決定に使用する統計情報を取得します。
+        
+        検索のたびに問い合わせないよう、結果はplanner_stats_ttl秒キャッシュします。
+        行数はCOUNT(*)ではなくpg_classの推定値を使用します。
         
         Args:
-            query_embedding (List[float]): 検索クエリのベクトル埋め込み。
-            limit (int): 返す結果の最大数。
-            probes (Optional[int]): 検索時に調査するクラスタ数。Noneの場合は自動設定。
-            similarity_threshold (float): 類似度の最小閾値。0～1の間で指定し、この値以上の類似度を持つ結果のみ返します。
+            embedding_column (str): 検索対象の埋め込みカラム
+            use_cache (bool): キャッシュを使用するかどうか
             
         Returns:
-            List[Tuple]: 類似度順に並べられたドキュメントのリスト。
+            Dict[str, Any]: row_count（メインテーブルの推定行数）、delta_rows（差分テーブルの行数）、
+                lists（インデックスのクラスタ数。インデックスがない場合はNone）、has_original_filepath、has_page_number
         """
-        try:
-            # クエリベクトルを正規化
-            normalized_query = self._normalize_embedding(query_embedding)
-            
-            # インデックス情報を取得してprobesパラメータを設定
-            if probes is None:
-                # まずインデックスのクラスタ数を取得
-                index_query = f"""
-                SELECT indexdef FROM pg_indexes 
-                WHERE tablename = '{self.table_name}' AND indexname = '{self.table_name}_embedding_idx';
-                """
-                index_result = self.execute_query(index_query)
-                
-                # デフォルトのクラスタ数
-                lists = 100
-                
-                # インデックス定義からlistsパラメータを抽出
-                if index_result:
-                    indexdef = index_result[0][0]
-                    import re
-                    lists_match = re.search(r'WITH \(lists = (\d+)\)', indexdef)
-                    if lists_match:
-                        lists = int(lists_match.group(1))
-                
-                # pgvectorの推奨に従い、probesの初期値をsqrt(lists)に設定
-                probes = int(np.sqrt(lists))
-                
-                # データ量に応じて調整
-                count_query = f"SELECT COUNT(*) FROM {self.table_name};"
-                count_result = self.execute_query(count_query)
-                row_count = count_result[0][0] if count_result else 0
-                
-                # データ量が多い場合は、精度を高めるためにクラスタ数を増やす
-                if row_count > 100000:
-                    probes = max(probes, 20)  # 大量データの場合は最低20クラスタ
-                
-                self.logger.debug(f"クラスタ数 {lists} に対して probes={probes} で検索します。")
-            
-            # ivfflatインデックスの検索パラメータを設定
-            self.execute_query(f"SET ivfflat.probes = {probes};", fetch=False)
-            
-            # 閾値を考慮して検索クエリを构築
-            # 最初に多めに結果を取得し、後でフィルタリングするための上限
-            search_limit = max(limit * 3, 20)  # 最低でも20件取得
-            
-            # 埋め込みベクトルをPGVECTOR形式に変換
-            vector_str = f"'[{','.join(map(str, normalized_query))}]'::vector({self.dimension})"
+        now = time.time()
+        cached = self._planner_stats.get(embedding_column)
+        if use_cache and cached is not None and now - cached['loaded_at'] < self.planner_stats_ttl:
+            return cached
+        
+        # ANALYZE前のテーブルでは推定値が0または-1になるため、その場合のみ実際に数える
+        result = self.execute_query("SELECT reltuples::BIGINT FROM pg_class WHERE relname = %s;", (self.table_name,))
+        row_count = int(result[0][0]) if result and result[0][0] is not None else 0
+        if row_count <= 0:
+            result = self.execute_query(f"SELECT COUNT(*) FROM {self.table_name};")
+            row_count = result[0][0] if result else 0
+        
+        # インデックス定義からlistsパラメータを抽出
+        lists = None
+        index_result = self.execute_query(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname = %s;",
+            (self.table_name, f"{self.table_name}_{embedding_column}_idx")
+        )
+        if index_result:
+            lists_match = re.search(r'lists\s*=\s*\'?(\d+)', index_result[0][0])
+            lists = int(lists_match.group(1)) if lists_match else 100
+        
+        # テーブルにoriginal_filepath・page_numberカラムが存在するか確認
+        column_result = self.execute_query('''
+        SELECT column_name FROM information_schema.columns 
+        WHERE table_name = %s AND column_name IN ('original_filepath', 'page_number');
+        ''', (self.table_name,))
+        column_names = {row[0] for row in column_result or []}
+        
+        stats = {
+            'row_count': row_count,
+            'delta_rows': self.get_delta_stats()['delta_rows'],
+            'lists': lists,
+            'has_original_filepath': 'original_filepath' in column_names,
+            'has_page_number': 'page_number' in column_names,
+            'loaded_at': now
+        }
+        self._planner_stats[embedding_column] = stats
+        return stats
+    
+    @staticmethod
+    def _estimate_probes(lists: int, row_count: int, recall_target: float) -> int:
+        """
+        要求される再現率を満たすためのprobesを見積もります。
+        
+        pgvectorの推奨に従いsqrt(lists)を基準とし、再現率の要求が高いほど多くのクラスタを調査します。
+        
+        Args:
+            lists (int): インデックスのクラスタ数
+            row_count (int): テーブルの行数
+            recall_target (float): 要求される再現率（0～1）
             
-            # テーブルにoriginal_filepathカラムが存在するか確認
-            column_check_query = f"""
-            SELECT column_name FROM information_schema.columns 
-            WHERE table_name = '{self.table_name}' AND column_name = 'original_filepath';
-            """
-            column_check_result = self.execute_query(column_check_query)
-            column_exists = len(column_check_result) > 0
+        Returns:
+            int: probes（1以上lists以下）
+        """
+        probes = max(1, int(np.sqrt(lists)))
+        if recall_target >= 0.99:
+            probes *= 4
+        elif recall_target >= 0.95:
+            probes *= 2
+        
+        # データ量が多い場合は、精度を高めるためにクラスタ数を増やす
+        if row_count > 100000:
+            probes = max(probes, 20)
+        
+        return min(probes, lists)
+    
+    def plan_search(self, embedding_column: str, strategy: str = "auto", recall_target: Optional[float] = None,
+                    probes: Optional[int] = None) -> Dict[str, Any]:
+        """
+        テーブルの規模と要求される再現率から、全件検索とインデックス検索のどちらを使うかを決定します。
+        
+        - インデックスがない、または行数がexact_scan_max_rows以下の場合は全件検索
+        - 要求される再現率に必要なprobesがクラスタ数の半分以上になる場合は全件検索
+        - それ以外はprobesを調整したインデックス検索
+        
+        Args:
+            embedding_column (str): 検索対象の埋め込みカラム
+            strategy (str): "auto"、"exact"、"ann"のいずれか。"auto"以外は指定された方式を使用
+            recall_target (Optional[float]): 要求される再現率。Noneの場合はdefault_recall_target
+            probes (Optional[int]): インデックス検索時のprobes。Noneの場合は自動設定
             
-            # コサイン類似度を使用して検索（カラムの存在に応じてクエリを調整）
-            if column_exists:
-                self.logger.debug(f"テーブル '{self.table_name}' にoriginal_filepathカラムが存在します。")
-                query = f'''
-                SELECT id, chunk_text, filename, filepath, original_filepath, chunk_index, 1 - (embedding <=> {vector_str}) as similarity
-                FROM {self.table_name}
-                WHERE 1 - (embedding <=> {vector_str}) >= {similarity_threshold}
-                ORDER BY similarity DESC
-                LIMIT {search_limit};
-                '''
-                results = self.execute_query(query)
-                
-                # 結果がない場合は空リストを返す
-                if not results:
-                    return []
-                
-                # 閾値でフィルタリングし、limitまでの結果を返す
-                filtered_results = [r for r in results if r[6] >= similarity_threshold]
-                limited_results = filtered_results[:limit]
-                
+        Returns:
+            Dict[str, Any]: 検索プラン（strategy、probes、row_count、delta_rows、lists、recall_target、reason）
+        """
+        if strategy not in ("auto", "exact", "ann"):
+            raise ValueError(f"不明な検索方式です: {strategy}")
+        
+        stats = self._get_planner_stats(embedding_column)
+        recall_target = self.default_recall_target if recall_target is None else recall_target
+        lists = stats['lists']
+        row_count = stats['row_count']
+        
+        plan = {
+            'strategy': strategy,
+            'probes': None,
+            'row_count': row_count,
+            'delta_rows': stats['delta_rows'],
+            'lists': lists,
+            'recall_target': recall_target,
+            'reason': "呼び出し元の指定"
+        }
+        
+        if strategy == "ann" and lists is None:
+            plan['strategy'] = "exact"
+            plan['reason'] = "インデックスが存在しないため全件検索に切り替え"
+        elif strategy == "auto":
+            if lists is None:
+                plan['strategy'] = "exact"
+                plan['reason'] = "インデックスが存在しない"
+            elif row_count <= self.exact_scan_max_rows:
+                plan['strategy'] = "exact"
+                plan['reason'] = f"行数 {row_count} が閾値 {self.exact_scan_max_rows} 以下"
             else:
-                self.logger.debug(f"テーブル '{self.table_name}' にoriginal_filepathカラムが存在しません。")
-                query = f'''
-                SELECT id, chunk_text, filename, filepath, chunk_index, 1 - (embedding <=> {vector_str}) as similarity
-                FROM {self.table_name}
-                WHERE 1 - (embedding <=> {vector_str}) >= {similarity_threshold}
-                ORDER BY similarity DESC
-                LIMIT {search_limit};
-                '''
-                results = self.execute_query(query)
-                
-                # 結果がない場合は空リストを返す
-                if not results:
-                    return []
-                
-                # 閾値でフィルタリングし、limitまでの結果を返す
-                filtered_results = [r for r in results if r[5] >= similarity_threshold]
-                limited_results = filtered_results[:limit]
+                estimated = probes or self._estimate_probes(lists, row_count, recall_target)
+                if estimated * 2 >= lists:
+                    plan['strategy'] = "exact"
+                    plan['reason'] = f"再現率 {recall_target} に必要なprobes {estimated} がクラスタ数 {lists} の半分以上"
+                else:
+                    plan['strategy'] = "ann"
+                    plan['reason'] = f"行数 {row_count} に対しprobes {estimated}/{lists} で再現率 {recall_target} を見込める"
+        
+        if plan['strategy'] == "ann":
+            plan['probes'] = probes or self._estimate_probes(lists, row_count, recall_target)
+        
+        return plan
+    
+    def search_with_plan(self, query_embedding: np.ndarray, limit: int = 5, similarity_threshold: float = 0.0,
+                         embedding_version: Optional[Dict[str, Any]] = None, strategy: str = "auto",
+                         recall_target: Optional[float] = None, probes: Optional[int] = None) -> Tuple[List[Tuple], Dict[str, Any]]:
+        """
+        検索プランを決定して類似ドキュメントを検索し、結果とプランを返します。
+        
+        プランナーの設定はSET LOCALで検索クエリと同じトランザクション内に限定し、1回の往復で実行します。
+        
+        Args:
+            query_embedding (np.ndarray): 検索クエリのベクトル埋め込み。
+            limit (int): 返す結果の最大数。
+            similarity_threshold (float): 類似度の最小閾値。0～1の間で指定し、この値以上の類似度を持つ結果のみ返します。
+            embedding_version (Optional[Dict[str, Any]]): 検索対象の埋め込みバージョン。Noneの場合はアクティブなバージョン。
+                クエリの埋め込みを生成したモデルと同じバージョンを指定してください。
+            strategy (str): "auto"、"exact"、"ann"のいずれか
+            recall_target (Optional[float]): 要求される再現率。Noneの場合はdefault_recall_target
+            probes (Optional[int]): インデックス検索時のprobes。Noneの場合は自動設定
             
-            # フィルタリング後の結果数をログに出力
-            self.logger.debug(f"検索結果: 全{len(results)}件中{len(filtered_results)}件が閾値{similarity_threshold}以上、返却件数: {len(limited_results)}/{limit}")
+        Returns:
+            Tuple[List[Tuple], Dict[str, Any]]: 類似度順に並べられたドキュメントのリストと、使用した検索プラン。
+        """
+        # 検索対象の埋め込みカラムを決定
+        if embedding_version is None:
+            embedding_version = self.get_active_embedding_version()
+        embedding_column = embedding_version['column_name']
+        dimension = embedding_version['dimension']
+        
+        plan = self.plan_search(embedding_column, strategy=strategy, recall_target=recall_target, probes=probes)
+        
+        # クエリベクトルを正規化し、PGVECTOR形式に変換
+        normalized_query = self._normalize_embedding(query_embedding)
+        vector_str = f"'{to_pgvector_literal(normalized_query)}'::vector({dimension})"
+        
+        # 最初に多めに結果を取得し、後でフィルタリングするための上限
+        search_limit = max(limit * 3, 20)  # 最低でも20件取得
+        
+        # 検索ではIDと類似度だけを取得し、本文とメタデータは上位limit件分だけ後でまとめて取得する
+        query = self._build_merged_search_query("id", embedding_column, vector_str, similarity_threshold, search_limit)
+        
+        if plan['strategy'] == "exact":
+            settings = "SET LOCAL enable_indexscan = off; SET LOCAL enable_bitmapscan = off;"
+        else:
+            settings = f"SET LOCAL ivfflat.probes = {int(plan['probes'])};"
+        
+        start_time = time.time()
+        with self.get_cursor() as cursor:
+            try:
+                cursor.execute(settings + query)
+                results = cursor.fetchall()
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+        plan['elapsed_ms'] = round((time.time() - start_time) * 1000, 2)
+        
+        # 閾値でフィルタリングし、limitまでの結果を返す
+        filtered_results = [r for r in results if r[-1] >= similarity_threshold]
+        
+        # 上位limit件の本文とメタデータを取得し、従来と同じ形式のタプルにする
+        top_results = filtered_results[:limit]
+        payloads = self.hydrate_payloads([doc_id for doc_id, _ in top_results], embedding_column)
+        has_original_filepath = self._get_planner_stats(embedding_column)['has_original_filepath']
+        limited_results = []
+        for doc_id, similarity in top_results:
+            payload = payloads.get(doc_id)
+            if payload is None:
+                # 検索後に削除されたドキュメント
+                continue
+            chunk_text, filename, filepath, original_filepath, chunk_index, page_number = payload
+            if has_original_filepath:
+                limited_results.append((doc_id, chunk_text, filename, filepath, original_filepath, chunk_index, page_number, similarity))
+            else:
+                limited_results.append((doc_id, chunk_text, filename, filepath, chunk_index, similarity))
+        
+        self.logger.debug(f"検索プラン: {plan}")
+        self.logger.debug(f"検索結果: 全{len(results)}件中{len(filtered_results)}件が閾値{similarity_threshold}以上、返却件数: {len(limited_results)}/{limit}")
+        return limited_results, plan
+    
+    def _payload_cache_prefix(self) -> Tuple[Any, Any]:
+        """
+        ペイロードキャッシュのキーの先頭部分（データベース名とテーブルのOID）を返します。
+        
+        テーブルを再作成するとIDが再利用されるため、キーにテーブルのOIDを含めます。
+        検索のたびに問い合わせないよう、OIDはインスタンスにキャッシュし、create_table・reset_tableでテーブルを作成し直したときだけ取得し直します。
+        
+        Returns:
+            Tuple[Any, Any]: (データベース名, テーブルのOID)
+        """
+        if self._table_oid is None:
+            oid_result = self.execute_query("SELECT to_regclass(%s)::oid;", (self.table_name,))
+            self._table_oid = oid_result[0][0] if oid_result else None
+        return (self.db_config.get('dbname'), self._table_oid)
+    
+    def hydrate_payloads(self, doc_ids: List[int], embedding_column: str = "embedding") -> Dict[int, Tuple]:
+        """
+        ドキュメントの本文とメタデータを1回の問い合わせでまとめて取得します。
+        
+        取得したペイロードはプロセス内のLRUキャッシュに保存され、繰り返し検索されるドキュメントは
+        データベースに問い合わせずに返します。
+        
+        Args:
+            doc_ids (List[int]): ドキュメントIDのリスト
+            embedding_column (str): 検索に使用した埋め込みカラム（キャッシュ済みの統計情報の参照に使用）
             
-            return limited_results
+        Returns:
+            Dict[int, Tuple]: ドキュメントIDと(chunk_text, filename, filepath, original_filepath, chunk_index, page_number)の辞書
+        """
+        if not doc_ids:
+            return {}
+        
+        stats = self._get_planner_stats(embedding_column)
+        cache = get_payload_cache()
+        cache_prefix = self._payload_cache_prefix()
+        
+        cached = cache.get_many([cache_prefix + (doc_id,) for doc_id in doc_ids])
+        payloads = {key[-1]: value for key, value in cached.items()}
+        missing_ids = [doc_id for doc_id in doc_ids if doc_id not in payloads]
+        if not missing_ids:
+            return payloads
         
+        original_filepath_column = "original_filepath" if stats['has_original_filepath'] else "NULL"
+        page_number_column = "page_number" if stats['has_page_number'] else "NULL"
+        columns = f"id, chunk_text, filename, filepath, {original_filepath_column}, chunk_index, {page_number_column}"
+        query = f"SELECT {columns} FROM {self.table_name} WHERE id = ANY(%s)"
+        params = [missing_ids]
+        if self._has_delta_table():
+            query += f" UNION ALL SELECT {columns} FROM {self.delta_table_name} WHERE id = ANY(%s)"
+            params.append(missing_ids)
+        
+        fetched = {}
+        for row in self.execute_query(query + ";", tuple(params)) or []:
+            fetched[row[0]] = tuple(row[1:])
+        self.commit()
+        
+        cache.put_many({cache_prefix + (doc_id,): payload for doc_id, payload in fetched.items()})
+        payloads.update(fetched)
+        self.logger.debug(f"ペイロード取得: キャッシュ {len(doc_ids) - len(missing_ids)}件、データベース {len(fetched)}件")
+        return payloads
+    
+    def search_similar(self, query_embedding: np.ndarray, limit: int = 5, probes: Optional[int] = None, similarity_threshold: float = 0.0,
+                       embedding_version: Optional[Dict[str, Any]] = None) -> List[Tuple]:
+        """
+        ivfflatインデックスを使用して類似ドキュメントを高速に検索します。
+        
+        Args:
+            query_embedding (np.ndarray): 検索クエリのベクトル埋め込み。
+            limit (int): 返す結果の最大数。
+            probes (Optional[int]): 検索時に調査するクラスタ数。Noneの場合は自動設定。
+            similarity_threshold (float): 類似度の最小閾値。0～1の間で指定し、この値以上の類似度を持つ結果のみ返します。
+            embedding_version (Optional[Dict[str, Any]]): 検索対象の埋め込みバージョン。Noneの場合はアクティブなバージョン。
+                クエリの埋め込みを生成したモデルと同じバージョンを指定してください。
+            
+        Returns:
+            List[Tuple]: 類似度順に並べられたドキュメントのリスト。
+        """
+        try:
+            results, _ = self.search_with_plan(
+                query_embedding, limit=limit, similarity_threshold=similarity_threshold,
+                embedding_version=embedding_version, strategy="ann", probes=probes
+            )
+            return results
         except Exception as e:
             self.logger.error(f"類似ドキュメント検索中にエラーが発生しました: {e}", exc_info=True)
             return []
     
-    def search_similar_exact(self, query_embedding: List[float], limit: int = 5, similarity_threshold: float = 0.0) -> List[Tuple]:
+    def search_similar_exact(self, query_embedding: np.ndarray, limit: int = 5, similarity_threshold: float = 0.0,
+                             embedding_version: Optional[Dict[str, Any]] = None) -> List[Tuple]:
         """
         インデックスを使用せずに正確な類似ドキュメント検索を行います。
-{{ ... }}
         
         Args:
-            query_embedding (List[float]): 検索クエリのベクトル埋め込み。
+            query_embedding (np.ndarray): 検索クエリのベクトル埋め込み。
             limit (int): 返す結果の最大数。
             similarity_threshold (float): 類似度の最小閾値。0～1の間で指定し、この値以上の類似度を持つ結果のみ返します。
+            embedding_version (Optional[Dict[str, Any]]): 検索対象の埋め込みバージョン。Noneの場合はアクティブなバージョン。
             
         Returns:
             List[Tuple]: 類似度順に並べられたドキュメントのリスト。
         """
-        # 検索設定を保存
-        original_settings = {}
-        
         try:
-            # クエリベクトルを正規化
-            normalized_query = self._normalize_embedding(query_embedding)
-            
-            # PostgreSQLのクエリプランナーの設定を保存
-            original_settings = {}
-            for setting in ['enable_indexscan', 'enable_seqscan']:
-                result = self.execute_query(f"SHOW {setting};")
-                if result:
-                    original_settings[setting] = result[0][0]
-            
-            # インデックススキャンを無効化し、シーケンシャルスキャンを有効化
-            self.execute_query("SET enable_indexscan = off;", fetch=False)
-            self.execute_query("SET enable_seqscan = on;", fetch=False)
-            
-            # 閾値を考慮して検索クエリを构築
-            search_limit = max(limit * 3, 20)  # 最低でも20件取得
-            
-            # 埋め込みベクトルをPGVECTOR形式に変換
-            vector_str = f"'[{','.join(map(str, normalized_query))}]'::vector({self.dimension})"
-            
-            # テーブルにoriginal_filepathカラムが存在するか確認
-            column_check_query = f"""
-            SELECT column_name FROM information_schema.columns 
-            WHERE table_name = '{self.table_name}' AND column_name = 'original_filepath';
-            """
-            column_exists = self.execute_query(column_check_query)
-            
-            # カラムの存在に応じてクエリを調整
-            if column_exists:
-                self.logger.debug(f"テーブル '{self.table_name}' にoriginal_filepathカラムが存在します。")
-                query = f'''
-                SELECT id, chunk_text, filename, filepath, original_filepath, chunk_index, 1 - (embedding <=> {vector_str}) as similarity
-                FROM {self.table_name}
-                WHERE 1 - (embedding <=> {vector_str}) >= {similarity_threshold}
-                ORDER BY similarity DESC
-                LIMIT {search_limit};
-                '''
-                results = self.execute_query(query)
-                
-                # 結果がない場合は空リストを返す
-                if not results:
-                    return []
-                
-                # 閾値でフィルタリングし、limitまでの結果を返す
-                filtered_results = [r for r in results if r[6] >= similarity_threshold]
-            else:
-                self.logger.debug(f"テーブル '{self.table_name}' にoriginal_filepathカラムが存在しません。")
-                query = f'''
-                SELECT id, chunk_text, filename, filepath, chunk_index, 1 - (embedding <=> {vector_str}) as similarity
-                FROM {self.table_name}
-                ORDER BY similarity DESC
-                LIMIT {search_limit};
-                '''
-                results = self.execute_query(query)
-                
-                # 結果がない場合は空リストを返す
-                if not results:
-                    return []
-                
-                # 閾値でフィルタリングし、limitまでの結果を返す
-                filtered_results = [r for r in results if r[5] >= similarity_threshold]
-            
-            # フィルタリング後の結果数をログに出力
-            self.logger.debug(f"正確検索結果: 全{len(results)}件中{len(filtered_results)}件が閾値{similarity_threshold}以上")
-            
-            return filtered_results[:limit]
-            
+            results, _ = self.search_with_plan(
+                query_embedding, limit=limit, similarity_threshold=similarity_threshold,
+                embedding_version=embedding_version, strategy="exact"
+            )
+            return results
         except Exception as e:
             self.logger.error(f"正確検索中にエラーが発生しました: {e}")
             return []
-        finally:
-            # 元の設定に戻す
-            for setting, value in original_settings.items():
-                self.execute_query(f"SET {setting} = {value};", fetch=False)
     
     def get_document_by_id(self, doc_id):
         """
@@ -580,8 +1558,18 @@ class RAGDatabase(BaseDatabase):
             tuple: ドキュメント情報。見つからない場合はNone。
         """
         try:
-            query = f"SELECT * FROM {self.table_name} WHERE id = %s;"
+            if not self._has_delta_table():
+                query = f"SELECT * FROM {self.table_name} WHERE id = %s;"
+                result = self.execute_query(query, (doc_id,))
+                return result[0] if result else None
+            
+            query = f'''
+            SELECT * FROM {self.table_name} m
+            WHERE id = %s AND NOT EXISTS (SELECT 1 FROM {self.tombstone_table_name} t WHERE t.doc_id = m.id);
+            '''
             result = self.execute_query(query, (doc_id,))
+            if not result:
+                result = self.execute_query(f"SELECT * FROM {self.delta_table_name} WHERE id = %s;", (doc_id,))
             return result[0] if result else None
         except Exception as e:
             self.logger.error(f"ID {doc_id} のドキュメント取得中にエラーが発生しました: {e}")
@@ -589,14 +1577,19 @@ class RAGDatabase(BaseDatabase):
     
     def get_document_count(self):
         """
-        ドキュメントの総数を取得する
+        ドキュメントの総数を取得する（差分テーブルを含み、トゥームストーンに登録されたものを除く）
         
         Returns:
             int: ドキュメントの総数
         """
         query = f"SELECT COUNT(*) FROM {self.table_name};"
         result = self.execute_query(query)
-        return result[0][0] if result else 0
+        count = result[0][0] if result else 0
+        
+        if self._has_delta_table():
+            stats = self.get_delta_stats()
+            count += stats['delta_rows'] - stats['tombstones']
+        return count
     
     def get_unique_sources(self):
         """
@@ -606,7 +1599,16 @@ class RAGDatabase(BaseDatabase):
             list: ファイルのリスト（ファイル名とパス）。
         """
         try:
-            query = f"SELECT DISTINCT filename, filepath FROM {self.table_name};"
+            if not self._has_delta_table():
+                query = f"SELECT DISTINCT filename, filepath FROM {self.table_name};"
+                return self.execute_query(query)
+            
+            query = f'''
+            SELECT filename, filepath FROM {self.table_name} m
+            WHERE NOT EXISTS (SELECT 1 FROM {self.tombstone_table_name} t WHERE t.doc_id = m.id)
+            UNION
+            SELECT filename, filepath FROM {self.delta_table_name};
+            '''
             return self.execute_query(query)
         except Exception as e:
             self.logger.error(f"ユニークファイルリストの取得中にエラーが発生しました: {e}")
@@ -616,6 +1618,9 @@ class RAGDatabase(BaseDatabase):
         """
         ドキュメントを削除します。
         
+        メインテーブルの行はインデックスを再作成せずに済むようトゥームストーンに登録し、
+        差分の統合時に物理削除します。差分テーブルの行は直接削除します。
+        
         Args:
             doc_id (int): 削除するドキュメントのID。
             
@@ -623,8 +1628,23 @@ class RAGDatabase(BaseDatabase):
             bool: 削除が成功したかどうか。
         """
         try:
-            query = f"DELETE FROM {self.table_name} WHERE id = %s;"
-            self.execute_query(query, (doc_id,), fetch=False)
+            if self._has_delta_table():
+                with self.get_cursor() as cursor:
+                    try:
+                        cursor.execute(f"DELETE FROM {self.delta_table_name} WHERE id = %s;", (doc_id,))
+                        if cursor.rowcount == 0:
+                            cursor.execute(
+                                f"INSERT INTO {self.tombstone_table_name} (doc_id) "
+                                f"SELECT id FROM {self.table_name} WHERE id = %s ON CONFLICT (doc_id) DO NOTHING;",
+                                (doc_id,)
+                            )
+                        self.connection.commit()
+                    except Exception:
+                        self.connection.rollback()
+                        raise
+            else:
+                query = f"DELETE FROM {self.table_name} WHERE id = %s;"
+                self.execute_query(query, (doc_id,), fetch=False)
             self.logger.info(f"ID {doc_id} のドキュメントを削除しました。")
             return True
         except Exception as e:
@@ -13,6 +13,7 @@ RAGシステムの初期化を一括で行うモジュール。
 
 import os
 import sys
+import argparse
 import pathlib
 from typing import Dict, Any
 from dotenv import load_dotenv
@@ -82,7 +83,7 @@ def check_table_exists(db_config, table_name):
         logger.error(f"テーブル '{table_name}' の存在確認中にエラーが発生しました: {e}")
         return False
 
-def create_vector_database(db_config: Dict[str, Any], markdown_dir: str, reset_table: bool = True) -> VectorDatabase:
+def create_vector_database(db_config: Dict[str, Any], markdown_dir: str, reset_table: bool = True, workers: int = 1) -> VectorDatabase:
     """
     ベクトルデータベースを作成し、Markdownファイルを処理します。
     
@@ -90,6 +91,7 @@ def create_vector_database(db_config: Dict[str, Any], markdown_dir: str, reset_t
         db_config (Dict[str, Any]): データベース接続設定
         markdown_dir (str): Markdownファイルのディレクトリパス
         reset_table (bool): テーブルをリセットするかどうか
+        workers (int): 埋め込みベクトル生成のワーカープロセス数
         
     Returns:
         VectorDatabase: 作成されたベクトルデータベース
@@ -100,13 +102,33 @@ def create_vector_database(db_config: Dict[str, Any], markdown_dir: str, reset_t
     # ベクトルデータベースの初期化
     vector_db = VectorDatabase(
         db_config=db_config,
-        dimension=1024,
+        dimension=int(os.getenv('EMBEDDING_DIMENSION', '1024')),
         markdown_dir=markdown_dir,
         model_name=os.getenv('EMBEDDING_MODEL', "intfloat/multilingual-e5-large"),
         chunk_size=500,
-        chunk_overlap=100
+        chunk_overlap=100,
+        workers=workers
     )
     
+    try:
+        return _populate_vector_database(vector_db, db_config, markdown_dir, reset_table)
+    finally:
+        # ワーカープロセスを使用した場合は、処理後に終了する
+        vector_db.close_embedding_generator()
+
+def _populate_vector_database(vector_db: VectorDatabase, db_config: Dict[str, Any], markdown_dir: str, reset_table: bool) -> VectorDatabase:
+    """
+    ベクトルデータベースのテーブルを準備し、Markdownファイルを処理します。
+    
+    Args:
+        vector_db (VectorDatabase): ベクトルデータベース
+        db_config (Dict[str, Any]): データベース接続設定
+        markdown_dir (str): Markdownファイルのディレクトリパス
+        reset_table (bool): テーブルをリセットするかどうか
+        
+    Returns:
+        VectorDatabase: 処理後のベクトルデータベース
+    """
     # テーブルが存在するか確認
     table_exists = check_table_exists(db_config, "vector_embeddings")
     logger.info(f"テーブル存在確認結果: {table_exists}")
@@ -172,7 +194,7 @@ def create_rag_database(db_config: Dict[str, Any], vector_db_config: Dict[str, A
     # RAGデータベースの初期化
     rag_db = RAGDatabase(
         db_config=db_config,
-        dimension=1024,
+        dimension=int(os.getenv('EMBEDDING_DIMENSION', '1024')),
         vector_db_config=vector_db_config
     )
     
@@ -207,13 +229,16 @@ def create_rag_database(db_config: Dict[str, Any], vector_db_config: Dict[str, A
     
     return rag_db
 
-def initialize_rag_system():
+def initialize_rag_system(workers: int = None):
     """
     RAGシステムの初期化を一括で行います。
     1. ソースファイルをMarkdown化
     2. データベースの初期化
     3. ベクトルデータベースの更新
     4. RAGデータベースの更新
+    
+    Args:
+        workers (int): 埋め込みベクトル生成のワーカープロセス数（Noneの場合は環境変数EMBEDDING_WORKERS）
     """
     # .envファイルを明示的に読み込む
     load_dotenv(override=True)
@@ -223,6 +248,9 @@ def initialize_rag_system():
     os.environ['RESET_VECTOR_TABLE'] = 'True'
     os.environ['RESET_RAG_TABLE'] = 'True'
     
+    if workers is None:
+        workers = int(os.getenv('EMBEDDING_WORKERS', '1'))
+    
     logger.info("RAGシステムの初期化を開始します...")
     
     # プロジェクトのルートディレクトリを取得
@@ -285,7 +313,7 @@ def initialize_rag_system():
         rag_db_config['dbname'] = os.getenv('RAG_DB', 'rag_db')
         
         # 3. ベクトルデータベースの更新
-        vector_db = create_vector_database(vector_db_config, markdown_dir, reset_table=True)
+        vector_db = create_vector_database(vector_db_config, markdown_dir, reset_table=True, workers=workers)
         logger.info("ベクトルデータベースの更新が完了しました。")
         
         # 4. RAGデータベースの更新
@@ -320,8 +348,13 @@ def main():
     """
     メイン関数。RAGシステムの初期化を実行します。
     """
+    parser = argparse.ArgumentParser(description='RAGシステムの初期化を一括で行います')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='埋め込みベクトル生成のワーカープロセス数 (デフォルト: 環境変数EMBEDDING_WORKERS、未設定の場合は1)')
+    args = parser.parse_args()
+    
     try:
-        initialize_rag_system()
+        initialize_rag_system(workers=args.workers)
     except Exception as e:
         logger.error(f"RAGシステム初期化中にエラーが発生しました: {e}", exc_info=True)
 
@@ -36,8 +36,7 @@ from langchain.prompts import PromptTemplate
 from langchain_community.llms import Ollama
 from langchain.chains.llm import LLMChain
 
-# PyTorchのデバイス設定
-import torch
+# PyTorchのデバイス設定（torch自体は埋め込みモデルを読み込む時点でインポートされる）
 import os
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"  # GPUを使用する場合
 
@@ -92,9 +91,9 @@ class RAGSearcher:
         self.rag_system._init_embedding_generator()
         self.embedding_generator = self.rag_system.embedding_generator
         
-        # PyTorchのデバイス設定
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        logger.info(f"PyTorchデバイス: {self.device}")
+        # 埋め込みモデルのデバイス（sidecarバックエンドの場合は"remote"）
+        self.device = self.embedding_generator.device
+        logger.info(f"埋め込みモデルのデバイス: {self.device}")
         
         # Ollamaの初期化
         try:
@@ -409,6 +408,10 @@ def search(query: str, top_k: int = 20, similarity_threshold: float = 0.7) -> st
     except Exception as e:
         logger.error(f"検索中にエラーが発生しました: {e}", exc_info=True)
         return f"# エラー\n\n検索中にエラーが発生しました: {str(e)}"
+    finally:
+        # 埋め込みモデルの参照を解放（モデルはレジストリに保持され、次回の検索で再利用される）
+        if 'searcher' in locals():
+            searcher.rag_system.cleanup()
 
 
 def main():
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+ソースファイル索引モジュール
+
+ソースディレクトリ（data/source）内のファイルの一覧を1回だけ走査し、相対パス、ファイル名、拡張子を除いた名前から
+ソースファイルを引けるようにします。Markdownファイルやチャンクに対応する元ファイル（original_filepath）の検索で
+ファイルごとにディレクトリを走査する代わりに使用します。
+
+索引にはディレクトリごとの更新日時を記録し、ファイルの追加・削除・名前の変更でディレクトリの更新日時が変わった場合だけ
+作り直します。索引はビルドマニフェストに保存され、取り込み処理とサーバーで共有されます。
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.rag.build_manifest import BuildManifest
+from src.utils.logger_util import setup_logger
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+
+class SourceIndex:
+    """
+    ソースファイル索引クラス
+
+    ファイルはソースディレクトリからの相対パス（区切り文字は"/"）で管理し、検索結果は絶対パスで返します。
+    検索のたびに、前回の確認からcheck_interval秒以上経過していればディレクトリの更新日時を確認し、
+    変わっていれば索引を作り直します。
+
+    Attributes:
+        source_dir: ソースディレクトリの絶対パス
+        check_interval: ディレクトリの更新日時を確認する間隔（秒）
+        builds: 索引を作成した回数
+    """
+
+    def __init__(self, source_dir: str, check_interval: Optional[float] = None):
+        """
+        SourceIndexのコンストラクタ
+
+        Args:
+            source_dir: ソースディレクトリ
+            check_interval: ディレクトリの更新日時を確認する間隔（秒、Noneの場合は環境変数SOURCE_INDEX_CHECK_INTERVAL、未設定の場合は2）
+        """
+        self.source_dir = os.path.abspath(source_dir)
+        if check_interval is None:
+            check_interval = float(os.getenv('SOURCE_INDEX_CHECK_INTERVAL', '2'))
+        self.check_interval = max(0.0, check_interval)
+        self.builds = 0
+
+        self._files: List[str] = []
+        self._file_set = set()
+        self._by_name: Dict[str, List[str]] = {}
+        self._by_stem: Dict[str, List[str]] = {}
+        self._by_relative_stem: Dict[str, List[str]] = {}
+        self._dir_mtimes: Dict[str, Optional[int]] = {}
+        self._checked_at = 0.0
+        self._lock = threading.RLock()
+
+    def _dir_mtime(self, relative_dir: str) -> Optional[int]:
+        """
+        ディレクトリの更新日時（ナノ秒）を返します。ディレクトリがない場合はNoneを返します。
+        """
+        try:
+            return os.stat(os.path.join(self.source_dir, relative_dir)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan(self) -> Tuple[List[str], Dict[str, Optional[int]]]:
+        """
+        ソースディレクトリを走査し、ファイルの相対パスとディレクトリの更新日時を返します。
+        """
+        files: List[str] = []
+        dir_mtimes: Dict[str, Optional[int]] = {"": self._dir_mtime("")}
+        stack = [""] if dir_mtimes[""] is not None else []
+        while stack:
+            relative_dir = stack.pop()
+            try:
+                with os.scandir(os.path.join(self.source_dir, relative_dir)) as entries:
+                    for entry in entries:
+                        relative_path = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            dir_mtimes[relative_path] = entry.stat(follow_symlinks=False).st_mtime_ns
+                            stack.append(relative_path)
+                        elif entry.is_file():
+                            files.append(relative_path)
+            except OSError as e:
+                logger.warning(f"ディレクトリ '{relative_dir}' の走査中にエラーが発生しました: {e}")
+        files.sort()
+        return files, dir_mtimes
+
+    def _set(self, files: List[str], dir_mtimes: Dict[str, Optional[int]]) -> None:
+        """
+        ファイルの一覧から検索用の辞書を作成します。
+        """
+        by_name: Dict[str, List[str]] = {}
+        by_stem: Dict[str, List[str]] = {}
+        by_relative_stem: Dict[str, List[str]] = {}
+        for relative_path in files:
+            name = relative_path.rsplit("/", 1)[-1]
+            by_name.setdefault(name, []).append(relative_path)
+            by_stem.setdefault(os.path.splitext(name)[0], []).append(relative_path)
+            by_relative_stem.setdefault(os.path.splitext(relative_path)[0], []).append(relative_path)
+
+        self._files = files
+        self._file_set = set(files)
+        self._by_name = by_name
+        self._by_stem = by_stem
+        self._by_relative_stem = by_relative_stem
+        self._dir_mtimes = dict(dir_mtimes)
+        self._checked_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        """
+        記録したディレクトリの更新日時が現在と異なるかどうかを返します。
+        """
+        if not self._dir_mtimes:
+            return True
+        return any(self._dir_mtime(relative_dir) != mtime for relative_dir, mtime in self._dir_mtimes.items())
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        索引が古くなっている場合は作り直します。
+
+        Args:
+            force: Trueの場合は更新日時にかかわらず作り直します
+
+        Returns:
+            作り直したかどうか
+        """
+        with self._lock:
+            if not force and not self.is_stale():
+                self._checked_at = time.monotonic()
+                return False
+            started = time.perf_counter()
+            files, dir_mtimes = self._scan()
+            self._set(files, dir_mtimes)
+            self.builds += 1
+            logger.info(f"ソースファイル索引を作成しました: '{self.source_dir}' の {len(files)} ファイル、"
+                        f"{len(dir_mtimes)} ディレクトリ（{time.perf_counter() - started:.3f}秒）")
+            return True
+
+    def _ensure_fresh(self) -> None:
+        """
+        前回の確認からcheck_interval秒以上経過していれば、索引が古くなっていないか確認します。
+        """
+        if not self._dir_mtimes or time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        ビルドマニフェストに保存する形式にします。
+        """
+        with self._lock:
+            return {"files": list(self._files), "dirs": dict(self._dir_mtimes)}
+
+    def load(self, data: Optional[Dict[str, Any]]) -> bool:
+        """
+        ビルドマニフェストに保存した索引を読み込みます。ディレクトリの更新日時が変わっている場合は使用しません。
+
+        Args:
+            data: to_dict()の結果
+
+        Returns:
+            読み込んだかどうか
+        """
+        if not data or not data.get("dirs"):
+            return False
+        with self._lock:
+            self._dir_mtimes = dict(data["dirs"])
+            if self.is_stale():
+                self._dir_mtimes = {}
+                return False
+            self._set(list(data.get("files", [])), data["dirs"])
+            logger.info(f"保存済みのソースファイル索引を使用します: '{self.source_dir}' の {len(self._files)} ファイル")
+            return True
+
+    def save_to(self, manifest: BuildManifest) -> None:
+        """
+        索引をビルドマニフェストに格納します。保存はmanifest.save()で行われます。
+        """
+        manifest.source_indexes[self.source_dir] = self.to_dict()
+
+    def _absolute(self, relative_path: str) -> str:
+        return os.path.join(self.source_dir, *relative_path.split("/"))
+
+    def exists(self, relative_path: str) -> bool:
+        """
+        ソースディレクトリからの相対パスのファイルが存在するかどうかを返します。
+        """
+        with self._lock:
+            self._ensure_fresh()
+            return relative_path.replace(os.sep, "/") in self._file_set
+
+    def find_by_relative_stem(self, relative_stem: str, extensions: Optional[List[str]] = None) -> Optional[str]:
+        """
+        拡張子を除いた相対パスが一致するソースファイルを返します。
+
+        Args:
+            relative_stem: 拡張子を除いたソースディレクトリからの相対パス
+            extensions: 優先する拡張子の順序（指定した場合は、この中の拡張子のファイルだけを返します）
+
+        Returns:
+            ソースファイルの絶対パス。見つからない場合はNone
+        """
+        with self._lock:
+            self._ensure_fresh()
+            candidates = self._by_relative_stem.get(relative_stem.replace(os.sep, "/"), [])
+        if extensions is None:
+            return self._absolute(candidates[0]) if candidates else None
+        for extension in extensions:
+            for relative_path in candidates:
+                if os.path.splitext(relative_path)[1] == extension:
+                    return self._absolute(relative_path)
+        return None
+
+    def find_by_stem(self, stem: str, directory: Optional[str] = None) -> Optional[str]:
+        """
+        拡張子を除いたファイル名が一致するソースファイルを返します。複数ある場合は相対パスの順で最初のものを返します。
+
+        Args:
+            stem: 拡張子を除いたファイル名
+            directory: 検索するディレクトリ（ソースディレクトリからの相対パス）。Noneの場合は全てのディレクトリ
+
+        Returns:
+            ソースファイルの絶対パス。見つからない場合はNone
+        """
+        with self._lock:
+            self._ensure_fresh()
+            candidates = self._by_stem.get(stem, [])
+        if directory is not None:
+            prefix = directory.replace(os.sep, "/").strip("/")
+            candidates = [path for path in candidates if path.rsplit("/", 1)[0] == prefix] if prefix else \
+                [path for path in candidates if "/" not in path]
+        return self._absolute(candidates[0]) if candidates else None
+
+    def find_by_name(self, name: str) -> Optional[str]:
+        """
+        ファイル名が一致するソースファイルを返します。複数ある場合は相対パスの順で最初のものを返します。
+
+        Args:
+            name: ファイル名
+
+        Returns:
+            ソースファイルの絶対パス。見つからない場合はNone
+        """
+        with self._lock:
+            self._ensure_fresh()
+            candidates = self._by_name.get(name, [])
+        return self._absolute(candidates[0]) if candidates else None
+
+
+# ソースディレクトリごとの索引のインスタンス
+_source_indexes: Dict[str, SourceIndex] = {}
+_source_indexes_lock = threading.Lock()
+
+
+def get_source_index(source_dir: str) -> SourceIndex:
+    """
+    ソースディレクトリの索引を取得します。プロセス内で共有され、初回はビルドマニフェストに保存された索引を読み込みます。
+
+    Args:
+        source_dir: ソースディレクトリ
+
+    Returns:
+        SourceIndex: ソースファイル索引
+    """
+    key = os.path.abspath(source_dir)
+    with _source_indexes_lock:
+        index = _source_indexes.get(key)
+        if index is None:
+            index = SourceIndex(key)
+            try:
+                index.load(BuildManifest().source_indexes.get(key))
+            except Exception as e:
+                logger.warning(f"保存済みのソースファイル索引の読み込みに失敗しました: {e}")
+            _source_indexes[key] = index
+        return index
+
+
+def persist_source_index(index: SourceIndex, manifest: Optional[BuildManifest] = None) -> None:
+    """
+    索引をビルドマニフェストに保存します。
+
+    Args:
+        index: ソースファイル索引
+        manifest: ビルドマニフェスト。Noneの場合は既定のパスから読み込んで保存します。
+            指定した場合は格納だけを行い、保存は呼び出し元のmanifest.save()で行われます
+    """
+    if not index.to_dict()["dirs"]:
+        # 一度も検索していない索引は保存しない
+        return
+    if manifest is not None:
+        index.save_to(manifest)
+        return
+    try:
+        manifest = BuildManifest()
+        index.save_to(manifest)
+        manifest.save()
+    except Exception as e:
+        logger.warning(f"ソースファイル索引の保存に失敗しました: {e}")
@@ -5,14 +5,26 @@ import os
 import glob
 import json
 import pathlib
-from typing import List, Dict, Any, Tuple, Optional
-from psycopg2.extras import execute_batch
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from psycopg2.extras import execute_batch, execute_values
 
 from src.rag.base_database import BaseDatabase
-from src.utils.chunk_processor import clean_text, chunk_splitter
+from src.rag.build_manifest import BuildManifest, STAGE_VECTORS, REASON_PARAMS_CHANGED
+from src.rag.ingestion_pipeline import IngestionPipeline
+from src.rag.source_index import get_source_index, persist_source_index
+from src.utils.chunk_processor import clean_text, chunk_splitter, chunk_hash, iter_pages
+from src.utils.token_chunker import TokenChunker, get_token_chunker
 from src.utils.embedding_generator import EmbeddingGenerator
+from src.utils.embedding_pool import EmbeddingPool
+from src.utils.embedding_scheduler import generate_bulk_embeddings
+from src.utils.model_registry import get_model_registry
 from src.utils.logger_util import setup_logger
 
+# 元ファイルとして探す拡張子（優先順）
+SOURCE_EXTENSIONS = [".txt", ".pdf", ".docx", ".html", ".md", ".json", ".csv", ".xml"]
+
 class VectorDatabase(BaseDatabase):
     """
     Markdownファイルをベクトル化して格納するデータベース。
@@ -20,7 +32,8 @@ class VectorDatabase(BaseDatabase):
     """
 
     def __init__(self, db_config: Dict[str, Any], dimension: int = 1024, markdown_dir: str = "./data/markdowns",
-                 model_name: str = "intfloat/multilingual-e5-large", chunk_size: int = 500, chunk_overlap: int = 100):
+                 model_name: str = "intfloat/multilingual-e5-large", chunk_size: int = 500, chunk_overlap: int = 100,
+                 workers: int = 1, chunker: Optional[str] = None):
         """
         ベクトルデータベースの初期化。
 
@@ -29,8 +42,11 @@ class VectorDatabase(BaseDatabase):
             dimension (int): ベクトルの次元数。
             markdown_dir (str): Markdownファイルが格納されているディレクトリ。
             model_name (str): 埋め込みベクトル生成に使用するモデル名。
-            chunk_size (int): チャンクのサイズ。
-            chunk_overlap (int): チャンクの重複サイズ。
+            chunk_size (int): チャンクのサイズ（chunkerが"token"の場合はトークン数、"character"の場合は文字数）。
+            chunk_overlap (int): チャンクの重複サイズ（単位はchunk_sizeと同じ）。
+            workers (int): 埋め込みベクトル生成のワーカープロセス数。2以上の場合はプロセスプールを使用します。
+            chunker (str): チャンクの分割方法。"token"は埋め込みモデルのトークナイザーでトークン数を数えて分割し、
+                "character"は文字数で分割します。Noneの場合は環境変数CHUNKER（未設定の場合は"token"）。
         """
         super().__init__(db_config)
         self.logger = setup_logger(self.__class__.__name__)
@@ -39,8 +55,31 @@ class VectorDatabase(BaseDatabase):
         self.markdown_dir = markdown_dir
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        self.embedding_generator: Optional[EmbeddingGenerator] = None
+        self.embedding_generator: Optional[Union[EmbeddingGenerator, EmbeddingPool]] = None
         self.model_name = model_name
+        self.workers = max(1, workers)
+        self.chunker = (chunker or os.getenv('CHUNKER', 'token')).lower()
+        if self.chunker not in ("token", "character"):
+            self.logger.warning(f"不明なチャンクの分割方法 '{self.chunker}' が指定されたため、'token' を使用します。")
+            self.chunker = "token"
+
+    @property
+    def build_params(self) -> str:
+        """
+        チャンクと埋め込みベクトルに影響する設定を、ビルドマニフェストに記録する文字列にします。
+        """
+        return f"model={self.model_name};chunker={self.chunker};chunk_size={self.chunk_size};chunk_overlap={self.chunk_overlap}"
+
+    def get_token_chunker(self) -> Optional[TokenChunker]:
+        """
+        chunkerが"token"の場合は、埋め込みモデルのトークナイザーを使用するチャンク分割器を返します。
+
+        Returns:
+            Optional[TokenChunker]: チャンク分割器。"character"の場合はNone
+        """
+        if self.chunker != "token":
+            return None
+        return get_token_chunker(self.model_name, self.chunk_size, self.chunk_overlap)
 
     def create_table(self) -> None:
         """
@@ -56,20 +95,27 @@ class VectorDatabase(BaseDatabase):
             filepath TEXT NOT NULL,
             original_filepath TEXT,
             chunk_index INTEGER NOT NULL,
+            chunk_hash TEXT,
+            page_number INTEGER,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         '''
         self.execute_query(query, fetch=False)
+        # 既存のテーブルにはchunk_hashカラムがない場合があるため追加する
+        self.execute_query(f"ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS chunk_hash TEXT;", fetch=False)
+        # ページごとに変換したファイルのチャンクには元のファイルのページ番号を格納する
+        self.execute_query(f"ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS page_number INTEGER;", fetch=False)
+        self.execute_query(f"CREATE INDEX IF NOT EXISTS {self.table_name}_filepath_idx ON {self.table_name} (filepath);", fetch=False)
         self.commit()
         self.logger.info(f"テーブル '{self.table_name}' を作成しました。")
 
-    def store_markdown_chunk(self, chunk_text: str, embedding: List[float], filename: str, filepath: str, chunk_index: int, original_filepath: str = None) -> Optional[int]:
+    def store_markdown_chunk(self, chunk_text: str, embedding: np.ndarray, filename: str, filepath: str, chunk_index: int, original_filepath: str = None) -> Optional[int]:
         """
         Markdownのチャンクとそのベクトル埋め込みを保存します。
 
         Args:
             chunk_text (str): Markdownテキストのチャンク。
-            embedding (list): ベクトル埋め込み。
+            embedding (np.ndarray): ベクトル埋め込み（float32の配列）。
             filename (str): ファイル名。
             filepath (str): ファイルパス。
             chunk_index (int): チャンクのインデックス。
@@ -80,12 +126,13 @@ class VectorDatabase(BaseDatabase):
         """
         try:
             query = f'''
-            INSERT INTO {self.table_name} (chunk_text, embedding, filename, filepath, chunk_index, original_filepath)
-            VALUES (%s, %s, %s, %s, %s, %s)
+            INSERT INTO {self.table_name} (chunk_text, embedding, filename, filepath, chunk_index, original_filepath, chunk_hash)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
             RETURNING id;
             '''
             # fetch=Trueを指定して結果を取得
-            result = self.execute_query(query, (chunk_text, embedding, filename, filepath, chunk_index, original_filepath), fetch=True)
+            result = self.execute_query(query, (chunk_text, embedding, filename, filepath, chunk_index, original_filepath,
+                                                chunk_hash(chunk_text)), fetch=True)
             # 明示的にコミットを行う
             self.commit()
             return result[0][0] if result else None
@@ -99,7 +146,8 @@ class VectorDatabase(BaseDatabase):
 
         Args:
             chunks (list): 保存するチャンクのリスト。各チャンクは
-                       {'chunk_text': str, 'embedding': list, 'filename': str, 'filepath': str, 'chunk_index': int, 'original_filepath': str} の形式。
+                       {'chunk_text': str, 'embedding': np.ndarray, 'filename': str, 'filepath': str, 'chunk_index': int, 'original_filepath': str} の形式。
+                       'chunk_hash'がない場合は本文から計算します。'page_number'（元のファイルのページ番号）は省略できます。
 
         Returns:
             list: 挿入されたチャンクのIDリスト。
@@ -108,43 +156,218 @@ class VectorDatabase(BaseDatabase):
             return []
         
         try:
-            # バッチ処理用のデータを準備
-            batch_data = []
-            for chunk in chunks:
-                # original_filepathが存在するか確認
-                original_filepath = chunk.get('original_filepath', None)
+            return self.insert_chunk_rows(chunks)
+        except Exception as e:
+            self.rollback()
+            self.logger.error(f"チャンクの一括挿入中にエラーが発生しました: {e}")
+            return []
+
+    def insert_chunk_rows(self, chunks: List[Dict[str, Any]], commit: bool = True) -> List[int]:
+        """
+        複数のチャンクを複数行のINSERTで挿入します。
+        
+        Args:
+            chunks (list): 保存するチャンクのリスト。形式はstore_markdown_chunksと同じ。
+            commit (bool): 挿入後にコミットするかどうか。Falseの場合は呼び出し元でコミットしてください。
+        
+        Returns:
+            list: 挿入されたチャンクのIDリスト（chunksと同じ順序）。
+        """
+        if not chunks:
+            return []
+        
+        rows = [
+            (
+                chunk['chunk_text'],
+                chunk['embedding'],
+                chunk['filename'],
+                chunk['filepath'],
+                chunk['chunk_index'],
+                chunk.get('original_filepath', None),
+                chunk.get('chunk_hash') or chunk_hash(chunk['chunk_text']),
+                chunk.get('page_number')
+            )
+            for chunk in chunks
+        ]
+        query = f'''
+        INSERT INTO {self.table_name} (chunk_text, embedding, filename, filepath, chunk_index, original_filepath, chunk_hash, page_number)
+        VALUES %s
+        RETURNING id;
+        '''
+        with self.get_cursor() as cursor:
+            result = execute_values(cursor, query, rows, page_size=len(rows), fetch=True)
+        if commit:
+            self.commit()
+        return [row[0] for row in result]
+
+    def delete_chunk_rows(self, ids: List[int], commit: bool = True) -> None:
+        """
+        IDを指定してチャンクを削除します。取り込みの途中で読み込みに失敗したファイルの行を取り消すために使用します。
+        
+        Args:
+            ids (list): 削除するチャンクのIDリスト。
+            commit (bool): 削除後にコミットするかどうか。Falseの場合は呼び出し元でコミットしてください。
+        """
+        if not ids:
+            return
+        with self.get_cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table_name} WHERE id = ANY(%s);", (list(ids),))
+        if commit:
+            self.commit()
+
+    def replace_file_chunks(self, filepath: str, chunks: List[Dict[str, Any]]) -> List[int]:
+        """
+        特定のファイルのチャンクを1つのトランザクションで置き換えます。
+        既存のチャンクを削除してから新しいチャンクを挿入するため、同じファイルを再処理しても重複しません。
+
+        Args:
+            filepath (str): 置き換えるファイルのパス。
+            chunks (list): 保存するチャンクのリスト。形式はstore_markdown_chunksと同じ。
+
+        Returns:
+            list: 挿入されたチャンクのIDリスト。
+
+        Raises:
+            Exception: 置き換えに失敗した場合（ロールバック済み）。
+        """
+        with self.get_cursor() as cursor:
+            try:
+                cursor.execute(f"DELETE FROM {self.table_name} WHERE filepath = %s;", (filepath,))
                 
-                batch_data.append((
-                    chunk['chunk_text'],
-                    chunk['embedding'],
-                    chunk['filename'],
-                    chunk['filepath'],
-                    chunk['chunk_index'],
-                    original_filepath
-                ))
-            
-            # バッチで挿入
-            with self.get_cursor() as cursor:
                 query = f'''
-                INSERT INTO {self.table_name} (chunk_text, embedding, filename, filepath, chunk_index, original_filepath)
-                VALUES (%s, %s, %s, %s, %s, %s)
+                INSERT INTO {self.table_name} (chunk_text, embedding, filename, filepath, chunk_index, original_filepath, chunk_hash, page_number)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
                 RETURNING id;
                 '''
-                
-                # バッチ実行
                 ids = []
-                for data in batch_data:
-                    cursor.execute(query, data)
+                for chunk in chunks:
+                    cursor.execute(query, (
+                        chunk['chunk_text'],
+                        chunk['embedding'],
+                        chunk['filename'],
+                        chunk['filepath'],
+                        chunk['chunk_index'],
+                        chunk.get('original_filepath', None),
+                        chunk.get('chunk_hash') or chunk_hash(chunk['chunk_text']),
+                        chunk.get('page_number')
+                    ))
                     result = cursor.fetchone()
                     if result:
                         ids.append(result[0])
                 
                 self.connection.commit()
                 return ids
+            except Exception as e:
+                self.connection.rollback()
+                self.logger.error(f"ファイル '{filepath}' のチャンクの置き換え中にエラーが発生しました: {e}")
+                raise
+
+    def update_file_chunks(self, file_path: str, reuse_embeddings: bool = True) -> List[int]:
+        """
+        Markdownファイルを再分割し、格納済みのチャンクとの差分だけを反映します。
+        
+        チャンクは正規化した本文のハッシュで照合し、内容が同じチャンクは行（idと埋め込みベクトル）をそのまま残して
+        chunk_indexとpage_numberだけを更新します。新しいチャンクだけ埋め込みベクトルを生成して挿入し、なくなったチャンクは削除します。
+        ファイルはページごとに読み込み、新しいチャンクはembed_batch_size件ごとに埋め込んで挿入するため、
+        ファイル全体のチャンクを保持しません。反映は1つのトランザクションで行います。
+        
+        Args:
+            file_path (str): Markdownファイルのパス。
+            reuse_embeddings (bool): Falseの場合は全てのチャンクの埋め込みベクトルを生成し直します（埋め込みモデルを変更した場合など）。
+        
+        Returns:
+            list: チャンクの順に並べたチャンクのIDリスト。
+        
+        Raises:
+            Exception: ファイルを読み込めなかった場合、または反映に失敗した場合（ロールバック済みで、格納済みのチャンクは変更しません）。
+        """
+        filepath = str(pathlib.Path(file_path).absolute())
+        
+        existing = self.execute_query(
+            f"SELECT id, chunk_index, chunk_hash, chunk_text, page_number FROM {self.table_name} WHERE filepath = %s ORDER BY chunk_index, id;",
+            (filepath,)
+        ) or []
+        self.commit()
+        
+        # 格納済みのチャンクをハッシュごとにまとめる（ハッシュが未設定の古い行は本文から計算する）
+        available: Dict[str, List[Tuple[int, int, Optional[int]]]] = {}
+        missing_hashes: Dict[int, str] = {}
+        if reuse_embeddings:
+            for doc_id, index, stored_hash, text, page_number in existing:
+                if stored_hash is None:
+                    stored_hash = chunk_hash(text)
+                    missing_hashes[doc_id] = stored_hash
+                available.setdefault(stored_hash, []).append((doc_id, index, page_number))
+        
+        embed_batch_size = max(1, int(os.getenv('INGESTION_EMBED_BATCH_SIZE', '256')))
+        ids: List[Optional[int]] = []
+        kept_ids = set()
+        moved: List[Tuple[int, Optional[int], int]] = []
+        pending: List[Dict[str, Any]] = []
+        new_count = 0
+        
+        query = f'''
+        INSERT INTO {self.table_name} (chunk_text, embedding, filename, filepath, chunk_index, original_filepath, chunk_hash, page_number)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id;
+        '''
+        
+        def insert_pending(cursor) -> None:
+            # 新しいチャンクだけ埋め込みベクトルを生成して挿入する
+            self._init_embedding_generator()
+            embeddings = generate_bulk_embeddings(self.embedding_generator, [chunk['chunk_text'] for chunk in pending])
+            for chunk, embedding in zip(pending, embeddings):
+                cursor.execute(query, (
+                    chunk['chunk_text'],
+                    embedding,
+                    chunk['filename'],
+                    chunk['filepath'],
+                    chunk['chunk_index'],
+                    chunk['original_filepath'],
+                    chunk['chunk_hash'],
+                    chunk.get('page_number')
+                ))
+                ids[chunk['chunk_index']] = cursor.fetchone()[0]
+            pending.clear()
+        
+        with self.get_cursor() as cursor:
+            try:
+                for chunks in self._iter_markdown_chunks(file_path):
+                    for chunk in chunks:
+                        candidates = available.get(chunk['chunk_hash'])
+                        if candidates:
+                            doc_id, old_index, old_page = candidates.pop(0)
+                            kept_ids.add(doc_id)
+                            ids.append(doc_id)
+                            if chunk['chunk_index'] != old_index or chunk.get('page_number') != old_page:
+                                moved.append((chunk['chunk_index'], chunk.get('page_number'), doc_id))
+                        else:
+                            ids.append(None)
+                            pending.append(chunk)
+                            new_count += 1
+                    if len(pending) >= embed_batch_size:
+                        insert_pending(cursor)
+                if pending:
+                    insert_pending(cursor)
                 
-        except Exception as e:
-            self.logger.error(f"チャンクの一括挿入中にエラーが発生しました: {e}")
-            return []
+                deleted_ids = [row[0] for row in existing if row[0] not in kept_ids]
+                hash_updates = [(missing_hashes[doc_id], doc_id) for doc_id in kept_ids if doc_id in missing_hashes]
+                if deleted_ids:
+                    cursor.execute(f"DELETE FROM {self.table_name} WHERE id = ANY(%s);", (deleted_ids,))
+                if moved:
+                    execute_batch(cursor, f"UPDATE {self.table_name} SET chunk_index = %s, page_number = %s WHERE id = %s;", moved, page_size=100)
+                if hash_updates:
+                    execute_batch(cursor, f"UPDATE {self.table_name} SET chunk_hash = %s WHERE id = %s;", hash_updates, page_size=100)
+                
+                self.connection.commit()
+            except Exception as e:
+                self.connection.rollback()
+                self.logger.error(f"ファイル '{filepath}' のチャンクの更新中にエラーが発生しました: {e}")
+                raise
+        
+        self.logger.info(f"ファイル '{filepath}' のチャンクを更新しました: 再利用 {len(kept_ids)} 個、"
+                         f"新規 {new_count} 個、削除 {len(deleted_ids)} 個")
+        return ids
 
     def get_all_vectors(self) -> List[Tuple]:
         """
@@ -202,6 +425,20 @@ class VectorDatabase(BaseDatabase):
             self.logger.error(f"処理済みファイルの取得中にエラーが発生しました: {e}")
             return []
 
+    def get_file_vector_ids(self, filepath: str) -> List[int]:
+        """
+        特定のファイルのチャンクのidをチャンクの順に取得します。
+
+        Args:
+            filepath (str): ファイルのパス。
+
+        Returns:
+            list: チャンクのidのリスト。
+        """
+        query = f"SELECT id FROM {self.table_name} WHERE filepath = %s ORDER BY chunk_index;"
+        result = self.execute_query(query, (filepath,))
+        return [row[0] for row in result] if result else []
+
     def delete_file_vectors(self, filepath: str) -> int:
         """
         特定のファイルに関連するベクトルを削除します。
@@ -246,8 +483,39 @@ class VectorDatabase(BaseDatabase):
         埋め込みベクトル生成器を初期化します。
         """
         if self.embedding_generator is None:
-            self.logger.info(f"埋め込みベクトル生成器を初期化しています。モデル: {self.model_name}")
-            self.embedding_generator = EmbeddingGenerator(model_name=self.model_name)
+            self.logger.info(f"埋め込みベクトル生成器を初期化しています。モデル: {self.model_name}, ワーカー数: {self.workers}")
+            if self.workers > 1:
+                self.embedding_generator = EmbeddingPool(model_name=self.model_name, workers=self.workers)
+            else:
+                self.embedding_generator = get_model_registry().acquire(self.model_name)
+                self.check_embedding_dimension(self.embedding_generator.dimension)
+
+    def check_embedding_dimension(self, dimension: int) -> None:
+        """
+        埋め込みモデルの次元数がテーブルのembeddingカラムの次元数と一致するか確認します。
+        テーブルがまだ存在しない場合は、作成時の次元数（self.dimension）と比較します。
+
+        Args:
+            dimension (int): 埋め込みモデルの次元数。
+
+        Raises:
+            ValueError: 次元数が一致しない場合。
+        """
+        table_dimension = self.get_vector_dimension(self.table_name) or self.dimension
+        if dimension != table_dimension:
+            raise ValueError(f"埋め込みモデル '{self.model_name}' の次元数 {dimension} が"
+                             f"テーブル '{self.table_name}' の次元数 {table_dimension} と一致しません。")
+
+    def close_embedding_generator(self) -> None:
+        """
+        埋め込みベクトル生成器を解放します。プロセスプールの場合はワーカープロセスを終了し、
+        共有モデルの場合はモデルレジストリの参照を解放します。
+        """
+        if isinstance(self.embedding_generator, EmbeddingPool):
+            self.embedding_generator.close()
+        else:
+            get_model_registry().release(self.embedding_generator)
+        self.embedding_generator = None
 
     def _read_markdown_file(self, file_path: str) -> str:
         """
@@ -268,19 +536,37 @@ class VectorDatabase(BaseDatabase):
             return ""
 
     
-    def _process_markdown_file(self, file_path: str) -> List[Dict[str, Any]]:
+    def _split_markdown_file(self, file_path: str) -> List[Dict[str, Any]]:
         """
-        Markdownファイルを処理し、チャンク化して埋め込みベクトルを生成します。
+        Markdownファイルをチャンク化します。埋め込みベクトルは生成しません。
         
         Args:
             file_path (str): ファイルパス。
             
         Returns:
-            List[Dict[str, Any]]: チャンクと埋め込みベクトルのリスト。
+            List[Dict[str, Any]]: チャンクのリスト（'embedding'以外はstore_markdown_chunksと同じ形式で、'chunk_hash'を含みます）。
+        
+        Raises:
+            OSError, UnicodeError: ファイルを読み込めなかった場合。
         """
-        # 埋め込みベクトル生成器を初期化
-        self._init_embedding_generator()
+        return [chunk for chunks in self._iter_markdown_chunks(file_path) for chunk in chunks]
+    
+    def _iter_markdown_chunks(self, file_path: str) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Markdownファイルをページごとに読み込み、ページのチャンクを順に返します。埋め込みベクトルは生成しません。
+        
+        ファイル全体のチャンクを保持しないため、大きなファイルでも埋め込みと書き込みをページ単位で進められます。
+        chunk_indexはファイル全体での通し番号です。
         
+        Args:
+            file_path (str): ファイルパス。
+            
+        Yields:
+            List[Dict[str, Any]]: 1ページ分のチャンクのリスト（形式は_split_markdown_fileと同じ）。
+        
+        Raises:
+            OSError, UnicodeError: ファイルを読み込めなかった場合。
+        """
         # ファイル情報を取得
         file_path_obj = pathlib.Path(file_path)
         filename = file_path_obj.name
@@ -297,53 +583,71 @@ class VectorDatabase(BaseDatabase):
                 # 拡張子を除いたパス
                 base_path_without_ext = os.path.splitext(relative_path)[0]
                 
-                # data/source ディレクトリを基準に元ファイルを探す
+                # data/source ディレクトリの索引から元ファイルを探す
                 source_dir = os.path.join(os.path.dirname(self.markdown_dir), "source")
-                
-                # 可能性のある拡張子のリスト
-                possible_extensions = [".txt", ".pdf", ".docx", ".html", ".md", ".json", ".csv", ".xml"]
-                
-                # 元ファイルを探す
-                for ext in possible_extensions:
-                    potential_source = os.path.join(source_dir, base_path_without_ext + ext)
-                    if os.path.exists(potential_source):
-                        original_filepath = str(pathlib.Path(potential_source).absolute())
-                        self.logger.info(f"元ファイルを見つけました: {original_filepath}")
-                        break
+                source = get_source_index(source_dir).find_by_relative_stem(base_path_without_ext, SOURCE_EXTENSIONS)
+                if source:
+                    original_filepath = str(pathlib.Path(source).absolute())
+                    self.logger.info(f"元ファイルを見つけました: {original_filepath}")
                 
                 if not original_filepath:
                     self.logger.warning(f"ファイル '{filepath}' の元ファイルが見つかりませんでした。")
         except Exception as e:
             self.logger.error(f"元ファイルパスの取得中にエラーが発生しました: {e}")
         
-        # ファイルを読み込む
-        content = self._read_markdown_file(file_path)
-        if not content:
-            return []
+        # ファイルをページごとに読み込み、クリーンアップしてチャンク化する
+        # （ページの区切りの行がないファイルは全体を1ページとして扱い、ページ番号はNoneになる）
+        chunker = self.get_token_chunker()
+        chunk_count = 0
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                for page_number, content in iter_pages(f):
+                    cleaned_text = clean_text(content)
+                    chunks: List[Dict[str, Any]] = []
+                    for chunk in chunk_splitter(cleaned_text, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap,
+                                                chunker=chunker):
+                        chunks.append({
+                            'chunk_text': chunk,
+                            'filename': filename,
+                            'filepath': filepath,
+                            'chunk_index': chunk_count + len(chunks),
+                            'page_number': page_number,
+                            'original_filepath': original_filepath,
+                            'chunk_hash': chunk_hash(chunk)
+                        })
+                    if chunks:
+                        chunk_count += len(chunks)
+                        yield chunks
+        except (OSError, UnicodeError) as e:
+            # 途中で止めずに空として扱うと、update_file_chunksが格納済みのチャンクを削除してしまうため、呼び出し元に伝える
+            self.logger.error(f"ファイル '{file_path}' の読み込み中にエラーが発生しました: {e}")
+            raise
         
-        # テキストをクリーンアップ
-        cleaned_text = clean_text(content)
+        self.logger.info(f"ファイル '{filename}' を {chunk_count} 個のチャンクに分割しました。")
+    
+    def _process_markdown_file(self, file_path: str) -> List[Dict[str, Any]]:
+        """
+        Markdownファイルを処理し、チャンク化して埋め込みベクトルを生成します。
         
-        # テキストをチャンク化
-        chunks = chunk_splitter(cleaned_text, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        Args:
+            file_path (str): ファイルパス。
+            
+        Returns:
+            List[Dict[str, Any]]: チャンクと埋め込みベクトルのリスト。
+        """
+        chunks = self._split_markdown_file(file_path)
+        if not chunks:
+            return []
         
-        self.logger.info(f"ファイル '{filename}' を {len(chunks)} 個のチャンクに分割しました。")
+        # 埋め込みベクトル生成器を初期化
+        self._init_embedding_generator()
         
         # 各チャンクの埋め込みベクトルを生成
-        result = []
-        embeddings = self.embedding_generator.generate_embeddings(chunks)
-        
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-            result.append({
-                'chunk_text': chunk,
-                'embedding': embedding,
-                'filename': filename,
-                'filepath': filepath,
-                'chunk_index': i,
-                'original_filepath': original_filepath
-            })
-        
-        return result
+        embeddings = generate_bulk_embeddings(self.embedding_generator, [chunk['chunk_text'] for chunk in chunks])
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk['embedding'] = embedding
+        
+        return chunks
     
     def process_markdown_directory(self, force_reprocess: bool = False) -> int:
         """
@@ -375,7 +679,7 @@ class VectorDatabase(BaseDatabase):
         
         # すでに処理されたファイルのリストを取得
         # 強制再処理モードまたはテーブルが空の場合は空リストを使用
-        processed_files = [] if force_reprocess or is_table_empty else self.get_processed_files()
+        processed_files = set() if force_reprocess or is_table_empty else set(self.get_processed_files())
         
         # .mdファイルを検索
         md_files = glob.glob(os.path.join(self.markdown_dir, "**/*.md"), recursive=True)
@@ -384,33 +688,46 @@ class VectorDatabase(BaseDatabase):
             self.logger.warning(f"ディレクトリ '{self.markdown_dir}' にMarkdownファイルが見つかりません。")
             return 0
         
-        # 各ファイルを処理
-        total_chunks = 0
+        # すでに処理済みのファイルはスキップ
+        target_files = []
         for file_path in md_files:
-            abs_path = str(pathlib.Path(file_path).absolute())
-            
-            # すでに処理済みのファイルはスキップ
-            if abs_path in processed_files:
+            if str(pathlib.Path(file_path).absolute()) in processed_files:
                 self.logger.info(f"ファイル '{file_path}' はすでに処理済みのためスキップします。")
                 continue
-            
-            # ファイルを処理
-            self.logger.info(f"ファイル '{file_path}' を処理しています...")
-            chunks = self._process_markdown_file(file_path)
-            
-            if chunks:
-                # チャンクをデータベースに格納
-                self.store_markdown_chunks(chunks)
-                total_chunks += len(chunks)
-                self.logger.info(f"ファイル '{file_path}' の {len(chunks)} 個のチャンクを格納しました。")
+            target_files.append(file_path)
+        
+        # 読み込み・埋め込み・書き込みを並行して処理
+        total_chunks = self.ingest_files(target_files)['chunks']
         
         self.logger.info(f"合計 {total_chunks} 個のチャンクを格納しました。")
         return total_chunks
+
+    def ingest_files(self, file_paths: List[str], on_file_done: Optional[Callable[[str, List[int]], None]] = None) -> Dict[str, Any]:
+        """
+        Markdownファイルを取り込みパイプラインで格納します。
+        ファイルの読み込みとチャンク化、埋め込みベクトルの生成、データベースへの書き込みを並行して行います。
+        
+        Args:
+            file_paths (list): 格納するMarkdownファイルのパス。
+            on_file_done (callable, optional): ファイルのチャンクをコミットした後に (ファイルパス, チャンクのIDリスト) で呼び出す関数。
+        
+        Returns:
+            Dict[str, Any]: files（格納したファイル数）、chunks（格納したチャンク数）、failed（失敗したファイル数）、seconds（処理時間）。
+        """
+        if not file_paths:
+            return {'files': 0, 'chunks': 0, 'failed': 0, 'seconds': 0.0}
+        self._init_embedding_generator()
+        pipeline = IngestionPipeline(self._iter_markdown_chunks, self.embedding_generator, self)
+        return pipeline.run(file_paths, on_file_done=on_file_done)
     
-    def update_markdown_directory(self) -> Tuple[int, int, int]:
+    def update_markdown_directory(self, manifest: Optional[BuildManifest] = None) -> Tuple[int, int, int]:
         """
         Markdownディレクトリ内のファイルを更新します。
-        新しいファイルを処理し、削除されたファイルのデータを削除します。
+        新しいファイルと変更されたファイルを処理し、削除されたファイルのデータを削除します。
+        変更の有無はビルドマニフェストに記録した内容のハッシュで判定します。
+        
+        Args:
+            manifest (Optional[BuildManifest]): ビルドマニフェスト。Noneの場合は既定のパスから読み込み、処理後に保存します。
         
         Returns:
             Tuple[int, int, int]: (新規チャンク数, 更新チャンク数, 削除チャンク数)。
@@ -427,32 +744,59 @@ class VectorDatabase(BaseDatabase):
         current_md_files = [str(pathlib.Path(f).absolute()) for f in 
                            glob.glob(os.path.join(self.markdown_dir, "**/*.md"), recursive=True)]
         
+        save_manifest = manifest is None
+        if manifest is None:
+            manifest = BuildManifest()
+        params = self.build_params
+        
         # 新規ファイル、変更されたファイル、削除されたファイルを特定
         new_files = [f for f in current_md_files if f not in processed_files]
         deleted_files = [f for f in processed_files if f not in current_md_files]
+        modified_files = []
+        for file_path in current_md_files:
+            if file_path not in processed_files:
+                continue
+            if manifest.get(STAGE_VECTORS, file_path) is None:
+                # マニフェスト導入前に処理したファイルは、現在の内容で処理済みとして登録する
+                manifest.record(STAGE_VECTORS, file_path, file_path, self.get_file_vector_ids(file_path), params)
+            else:
+                reason = manifest.check(STAGE_VECTORS, file_path, file_path, params)
+                if reason is not None:
+                    modified_files.append((file_path, reason))
         
-        # 変更されたファイルをチェックするためには、タイムスタンプなどの追加情報が必要
-        # ここでは簡略化のため、変更されたファイルを再処理する機能は実装しない
+        # 新規ファイルを並行して処理
+        self.logger.info(f"{len(new_files)} 個の新規ファイルを処理しています...")
+        new_chunks = self.ingest_files(
+            new_files,
+            on_file_done=lambda file_path, ids: manifest.record(STAGE_VECTORS, file_path, file_path, ids, params)
+        )['chunks']
         
-        # 新規ファイルを処理
-        new_chunks = 0
-        for file_path in new_files:
-            self.logger.info(f"新規ファイル '{file_path}' を処理しています...")
-            chunks = self._process_markdown_file(file_path)
-            
-            if chunks:
-                # チャンクをデータベースに格納
-                self.store_markdown_chunks(chunks)
-                new_chunks += len(chunks)
-                self.logger.info(f"ファイル '{file_path}' の {len(chunks)} 個のチャンクを格納しました。")
+        # 変更されたファイルはチャンクの差分だけを反映する（設定変更の場合は埋め込みベクトルを生成し直す）
+        updated_chunks = 0
+        for file_path, reason in modified_files:
+            self.logger.info(f"変更されたファイル '{file_path}' を処理しています（{reason}）...")
+            try:
+                ids = self.update_file_chunks(file_path, reuse_embeddings=(reason != REASON_PARAMS_CHANGED))
+            except Exception as e:
+                # マニフェストを更新しないため、次回の更新で再処理される
+                self.logger.error(f"変更されたファイル '{file_path}' の処理中にエラーが発生しました: {e}")
+                continue
+            manifest.record(STAGE_VECTORS, file_path, file_path, ids, params)
+            updated_chunks += len(ids)
+            self.logger.info(f"ファイル '{file_path}' のチャンクを {len(ids)} 個に置き換えました。")
         
         # 削除されたファイルのデータを削除
         deleted_chunks = 0
         for file_path in deleted_files:
             self.logger.info(f"削除されたファイル '{file_path}' のデータを削除しています...")
             count = self.delete_file_vectors(file_path)
+            manifest.remove(STAGE_VECTORS, file_path)
             deleted_chunks += count
             self.logger.info(f"ファイル '{file_path}' の {count} 個のチャンクを削除しました。")
         
-        self.logger.info(f"更新結果: {new_chunks} 個の新規チャンク、{deleted_chunks} 個の削除チャンク")
-        return (new_chunks, 0, deleted_chunks)
+        persist_source_index(get_source_index(os.path.join(os.path.dirname(self.markdown_dir), "source")), manifest)
+        if save_manifest:
+            manifest.save()
+        
+        self.logger.info(f"更新結果: {new_chunks} 個の新規チャンク、{updated_chunks} 個の更新チャンク、{deleted_chunks} 個の削除チャンク")
+        return (new_chunks, updated_chunks, deleted_chunks)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+エンベディングサイドカーモジュール
+
+埋め込みモデルを1つのプロセスで保持し、同じホストの複数のサーバープロセスにエンベディング生成を提供します。
+Unixドメインソケットまたはlocalhostのポートで待ち受け、同時に届いた要求はEmbeddingSchedulerでまとめてエンコードします。
+
+プロトコル:
+- GET /health: モデル名、次元数などをJSONで返します
+- POST /embed: {"texts": [...], "priority": "interactive" | "bulk"} を受け取り、
+  float32（リトルエンディアン、行優先）のバイト列を返します。件数と次元数は
+  X-Embedding-Count、X-Embedding-Dimensionヘッダーで返します
+"""
+
+import os
+import sys
+import json
+import stat
+import argparse
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+from urllib.parse import urlparse
+
+import numpy as np
+from dotenv import load_dotenv
+
+# プロジェクトルートをPythonパスに追加
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+sys.path.insert(0, root_dir)
+
+from src.utils.embedding_generator import EmbeddingGenerator
+from src.utils.embedding_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, get_embedding_scheduler
+from src.utils.model_registry import get_model_registry
+from src.utils.logger_util import setup_logger
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+# 既定の待ち受けURL
+DEFAULT_SIDECAR_URL = "unix:///tmp/nakedrag-embedding.sock"
+
+# 1回の要求で受け付ける最大テキスト数
+MAX_TEXTS_PER_REQUEST = 4096
+
+
+class EmbeddingSidecarHandler(BaseHTTPRequestHandler):
+    """
+    エンベディングサイドカーの要求を処理するハンドラ
+    """
+
+    # キープアライブ接続を使用する
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        generator: EmbeddingGenerator = self.server.generator
+        self._send_json(200, {
+            "model_name": generator.model_name,
+            "backend": generator.backend,
+            "dimension": generator.dimension,
+            "max_seq_length": getattr(generator.model, "max_seq_length", None),
+        })
+
+    def do_POST(self) -> None:
+        if self.path != "/embed":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+            request = json.loads(self.rfile.read(length).decode("utf-8"))
+            texts = request.get("texts")
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("texts には文字列のリストを指定してください")
+            if len(texts) > MAX_TEXTS_PER_REQUEST:
+                raise ValueError(f"1回の要求で指定できるテキストは {MAX_TEXTS_PER_REQUEST} 件までです")
+        except Exception as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        # 優先度が指定されない場合は、件数の少ない要求を検索クエリとして扱う
+        priority_name = request.get("priority")
+        if priority_name is None:
+            priority_name = "interactive" if len(texts) <= self.server.interactive_max_texts else "bulk"
+        priority = PRIORITY_INTERACTIVE if priority_name == "interactive" else PRIORITY_BULK
+
+        try:
+            if texts:
+                vectors = np.ascontiguousarray(self.server.scheduler.submit(texts, priority).result(), dtype="<f4")
+            else:
+                vectors = np.zeros((0, self.server.generator.dimension), dtype="<f4")
+        except Exception as e:
+            logger.error(f"エンベディングの生成中にエラーが発生しました: {e}", exc_info=True)
+            self._send_json(500, {"error": str(e)})
+            return
+
+        body = vectors.tobytes()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Embedding-Count", str(vectors.shape[0]))
+        self.send_header("X-Embedding-Dimension", str(vectors.shape[1]))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s - %s" % (self.client_address, format % args))
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unixドメインソケットで待ち受けるHTTPサーバー
+    """
+    daemon_threads = True
+
+
+def create_sidecar_server(url: str, generator: EmbeddingGenerator) -> socketserver.BaseServer:
+    """
+    エンベディングサイドカーのサーバーを作成します。
+
+    Args:
+        url: 待ち受けるURL（"unix:///path/to/socket" または "http://127.0.0.1:8765"）
+        generator: エンコードに使用するEmbeddingGenerator
+
+    Returns:
+        サーバー
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        # 前回の起動で残ったソケットファイルを削除する
+        if os.path.exists(parsed.path) and stat.S_ISSOCK(os.stat(parsed.path).st_mode):
+            os.remove(parsed.path)
+        server = ThreadingUnixHTTPServer(parsed.path, EmbeddingSidecarHandler)
+        os.chmod(parsed.path, 0o660)
+    elif parsed.scheme == "http":
+        server = ThreadingHTTPServer((parsed.hostname or "127.0.0.1", parsed.port or 8765), EmbeddingSidecarHandler)
+        server.daemon_threads = True
+    else:
+        raise ValueError(f"待ち受けるURLは unix:// または http:// で指定してください: {url}")
+
+    server.generator = generator
+    server.scheduler = get_embedding_scheduler(generator)
+    server.interactive_max_texts = int(os.getenv('EMBEDDING_SIDECAR_INTERACTIVE_MAX_TEXTS', '8'))
+    return server
+
+
+def main():
+    """
+    メイン関数
+    """
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='埋め込みモデルを保持し、他のプロセスにエンベディング生成を提供します')
+    parser.add_argument('--url', type=str, default=os.getenv('EMBEDDING_SIDECAR_URL', DEFAULT_SIDECAR_URL),
+                        help=f'待ち受けるURL (デフォルト: 環境変数EMBEDDING_SIDECAR_URLまたは{DEFAULT_SIDECAR_URL})')
+    parser.add_argument('--model', type=str, default=os.getenv('EMBEDDING_MODEL', 'intfloat/multilingual-e5-large'),
+                        help='埋め込みモデル名 (デフォルト: 環境変数EMBEDDING_MODEL)')
+    parser.add_argument('--backend', type=str, choices=['torch', 'onnx'], default=None,
+                        help='推論バックエンド (デフォルト: agent_settings.jsonの設定)')
+    args = parser.parse_args()
+
+    if args.backend is None and EmbeddingGenerator.resolve_backend(None) not in ("torch", "onnx"):
+        # agent_settings.jsonでクライアント側のバックエンドが指定されている場合は、サイドカー自身はtorchで動作する
+        args.backend = "torch"
+
+    registry = get_model_registry()
+    generator = registry.acquire(args.model, backend=args.backend)
+    server = create_sidecar_server(args.url, generator)
+    logger.info(f"エンベディングサイドカーを '{args.url}' で起動しました（モデル: {generator.model_name}, バックエンド: {generator.backend}）")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("キーボード割り込みを受信しました。終了します。")
+    except Exception as e:
+        logger.error(f"エンベディングサイドカーでエラーが発生しました: {e}", exc_info=True)
+        sys.exit(1)
+    finally:
+        server.server_close()
+        parsed = urlparse(args.url)
+        if parsed.scheme == "unix" and os.path.exists(parsed.path):
+            os.remove(parsed.path)
+        registry.unload_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,7 @@ from pathlib import Path
 
 # 自作モジュールのインポート
 from src.utils.resource_manager import get_resource_manager
+from src.rag.source_index import get_source_index
 from src.utils.logger_util import setup_logger
 
 # ロガーの設定
@@ -214,14 +215,12 @@ async def get_source_file(path: str = Query(..., description="ソースファイ
                             logger.info(f"元ファイルが直接パスで見つかりました: {direct_path}")
                             return direct_path
                         
-                        # ファイル名のみで検索
+                        # ファイル名のみで検索（要求ごとにディレクトリを走査しないよう、ソースファイル索引を使用する）
                         filename_only = os.path.basename(original_filepath)
-                        for root, _, files in os.walk(source_dir):
-                            for file in files:
-                                if file == filename_only:
-                                    found_path = os.path.join(root, file)
-                                    logger.info(f"元ファイルがファイル名で見つかりました: {found_path}")
-                                    return found_path
+                        found_path = get_source_index(source_dir).find_by_name(filename_only)
+                        if found_path:
+                            logger.info(f"元ファイルがファイル名で見つかりました: {found_path}")
+                            return found_path
                     
                     # filepathがあればそれを使用
                     if result_filepath and os.path.exists(result_filepath):
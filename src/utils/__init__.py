@@ -11,3 +11,4 @@ from .logger_util import setup_logger
 from .chunk_processor import chunk_splitter
 from .embedding_generator import EmbeddingGenerator
 from .firewall_manager import FirewallManager
+from .lru_cache import LRUCache
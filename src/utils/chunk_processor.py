@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 import re
 import os
+import time
+import hashlib
 import unicodedata
 from bs4 import BeautifulSoup, Comment
-from typing import List
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 # dotenvをインポート
 from dotenv import load_dotenv
@@ -16,52 +19,163 @@ from langchain_community.llms import Ollama
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from src.utils.llm_cache import LLMOutputCache
 from src.utils.logger_util import setup_logger
+from src.utils.text_window import estimate_tokens, split_windows, stitch_outputs
+from src.utils.token_chunker import TokenChunker
 
 # ロガーの設定
 logger = setup_logger(__name__)
 
-def clean_text(text: str) -> str:
+# clean_textで使用する正規表現（呼び出しのたびにコンパイルしないようモジュールで保持する）
+# HTMLとして解析が必要なテキスト（タグ、コメント、文字参照を含む）の判定
+_HTML_SNIFF = re.compile(r'<[A-Za-z!/?]|&[#A-Za-z]')
+# マークダウン記法（元の順番で適用する）。各パターンは、一致に必要な文字列のいずれもテキストにない場合は省略する
+_MARKDOWN_PATTERNS = [
+    (('](',), re.compile(r'!\[.*?\]\(.*?\)')),          # 画像リンク
+    (('](',), re.compile(r'\[.*?\]\(.*?\)')),           # ハイパーリンク
+    (('`',), re.compile(r'`{1,3}.*?`{1,3}')),          # インラインコード
+    (('**',), re.compile(r'\*\*(.*?)\*\*')),          # 太字
+    (('*',), re.compile(r'\*(.*?)\*')),                # イタリック
+    (('~~',), re.compile(r'~~(.*?)~~')),              # 取り消し線
+    (('>', '#'), re.compile(r'^(?:>|#+\s).*$', re.MULTILINE)),  # 引用と見出し（互いの一致に影響しないため1回で除去）
+    (('---',), re.compile(r'---')),                    # 水平線
+]
+_URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+# 一致は必ず空白以外の文字の並びの先頭から始まるため、並びの途中からの照合（長い並びで2乗の時間がかかる）を省く
+_EMAIL_PATTERN = re.compile(r'(?<!\S)\S+@\S+')
+_SYMBOL_PATTERN = re.compile(r'[^\w\s\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff]')
+# 非ASCII文字の並び（直前のASCII文字と結合する文字に備えて、直前の1文字を含める）
+_NON_ASCII_RUN = re.compile(r'[\x00-\x7f]?[^\x00-\x7f]+')
+
+
+def _normalize_nfkc(match: re.Match) -> str:
+    return unicodedata.normalize('NFKC', match.group())
+
+
+def _strip_html(text: str) -> str:
     """
-    テキストから不要なタグや記号を除去し、クリーンなテキストを返します。
+    HTMLタグを除去します（script, style, comments含む）。
     """
-    # HTMLタグの除去（script, style, comments含む）
     soup = BeautifulSoup(text, "html.parser")
     for element in soup(["script", "style"]):
         element.decompose()
     for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
         comment.extract()
-    text = soup.get_text(separator=" ")
+    return soup.get_text(separator=" ")
+
+
+def clean_text(text: str) -> str:
+    """
+    テキストから不要なタグや記号を除去し、クリーンなテキストを返します。
+
+    タグや文字参照を含まないテキストはBeautifulSoupでの解析を省略し、マークダウン記法の除去は
+    記法の文字を含む場合だけ行います。結果は全ての処理を行った場合と同じです。
+    """
+    # HTMLタグの除去（script, style, comments含む）
+    if _HTML_SNIFF.search(text):
+        text = _strip_html(text)
 
     # マークダウン記法の除去
-    markdown_patterns = [
-        r'!\[.*?\]\(.*?\)',  # 画像リンク
-        r'\[.*?\]\(.*?\)',   # ハイパーリンク
-        r'`{1,3}.*?`{1,3}',  # インラインコード
-        r'\*\*(.*?)\*\*',    # 太字
-        r'\*(.*?)\*',        # イタリック
-        r'~~(.*?)~~',        # 取り消し線
-        r'^>.*$',            # 引用
-        r'^#+\s.*$',         # 見出し
-        r'---',              # 水平線
-    ]
-    for pattern in markdown_patterns:
-        text = re.sub(pattern, '', text, flags=re.MULTILINE)
+    for triggers, pattern in _MARKDOWN_PATTERNS:
+        if any(trigger in text for trigger in triggers):
+            text = pattern.sub('', text)
 
     # URLとメールアドレスの除去
-    text = re.sub(r'https?://\S+|www\.\S+', '', text)
-    text = re.sub(r'\S+@\S+', '', text)
+    if '://' in text or 'www.' in text:
+        text = _URL_PATTERN.sub('', text)
+    if '@' in text:
+        # メールアドレスは改行をまたがないため、"@"を含む行だけを処理する
+        text = '\n'.join(_EMAIL_PATTERN.sub('', line) if '@' in line else line for line in text.split('\n'))
 
     # 特殊文字や記号の除去（英数字、漢字、ひらがな、カタカナ以外を除去）
-    text = re.sub(r'[^\w\s\u4e00-\u9fff\u3040-\u309f\u30a0-\u30ff]', '', text)
+    text = _SYMBOL_PATTERN.sub('', text)
 
-    # 全角英数字を半角に変換
-    text = unicodedata.normalize('NFKC', text)
+    # 全角英数字を半角に変換（ASCII文字は変換しても変わらないため、非ASCII文字の並びだけを変換する）
+    if not text.isascii():
+        text = _NON_ASCII_RUN.sub(_normalize_nfkc, text)
 
     # 余分な空白や改行の削除
-    text = re.sub(r'\s+', ' ', text).strip()
+    return ' '.join(text.split())
+
+# organize_text_with_llmのプロンプト（変更した場合はLLM出力キャッシュを使用しないようバージョンを上げる）
+ORGANIZE_PROMPT_VERSION = "1"
+ORGANIZE_PROMPT_TEMPLATE = (
+    "以下のテキストを読み、内容を改ざんせずに、意味のある単位でチャンクに分割してください。"
+    "各チャンクは、文脈的に一貫性があり、情報の損失がないようにしてください。\n\n"
+    "テキスト:\n{text}\n\n"
+    "チャンク:"
+)
+
+
+def _ollama_base_url() -> str:
+    """
+    環境変数からOllamaサーバーのURLを求めます。
+    """
+    ollama_base_url = os.getenv('OLLAMA_BASE_URL')
+    ollama_host = os.getenv('OLLAMA_HOST', 'localhost')
+    ollama_port = os.getenv('OLLAMA_PORT', '11434')
+
+    # クライアント接続用にホスト名を調整
+    # 0.0.0.0はサーバー側のリッスン設定であり、クライアントからの接続には使用できない
+    if ollama_host == '0.0.0.0':
+        client_host = 'localhost'
+    else:
+        client_host = ollama_host
+
+    # base_urlが設定されている場合はそれを使用、そうでなければhost/portから構築
+    if ollama_base_url:
+        return ollama_base_url
+    # ホスト名にポート番号が含まれていないか確認
+    if ':' in client_host:
+        # ホスト部分にすでにポートが含まれている場合は、そのまま使用
+        return f"http://{client_host}"
+    # 通常のホスト名とポートの組み合わせ
+    return f"http://{client_host}:{ollama_port}"
+
+
+def organize_window_tokens(num_ctx: int, num_predict: int) -> int:
+    """
+    1回のLLMの呼び出しで整形するテキストの推定トークン数の上限を返します。
+
+    プロンプトと入力と出力の合計がnum_ctxに収まり、入力と同程度の長さの出力がnum_predictに収まる長さにします。
+    環境変数LLM_WINDOW_TOKENSが設定されている場合はその値を使用します。
+    """
+    configured = int(os.getenv('LLM_WINDOW_TOKENS', '0'))
+    if configured > 0:
+        return configured
+    prompt_tokens = estimate_tokens(ORGANIZE_PROMPT_TEMPLATE.format(text=""))
+    # トークン数の推定の誤差に備えて1割の余裕を持たせる
+    return max(128, int(min(num_ctx - num_predict - prompt_tokens, num_predict) * 0.9))
+
+
+def organize_windows(text: str, num_ctx: int = 2048, num_predict: int = 1024, windowed: bool = None) -> List[str]:
+    """
+    テキストを、整形で1回のLLMの呼び出しに渡すウィンドウに分割します。
+
+    テキストが1回の呼び出しに収まる場合やウィンドウモードが無効な場合は、テキスト全体を1つのウィンドウとして返します。
+    各ウィンドウをorganize_text_with_llm(windowed=False)で整形し、出力をstitch_outputsで連結すると、
+    organize_text_with_llmのウィンドウモードと同じ結果になります。
+
+    Args:
+        text: 整形するテキスト
+        num_ctx: コンテキストウィンドウのサイズ
+        num_predict: 予測するトークンの最大数
+        windowed: ウィンドウに分割するかどうか（Noneの場合は環境変数LLM_WINDOWED、未設定の場合は有効）
+
+    Returns:
+        ウィンドウのリスト
+    """
+    if windowed is None:
+        windowed = os.getenv('LLM_WINDOWED', 'true').lower() == 'true'
+
+    window_tokens = organize_window_tokens(num_ctx, num_predict)
+    if not windowed or estimate_tokens(text) <= window_tokens:
+        return [text]
+
+    overlap_tokens = int(os.getenv('LLM_WINDOW_OVERLAP', str(window_tokens // 8)))
+    return split_windows(text, window_tokens, overlap_tokens)
 
-    return text
 
 def organize_text_with_llm(
     text: str,
@@ -69,9 +183,20 @@ def organize_text_with_llm(
     temperature: float = None,
     num_ctx: int = 2048,
     num_predict: int = 1024,
+    windowed: bool = None,
+    cache: Optional[LLMOutputCache] = None,
 ) -> str:
     """
     テキストをLLMで整形し、チャンク分割されたテキストのリストを返します。
+
+    テキストが1回の呼び出しに収まらない場合は、重なりのあるウィンドウに分割して並行に整形し、
+    出力を順番に連結します（src/utils/text_window.pyを参照）。これによりOllamaでの入力の切り捨てと
+    num_predictでの出力の打ち切りを避けます。
+
+    Args:
+        windowed: ウィンドウに分割するかどうか（Noneの場合は環境変数LLM_WINDOWED、未設定の場合は有効）
+        cache: LLM出力キャッシュ（指定した場合はLLMの呼び出しごとに使用します。ウィンドウに分割した場合は
+            変更のないウィンドウの出力を再利用できます）
     """
     # 環境変数から設定を取得
     if model is None:
@@ -79,67 +204,104 @@ def organize_text_with_llm(
     
     if temperature is None:
         temperature = float(os.getenv('LLM_TEMPERATURE', '0.0'))
-    
-    # Ollamaサーバーの設定を取得
-    ollama_base_url = os.getenv('OLLAMA_BASE_URL')
-    ollama_host = os.getenv('OLLAMA_HOST', 'localhost')
-    ollama_port = os.getenv('OLLAMA_PORT', '11434')
-    
-    # クライアント接続用にホスト名を調整
-    # 0.0.0.0はサーバー側のリッスン設定であり、クライアントからの接続には使用できない
-    if ollama_host == '0.0.0.0':
-        client_host = 'localhost'
-    else:
-        client_host = ollama_host
-    
-    # base_urlが設定されている場合はそれを使用、そうでなければhost/portから構築
-    if ollama_base_url:
-        base_url = ollama_base_url
-    else:
-        # ホスト名にポート番号が含まれていないか確認
-        if ':' in client_host:
-            # ホスト部分にすでにポートが含まれている場合は、そのまま使用
-            base_url = f"http://{client_host}"
-        else:
-            # 通常のホスト名とポートの組み合わせ
-            base_url = f"http://{client_host}:{ollama_port}"
-    
+
     # Ollamaで指定されたモデルを使用するLLMを初期化
     llm = Ollama(
         model=model,
         temperature=temperature,
         num_ctx=num_ctx,
         num_predict=num_predict,
-        base_url=base_url
+        base_url=_ollama_base_url()
     )
 
     # プロンプトテンプレートを定義
     prompt_template = PromptTemplate(
         input_variables=["text"],
-        template=(
-            "以下のテキストを読み、内容を改ざんせずに、意味のある単位でチャンクに分割してください。"
-            "各チャンクは、文脈的に一貫性があり、情報の損失がないようにしてください。\n\n"
-            "テキスト:\n{text}\n\n"
-            "チャンク:"
-        )
+        template=ORGANIZE_PROMPT_TEMPLATE
     )
 
     # LLMChainを作成
     chain = LLMChain(llm=llm, prompt=prompt_template)
 
-    # テキストを整形
-    organized_text = chain.run(text)
+    options = f"temperature={temperature};num_ctx={num_ctx};num_predict={num_predict}"
+
+    def run(window: str) -> str:
+        if cache is not None:
+            cached = cache.get(model, options, ORGANIZE_PROMPT_VERSION, window)
+            if cached is not None:
+                return cached
+        started = time.perf_counter()
+        output = chain.run(window)
+        if cache is not None:
+            cache.put(model, options, ORGANIZE_PROMPT_VERSION, window, output, time.perf_counter() - started)
+        return output
+
+    windows = organize_windows(text, num_ctx, num_predict, windowed)
+    if len(windows) == 1:
+        # テキストを整形
+        return run(windows[0])
+
+    logger.info(f"テキスト（推定 {estimate_tokens(text)} トークン）を {len(windows)} 個のウィンドウに分割して整形します")
+
+    # ウィンドウを順に整形して連結する
+    # 並行に整形する場合は、呼び出し元がorganize_windows()で分割し、自身の同時実行数の上限で各ウィンドウを整形する
+    outputs = [run(window) for window in windows]
+
+    return stitch_outputs(outputs)
 
-    return organized_text
 
+# ページごとに変換したMarkdownで、各ページの先頭に置く行
+PAGE_MARKER = "<!-- page: {} -->"
+_PAGE_MARKER_LINE = re.compile(r'^<!-- page: (\d+) -->\s*$')
 
-def chunk_splitter(text: str, chunk_size: int = 500, chunk_overlap: int = 100) -> List[str]:
+
+def format_page_marker(page_number: int) -> str:
     """
-    テキストをチャンクに分割します。
+    ページの先頭に置く行を返します。
+    """
+    return PAGE_MARKER.format(page_number)
+
+
+def iter_pages(lines: Iterable[str]) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    Markdownをページの区切りの行で分割します。ファイルオブジェクトを渡すと、ファイル全体を読み込まずにページごとに返します。
+
+    Args:
+        lines: Markdownの行（改行を含む）
+
+    Yields:
+        (ページ番号, ページのテキスト)。最初の区切りより前のテキスト（区切りがない場合は全体）のページ番号はNone
+    """
+    page_number: Optional[int] = None
+    buffer: List[str] = []
+    for line in lines:
+        match = _PAGE_MARKER_LINE.match(line)
+        if match is None:
+            buffer.append(line)
+            continue
+        if page_number is not None or "".join(buffer).strip():
+            yield page_number, "".join(buffer)
+        page_number = int(match.group(1))
+        buffer = []
+    if page_number is not None or "".join(buffer).strip():
+        yield page_number, "".join(buffer)
+
+
+def chunk_hash(text: str) -> str:
+    """
+    チャンクの内容のハッシュを返します。
+    NFKC正規化と空白の統一を行ってから計算するため、空白や全角半角の違いだけのチャンクは同じハッシュになります。
     """
+    normalized = re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', text)).strip()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
 
-    # チャンク分割器を初期化
-    text_splitter = RecursiveCharacterTextSplitter(
+
+@lru_cache(maxsize=8)
+def _character_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """
+    文字数で分割するチャンク分割器を返します。同じ設定の分割器は使い回します。
+    """
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         separators=["\n\n", "\n", "。", "．", ".", " ", ""],
@@ -147,7 +309,23 @@ def chunk_splitter(text: str, chunk_size: int = 500, chunk_overlap: int = 100) -
         is_separator_regex=False
     )
 
-    # テキストをチャンク分割
-    chunks = text_splitter.split_text(text)
 
-    return chunks
\ No newline at end of file
+def chunk_splitter(text: str, chunk_size: int = 500, chunk_overlap: int = 100,
+                   chunker: Optional[TokenChunker] = None) -> List[str]:
+    """
+    テキストをチャンクに分割します。
+
+    Args:
+        text: 分割するテキスト
+        chunk_size: チャンクのサイズ（文字数。chunkerを指定した場合は使用しません）
+        chunk_overlap: チャンクの重複サイズ（文字数。chunkerを指定した場合は使用しません）
+        chunker: トークン数で分割するチャンク分割器（Noneの場合は文字数で分割）
+
+    Returns:
+        チャンクのリスト
+    """
+    if chunker is not None:
+        return chunker.split(text)
+
+    # テキストをチャンク分割
+    return _character_splitter(chunk_size, chunk_overlap).split_text(text)
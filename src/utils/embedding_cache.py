@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+エンベディングキャッシュモジュール
+
+生成済みのエンベディングをSQLiteファイルに保存し、同じテキストの再エンコードを省略します。
+キーは（モデル名、前処理バージョン、テキストのSHA-256）で、ベクトルはfloat32のバイト列として保存します。
+合計サイズが上限を超えた場合は、最も長く参照されていないエントリから削除します。
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.utils.logger_util import setup_logger
+
+
+class EmbeddingCache:
+    """
+    ディスク上のエンベディングキャッシュ
+
+    複数のプロセスから同じファイルを共有できます（SQLiteのWALモードを使用）。
+
+    Attributes:
+        path: キャッシュファイルのパス
+        max_bytes: キャッシュするベクトルの合計サイズの上限（バイト）
+        hits: キャッシュヒット数
+        misses: キャッシュミス数
+    """
+
+    # 参照日時の更新とサイズ確認を行う間隔（書き込み回数を抑えるため）
+    EVICTION_CHECK_INTERVAL = 100
+
+    def __init__(self, path: str = "./cache/embedding_cache.sqlite3", max_bytes: int = 1024 * 1024 * 1024):
+        """
+        EmbeddingCacheのコンストラクタ
+
+        Args:
+            path: キャッシュファイルのパス（デフォルト: "./cache/embedding_cache.sqlite3"）
+            max_bytes: キャッシュするベクトルの合計サイズの上限（バイト、デフォルト: 1GB）
+        """
+        self.logger = setup_logger("embedding_cache")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_check = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model_name TEXT NOT NULL,
+            preprocess_version TEXT NOT NULL,
+            text_hash TEXT NOT NULL,
+            dimension INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (model_name, preprocess_version, text_hash)
+        );
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access_idx ON embeddings (last_access);")
+        self._conn.commit()
+        self.logger.info(f"エンベディングキャッシュ '{path}' を開きました")
+
+    @classmethod
+    def from_env(cls) -> Optional["EmbeddingCache"]:
+        """
+        環境変数の設定からキャッシュを作成します。
+
+        EMBEDDING_CACHE_ENABLEDがfalseの場合はNoneを返します。
+        パスはEMBEDDING_CACHE_PATH、上限はEMBEDDING_CACHE_MAX_MBで指定します。
+
+        Returns:
+            キャッシュ。無効な場合やファイルを開けない場合はNone
+        """
+        if os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() != 'true':
+            return None
+        try:
+            return cls(
+                path=os.getenv('EMBEDDING_CACHE_PATH', './cache/embedding_cache.sqlite3'),
+                max_bytes=int(float(os.getenv('EMBEDDING_CACHE_MAX_MB', '1024')) * 1024 * 1024)
+            )
+        except Exception as e:
+            setup_logger("embedding_cache").warning(f"エンベディングキャッシュを開けないため、キャッシュなしで続行します: {e}")
+            return None
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """
+        テキストのSHA-256ハッシュを返します。
+
+        Args:
+            text: テキスト
+
+        Returns:
+            16進数のハッシュ文字列
+        """
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model_name: str, preprocess_version: str, texts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        複数のテキストのエンベディングをまとめて取得します。
+
+        Args:
+            model_name: モデル名
+            preprocess_version: 前処理のバージョン
+            texts: テキストのリスト
+
+        Returns:
+            キャッシュに存在したテキストとエンベディング（float32の配列）の辞書
+        """
+        hash_to_texts: Dict[str, List[str]] = {}
+        for text in texts:
+            hash_to_texts.setdefault(self.text_hash(text), []).append(text)
+
+        found: Dict[str, np.ndarray] = {}
+        hashes = list(hash_to_texts.keys())
+        with self._lock:
+            # SQLiteの変数の上限を超えないよう分割して問い合わせる
+            for offset in range(0, len(hashes), 500):
+                batch = hashes[offset:offset + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f'''
+                    SELECT text_hash, vector FROM embeddings
+                    WHERE model_name = ? AND preprocess_version = ? AND text_hash IN ({placeholders});
+                    ''',
+                    [model_name, preprocess_version] + batch
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    for text in hash_to_texts[text_hash]:
+                        found[text] = vector
+
+            # 参照日時を更新（LRUの順序を維持するため）
+            if found:
+                now = time.time()
+                hit_hashes = {self.text_hash(text) for text in found}
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model_name = ? AND preprocess_version = ? AND text_hash = ?;",
+                    [(now, model_name, preprocess_version, text_hash) for text_hash in hit_hashes]
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(set(texts)) - len(found)
+        return found
+
+    def put_many(self, model_name: str, preprocess_version: str, embeddings: Dict[str, np.ndarray]) -> None:
+        """
+        複数のテキストのエンベディングをまとめて保存します。
+
+        Args:
+            model_name: モデル名
+            preprocess_version: 前処理のバージョン
+            embeddings: テキストとエンベディングの辞書
+        """
+        if not embeddings:
+            return
+
+        now = time.time()
+        rows = []
+        for text, embedding in embeddings.items():
+            vector = np.asarray(embedding, dtype=np.float32)
+            rows.append((model_name, preprocess_version, self.text_hash(text), int(vector.shape[0]), vector.tobytes(), now))
+
+        with self._lock:
+            self._conn.executemany(
+                '''
+                INSERT OR REPLACE INTO embeddings (model_name, preprocess_version, text_hash, dimension, vector, last_access)
+                VALUES (?, ?, ?, ?, ?, ?);
+                ''',
+                rows
+            )
+            self._conn.commit()
+
+            self._writes_since_check += len(rows)
+            if self._writes_since_check >= self.EVICTION_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._evict()
+
+    def _evict(self) -> None:
+        """
+        合計サイズが上限を超えている場合、参照日時の古いエントリから削除します。
+        呼び出し元でロックを取得してください。
+        """
+        total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings;").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+
+        # 上限の90%まで削除し、削除処理が頻発しないようにする
+        target_bytes = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_access;").fetchall()
+        delete_ids = []
+        for rowid, size in rows:
+            if total_bytes <= target_bytes:
+                break
+            delete_ids.append((rowid,))
+            total_bytes -= size
+
+        self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?;", delete_ids)
+        self._conn.commit()
+        self.logger.info(f"エンベディングキャッシュから {len(delete_ids)} 件の古いエントリを削除しました")
+
+    def close(self) -> None:
+        """
+        キャッシュファイルを閉じます。
+        """
+        with self._lock:
+            self._conn.close()
@@ -3,13 +3,58 @@
 エンベディング生成モジュール
 
 テキストからエンベディングを生成します。
+エンベディングはfloat32のnumpy配列（複数のテキストの場合は2次元の配列）で返し、
+リストへの変換はJSONで返す箇所だけで行います。
+torchとsentence-transformersはモデルを読み込む時点でインポートするため、
+外部プロセスのモデルを使用する場合（sidecar / ollamaバックエンド）はこれらを読み込みません。
 """
 
 import os
-import torch
-from typing import List
-from sentence_transformers import SentenceTransformer
+import time
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
 from src.utils.logger_util import setup_logger
+from src.utils.embedding_cache import EmbeddingCache
+from src.config.config_manager import ConfigManager
+
+
+def build_token_batches(lengths: List[int], token_budget: int, max_batch_size: int = 128) -> List[List[int]]:
+    """
+    トークン数の上限に収まるようにテキストをバッチに分けます。
+
+    パディングを減らすためにトークン数の多い順に並べ、バッチ内の最大トークン数×件数が
+    token_budgetを超えない範囲でテキストを詰めます。最も長いテキストが最初のバッチになるため、
+    メモリが不足する場合は処理の最初に判明します。
+
+    Args:
+        lengths: 各テキストのトークン数
+        token_budget: 1バッチあたりのトークン数の上限（パディングを含む）
+        max_batch_size: 1バッチあたりの最大件数
+
+    Returns:
+        バッチごとのテキストのインデックスのリスト
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_max = 0
+    for index in order:
+        length = max(1, lengths[index])
+        batch_max = max(current_max, length)
+        if current and (batch_max * (len(current) + 1) > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current = []
+            batch_max = length
+        current.append(index)
+        current_max = batch_max
+    if current:
+        batches.append(current)
+    return batches
 
 
 class EmbeddingGenerator:
@@ -19,11 +64,31 @@ class EmbeddingGenerator:
     テキストからエンベディングを生成します。
 
     Attributes:
-        model: SentenceTransformerモデル
+        model: SentenceTransformerモデル（sidecar / ollamaバックエンドの場合はremote_embeddingのクライアント）
+        model_name: 使用しているモデル名（ollamaバックエンドの場合はOllamaのモデル名）
+        backend: 推論バックエンド（"torch"、"onnx"、"sidecar"、"ollama" のいずれか）
+        quantize: ONNXモデルをint8に動的量子化しているかどうか
+        cold_start_seconds: 初期化（モデルの読み込みとウォームアップ）にかかった時間（秒）
+        embedding_cache: エンベディングキャッシュ（無効な場合はNone）
         logger: ロガー
     """
 
-    def __init__(self, model_name: str = "intfloat/multilingual-e5-large", model_dir: str = "./models", device: str = None):
+    # テキストの前処理のバージョン。前処理を変更した場合は更新し、古いキャッシュを使わないようにする
+    PREPROCESS_VERSION = "query-prefix-v1"
+
+    # 使用できる推論バックエンド
+    BACKENDS = ("torch", "onnx", "sidecar", "ollama")
+
+    # モデルを外部のプロセスが保持するバックエンド（torchを読み込まない）
+    REMOTE_BACKENDS = ("sidecar", "ollama")
+
+    # 高速に読み込むためにローカルのモデルディレクトリに必要なファイル
+    # （メモリマップで読み込める重みと、変換なしで読み込める高速トークナイザー）
+    FAST_LOAD_FILES = ("model.safetensors", "tokenizer.json")
+
+    def __init__(self, model_name: str = "intfloat/multilingual-e5-large", model_dir: str = "./models", device: str = None,
+                 embedding_cache: Optional[EmbeddingCache] = None, use_cache: bool = True,
+                 backend: Optional[str] = None, quantize: Optional[bool] = None):
         """
         EmbeddingGeneratorのコンストラクタ
 
@@ -31,12 +96,49 @@ class EmbeddingGenerator:
             model_name: 使用するモデル名（デフォルト: "intfloat/multilingual-e5-large"）
             model_dir: モデルを保存するディレクトリ（デフォルト: "./models"）
             device: 使用するデバイス（Noneの場合は自動選択）
+            embedding_cache: エンベディングキャッシュ（Noneの場合は環境変数の設定から作成）
+            use_cache: generate_embeddingsでキャッシュを使用するかどうか
+            backend: 推論バックエンド（"torch"、"onnx"、"sidecar"、"ollama" のいずれか）。Noneの場合はagent_settings.jsonのembeddingセクションから取得
+            quantize: ONNXモデルをint8に動的量子化するかどうか。Noneの場合はagent_settings.jsonから取得
         """
         # ロガーの設定
         self.logger = setup_logger("embedding_generator")
+        self.model_name = model_name
+        started = time.perf_counter()
+        
+        # 複数のスレッドから共有された場合に備えて、エンコードを直列化する
+        self._encode_lock = threading.Lock()
+        
+        # 推論バックエンドの設定（引数で指定した場合は引数を優先）
+        self.embedding_config = ConfigManager().get_embedding_config()
+        self.backend = self.resolve_backend(backend, self.embedding_config)
+        self.quantize = bool(self.embedding_config.get("quantize", False) if quantize is None else quantize) and self.backend == "onnx"
+        
+        # 動的バッチ処理の設定（1バッチあたりのトークン数の上限と最大件数）
+        self.token_budget = int(os.getenv('EMBEDDING_TOKEN_BUDGET', '16384'))
+        self.max_batch_size = int(os.getenv('EMBEDDING_MAX_BATCH_SIZE', '128'))
         
-        # デバイスの設定
-        if device is None:
+        # エンベディングキャッシュの設定（sidecarバックエンドではサイドカー側のキャッシュを使用する）
+        if use_cache and self.backend != "sidecar":
+            self.embedding_cache = embedding_cache if embedding_cache is not None else EmbeddingCache.from_env()
+        else:
+            self.embedding_cache = None
+        
+        # 外部プロセスのモデルを使用する場合は、torchを読み込まずに接続だけを行う
+        if self.backend in self.REMOTE_BACKENDS:
+            self.device = "remote"
+            self.model = self._load_remote_model()
+            self.cold_start_seconds = time.perf_counter() - started
+            self.logger.info(f"埋め込みモデル '{model_name}' の準備が完了しました（バックエンド: {self.backend}, {self.cold_start_seconds:.2f}秒）")
+            return
+        
+        import torch
+        from sentence_transformers import SentenceTransformer
+        
+        # デバイスの設定（ONNX RuntimeバックエンドはCPUで実行する）
+        if self.backend == "onnx":
+            self.device = "cpu"
+        elif device is None:
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
         else:
             self.device = device
@@ -56,26 +158,256 @@ class EmbeddingGenerator:
         
         # モデルの読み込み
         try:
+            if self.backend == "onnx":
+                self.model = self._load_onnx_model(model_local_path)
             # まずローカルディレクトリからモデルの読み込みを試みる
-            if os.path.exists(model_local_path):
+            elif os.path.exists(model_local_path):
                 self.logger.info(f"ローカルからモデル '{model_local_path}' を読み込んでいます...")
-                self.model = SentenceTransformer(model_local_path, device=self.device)
+                # ローカルのファイルだけを参照し、Hugging Face Hubへの問い合わせを省略する
+                self.model = SentenceTransformer(model_local_path, device=self.device, local_files_only=True)
                 self.logger.info(f"ローカルからモデル '{model_local_path}' を読み込みました")
+                self._save_fast_load_files(model_local_path)
             else:
                 # ローカルにモデルがない場合、オンラインから取得して保存
                 self.logger.info(f"オンラインからモデル '{model_name}' を読み込んでいます...")
                 self.model = SentenceTransformer(model_name, device=self.device)
                 self.logger.info(f"モデル '{model_name}' を読み込みました")
                 
-                # モデルをローカルに保存
-                self.logger.info(f"モデルを '{model_local_path}' に保存しています...")
-                self.model.save(model_local_path)
-                self.logger.info(f"モデルを '{model_local_path}' に保存しました")
+                # モデルをローカルに保存（次回以降は重みをメモリマップで読み込めるようsafetensors形式で保存）
+                self._save_model(model_local_path)
         except Exception as e:
             self.logger.error(f"モデル '{model_name}' の読み込みに失敗しました: {str(e)}")
             raise
+        load_seconds = time.perf_counter() - started
+        
+        # 最初の要求が遅くならないよう、CUDAカーネルの初期化などを起動時に済ませる
+        warmup_seconds = 0.0
+        if self.embedding_config.get("warmup", False):
+            warmup_seconds = self.warmup()
+        
+        self.cold_start_seconds = time.perf_counter() - started
+        self.logger.info(f"埋め込みモデル '{model_name}' の準備が完了しました（デバイス: {self.device}, バックエンド: {self.backend}, "
+                         f"読み込み: {load_seconds:.2f}秒, ウォームアップ: {warmup_seconds:.2f}秒, 合計: {self.cold_start_seconds:.2f}秒）")
+
+    @staticmethod
+    def resolve_backend(backend: Optional[str], embedding_config: Optional[Dict[str, Any]] = None) -> str:
+        """
+        使用する推論バックエンドを決定します。
+
+        Args:
+            backend: 引数で指定されたバックエンド（Noneの場合は設定ファイルの値）
+            embedding_config: agent_settings.jsonのembeddingセクション（Noneの場合は読み込む）
+
+        Returns:
+            推論バックエンド名
+
+        Raises:
+            ValueError: 不明なバックエンドが指定された場合
+        """
+        if embedding_config is None:
+            embedding_config = ConfigManager().get_embedding_config()
+        resolved = (backend or embedding_config.get("backend") or "torch").lower()
+        if resolved not in EmbeddingGenerator.BACKENDS:
+            raise ValueError(f"不明な推論バックエンドです: {resolved}")
+        return resolved
+
+    def _load_remote_model(self) -> Any:
+        """
+        外部プロセスのモデルに接続します。
 
-    def generate_embedding(self, text: str) -> List[float]:
+        sidecarバックエンドは、環境変数EMBEDDING_SIDECAR_URL（未設定の場合はagent_settings.jsonのsidecar_url）で
+        指定したエンベディングサイドカーに接続します。サイドカーのモデルが指定したモデルと異なる場合はエラーになります。
+        ollamaバックエンドは、Ollamaの/api/embedでmodel_nameのモデルを使用し、次元数は接続時に検出します。
+
+        Returns:
+            encode()とget_sentence_embedding_dimension()を持つモデル
+        """
+        from src.utils.remote_embedding import OllamaEmbeddingModel, SidecarEmbeddingModel
+
+        if self.backend == "ollama":
+            return OllamaEmbeddingModel(
+                self.model_name,
+                base_url=self.embedding_config.get("ollama_base_url") or None,
+                timeout=float(os.getenv('OLLAMA_EMBEDDING_TIMEOUT', '60')),
+                pool_size=int(self.embedding_config.get("ollama_pool_size", 8)),
+                max_batch_size=self.max_batch_size,
+                keep_alive=self.embedding_config.get("ollama_keep_alive") or None
+            )
+
+        url = os.getenv('EMBEDDING_SIDECAR_URL') or self.embedding_config.get("sidecar_url", "unix:///tmp/nakedrag-embedding.sock")
+        model = SidecarEmbeddingModel(url, timeout=float(os.getenv('EMBEDDING_SIDECAR_TIMEOUT', '60')))
+        if model.model_name != self.model_name:
+            raise ValueError(f"エンベディングサイドカーのモデル '{model.model_name}' が指定したモデル '{self.model_name}' と異なります")
+        return model
+
+    @staticmethod
+    def _make_temp_dir(model_local_path: str) -> str:
+        """
+        モデルディレクトリと同じファイルシステム上に一時ディレクトリを作成します（os.replaceで移動できるようにするため）。
+
+        Args:
+            model_local_path: モデルのローカルパス
+
+        Returns:
+            一時ディレクトリのパス
+        """
+        parent = os.path.dirname(os.path.abspath(model_local_path))
+        return tempfile.mkdtemp(prefix=f".{os.path.basename(model_local_path)}-", dir=parent)
+
+    def _save_model(self, model_local_path: str) -> None:
+        """
+        オンラインから取得したモデルをローカルのモデルディレクトリに保存します。
+
+        一時ディレクトリに保存してからos.replaceで移動するため、EmbeddingPoolのワーカープロセスが同時に保存しても、
+        保存途中のディレクトリを他のプロセスが読み込むことはありません。他のプロセスが先に保存した場合はそちらを残します。
+
+        Args:
+            model_local_path: モデルのローカルパス
+        """
+        self.logger.info(f"モデルを '{model_local_path}' に保存しています...")
+        temp_dir = self._make_temp_dir(model_local_path)
+        try:
+            self.model.save(temp_dir, safe_serialization=True)
+            try:
+                os.replace(temp_dir, model_local_path)
+            except OSError:
+                self.logger.info(f"モデルは他のプロセスによって '{model_local_path}' に保存済みです")
+                return
+            self.logger.info(f"モデルを '{model_local_path}' に保存しました")
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _save_fast_load_files(self, model_local_path: str) -> None:
+        """
+        ローカルのモデルディレクトリに高速に読み込むためのファイルがない場合は保存します。
+
+        古い形式（pytorch_model.bin）で保存されたモデルはsafetensors形式で保存し直し、
+        高速トークナイザーのtokenizer.jsonがない場合は保存します。次回以降は重みをメモリマップで読み込み、
+        トークナイザーの変換も省略されます。保存に失敗しても処理は続行します。
+
+        ファイルは一時ディレクトリに保存してからos.replaceで1つずつ置き換えるため、EmbeddingPoolのワーカープロセスが
+        同時に保存しても、書きかけのファイルを他のプロセスが読み込むことはありません。
+
+        Args:
+            model_local_path: モデルのローカルパス
+        """
+        missing = [name for name in self.FAST_LOAD_FILES if not os.path.exists(os.path.join(model_local_path, name))]
+        if not missing:
+            return
+        if "model.safetensors" not in missing and not getattr(self.model.tokenizer, "is_fast", False):
+            return
+        temp_dir = None
+        try:
+            temp_dir = self._make_temp_dir(model_local_path)
+            if "model.safetensors" in missing:
+                self.logger.info(f"モデルの重みをsafetensors形式で '{model_local_path}' に保存しています...")
+                self.model.save(temp_dir, safe_serialization=True)
+            else:
+                self.model.tokenizer.save_pretrained(temp_dir)
+            saved = []
+            for name in missing:
+                temp_path = os.path.join(temp_dir, name)
+                if os.path.exists(temp_path):
+                    os.replace(temp_path, os.path.join(model_local_path, name))
+                    saved.append(name)
+            self.logger.info(f"高速読み込み用のファイルを '{model_local_path}' に保存しました: {', '.join(saved)}")
+        except Exception as e:
+            self.logger.warning(f"高速読み込み用のファイルの保存に失敗しました: {str(e)}")
+        finally:
+            if temp_dir is not None:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def warmup(self) -> float:
+        """
+        短いテキストを1回エンコードし、初回の推論にかかる初期化を済ませます。
+
+        Returns:
+            ウォームアップにかかった時間（秒）
+        """
+        started = time.perf_counter()
+        try:
+            with self._encode_lock:
+                self.model.encode(["query: warmup"], batch_size=1)
+        except Exception as e:
+            self.logger.warning(f"埋め込みモデルのウォームアップに失敗しました: {str(e)}")
+        return time.perf_counter() - started
+
+    def _load_onnx_model(self, model_local_path: str) -> "SentenceTransformer":
+        """
+        ONNX Runtimeで推論するモデルを読み込みます。
+
+        初回はモデルをONNX形式にエクスポートしてローカルに保存し、量子化が有効な場合は
+        int8に動的量子化したモデルも保存します。スレッド数はagent_settings.jsonの
+        intra_op_threads / inter_op_threadsで指定します（0の場合はONNX Runtimeの既定値）。
+
+        Args:
+            model_local_path: モデルのローカルパス
+
+        Returns:
+            ONNX Runtimeバックエンドのモデル
+        """
+        try:
+            import onnxruntime as ort
+            from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+        except ImportError as e:
+            raise ImportError("ONNXバックエンドを使用するには 'sentence-transformers[onnx]' をインストールしてください") from e
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        intra_op_threads = int(self.embedding_config.get("intra_op_threads", 0))
+        inter_op_threads = int(self.embedding_config.get("inter_op_threads", 0))
+        if intra_op_threads > 0:
+            session_options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads > 0:
+            session_options.inter_op_num_threads = inter_op_threads
+        model_kwargs = {"provider": "CPUExecutionProvider", "session_options": session_options}
+
+        onnx_file = os.path.join(model_local_path, "onnx", "model.onnx")
+        source = model_local_path if os.path.exists(model_local_path) else self.model_name
+        self.logger.info(f"ONNX Runtimeでモデル '{source}' を読み込んでいます...")
+        model = SentenceTransformer(source, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+        # エクスポートしたONNXモデルを保存し、次回以降はエクスポートを省略する
+        if not os.path.exists(onnx_file):
+            self.logger.info(f"ONNXモデルを '{model_local_path}' に保存しています...")
+            model.save_pretrained(model_local_path)
+
+        if self.quantize:
+            quantization_config = self.embedding_config.get("quantization_config", "avx2")
+            quantized_file = f"onnx/model_qint8_{quantization_config}.onnx"
+            if not os.path.exists(os.path.join(model_local_path, quantized_file)):
+                self.logger.info(f"ONNXモデルをint8に量子化しています（{quantization_config}）...")
+                export_dynamic_quantized_onnx_model(model, quantization_config, model_local_path)
+            model = SentenceTransformer(model_local_path, device="cpu", backend="onnx",
+                                        model_kwargs={**model_kwargs, "file_name": quantized_file})
+
+        self.logger.info(f"ONNX Runtimeでモデルを読み込みました（量子化: {self.quantize}, intra_op_threads: {intra_op_threads}, inter_op_threads: {inter_op_threads}）")
+        return model
+
+    @property
+    def cache_model_name(self) -> str:
+        """
+        エンベディングキャッシュのキーに使用するモデル名を返します。
+        バックエンドや量子化によって出力がわずかに異なるため、区別して保存します。
+
+        Returns:
+            キャッシュ用のモデル名
+        """
+        if self.backend == "torch":
+            return self.model_name
+        return f"{self.model_name}#{self.backend}{'-int8' if self.quantize else ''}"
+
+    @property
+    def dimension(self) -> int:
+        """
+        モデルが出力するエンベディングの次元数を返します。
+
+        Returns:
+            エンベディングの次元数
+        """
+        return self.model.get_sentence_embedding_dimension()
+
+    def generate_embedding(self, text: str) -> np.ndarray:
         """
         テキストからエンベディングを生成します。
 
@@ -83,11 +415,11 @@ class EmbeddingGenerator:
             text: エンベディングを生成するテキスト
 
         Returns:
-            エンベディング（浮動小数点数のリスト）
+            エンベディング（float32の1次元配列）
         """
         if not text:
             self.logger.warning("空のテキストからエンベディングを生成しようとしています")
-            return []
+            return np.zeros(0, dtype=np.float32)
 
         try:
             # テキストの前処理
@@ -95,51 +427,163 @@ class EmbeddingGenerator:
             processed_text = f"query: {text}" if "query" not in text.lower() else text
 
             # エンベディングの生成
-            embedding = self.model.encode(processed_text)
-
-            # numpy配列をリストに変換
-            embedding_list = embedding.tolist()
+            with self._encode_lock:
+                embedding = self.model.encode(processed_text)
 
             self.logger.debug(f"テキスト '{text[:50]}...' のエンベディングを生成しました")
-            return embedding_list
+            return np.ascontiguousarray(embedding, dtype=np.float32)
 
         except Exception as e:
             self.logger.error(f"エンベディングの生成中にエラーが発生しました: {str(e)}")
             raise
 
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        各テキストのトークン数を数えます。トークナイザーを利用できない場合は文字数で代用します。
+
+        Args:
+            texts: 前処理済みのテキストのリスト
+
+        Returns:
+            各テキストのトークン数（モデルの最大長で切り詰めた値）
+        """
+        max_length = getattr(self.model, "max_seq_length", None) or 512
+        try:
+            encoded = self.model.tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_length)
+            return [len(input_ids) for input_ids in encoded["input_ids"]]
+        except Exception as e:
+            self.logger.debug(f"トークン数の取得に失敗したため文字数で代用します: {str(e)}")
+            return [min(len(text), max_length) for text in texts]
+
+    def iter_embeddings(self, texts: List[str], use_cache: bool = True) -> Iterator[Tuple[List[int], np.ndarray]]:
+        """
+        複数のテキストのエンベディングをバッチごとに順次生成します。
+
+        キャッシュ済みのテキストは最初にまとめて返し、残りはトークン数の近いテキストを
+        トークン数の上限（token_budget）に収まるバッチにまとめてエンコードします。
+        呼び出し元はバッチごとにデータベースへの書き込みなどを並行して進められます。
+
+        Args:
+            texts: エンベディングを生成するテキストのリスト
+            use_cache: エンベディングキャッシュを使用するかどうか（検索クエリなど保存しないテキストの場合はFalse）
+
+        Yields:
+            (テキストのインデックスのリスト, 対応するエンベディングの2次元配列)。インデックスはtextsでの位置です
+        """
+        # キャッシュ済みのエンベディングをまとめて取得
+        cached = self._get_cached_embeddings(texts) if use_cache else {}
+        if cached:
+            cached_indices = [i for i, text in enumerate(texts) if text in cached]
+            yield cached_indices, np.stack([cached[texts[i]] for i in cached_indices])
+
+        # キャッシュにないテキストだけをエンコードする（重複は1回だけ）
+        positions: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            if text not in cached:
+                positions.setdefault(text, []).append(i)
+        missing_texts = list(positions.keys())
+        if not missing_texts:
+            return
+
+        # テキストの前処理
+        # multilingual-e5-largeモデルの場合、クエリには "query: " プレフィックスを追加
+        processed_texts = [f"query: {text}" if "query" not in text.lower() else text for text in missing_texts]
+
+        batches = build_token_batches(self._count_tokens(processed_texts), self.token_budget, self.max_batch_size)
+        encoded_count = 0
+        next_report = 0.1
+        for batch in batches:
+            # エンベディングの生成（バッチ処理）
+            with self._encode_lock:
+                embeddings = self.model.encode([processed_texts[k] for k in batch], batch_size=len(batch))
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+            batch_texts = [missing_texts[k] for k in batch]
+            if use_cache:
+                self._put_cached_embeddings(dict(zip(batch_texts, embeddings)))
+
+            # 重複したテキストは同じ行を参照する
+            indices: List[int] = []
+            rows: List[int] = []
+            for row, text in enumerate(batch_texts):
+                for i in positions[text]:
+                    indices.append(i)
+                    rows.append(row)
+            vectors = embeddings if len(rows) == len(batch_texts) else embeddings[rows]
+
+            encoded_count += len(batch)
+            progress = encoded_count / len(missing_texts)
+            self.logger.debug(f"{encoded_count}/{len(missing_texts)} 個のテキストをエンコードしました（バッチ: {len(batch)} 件）")
+            if progress >= next_report or encoded_count == len(missing_texts):
+                self.logger.info(f"エンベディングの生成: {encoded_count}/{len(missing_texts)} ({progress:.0%})")
+                next_report = progress + 0.1
+
+            yield indices, vectors
+
+    def generate_embeddings(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
         """
         複数のテキストからエンベディングを生成します。
 
+        iter_embeddingsでトークン数ごとのバッチに分けて生成し、元の順序に並べ直して返します。
+
         Args:
             texts: エンベディングを生成するテキストのリスト
+            use_cache: エンベディングキャッシュを使用するかどうか
 
         Returns:
-            エンベディングのリスト
+            エンベディングの2次元配列（float32、行がtextsの順序に対応）
         """
         if not texts:
             self.logger.warning("空のテキストリストからエンベディングを生成しようとしています")
-            return []
+            return np.zeros((0, 0), dtype=np.float32)
 
         try:
-            # テキストの前処理
-            # multilingual-e5-largeモデルの場合、クエリには "query: " プレフィックスを追加
-            processed_texts = [f"query: {text}" if "query" not in text.lower() else text for text in texts]
-
-            # エンベディングの生成（バッチ処理）
-            embeddings = self.model.encode(processed_texts)
-
-            # numpy配列をリストに変換
-            embeddings_list = embeddings.tolist()
+            embeddings: Optional[np.ndarray] = None
+            for indices, vectors in self.iter_embeddings(texts, use_cache):
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+                embeddings[indices] = vectors
 
             self.logger.info(f"{len(texts)} 個のテキストのエンベディングを生成しました")
-            return embeddings_list
+            return embeddings
 
         except Exception as e:
             self.logger.error(f"エンベディングの生成中にエラーが発生しました: {str(e)}")
             raise
 
-    def generate_search_embedding(self, query: str) -> List[float]:
+    def _get_cached_embeddings(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        キャッシュからエンベディングをまとめて取得します。キャッシュの読み込みに失敗した場合は空の辞書を返します。
+
+        Args:
+            texts: テキストのリスト
+
+        Returns:
+            キャッシュに存在したテキストとエンベディングの辞書
+        """
+        if self.embedding_cache is None:
+            return {}
+        try:
+            return self.embedding_cache.get_many(self.cache_model_name, self.PREPROCESS_VERSION, texts)
+        except Exception as e:
+            self.logger.warning(f"エンベディングキャッシュの読み込みに失敗しました: {str(e)}")
+            return {}
+
+    def _put_cached_embeddings(self, embeddings: Dict[str, np.ndarray]) -> None:
+        """
+        生成したエンベディングをキャッシュに保存します。保存に失敗しても処理は続行します。
+
+        Args:
+            embeddings: テキストとエンベディングの辞書
+        """
+        if self.embedding_cache is None:
+            return
+        try:
+            self.embedding_cache.put_many(self.cache_model_name, self.PREPROCESS_VERSION, embeddings)
+        except Exception as e:
+            self.logger.warning(f"エンベディングキャッシュへの保存に失敗しました: {str(e)}")
+
+    def generate_search_embedding(self, query: str) -> np.ndarray:
         """
         検索クエリからエンベディングを生成します。
 
@@ -147,24 +591,22 @@ class EmbeddingGenerator:
             query: 検索クエリ
 
         Returns:
-            エンベディング（浮動小数点数のリスト）
+            エンベディング（float32の1次元配列）
         """
         if not query:
             self.logger.warning("空のクエリからエンベディングを生成しようとしています")
-            return []
+            return np.zeros(0, dtype=np.float32)
 
         try:
             # multilingual-e5-largeモデルの場合、クエリには "query: " プレフィックスを追加
             processed_query = f"query: {query}" if "query" not in query.lower() else query
 
             # エンベディングの生成
-            embedding = self.model.encode(processed_query)
-
-            # numpy配列をリストに変換
-            embedding_list = embedding.tolist()
+            with self._encode_lock:
+                embedding = self.model.encode(processed_query)
 
             self.logger.debug(f"クエリ '{query}' のエンベディングを生成しました")
-            return embedding_list
+            return np.ascontiguousarray(embedding, dtype=np.float32)
 
         except Exception as e:
             self.logger.error(f"クエリエンベディングの生成中にエラーが発生しました: {str(e)}")
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+エンベディングのバックエンド間の一致確認モジュール
+
+ONNX Runtimeバックエンド（int8量子化を含む）の出力が、PyTorchバックエンドの出力と
+十分に一致しているかをコサイン類似度で確認します。
+"""
+
+import os
+import sys
+import argparse
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from src.utils.embedding_generator import EmbeddingGenerator
+from src.utils.logger_util import setup_logger
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+# 確認に使用する既定のサンプルテキスト
+DEFAULT_SAMPLE_TEXTS = [
+    "RAGシステムは検索した文書をもとに回答を生成します。",
+    "ベクトルデータベースには文書のチャンクと埋め込みベクトルが格納されています。",
+    "PostgreSQLのpgvector拡張を使用して類似度検索を行います。",
+    "会議の議事録をMarkdown形式に変換してから取り込みます。",
+    "The quick brown fox jumps over the lazy dog.",
+    "社内規程の第3条では、休暇の申請手続きについて定めています。",
+    "検索結果が不十分な場合は、質問の言い換えを提案してください。",
+    "大量のファイルを取り込む場合は、バッチ処理で埋め込みを生成します。",
+]
+
+
+def check_embedding_parity(model_name: str,
+                           texts: Optional[List[str]] = None,
+                           quantize: bool = False,
+                           threshold: float = 0.99) -> Dict[str, float]:
+    """
+    ONNX Runtimeバックエンドの出力とPyTorchバックエンドの出力を比較します。
+
+    Args:
+        model_name: 比較するモデル名
+        texts: 比較に使用するテキスト。Noneの場合は既定のサンプルを使用
+        quantize: ONNXモデルをint8に量子化して比較するかどうか
+        threshold: 合格とするコサイン類似度の最小値
+
+    Returns:
+        min_cosine（最小値）、mean_cosine（平均値）、passed（1.0: 合格、0.0: 不合格）
+    """
+    texts = texts or DEFAULT_SAMPLE_TEXTS
+
+    # キャッシュを使うと比較にならないため、両方ともキャッシュを無効にする
+    torch_generator = EmbeddingGenerator(model_name=model_name, backend="torch", use_cache=False)
+    torch_embeddings = np.asarray(torch_generator.generate_embeddings(texts), dtype=np.float32)
+    del torch_generator
+
+    onnx_generator = EmbeddingGenerator(model_name=model_name, backend="onnx", quantize=quantize, use_cache=False)
+    onnx_embeddings = np.asarray(onnx_generator.generate_embeddings(texts), dtype=np.float32)
+
+    torch_norm = torch_embeddings / np.linalg.norm(torch_embeddings, axis=1, keepdims=True)
+    onnx_norm = onnx_embeddings / np.linalg.norm(onnx_embeddings, axis=1, keepdims=True)
+    cosines = np.sum(torch_norm * onnx_norm, axis=1)
+
+    result = {
+        'min_cosine': float(np.min(cosines)),
+        'mean_cosine': float(np.mean(cosines)),
+        'passed': 1.0 if float(np.min(cosines)) >= threshold else 0.0
+    }
+    logger.info(f"バックエンド間の一致確認（量子化: {quantize}）: 最小 {result['min_cosine']:.4f}, 平均 {result['mean_cosine']:.4f}, 閾値 {threshold}")
+    return result
+
+
+def main():
+    """
+    メイン関数
+    """
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='ONNXバックエンドとPyTorchバックエンドの出力の一致を確認します')
+    parser.add_argument('--model', type=str, default=os.getenv('EMBEDDING_MODEL', 'intfloat/multilingual-e5-large'),
+                        help='比較するモデル名')
+    parser.add_argument('--quantize', action='store_true', help='ONNXモデルをint8に量子化して比較する')
+    parser.add_argument('--threshold', type=float, default=0.99, help='合格とするコサイン類似度の最小値 (デフォルト: 0.99)')
+    parser.add_argument('--texts-file', type=str, default=None, help='比較に使用するテキストのファイル（1行に1テキスト）')
+    args = parser.parse_args()
+
+    texts = None
+    if args.texts_file:
+        with open(args.texts_file, 'r', encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    try:
+        result = check_embedding_parity(args.model, texts=texts, quantize=args.quantize, threshold=args.threshold)
+        print(f"最小コサイン類似度: {result['min_cosine']:.4f}")
+        print(f"平均コサイン類似度: {result['mean_cosine']:.4f}")
+        if not result['passed']:
+            print(f"不合格: 最小コサイン類似度が閾値 {args.threshold} を下回っています")
+            sys.exit(1)
+        print("合格")
+    except Exception as e:
+        logger.error(f"一致確認中にエラーが発生しました: {e}", exc_info=True)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+エンベディング生成プロセスプールモジュール
+
+大量のチャンクを取り込む際に、複数のワーカープロセスでエンベディングを並列に生成します。
+各ワーカーはそれぞれモデルを読み込み、トークナイズやPythonの処理もGILに縛られずに並列化されます。
+"""
+
+import os
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, List, Optional
+
+import numpy as np
+
+from src.utils.logger_util import setup_logger
+
+# ワーカープロセス内の埋め込み生成器
+_worker_generator = None
+
+
+def _init_worker(model_name: str, model_dir: str, backend: Optional[str], num_threads: int) -> None:
+    """
+    ワーカープロセスの初期化処理。モデルを読み込みます。
+
+    Args:
+        model_name: モデル名
+        model_dir: モデルを保存するディレクトリ
+        backend: 推論バックエンド
+        num_threads: ワーカー1つあたりの演算スレッド数
+    """
+    global _worker_generator
+    import torch
+    from src.utils.embedding_generator import EmbeddingGenerator
+
+    # ワーカー間でCPUコアを取り合わないよう、スレッド数を制限する
+    torch.set_num_threads(num_threads)
+
+    # エンベディングキャッシュ（SQLiteのWALモード）はワーカー間で共有される
+    _worker_generator = EmbeddingGenerator(model_name=model_name, model_dir=model_dir, device="cpu", backend=backend)
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    """
+    ワーカープロセスでエンベディングを生成します。
+
+    Args:
+        texts: テキストのリスト
+
+    Returns:
+        float32のエンベディングの配列
+    """
+    return _worker_generator.generate_embeddings(texts)
+
+
+class EmbeddingPool:
+    """
+    複数のワーカープロセスでエンベディングを生成するクラス
+
+    EmbeddingGeneratorと同じgenerate_embeddingsを提供するため、置き換えて使用できます。
+
+    Attributes:
+        model_name: 使用するモデル名
+        workers: ワーカープロセス数
+        shard_size: 1つのワーカーに割り当てる最大テキスト数
+    """
+
+    def __init__(self, model_name: str = "intfloat/multilingual-e5-large", workers: int = 2, model_dir: str = "./models",
+                 backend: Optional[str] = None, shard_size: int = 256):
+        """
+        EmbeddingPoolのコンストラクタ
+
+        Args:
+            model_name: 使用するモデル名
+            workers: ワーカープロセス数
+            model_dir: モデルを保存するディレクトリ
+            backend: 推論バックエンド（Noneの場合はagent_settings.jsonの設定）
+            shard_size: 1つのワーカーに割り当てる最大テキスト数
+        """
+        self.logger = setup_logger("embedding_pool")
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.shard_size = shard_size
+
+        num_threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self.logger.info(f"{self.workers} 個のワーカープロセスを起動しています（ワーカーあたり {num_threads} スレッド）...")
+
+        # CUDAやスレッドの状態を引き継がないよう、spawnで起動する
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, model_dir, backend, num_threads)
+        )
+
+    def submit(self, texts: List[str]) -> "Future[np.ndarray]":
+        """
+        テキストのエンベディング生成を1つのワーカーに依頼します。
+
+        Args:
+            texts: テキストのリスト
+
+        Returns:
+            float32のエンベディングの配列を返すFuture
+        """
+        return self._executor.submit(_encode_in_worker, texts)
+
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        複数のテキストからエンベディングを生成します。
+
+        テキストをワーカー数に応じて分割して並列に生成し、元の順序で返します。
+
+        Args:
+            texts: エンベディングを生成するテキストのリスト
+
+        Returns:
+            エンベディングの2次元配列（float32、行がtextsの順序に対応）
+        """
+        if not texts:
+            self.logger.warning("空のテキストリストからエンベディングを生成しようとしています")
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # 重複を除き、ワーカー数以上に分割して各ワーカーに均等に割り当てる
+        # キャッシュの参照と保存は各ワーカーのEmbeddingGeneratorが行う
+        unique_texts = list(dict.fromkeys(texts))
+        shard_size = max(1, min(self.shard_size, -(-len(unique_texts) // self.workers)))
+        shards = [unique_texts[i:i + shard_size] for i in range(0, len(unique_texts), shard_size)]
+        futures = [self.submit(shard) for shard in shards]
+
+        # ワーカーの結果を連結し、元のテキストの順序で行を取り出す
+        generated = np.concatenate([future.result() for future in futures])
+        row_of = {text: row for row, text in enumerate(unique_texts)}
+
+        self.logger.info(f"{len(texts)} 個のテキストのエンベディングを {self.workers} プロセスで生成しました")
+        if len(unique_texts) == len(texts):
+            return generated
+        return generated[[row_of[text] for text in texts]]
+
+    def close(self) -> None:
+        """
+        ワーカープロセスを終了します。
+        """
+        self._executor.shutdown(wait=True)
+        self.logger.info("ワーカープロセスを終了しました")
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+エンベディング生成スケジューラーモジュール
+
+同じプロセス内の複数のスレッド（MCP、FastAPI、LINEの各サーバーなど）からのエンベディング生成要求を
+数ミリ秒だけ待って集め、1つのバッチとしてエンコードします。
+要求には優先度があり、対話的な検索クエリは一括取り込みのバッチよりも常に先に処理されます。
+"""
+
+import os
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from src.utils.embedding_generator import EmbeddingGenerator
+from src.utils.logger_util import setup_logger
+
+# 優先度（値が小さいほど先に処理される）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+class _PendingResult:
+    """
+    1回の要求の結果を組み立てるクラス。一括取り込みの要求は複数のバッチに分割されるため、
+    全ての部分が揃った時点でFutureを完了させます。
+    """
+
+    def __init__(self, size: int, future: Future):
+        self.future = future
+        self.size = size
+        # 次元数は最初の部分が揃った時点で決まる
+        self.embeddings: Optional[np.ndarray] = None
+        self.remaining = size
+        self.lock = threading.Lock()
+
+    def set_part(self, offset: int, embeddings: np.ndarray) -> None:
+        with self.lock:
+            if self.future.done():
+                return
+            if self.embeddings is None:
+                self.embeddings = np.empty((self.size, embeddings.shape[1]), dtype=np.float32)
+            self.embeddings[offset:offset + len(embeddings)] = embeddings
+            self.remaining -= len(embeddings)
+            if self.remaining <= 0:
+                self.future.set_result(self.embeddings)
+
+    def set_exception(self, error: Exception) -> None:
+        with self.lock:
+            if not self.future.done():
+                self.future.set_exception(error)
+
+
+class _EmbeddingRequest:
+    """
+    キューに格納する要求の単位
+    """
+
+    def __init__(self, priority: int, sequence: int, texts: List[str], pending: _PendingResult, offset: int):
+        self.priority = priority
+        self.sequence = sequence
+        self.texts = texts
+        self.pending = pending
+        self.offset = offset
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_EmbeddingRequest") -> bool:
+        # 優先度が同じ場合は到着順に処理する
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class EmbeddingScheduler:
+    """
+    エンベディング生成要求をまとめてバッチ処理するスケジューラー
+
+    1つのEmbeddingGeneratorに対して1つのワーカースレッドがエンコードを行うため、
+    複数のスレッドから同時に呼び出してもモデルへのアクセスは直列化されます。
+
+    Attributes:
+        generator: エンコードに使用するEmbeddingGenerator
+        max_wait: バッチを集めるために待つ最大時間（秒）
+        max_batch_size: 1バッチあたりの最大テキスト数
+        batches: エンコードしたバッチ数
+        requests: 受け付けた要求数
+    """
+
+    def __init__(self, generator, max_wait_ms: Optional[float] = None, max_batch_size: Optional[int] = None):
+        """
+        EmbeddingSchedulerのコンストラクタ
+
+        Args:
+            generator: エンコードに使用するEmbeddingGenerator
+            max_wait_ms: バッチを集めるために待つ最大時間（ミリ秒、Noneの場合は環境変数EMBEDDING_SCHEDULER_MAX_WAIT_MS）
+            max_batch_size: 1バッチあたりの最大テキスト数（Noneの場合は環境変数EMBEDDING_SCHEDULER_MAX_BATCH）
+        """
+        self.logger = setup_logger("embedding_scheduler")
+        self.generator = generator
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv('EMBEDDING_SCHEDULER_MAX_WAIT_MS', '5'))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_batch_size = max(1, max_batch_size or int(os.getenv('EMBEDDING_SCHEDULER_MAX_BATCH', '32')))
+        self.batches = 0
+        self.requests = 0
+
+        self._queue: List[_EmbeddingRequest] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_worker(self) -> None:
+        """
+        ワーカースレッドが起動していない場合は起動します。呼び出し元でロックを取得してください。
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="embedding-scheduler", daemon=True)
+            self._thread.start()
+
+    def submit(self, texts: List[str], priority: int = PRIORITY_INTERACTIVE) -> "Future[np.ndarray]":
+        """
+        エンベディング生成を要求します。
+
+        一括取り込みの要求はmax_batch_sizeごとに分割してキューに入れるため、
+        処理の途中で到着した対話的な要求が分割の合間に割り込めます。
+
+        Args:
+            texts: テキストのリスト
+            priority: 優先度（PRIORITY_INTERACTIVE または PRIORITY_BULK）
+
+        Returns:
+            エンベディングの2次元配列（float32）を返すFuture
+        """
+        future: Future = Future()
+        if not texts:
+            future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return future
+
+        pending = _PendingResult(len(texts), future)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("エンベディングスケジューラーは停止しています")
+            for offset in range(0, len(texts), self.max_batch_size):
+                request = _EmbeddingRequest(priority, next(self._sequence), texts[offset:offset + self.max_batch_size],
+                                            pending, offset)
+                heapq.heappush(self._queue, request)
+            self.requests += 1
+            self._ensure_worker()
+            self._condition.notify()
+        return future
+
+    def generate_embedding(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        """
+        検索クエリのエンベディングを対話的な優先度で生成します。
+
+        Args:
+            text: テキスト
+            timeout: 結果を待つ最大時間（秒）
+
+        Returns:
+            エンベディング（float32の1次元配列）
+        """
+        if not text:
+            self.logger.warning("空のテキストからエンベディングを生成しようとしています")
+            return np.zeros(0, dtype=np.float32)
+        return self.submit([text], PRIORITY_INTERACTIVE).result(timeout)[0]
+
+    def generate_embeddings(self, texts: List[str], priority: int = PRIORITY_BULK) -> np.ndarray:
+        """
+        複数のテキストのエンベディングを生成します。既定では一括取り込みの優先度で処理します。
+
+        Args:
+            texts: テキストのリスト
+            priority: 優先度
+
+        Returns:
+            エンベディングの2次元配列（float32）
+        """
+        return self.submit(texts, priority).result()
+
+    def _collect_batch(self) -> Optional[List[_EmbeddingRequest]]:
+        """
+        キューから次に処理するバッチを取り出します。
+
+        最も優先度の高い要求を取り出した後、max_batch_sizeに達するかmax_waitが経過するまで
+        同じ優先度の後続の要求を集めます（対話的な要求と一括取り込みの要求はキャッシュの扱いが異なるため混ぜません）。
+
+        Returns:
+            要求のリスト。停止した場合はNone
+        """
+        with self._condition:
+            while not self._queue and not self._stopped:
+                self._condition.wait()
+            if not self._queue:
+                return None
+
+            first = heapq.heappop(self._queue)
+            batch = [first]
+            count = len(first.texts)
+            deadline = time.monotonic() + self.max_wait
+            while count < self.max_batch_size:
+                if self._queue:
+                    if self._queue[0].priority != first.priority or count + len(self._queue[0].texts) > self.max_batch_size:
+                        break
+                    request = heapq.heappop(self._queue)
+                    batch.append(request)
+                    count += len(request.texts)
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopped:
+                    break
+                self._condition.wait(remaining)
+            return batch
+
+    def _run(self) -> None:
+        """
+        ワーカースレッドの処理。バッチを取り出してエンコードし、各要求のFutureを完了させます。
+
+        対話的な要求（検索クエリ）はエンベディングキャッシュを使用せずにエンコードするため、
+        クエリのテキストがキャッシュのデータベースに保存されることはありません。
+        """
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+
+            texts: List[str] = []
+            for request in batch:
+                texts.extend(request.texts)
+            started = time.monotonic()
+            use_cache = batch[0].priority != PRIORITY_INTERACTIVE
+            try:
+                embeddings = np.asarray(self.generator.generate_embeddings(texts, use_cache=use_cache), dtype=np.float32)
+            except Exception as e:
+                self.logger.error(f"バッチのエンベディング生成中にエラーが発生しました: {e}")
+                for request in batch:
+                    request.pending.set_exception(e)
+                continue
+
+            self.batches += 1
+            position = 0
+            for request in batch:
+                request.pending.set_part(request.offset, embeddings[position:position + len(request.texts)])
+                position += len(request.texts)
+
+            max_queue_ms = (started - min(request.enqueued_at for request in batch)) * 1000
+            self.logger.debug(f"{len(batch)} 件の要求（{len(texts)} テキスト）をまとめてエンコードしました"
+                              f"（最大待ち時間: {max_queue_ms:.1f}ms, エンコード: {(time.monotonic() - started) * 1000:.1f}ms）")
+
+    def close(self) -> None:
+        """
+        スケジューラーを停止します。キューに残っている要求は処理してから停止します。
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def is_embedding_scheduler_enabled() -> bool:
+    """
+    スケジューラーを使用するかどうかを返します（環境変数EMBEDDING_SCHEDULER_ENABLED、デフォルト: true）。
+
+    Returns:
+        スケジューラーを使用するかどうか
+    """
+    return os.getenv('EMBEDDING_SCHEDULER_ENABLED', 'true').lower() == 'true'
+
+
+def generate_bulk_embeddings(generator, texts: List[str]) -> np.ndarray:
+    """
+    一括取り込みのエンベディングを生成します。
+
+    スケジューラーが有効な場合は一括取り込みの優先度でスケジューラーを経由するため、
+    同じプロセスの検索クエリのエンコードが取り込みのバッチの後ろで待たされることはありません。
+    EmbeddingPoolなど、別のプロセスでエンコードする生成器は直接呼び出します。
+
+    Args:
+        generator: EmbeddingGeneratorまたはgenerate_embeddings()を持つ生成器
+        texts: テキストのリスト
+
+    Returns:
+        エンベディングの2次元配列
+    """
+    if is_embedding_scheduler_enabled() and isinstance(generator, EmbeddingGenerator):
+        return get_embedding_scheduler(generator).generate_embeddings(texts, PRIORITY_BULK)
+    return generator.generate_embeddings(texts)
+
+
+# EmbeddingGeneratorごとのスケジューラー
+_schedulers: Dict[int, EmbeddingScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_embedding_scheduler(generator) -> EmbeddingScheduler:
+    """
+    EmbeddingGeneratorに対応するスケジューラーを取得します。存在しない場合は作成します。
+
+    Args:
+        generator: EmbeddingGenerator
+
+    Returns:
+        スケジューラー
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(id(generator))
+        if scheduler is None or scheduler.generator is not generator:
+            scheduler = EmbeddingScheduler(generator)
+            _schedulers[id(generator)] = scheduler
+        return scheduler
+
+
+def release_embedding_scheduler(generator) -> None:
+    """
+    EmbeddingGeneratorに対応するスケジューラーを停止して破棄します。
+
+    Args:
+        generator: EmbeddingGenerator
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.pop(id(generator), None)
+    if scheduler is not None:
+        scheduler.close()
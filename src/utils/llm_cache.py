@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+LLM出力キャッシュモジュール
+
+organize_text_with_llmによる整形結果をSQLiteファイルに保存し、同じ入力に対するLLMの呼び出しを省略します。
+キーは（モデル名、生成の設定、プロンプトのバージョン、入力のSHA-256）です。出力と一緒にLLMの呼び出しに
+かかった時間を保存し、キャッシュヒットで節約した時間の集計に使用します。
+合計サイズが上限を超えた場合は、最も長く参照されていないエントリから削除します。
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from src.utils.logger_util import setup_logger
+
+
+class LLMOutputCache:
+    """
+    ディスク上のLLM出力キャッシュ
+
+    複数のプロセスから同じファイルを共有できます（SQLiteのWALモードを使用）。
+
+    Attributes:
+        path: キャッシュファイルのパス
+        max_bytes: キャッシュする出力の合計サイズの上限（バイト）
+        hits: キャッシュヒット数
+        misses: キャッシュミス数
+        saved_seconds: キャッシュヒットで省略したLLMの呼び出し時間の合計（秒）
+    """
+
+    # サイズ確認を行う間隔（書き込み回数）
+    EVICTION_CHECK_INTERVAL = 100
+
+    def __init__(self, path: str = "./cache/llm_cache.sqlite3", max_bytes: int = 512 * 1024 * 1024):
+        """
+        LLMOutputCacheのコンストラクタ
+
+        Args:
+            path: キャッシュファイルのパス（デフォルト: "./cache/llm_cache.sqlite3"）
+            max_bytes: キャッシュする出力の合計サイズの上限（バイト、デフォルト: 512MB）
+        """
+        self.logger = setup_logger("llm_cache")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._writes_since_check = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute('''
+        CREATE TABLE IF NOT EXISTS llm_outputs (
+            model_name TEXT NOT NULL,
+            options TEXT NOT NULL,
+            prompt_version TEXT NOT NULL,
+            input_hash TEXT NOT NULL,
+            output TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (model_name, options, prompt_version, input_hash)
+        );
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_outputs_last_access_idx ON llm_outputs (last_access);")
+        self._conn.commit()
+        self.logger.info(f"LLM出力キャッシュ '{path}' を開きました")
+
+    @classmethod
+    def from_env(cls) -> Optional["LLMOutputCache"]:
+        """
+        環境変数の設定からキャッシュを作成します。
+
+        LLM_CACHE_ENABLEDがfalseの場合はNoneを返します。
+        パスはLLM_CACHE_PATH、上限はLLM_CACHE_MAX_MBで指定します。
+
+        Returns:
+            キャッシュ。無効な場合やファイルを開けない場合はNone
+        """
+        if os.getenv('LLM_CACHE_ENABLED', 'true').lower() != 'true':
+            return None
+        try:
+            return cls(
+                path=os.getenv('LLM_CACHE_PATH', './cache/llm_cache.sqlite3'),
+                max_bytes=int(float(os.getenv('LLM_CACHE_MAX_MB', '512')) * 1024 * 1024)
+            )
+        except Exception as e:
+            setup_logger("llm_cache").warning(f"LLM出力キャッシュを開けないため、キャッシュなしで続行します: {e}")
+            return None
+
+    @staticmethod
+    def input_hash(text: str) -> str:
+        """
+        入力のSHA-256ハッシュを返します。
+        """
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, model_name: str, options: str, prompt_version: str, text: str) -> Optional[str]:
+        """
+        入力に対するLLMの出力を取得します。
+
+        Args:
+            model_name: モデル名
+            options: 出力に影響する生成の設定（温度など）
+            prompt_version: プロンプトのバージョン
+            text: LLMへの入力
+
+        Returns:
+            キャッシュされた出力。存在しない場合はNone
+        """
+        key = (model_name, options, prompt_version, self.input_hash(text))
+        with self._lock:
+            row = self._conn.execute(
+                '''
+                SELECT output, seconds FROM llm_outputs
+                WHERE model_name = ? AND options = ? AND prompt_version = ? AND input_hash = ?;
+                ''',
+                key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            # 参照日時を更新（LRUの順序を維持するため）
+            self._conn.execute(
+                "UPDATE llm_outputs SET last_access = ? WHERE model_name = ? AND options = ? AND prompt_version = ? AND input_hash = ?;",
+                (time.time(),) + key
+            )
+            self._conn.commit()
+            self.hits += 1
+            self.saved_seconds += row[1]
+            return row[0]
+
+    def put(self, model_name: str, options: str, prompt_version: str, text: str, output: str, seconds: float) -> None:
+        """
+        入力に対するLLMの出力を保存します。
+
+        Args:
+            model_name: モデル名
+            options: 出力に影響する生成の設定（温度など）
+            prompt_version: プロンプトのバージョン
+            text: LLMへの入力
+            output: LLMの出力
+            seconds: LLMの呼び出しにかかった時間（秒）
+        """
+        with self._lock:
+            self._conn.execute(
+                '''
+                INSERT OR REPLACE INTO llm_outputs (model_name, options, prompt_version, input_hash, output, seconds, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?);
+                ''',
+                (model_name, options, prompt_version, self.input_hash(text), output, seconds, time.time())
+            )
+            self._conn.commit()
+
+            self._writes_since_check += 1
+            if self._writes_since_check >= self.EVICTION_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        キャッシュヒット数、キャッシュミス数、省略した時間を返します。
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'saved_seconds': self.saved_seconds}
+
+    def _evict(self) -> None:
+        """
+        合計サイズが上限を超えている場合、参照日時の古いエントリから削除します。
+        呼び出し元でロックを取得してください。
+        """
+        total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(CAST(output AS BLOB))), 0) FROM llm_outputs;").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+
+        # 上限の90%まで削除し、削除処理が頻発しないようにする
+        target_bytes = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT rowid, LENGTH(CAST(output AS BLOB)) FROM llm_outputs ORDER BY last_access;").fetchall()
+        delete_ids = []
+        for rowid, size in rows:
+            if total_bytes <= target_bytes:
+                break
+            delete_ids.append((rowid,))
+            total_bytes -= size
+
+        self._conn.executemany("DELETE FROM llm_outputs WHERE rowid = ?;", delete_ids)
+        self._conn.commit()
+        self.logger.info(f"LLM出力キャッシュから {len(delete_ids)} 件の古いエントリを削除しました")
+
+    def close(self) -> None:
+        """
+        キャッシュファイルを閉じます。
+        """
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+LRUキャッシュモジュール
+
+スレッドセーフなメモリ内LRUキャッシュを提供します。
+最大件数を超えた場合は、最も長く参照されていないエントリから削除します。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+
+class LRUCache:
+    """
+    スレッドセーフなLRUキャッシュ
+
+    Attributes:
+        max_size: 保持する最大件数。0以下の場合はキャッシュしない
+        hits: キャッシュヒット数
+        misses: キャッシュミス数
+    """
+
+    def __init__(self, max_size: int = 1024):
+        """
+        LRUCacheの初期化
+
+        Args:
+            max_size (int): 保持する最大件数。0以下の場合はキャッシュしない
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        キーに対応する値を取得します。
+
+        Args:
+            key (Hashable): キー
+            default (Optional[Any]): キーが存在しない場合に返す値
+
+        Returns:
+            Any: キャッシュされた値。存在しない場合はdefault
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """
+        複数のキーに対応する値をまとめて取得します。
+
+        Args:
+            keys (Iterable[Hashable]): キーのリスト
+
+        Returns:
+            Dict[Hashable, Any]: キャッシュに存在したキーと値の辞書
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return found
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        値をキャッシュに格納します。最大件数を超えた場合は古いエントリを削除します。
+
+        Args:
+            key (Hashable): キー
+            value (Any): 値
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def put_many(self, items: Dict[Hashable, Any]) -> None:
+        """
+        複数の値をまとめてキャッシュに格納します。
+
+        Args:
+            items (Dict[Hashable, Any]): キーと値の辞書
+        """
+        for key, value in items.items():
+            self.put(key, value)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        キーに対応するエントリを削除します。
+
+        Args:
+            key (Hashable): キー
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        全てのエントリを削除します。
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._data
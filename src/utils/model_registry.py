@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+埋め込みモデルレジストリ
+
+プロセス内でEmbeddingGenerator（SentenceTransformerモデル）を共有します。
+（モデル名、デバイス、バックエンド）ごとに1つのインスタンスだけを読み込み、参照カウントで利用状況を管理します。
+参照カウントが0になってもモデルは保持され、unload()を呼び出すまで再利用されます。
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.embedding_generator import EmbeddingGenerator
+from src.utils.embedding_scheduler import release_embedding_scheduler
+from src.utils.logger_util import setup_logger
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+ModelKey = Tuple[str, str, str]
+
+
+class _ModelEntry:
+    """
+    レジストリに登録されたモデルの情報
+    """
+
+    def __init__(self, key: ModelKey):
+        self.key = key
+        self.generator: Optional[EmbeddingGenerator] = None
+        self.ref_count = 0
+        # モデルの読み込みを1回だけ行うためのロック
+        self.load_lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    埋め込みモデルレジストリクラス
+    シングルトンパターンを使用して、プロセス内でモデルの重複読み込みを防ぎます。
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(ModelRegistry, cls).__new__(cls)
+                cls._instance._initialized = False
+            return cls._instance
+
+    def __init__(self):
+        if self._initialized:
+            return
+
+        self._entries: Dict[ModelKey, _ModelEntry] = {}
+        self._entries_lock = threading.Lock()
+
+        self._initialized = True
+        logger.info("埋め込みモデルレジストリを初期化しました")
+
+    @staticmethod
+    def _resolve_key(model_name: str, device: Optional[str], backend: Optional[str]) -> ModelKey:
+        """
+        EmbeddingGeneratorと同じ規則でデバイスとバックエンドを決定し、レジストリのキーを返します。
+
+        Args:
+            model_name: モデル名
+            device: デバイス（Noneの場合は自動選択）
+            backend: 推論バックエンド（Noneの場合はagent_settings.jsonの設定）
+
+        Returns:
+            （モデル名、デバイス、バックエンド）
+        """
+        backend = EmbeddingGenerator.resolve_backend(backend)
+        if backend in EmbeddingGenerator.REMOTE_BACKENDS:
+            device = "remote"
+        elif backend == "onnx":
+            device = "cpu"
+        elif device is None:
+            import torch
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        return (model_name, device, backend)
+
+    def acquire(self, model_name: str = "intfloat/multilingual-e5-large", device: Optional[str] = None,
+                backend: Optional[str] = None) -> EmbeddingGenerator:
+        """
+        共有のEmbeddingGeneratorを取得し、参照カウントを増やします。
+        読み込まれていない場合は読み込みます。使用後はrelease()を呼び出してください。
+
+        Args:
+            model_name: モデル名
+            device: デバイス（Noneの場合は自動選択）
+            backend: 推論バックエンド（Noneの場合はagent_settings.jsonの設定）
+
+        Returns:
+            EmbeddingGenerator: 共有のEmbeddingGenerator
+        """
+        key = self._resolve_key(model_name, device, backend)
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _ModelEntry(key)
+                self._entries[key] = entry
+            entry.ref_count += 1
+
+        # 同じモデルを同時に要求された場合は、最初の要求だけが読み込みを行う
+        with entry.load_lock:
+            if entry.generator is None:
+                logger.info(f"埋め込みモデル '{model_name}' を読み込んでいます（デバイス: {key[1]}, バックエンド: {key[2]}）...")
+                try:
+                    entry.generator = EmbeddingGenerator(model_name=model_name, device=key[1], backend=key[2])
+                except Exception as e:
+                    logger.error(f"埋め込みモデル '{model_name}' の読み込み中にエラーが発生しました: {e}", exc_info=True)
+                    with self._entries_lock:
+                        entry.ref_count -= 1
+                        if entry.ref_count <= 0 and self._entries.get(key) is entry:
+                            del self._entries[key]
+                    raise
+            generator = entry.generator
+
+        logger.debug(f"埋め込みモデル '{model_name}' の参照数: {entry.ref_count}")
+        return generator
+
+    def release(self, generator: Optional[EmbeddingGenerator]) -> None:
+        """
+        acquire()で取得したEmbeddingGeneratorの参照カウントを減らします。
+        参照カウントが0になってもモデルは保持されます。
+
+        Args:
+            generator: acquire()で取得したEmbeddingGenerator
+        """
+        if generator is None:
+            return
+        with self._entries_lock:
+            for entry in self._entries.values():
+                if entry.generator is generator:
+                    entry.ref_count = max(0, entry.ref_count - 1)
+                    logger.debug(f"埋め込みモデル '{entry.key[0]}' の参照数: {entry.ref_count}")
+                    return
+        logger.debug("レジストリに登録されていないEmbeddingGeneratorが解放されました")
+
+    def unload(self, model_name: Optional[str] = None, force: bool = False) -> int:
+        """
+        モデルをメモリから解放します。
+
+        Args:
+            model_name: 解放するモデル名（Noneの場合は全てのモデル）
+            force: 参照中のモデルも解放するかどうか。Falseの場合は参照カウントが0のモデルだけを解放します
+
+        Returns:
+            int: 解放したモデル数
+        """
+        unloaded: List[_ModelEntry] = []
+        with self._entries_lock:
+            for key, entry in list(self._entries.items()):
+                if model_name is not None and key[0] != model_name:
+                    continue
+                if entry.ref_count > 0 and not force:
+                    logger.info(f"埋め込みモデル '{key[0]}' は {entry.ref_count} 箇所から参照されているため解放しません")
+                    continue
+                del self._entries[key]
+                unloaded.append(entry)
+
+        for entry in unloaded:
+            with entry.load_lock:
+                if entry.generator is None:
+                    continue
+                release_embedding_scheduler(entry.generator)
+                entry.generator = None
+                logger.info(f"埋め込みモデル '{entry.key[0]}' を解放しました（デバイス: {entry.key[1]}, バックエンド: {entry.key[2]}）")
+
+        # GPUのメモリを解放する
+        if any(entry.key[1].startswith("cuda") for entry in unloaded):
+            try:
+                import gc
+                import torch
+                gc.collect()
+                torch.cuda.empty_cache()
+            except Exception as e:
+                logger.warning(f"GPUメモリの解放中にエラーが発生しました: {e}")
+
+        return len(unloaded)
+
+    def unload_all(self) -> int:
+        """
+        全てのモデルを参照カウントにかかわらず解放します。アプリケーション終了時に呼び出されます。
+
+        Returns:
+            int: 解放したモデル数
+        """
+        return self.unload(force=True)
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """
+        読み込まれているモデルの一覧を返します。
+
+        Returns:
+            List[Dict[str, Any]]: モデル名、デバイス、バックエンド、参照数のリスト
+        """
+        with self._entries_lock:
+            return [
+                {'model_name': key[0], 'device': key[1], 'backend': key[2], 'ref_count': entry.ref_count,
+                 'loaded': entry.generator is not None}
+                for key, entry in self._entries.items()
+            ]
+
+# グローバルなモデルレジストリのインスタンス
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+def get_model_registry() -> ModelRegistry:
+    """
+    埋め込みモデルレジストリのインスタンスを取得します。
+
+    Returns:
+        ModelRegistry: 埋め込みモデルレジストリのインスタンス
+    """
+    global _model_registry
+
+    with _model_registry_lock:
+        if _model_registry is None:
+            _model_registry = ModelRegistry()
+
+        return _model_registry
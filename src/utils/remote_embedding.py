@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+外部プロセスのエンベディング生成モジュール
+
+モデルを別のプロセス（エンベディングサイドカーまたはOllama）が保持している場合に、
+SentenceTransformerの代わりにEmbeddingGeneratorから使用するクライアントです。
+encode()とget_sentence_embedding_dimension()だけを提供し、torchやsentence-transformersを読み込みません。
+"""
+
+import os
+import json
+import socket
+import threading
+import http.client
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+
+import numpy as np
+
+from src.utils.logger_util import setup_logger
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    Unixドメインソケットで接続するHTTPコネクション
+    """
+
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class SidecarEmbeddingModel:
+    """
+    エンベディングサイドカー（src/server/embedding_sidecar.py）のクライアント
+
+    スレッドごとにHTTPのキープアライブ接続を保持し、レスポンスはfloat32のバイナリで受け取ります。
+
+    Attributes:
+        url: サイドカーのURL（"unix:///path/to/socket" または "http://127.0.0.1:8765"）
+        model_name: サイドカーが読み込んでいるモデル名
+        max_seq_length: モデルの最大トークン数
+    """
+
+    def __init__(self, url: str, timeout: float = 60.0):
+        """
+        SidecarEmbeddingModelのコンストラクタ
+
+        Args:
+            url: サイドカーのURL
+            timeout: 1回の要求のタイムアウト（秒）
+        """
+        self.logger = setup_logger("remote_embedding")
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+        parsed = urlparse(url)
+        if parsed.scheme == "unix":
+            self._socket_path: Optional[str] = parsed.path
+            self._host, self._port = None, None
+        elif parsed.scheme == "http":
+            self._socket_path = None
+            self._host, self._port = parsed.hostname or "127.0.0.1", parsed.port or 80
+        else:
+            raise ValueError(f"サイドカーのURLは unix:// または http:// で指定してください: {url}")
+
+        info = self._request_json("GET", "/health")
+        self.model_name = info["model_name"]
+        self.max_seq_length = info.get("max_seq_length")
+        self._dimension = int(info["dimension"])
+        self.logger.info(f"エンベディングサイドカー '{url}' に接続しました（モデル: {self.model_name}, 次元数: {self._dimension}）")
+
+    def _connection(self) -> http.client.HTTPConnection:
+        """
+        現在のスレッドの接続を返します。接続がない場合は作成します。
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self._socket_path is not None:
+                connection = _UnixHTTPConnection(self._socket_path, self.timeout)
+            else:
+                connection = http.client.HTTPConnection(self._host, self._port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _request(self, method: str, path: str, body: Optional[bytes] = None,
+                 headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        サイドカーに要求を送信します。キープアライブ接続が切断されていた場合は1回だけ再接続します。
+
+        Returns:
+            (ステータスコード, レスポンスヘッダー, レスポンス本文)
+        """
+        try:
+            return self._send(method, path, body, headers)
+        except (ConnectionError, http.client.HTTPException, socket.timeout, OSError):
+            # サイドカーの再起動などで接続が切れている場合は、接続し直して再送する
+            self._close_connection()
+            return self._send(method, path, body, headers)
+
+    def _send(self, method: str, path: str, body: Optional[bytes],
+              headers: Optional[Dict[str, str]]) -> Tuple[int, Dict[str, str], bytes]:
+        connection = self._connection()
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            data = response.read()
+        except Exception:
+            self._close_connection()
+            raise
+        return response.status, {k.lower(): v for k, v in response.getheaders()}, data
+
+    def _close_connection(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+        self._local.connection = None
+
+    def _request_json(self, method: str, path: str) -> Dict[str, Any]:
+        status, _, data = self._request(method, path)
+        if status != 200:
+            raise RuntimeError(f"エンベディングサイドカーがエラーを返しました（{status}）: {data[:200]!r}")
+        return json.loads(data.decode("utf-8"))
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """
+        エンベディングの次元数を返します。
+        """
+        return self._dimension
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: Optional[int] = None,
+               priority: Optional[str] = None, **kwargs: Any) -> np.ndarray:
+        """
+        テキストのエンベディングをサイドカーで生成します。
+
+        Args:
+            sentences: テキストまたはテキストのリスト（前処理済み）
+            batch_size: 未使用（サイドカー側でバッチを組み立てます）
+            priority: "interactive" または "bulk"。Noneの場合はサイドカーが件数から判断します
+
+        Returns:
+            float32のエンベディング（テキストが1つの場合は1次元、リストの場合は2次元）
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self._dimension), dtype=np.float32)
+
+        payload: Dict[str, Any] = {"texts": texts}
+        if priority is not None:
+            payload["priority"] = priority
+        status, headers, data = self._request("POST", "/embed", body=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                                              headers={"Content-Type": "application/json"})
+        if status != 200:
+            raise RuntimeError(f"エンベディングサイドカーがエラーを返しました（{status}）: {data[:200]!r}")
+
+        count = int(headers["x-embedding-count"])
+        dimension = int(headers["x-embedding-dimension"])
+        embeddings = np.frombuffer(data, dtype="<f4").reshape(count, dimension)
+        return embeddings[0] if single else embeddings
+
+
+def resolve_ollama_base_url() -> str:
+    """
+    エンベディングに使用するOllamaサーバーのURLを環境変数から決定します。
+
+    OLLAMA_EMBEDDING_BASE_URL、OLLAMA_BASE_URL、OLLAMA_HOST / OLLAMA_PORT の順に参照します。
+
+    Returns:
+        OllamaサーバーのURL
+    """
+    base_url = os.getenv('OLLAMA_EMBEDDING_BASE_URL') or os.getenv('OLLAMA_BASE_URL')
+    if base_url:
+        return base_url.rstrip("/")
+
+    ollama_host = os.getenv('OLLAMA_HOST', 'localhost')
+    ollama_port = os.getenv('OLLAMA_PORT', '11434')
+
+    # 0.0.0.0はサーバー側のリッスン設定であり、クライアントからの接続には使用できない
+    client_host = 'localhost' if ollama_host == '0.0.0.0' else ollama_host
+    if ':' in client_host:
+        return f"http://{client_host}"
+    return f"http://{client_host}:{ollama_port}"
+
+
+class OllamaEmbeddingModel:
+    """
+    Ollamaの/api/embedを使用してエンベディングを生成するクライアント
+
+    接続プールを持つHTTPセッションを共有し、複数のテキストを1回の要求でまとめてエンコードします。
+    次元数は初期化時に1件のテキストをエンコードして取得します。
+
+    Attributes:
+        model_name: Ollamaのモデル名（例: "bge-m3"）
+        base_url: OllamaサーバーのURL
+        max_batch_size: 1回の要求で送信する最大テキスト数
+    """
+
+    def __init__(self, model_name: str, base_url: Optional[str] = None, timeout: float = 60.0,
+                 pool_size: int = 8, max_batch_size: int = 64, keep_alive: Optional[str] = None):
+        """
+        OllamaEmbeddingModelのコンストラクタ
+
+        Args:
+            model_name: Ollamaのモデル名
+            base_url: OllamaサーバーのURL（Noneの場合は環境変数から決定）
+            timeout: 1回の要求のタイムアウト（秒）
+            pool_size: 接続プールの大きさ
+            max_batch_size: 1回の要求で送信する最大テキスト数
+            keep_alive: Ollamaがモデルをメモリに保持する時間（例: "30m"、Noneの場合はOllamaの既定値）
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.logger = setup_logger("remote_embedding")
+        self.model_name = model_name
+        self.base_url = (base_url or resolve_ollama_base_url()).rstrip("/")
+        self.timeout = timeout
+        self.max_batch_size = max(1, max_batch_size)
+        self.keep_alive = keep_alive
+        self.max_seq_length = None
+
+        # 接続を使い回し、Ollamaの一時的なエラーは再試行する
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=frozenset(["POST"]))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        # 次元数を検出する
+        self._dimension = int(self._embed(["dimension probe"]).shape[1])
+        self.logger.info(f"Ollama '{self.base_url}' のモデル '{model_name}' を使用します（次元数: {self._dimension}）")
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        """
+        /api/embedを1回呼び出します。
+        """
+        payload: Dict[str, Any] = {"model": self.model_name, "input": texts, "truncate": True}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        response = self._session.post(f"{self.base_url}/api/embed", json=payload, timeout=self.timeout)
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollamaがエラーを返しました（{response.status_code}）: {response.text[:200]}")
+        embeddings = response.json().get("embeddings")
+        if not embeddings or len(embeddings) != len(texts):
+            raise RuntimeError(f"Ollamaのモデル '{self.model_name}' からエンベディングを取得できませんでした")
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        """
+        エンベディングの次元数を返します。
+        """
+        return self._dimension
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: Optional[int] = None, **kwargs: Any) -> np.ndarray:
+        """
+        テキストのエンベディングをOllamaで生成します。
+
+        Args:
+            sentences: テキストまたはテキストのリスト（前処理済み）
+            batch_size: 1回の要求で送信する最大テキスト数（Noneの場合はmax_batch_size）
+
+        Returns:
+            float32のエンベディング（テキストが1つの場合は1次元、リストの場合は2次元）
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self._dimension), dtype=np.float32)
+
+        step = min(batch_size or self.max_batch_size, self.max_batch_size)
+        embeddings = np.concatenate([self._embed(texts[i:i + step]) for i in range(0, len(texts), step)])
+        return embeddings[0] if single else embeddings
+
+    def close(self) -> None:
+        """
+        HTTPセッションを閉じます。
+        """
+        self._session.close()
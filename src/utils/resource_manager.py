@@ -15,6 +15,7 @@ from typing import Optional, Dict, Any
 # 自作モジュールのインポート
 from src.agents.librarian_agent import LibrarianAgent
 from src.utils.logger_util import setup_logger
+from src.utils.model_registry import get_model_registry
 
 # ロガーの設定
 logger = setup_logger(__name__)
@@ -82,6 +83,12 @@ class ResourceManager:
                 finally:
                     self._librarian = None
         
+        # 共有している埋め込みモデルを解放
+        try:
+            get_model_registry().unload_all()
+        except Exception as e:
+            logger.error(f"埋め込みモデルの解放中にエラーが発生しました: {e}", exc_info=True)
+        
         logger.info("共有リソースのクリーンアップが完了しました")
 
 # グローバルなリソースマネージャーのインスタンス
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+テキストウィンドウモジュール
+
+LLMのコンテキストウィンドウ（num_ctx）に収まらない長いテキストを、トークン数の上限に収まる重なりのある
+ウィンドウに分割し、ウィンドウごとのLLMの出力を重なりの部分を除いて連結します。
+
+LLMのトークナイザーは使用せず、トークン数は文字の種類から推定します（日本語などの非ASCII文字は1文字1トークン、
+ASCII文字は4文字1トークン）。推定は実際のトークン数より多めになるよう、余裕を持たせて使用します。
+"""
+
+import re
+import math
+from difflib import SequenceMatcher
+from typing import Iterator, List
+
+# 文（区切り文字と後ろの空白を含む。全ての文を連結すると元のテキストに戻る）
+_SENTENCE = re.compile(r'.*?(?:[。．！？!?]+\s*|\.\s+|\n+|$)', re.S)
+_NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+# 連結時に重なりとみなす最小の文字数
+MIN_SEAM_CHARS = 20
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を推定します。
+
+    Args:
+        text: テキスト
+
+    Returns:
+        推定トークン数
+    """
+    non_ascii = len(_NON_ASCII.findall(text))
+    return non_ascii + math.ceil((len(text) - non_ascii) / 4)
+
+
+def iter_sentences(text: str) -> Iterator[str]:
+    """
+    テキストを文に分割します。文は区切り文字と後ろの空白を含み、全ての文を連結すると元のテキストに戻ります。
+
+    Args:
+        text: テキスト
+
+    Yields:
+        空でない文
+    """
+    for match in _SENTENCE.finditer(text):
+        if match.group():
+            yield match.group()
+
+
+def _split_sentences(text: str, max_tokens: int) -> List[str]:
+    """
+    テキストを文に分割します。max_tokensを超える文はさらに文字数で分割します。
+    """
+    sentences = []
+    for sentence in iter_sentences(text):
+        while estimate_tokens(sentence) > max_tokens:
+            # 非ASCII文字だけの場合でも上限を超えない長さで切る
+            sentences.append(sentence[:max_tokens])
+            sentence = sentence[max_tokens:]
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def split_windows(text: str, window_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """
+    テキストを推定トークン数がwindow_tokens以下のウィンドウに分割します。
+
+    ウィンドウは文の区切りで分け、次のウィンドウの先頭には前のウィンドウの末尾の文をoverlap_tokensまで含めます。
+    処理時間はテキストの長さに比例します。
+
+    Args:
+        text: テキスト
+        window_tokens: 1つのウィンドウの推定トークン数の上限
+        overlap_tokens: 隣り合うウィンドウで重ねる推定トークン数
+
+    Returns:
+        ウィンドウのリスト（テキストがwindow_tokens以下の場合は要素が1つ）
+    """
+    window_tokens = max(1, window_tokens)
+    overlap_tokens = max(0, min(overlap_tokens, window_tokens // 2))
+    if estimate_tokens(text) <= window_tokens:
+        return [text]
+
+    windows: List[str] = []
+    current: List[str] = []
+    current_tokens: List[int] = []
+    total = 0
+    for sentence in _split_sentences(text, window_tokens):
+        tokens = estimate_tokens(sentence)
+        if current and total + tokens > window_tokens:
+            windows.append("".join(current))
+            # 末尾の文をoverlap_tokensまで次のウィンドウに残す
+            kept = 0
+            keep_from = len(current)
+            while keep_from > 0 and kept + current_tokens[keep_from - 1] <= overlap_tokens:
+                keep_from -= 1
+                kept += current_tokens[keep_from]
+            current, current_tokens, total = current[keep_from:], current_tokens[keep_from:], kept
+            # 重なりと次の文で上限を超える場合は重なりを減らす
+            while current and total + tokens > window_tokens:
+                total -= current_tokens.pop(0)
+                current.pop(0)
+        current.append(sentence)
+        current_tokens.append(tokens)
+        total += tokens
+    if current:
+        windows.append("".join(current))
+    return windows
+
+
+def stitch_outputs(outputs: List[str], seam_chars: int = 1000) -> str:
+    """
+    ウィンドウごとのLLMの出力を順番に連結します。
+
+    前の出力の末尾と次の出力の先頭（それぞれseam_chars文字まで）で最も長く一致する部分を重なりとみなし、
+    次の出力は重なりの後ろから連結します。MIN_SEAM_CHARS文字以上一致する部分がない場合は改行を挟んで連結します。
+
+    Args:
+        outputs: ウィンドウの順に並べたLLMの出力
+        seam_chars: 重なりを探す範囲の文字数
+
+    Returns:
+        連結したテキスト
+    """
+    result = ""
+    for output in outputs:
+        output = output.strip()
+        if not output:
+            continue
+        if not result:
+            result = output
+            continue
+        tail_start = max(0, len(result) - seam_chars)
+        tail = result[tail_start:]
+        head = output[:seam_chars]
+        match = SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(0, len(tail), 0, len(head))
+        if match.size >= MIN_SEAM_CHARS:
+            result = result[:tail_start + match.a + match.size] + output[match.b + match.size:]
+        else:
+            result = result + "\n\n" + output
+    return result
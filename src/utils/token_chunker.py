@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+トークンチャンク分割モジュール
+
+テキストを埋め込みモデルのトークナイザーで数えたトークン数の上限に収まるチャンクに分割します。
+文字数で分割する場合、日本語のテキストでは500文字がモデルの最大長（multilingual-e5-largeでは512トークン）を超えることがあり、
+超えた部分はエンコード時に切り捨てられます。このモジュールは文の区切り（。、．など）でチャンクを分け、
+モデルの最大長とchunk_tokensの小さい方までチャンクを詰めます。
+
+各文のトークン数は1回だけ数えるため、処理時間はテキストの長さに比例します。
+トークナイザーを読み込めない場合（Ollamaのモデルなど）は、text_windowの推定トークン数を使用します。
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.logger_util import setup_logger
+from src.utils.text_window import estimate_tokens, iter_sentences
+
+# ロガーの設定
+logger = setup_logger(__name__)
+
+# トークナイザーからモデルの最大長を取得できない場合の最大長
+DEFAULT_MAX_LENGTH = 512
+
+# EmbeddingGeneratorがテキストの前に付けるプレフィックス（チャンクのトークン数の上限から差し引く）
+EMBEDDING_PREFIX = "query: "
+
+
+def load_tokenizer(model_name: str, model_dir: str = "./models") -> Optional[Any]:
+    """
+    埋め込みモデルのトークナイザーを読み込みます。
+
+    EmbeddingGeneratorと同じローカルのモデルディレクトリ（model_dir/モデル名）があればそこから読み込み、
+    なければHugging Face Hubから読み込みます。
+
+    Args:
+        model_name: 埋め込みモデル名
+        model_dir: モデルを保存するディレクトリ
+
+    Returns:
+        トークナイザー。読み込めない場合はNone
+    """
+    try:
+        from transformers import AutoTokenizer
+
+        model_local_path = os.path.join(model_dir, os.path.basename(model_name))
+        if os.path.exists(model_local_path):
+            return AutoTokenizer.from_pretrained(model_local_path, local_files_only=True)
+        return AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        logger.warning(f"モデル '{model_name}' のトークナイザーを読み込めないため、推定トークン数で分割します: {e}")
+        return None
+
+
+class TokenChunker:
+    """
+    トークン数の上限でテキストを分割するクラス
+
+    Attributes:
+        chunk_tokens: 1つのチャンクのトークン数の上限（モデルの最大長から特殊トークンとプレフィックスの分を引いた値以下）
+        overlap_tokens: 隣り合うチャンクで重ねるトークン数
+        max_tokens: モデルの最大長から特殊トークンとプレフィックスの分を引いた値
+    """
+
+    def __init__(self, tokenizer: Optional[Any] = None, chunk_tokens: int = 500, overlap_tokens: int = 100):
+        """
+        TokenChunkerのコンストラクタ
+
+        Args:
+            tokenizer: 埋め込みモデルのトークナイザー（Noneの場合は推定トークン数を使用）
+            chunk_tokens: 1つのチャンクのトークン数の上限（デフォルト: 500）
+            overlap_tokens: 隣り合うチャンクで重ねるトークン数（デフォルト: 100、chunk_tokensの半分まで）
+        """
+        self.tokenizer = tokenizer
+        # 高速トークナイザーは複数のスレッドから同時に呼び出すとエラーになることがあるため直列化する
+        self._lock = threading.Lock()
+
+        max_length = DEFAULT_MAX_LENGTH
+        reserved = 2
+        if tokenizer is not None:
+            model_max_length = getattr(tokenizer, "model_max_length", None)
+            # 最大長が設定されていないトークナイザーは非常に大きな値を返す
+            if isinstance(model_max_length, int) and 0 < model_max_length <= 100000:
+                max_length = model_max_length
+            reserved = len(self._encode([EMBEDDING_PREFIX], add_special_tokens=True)[0])
+        else:
+            reserved += estimate_tokens(EMBEDDING_PREFIX)
+        self.max_tokens = max(1, max_length - reserved)
+        self.chunk_tokens = max(1, min(chunk_tokens, self.max_tokens))
+        self.overlap_tokens = max(0, min(overlap_tokens, self.chunk_tokens // 2))
+
+    def _encode(self, texts: List[str], add_special_tokens: bool = False) -> List[List[int]]:
+        with self._lock:
+            return self.tokenizer(texts, add_special_tokens=add_special_tokens)["input_ids"]
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        各テキストのトークン数を数えます（特殊トークンを含みません）。
+
+        Args:
+            texts: テキストのリスト
+
+        Returns:
+            各テキストのトークン数
+        """
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [estimate_tokens(text) for text in texts]
+        return [len(input_ids) for input_ids in self._encode(texts)]
+
+    def _split_long(self, text: str, tokens: int) -> List[Tuple[str, int]]:
+        """
+        chunk_tokensを超える文をトークンの位置で分割します。
+
+        Returns:
+            (分割したテキスト, トークン数) のリスト
+        """
+        pieces: List[Tuple[str, int]] = []
+        if self.tokenizer is not None and getattr(self.tokenizer, "is_fast", False):
+            with self._lock:
+                offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+            start = 0
+            for i in range(self.chunk_tokens, len(offsets), self.chunk_tokens):
+                end = offsets[i][0]
+                if end > start:
+                    pieces.append((text[start:end], self.chunk_tokens))
+                    start = end
+            pieces.append((text[start:], len(offsets) - self.chunk_tokens * len(pieces)))
+            return pieces
+
+        # 文字の位置を取得できない場合は、トークン数の比で文字数を決めて分割する
+        size = max(1, len(text) * self.chunk_tokens // max(1, tokens))
+        parts = [text[i:i + size] for i in range(0, len(text), size)]
+        for part, count in zip(parts, self.count_tokens(parts)):
+            if count > self.chunk_tokens and len(part) > 1:
+                pieces.extend(self._split_long(part, count))
+            else:
+                pieces.append((part, count))
+        return pieces
+
+    def _sentences(self, text: str) -> List[Tuple[str, int]]:
+        """
+        テキストを文に分割し、文ごとのトークン数を数えます。chunk_tokensを超える文はさらに分割します。
+        """
+        sentences = list(iter_sentences(text))
+        result: List[Tuple[str, int]] = []
+        for sentence, tokens in zip(sentences, self.count_tokens(sentences)):
+            if tokens > self.chunk_tokens:
+                result.extend(self._split_long(sentence, tokens))
+            else:
+                result.append((sentence, tokens))
+        return result
+
+    def split(self, text: str) -> List[str]:
+        """
+        テキストをトークン数がchunk_tokens以下のチャンクに分割します。
+
+        チャンクは文の区切りで分け、上限まで文を詰めます。次のチャンクの先頭には、前のチャンクの末尾の文を
+        overlap_tokensまで含めます。文ごとのトークン数の合計で判定するため、チャンク全体を数え直した場合とは
+        わずかに異なることがあります。モデルの最大長を超えたチャンクだけは数え直して分割します。
+
+        Args:
+            text: テキスト
+
+        Returns:
+            チャンクのリスト（前後の空白は除去し、空のチャンクは含みません）
+        """
+        chunks: List[str] = []
+        current: deque = deque()
+        total = 0
+        for sentence, tokens in self._sentences(text):
+            if current and total + tokens > self.chunk_tokens:
+                chunks.append("".join(s for s, _ in current))
+                # 末尾の文をoverlap_tokensまで次のチャンクに残す
+                kept: deque = deque()
+                kept_tokens = 0
+                while current and kept_tokens + current[-1][1] <= self.overlap_tokens:
+                    kept.appendleft(current.pop())
+                    kept_tokens += kept[0][1]
+                current, total = kept, kept_tokens
+                # 重なりと次の文で上限を超える場合は重なりを減らす
+                while current and total + tokens > self.chunk_tokens:
+                    total -= current.popleft()[1]
+            current.append((sentence, tokens))
+            total += tokens
+        if current:
+            chunks.append("".join(s for s, _ in current))
+
+        chunks = [chunk.strip() for chunk in chunks]
+        chunks = [chunk for chunk in chunks if chunk]
+        return self._fit(chunks)
+
+    def _fit(self, chunks: List[str]) -> List[str]:
+        """
+        連結したことでトークン数がモデルの最大長を超えたチャンクを分割します。
+        """
+        if self.tokenizer is None or not chunks:
+            return chunks
+        result: List[str] = []
+        for chunk, tokens in zip(chunks, self.count_tokens(chunks)):
+            if tokens > self.max_tokens:
+                logger.debug(f"チャンクのトークン数がモデルの最大長を超えたため分割します: {tokens} > {self.max_tokens}")
+                result.extend(piece.strip() for piece, _ in self._split_long(chunk, tokens) if piece.strip())
+            else:
+                result.append(chunk)
+        return result
+
+
+# （モデル名、チャンクのトークン数、重ねるトークン数）ごとのインスタンス
+_chunkers: Dict[Tuple[str, int, int], TokenChunker] = {}
+_tokenizers: Dict[str, Optional[Any]] = {}
+_chunkers_lock = threading.Lock()
+
+
+def get_token_chunker(model_name: str, chunk_tokens: int = 500, overlap_tokens: int = 100,
+                      model_dir: str = "./models") -> TokenChunker:
+    """
+    埋め込みモデルのトークナイザーを使用するTokenChunkerを取得します。トークナイザーはプロセス内で共有されます。
+
+    Args:
+        model_name: 埋め込みモデル名
+        chunk_tokens: 1つのチャンクのトークン数の上限
+        overlap_tokens: 隣り合うチャンクで重ねるトークン数
+        model_dir: モデルを保存するディレクトリ
+
+    Returns:
+        TokenChunker: トークンチャンク分割器
+    """
+    key = (model_name, chunk_tokens, overlap_tokens)
+    with _chunkers_lock:
+        chunker = _chunkers.get(key)
+        if chunker is None:
+            if model_name not in _tokenizers:
+                _tokenizers[model_name] = load_tokenizer(model_name, model_dir)
+            chunker = TokenChunker(_tokenizers[model_name], chunk_tokens, overlap_tokens)
+            _chunkers[key] = chunker
+            logger.info(f"トークンチャンク分割器を作成しました: モデル '{model_name}'、"
+                        f"上限 {chunker.chunk_tokens} トークン、重なり {chunker.overlap_tokens} トークン")
+        return chunker
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+clean_textのマイクロベンチマーク
+
+変更前の実装（test_clean_text.reference_clean_text）と現在のclean_textの処理時間を、
+プレーンなMarkdown、HTMLを含むMarkdown、またはMarkdownファイルで比較します。
+"""
+
+import os
+import sys
+import time
+import argparse
+
+# プロジェクトのルートディレクトリとこのディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.utils.chunk_processor import clean_text
+from test_clean_text import reference_clean_text
+
+# ベンチマーク用の文書の1節
+SECTION = (
+    "# 第{i}章 概要\n\n"
+    "本章では**重要な事項**について説明します。詳細は[資料](https://example.com/docs/{i})を参照してください。"
+    "問い合わせ先は support{i}@example.com です。\n\n"
+    "- 項目1: ＡＢＣ１２３の設定\n"
+    "- 項目2: `config.yaml`の編集\n\n"
+    "> 注意: 設定を変更した後は再起動が必要です。\n\n"
+    "| 列1 | 列2 |\n|---|---|\n| 値{i} | 説明文 |\n\n"
+)
+
+
+def build_document(sections: int, html: bool) -> str:
+    """
+    ベンチマーク用の文書を作成します。
+    """
+    text = "".join(SECTION.format(i=i) for i in range(sections))
+    if html:
+        text += "<div><p>HTMLの段落</p><script>var x = 1;</script></div>"
+    return text
+
+
+def measure(function, text: str, repeat: int) -> float:
+    """
+    関数の1回あたりの処理時間（秒）の最小値を返します。
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='clean_textの処理時間を変更前の実装と比較します')
+    parser.add_argument('--sections', type=int, default=2000, help='ベンチマーク用の文書の節の数')
+    parser.add_argument('--repeat', type=int, default=5, help='計測の回数（最小値を使用）')
+    parser.add_argument('--file', type=str, default=None, help='ベンチマークに使用するMarkdownファイル')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8") as f:
+            documents = {os.path.basename(args.file): f.read()}
+    else:
+        documents = {
+            "プレーンなMarkdown": build_document(args.sections, html=False),
+            "HTMLを含むMarkdown": build_document(args.sections, html=True),
+        }
+
+    for name, text in documents.items():
+        if clean_text(text) != reference_clean_text(text):
+            print(f"{name}: 変更前の実装と結果が異なります")
+            continue
+        reference_seconds = measure(reference_clean_text, text, args.repeat)
+        seconds = measure(clean_text, text, args.repeat)
+        print(f"{name}（{len(text)} 文字）: 変更前 {reference_seconds * 1000:.1f}ms、"
+              f"現在 {seconds * 1000:.1f}ms（{reference_seconds / seconds:.1f}倍）")
+
+
+if __name__ == "__main__":
+    main()
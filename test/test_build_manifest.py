@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+build_manifest.pyのテストモジュール
+
+ビルドマニフェストの変更判定、保存、コストの推定をテストします。
+"""
+
+import os
+import sys
+import time
+import tempfile
+import unittest
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.rag.build_manifest import BuildManifest, STAGE_MARKDOWN
+
+
+class TestBuildManifest(unittest.TestCase):
+    """BuildManifestクラスのテスト"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.manifest_path = os.path.join(self.temp_dir.name, "manifest.json")
+        self.source = os.path.join(self.temp_dir.name, "a.txt")
+        self._write(self.source, "first")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, path, text):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def test_check_reasons(self):
+        """新規、最新、設定変更、内容の変更を判定できることのテスト"""
+        manifest = BuildManifest(self.manifest_path)
+        self.assertEqual(manifest.check(STAGE_MARKDOWN, self.source, self.source, "p1"), "新規")
+        manifest.record(STAGE_MARKDOWN, self.source, self.source, ["out.md"], "p1")
+        self.assertIsNone(manifest.check(STAGE_MARKDOWN, self.source, self.source, "p1"))
+        self.assertEqual(manifest.check(STAGE_MARKDOWN, self.source, self.source, "p2"), "設定変更")
+
+        self._write(self.source, "second")
+        self.assertEqual(manifest.check(STAGE_MARKDOWN, self.source, self.source, "p1"), "変更")
+
+    def test_touch_without_change(self):
+        """更新日時だけが変わったファイルは最新とみなすことのテスト"""
+        manifest = BuildManifest(self.manifest_path)
+        manifest.record(STAGE_MARKDOWN, self.source, self.source, ["out.md"], "p1")
+        mtime = time.time() + 100
+        os.utime(self.source, (mtime, mtime))
+        self.assertIsNone(manifest.check(STAGE_MARKDOWN, self.source, self.source, "p1"))
+        self.assertEqual(manifest.get(STAGE_MARKDOWN, self.source)["mtime"], os.stat(self.source).st_mtime)
+
+    def test_save_and_load(self):
+        """保存したマニフェストを読み込めることのテスト"""
+        manifest = BuildManifest(self.manifest_path)
+        manifest.record(STAGE_MARKDOWN, self.source, self.source, ["out.md"], "p1")
+        manifest.record_cost(STAGE_MARKDOWN, 100, 2.0)
+        manifest.save()
+
+        loaded = BuildManifest(self.manifest_path)
+        self.assertEqual(loaded.keys(STAGE_MARKDOWN), [self.source])
+        self.assertEqual(loaded.get(STAGE_MARKDOWN, self.source)["outputs"], ["out.md"])
+        self.assertIsNone(loaded.check(STAGE_MARKDOWN, self.source, self.source, "p1"))
+
+    def test_estimate_seconds(self):
+        """処理時間の実績から推定できることのテスト"""
+        manifest = BuildManifest(self.manifest_path)
+        self.assertIsNone(manifest.estimate_seconds(STAGE_MARKDOWN, 100))
+        manifest.record_cost(STAGE_MARKDOWN, 100, 2.0)
+        manifest.record_cost(STAGE_MARKDOWN, 300, 6.0)
+        self.assertAlmostEqual(manifest.estimate_seconds(STAGE_MARKDOWN, 50), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+chunk_processor.clean_textのテストモジュール
+
+正規表現をまとめてコンパイルし、HTMLの解析とマークダウン記法の除去を必要な場合だけ行うようにした
+clean_textが、変更前の実装（reference_clean_text）と同じ結果を返すことをテストします。
+"""
+
+import os
+import re
+import sys
+import random
+import unittest
+import unicodedata
+
+from bs4 import BeautifulSoup, Comment
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.utils.chunk_processor import clean_text
+
+
+def reference_clean_text(text: str) -> str:
+    """
+    変更前のclean_text（結果の比較に使用します）
+    """
+    # HTMLタグの除去（script, style, comments含む）
+    soup = BeautifulSoup(text, "html.parser")
+    for element in soup(["script", "style"]):
+        element.decompose()
+    for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
+        comment.extract()
+    text = soup.get_text(separator=" ")
+
+    # マークダウン記法の除去
+    markdown_patterns = [
+        r'!\[.*?\]\(.*?\)',  # 画像リンク
+        r'\[.*?\]\(.*?\)',   # ハイパーリンク
+        r'`{1,3}.*?`{1,3}',  # インラインコード
+        r'\*\*(.*?)\*\*',    # 太字
+        r'\*(.*?)\*',        # イタリック
+        r'~~(.*?)~~',        # 取り消し線
+        r'^>.*$',            # 引用
+        r'^#+\s.*$',         # 見出し
+        r'---',              # 水平線
+    ]
+    for pattern in markdown_patterns:
+        text = re.sub(pattern, '', text, flags=re.MULTILINE)
+
+    # URLとメールアドレスの除去
+    text = re.sub(r'https?://\S+|www\.\S+', '', text)
+    text = re.sub(r'\S+@\S+', '', text)
+
+    # 特殊文字や記号の除去（英数字、漢字、ひらがな、カタカナ以外を除去）
+    text = re.sub(r'[^\w\s一-鿿぀-ゟ゠-ヿ]', '', text)
+
+    # 全角英数字を半角に変換
+    text = unicodedata.normalize('NFKC', text)
+
+    # 余分な空白や改行の削除
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    return text
+
+
+# 代表的な入力と期待される出力
+GOLDEN_CASES = [
+    ("# 見出し\n本文です。", "本文です"),
+    ("段落1\n\n段落2", "段落1 段落2"),
+    ("**太字**と*斜体*と~~取消~~", "とと"),
+    ("[リンク](https://example.com)と![画像](a.png)", "と"),
+    ("`code` と ```block```", "と"),
+    ("> 引用\n通常の行", "通常の行"),
+    ("前---後", "前後"),
+    ("連絡先: user@example.com または https://example.com/path?q=1 www.example.jp", "連絡先 または"),
+    ("ＡＢＣ１２３　全角", "ABC123 全角"),
+    ("<p>段落<b>太字</b></p><script>alert(1)</script><!-- comment --><style>p{}</style>", "段落 太字"),
+    ("R&D と &amp; と &#12354;", "RD と と あ"),
+    ("a < b かつ c > d", "a b かつ c d"),
+    ("| 列1 | 列2 |\n|---|---|\n| 値1 | 値2 |", "列1 列2 値1 値2"),
+    ("#\n> 引用\n本文", "本文"),
+    ("", ""),
+    ("   \n\t  ", ""),
+]
+
+
+class TestCleanText(unittest.TestCase):
+    """clean_text関数のテスト"""
+
+    def test_golden_outputs(self):
+        """代表的な入力の出力が期待どおりで、変更前の実装と一致することのテスト"""
+        for text, expected in GOLDEN_CASES:
+            with self.subTest(text=text):
+                self.assertEqual(reference_clean_text(text), expected)
+                self.assertEqual(clean_text(text), expected)
+
+    def test_matches_reference_on_random_inputs(self):
+        """ランダムに組み合わせたマークダウン記法の入力で変更前の実装と一致することのテスト"""
+        tokens = ["#", "# ", "##", ">", "*", "**", "~~", "`", "```", "[", "]", "(", ")", "!", "-", "---",
+                  "\n", " ", "\t", "\r\n", "http://", "https://x.jp/a", "www.", "@", "a@b", "<", "<b>", "</b>",
+                  "<!--", "-->", "&", "&amp;", "テキスト", "漢字", "ｶﾀｶﾅ", "ＡＢＣ", "abc", "123", "。", "、",
+                  "e\u0301", "\u0301", "ｶ", "ﾞ", "\u00b4", "①", "ﬁ"]
+        generator = random.Random(0)
+        for _ in range(3000):
+            text = "".join(generator.choice(tokens) for _ in range(generator.randint(0, 30)))
+            with self.subTest(text=text):
+                try:
+                    expected = reference_clean_text(text)
+                except Exception as e:
+                    # HTMLとして解析できない入力は、変更前と同じ例外になること
+                    with self.assertRaises(type(e)):
+                        clean_text(text)
+                    continue
+                self.assertEqual(clean_text(text), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+conversion_pipeline.pyのテストモジュール
+
+文書変換パイプラインのLLMの同時実行数の制限、再試行、状態ファイルによる再開、ページごとの変換をテストします。
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.rag import conversion_pipeline
+from src.rag.conversion_pipeline import ConversionPipeline, ConversionState, llm_skip_reason
+from src.utils.chunk_processor import iter_pages
+
+
+class ThreadConversionPipeline(ConversionPipeline):
+    """解析段階をスレッドで実行するパイプライン"""
+
+    def _create_parse_executor(self):
+        return ThreadPoolExecutor(max_workers=self.parse_workers)
+
+
+class FakeLLM:
+    """同時に実行された要求の最大数を記録するLLM"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.running = 0
+        self.max_running = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, text, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            fail = self.failures > 0
+            if fail:
+                self.failures -= 1
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        if fail:
+            raise ConnectionError("ollama unavailable")
+        return f"# {text}"
+
+
+def parse(file_path, skip_extensions, structured_ratio):
+    with open(file_path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return text, conversion_pipeline.llm_skip_reason(file_path, text, skip_extensions, structured_ratio)
+
+
+def count_sections(file_path):
+    """改ページ文字で区切ったページの数を返す"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return len(f.read().split("\f"))
+
+
+def parse_sections(file_path, start, count, skip_extensions, structured_ratio):
+    with open(file_path, "r", encoding="utf-8") as f:
+        pages = f.read().split("\f")
+    return [(number + 1, pages[number], None) for number in range(start, min(start + count, len(pages)))]
+
+
+class TestConversionPipeline(unittest.TestCase):
+    """ConversionPipelineクラスのテスト"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        root = Path(self.temp_dir.name)
+        self.items = []
+        for i in range(6):
+            path = root / "source" / f"doc{i}.txt"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(f"text {i}", encoding="utf-8")
+            self.items.append({'path': path, 'output': root / "markdowns" / f"doc{i}.md", 'bytes': path.stat().st_size})
+        self.state_path = str(root / "state.jsonl")
+        for name, function in (("_parse_document", parse), ("_count_sections", count_sections),
+                               ("_parse_sections", parse_sections)):
+            patcher = mock.patch.object(conversion_pipeline, name, function)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _pipeline(self, llm, **kwargs):
+        pipeline = ThreadConversionPipeline(parse_workers=2, llm_concurrency=2, retry_delay=0, progress_interval=0,
+                                            state=ConversionState(self.state_path), use_cache=False, **kwargs)
+        pipeline._organize = llm
+        return pipeline
+
+    def test_converts_with_limited_concurrency(self):
+        """全てのファイルを変換し、LLMの同時実行数が上限を超えないことのテスト"""
+        llm = FakeLLM()
+        done = []
+        stats = self._pipeline(llm).run(self.items, "p", lambda item, output: done.append(output))
+
+        self.assertEqual(stats['files'], 6)
+        self.assertEqual(stats['failed'], 0)
+        self.assertLessEqual(llm.max_running, 2)
+        self.assertEqual(sorted(done), sorted(item['output'] for item in self.items))
+        self.assertEqual(self.items[0]['output'].read_text(encoding="utf-8"), "# text 0")
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_long_text_windows_share_concurrency_limit(self):
+        """長いテキストのウィンドウもパイプライン全体の同時実行数の上限で整形されることのテスト"""
+        text = "".join(f"これは{i}番目の文です。" for i in range(300))
+        self.items[0]['path'].write_text(text, encoding="utf-8")
+        llm = FakeLLM()
+        with mock.patch.dict(os.environ, {"LLM_WINDOWED": "true"}):
+            stats = self._pipeline(llm, num_ctx=1024, num_predict=256).run(self.items[:3], "p")
+
+        self.assertEqual(stats['files'], 3)
+        self.assertGreater(llm.calls, 3)
+        self.assertLessEqual(llm.max_running, 2)
+
+    def test_retries_failed_requests(self):
+        """LLMへの要求が失敗した場合に再試行することのテスト"""
+        llm = FakeLLM(failures=2)
+        stats = self._pipeline(llm, max_retries=2).run(self.items[:1], "p")
+
+        self.assertEqual(stats['files'], 1)
+        self.assertEqual(llm.calls, 3)
+
+    def test_resumes_from_state_file(self):
+        """失敗したファイルだけを次回の実行で変換し直すことのテスト"""
+        llm = FakeLLM(failures=1)
+        stats = self._pipeline(llm, max_retries=0).run(self.items, "p")
+        self.assertEqual(stats['failed'], 1)
+        self.assertTrue(os.path.exists(self.state_path))
+
+        llm = FakeLLM()
+        done = []
+        stats = self._pipeline(llm).run(self.items, "p", lambda item, output: done.append(output))
+        self.assertEqual(stats['resumed'], 5)
+        self.assertEqual(stats['files'], 1)
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual(len(done), 6)
+        self.assertFalse(os.path.exists(self.state_path))
+
+    def test_structured_files_skip_llm(self):
+        """構造化済みのファイルはLLMを呼び出さずにそのまま保存することのテスト"""
+        path = self.items[0]['path'].with_suffix(".csv")
+        path.write_text("a,b\n1,2", encoding="utf-8")
+        item = {'path': path, 'output': self.items[0]['output'], 'bytes': 7}
+        llm = FakeLLM()
+        stats = self._pipeline(llm).run([item, self.items[1]], "p")
+
+        self.assertEqual(stats['llm_skipped'], 1)
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual(item['output'].read_text(encoding="utf-8"), "a,b\n1,2")
+
+    def _pdf_item(self, pages):
+        path = self.items[0]['path'].with_suffix(".pdf")
+        path.write_text("\f".join(pages), encoding="utf-8")
+        return {'path': path, 'output': self.items[0]['output'], 'bytes': path.stat().st_size}
+
+    def test_streams_pages_with_markers(self):
+        """PDFをページごとに整形し、ページ番号とともに順番に保存することのテスト"""
+        item = self._pdf_item([f"page {i}" for i in range(1, 6)] + ["   "])
+        llm = FakeLLM()
+        stats = self._pipeline(llm, stream_pages=2).run([item], "p")
+
+        self.assertEqual(stats['files'], 1)
+        self.assertEqual(stats['pages'], 6)
+        # 空のページはLLMを呼び出さず、保存もしない
+        self.assertEqual(llm.calls, 5)
+        self.assertLessEqual(llm.max_running, 2)
+        with open(item['output'], "r", encoding="utf-8") as f:
+            pages = [(number, text.strip()) for number, text in iter_pages(f)]
+        self.assertEqual(pages, [(i, f"# page {i}") for i in range(1, 6)])
+        self.assertFalse(item['output'].with_name(item['output'].name + ".part").exists())
+
+    def test_streaming_retries_only_failed_batch(self):
+        """ページごとの変換で失敗した場合は、失敗した数ページ分だけ再試行することのテスト"""
+        item = self._pdf_item(["a", "b", "c"])
+        llm = FakeLLM(failures=1)
+        stats = self._pipeline(llm, stream_pages=1, max_retries=1).run([item], "p")
+
+        self.assertEqual(stats['files'], 1)
+        self.assertEqual(llm.calls, 4)
+
+    def test_streaming_disabled_converts_whole_file(self):
+        """ページごとの変換を無効にした場合はファイル全体を1回で整形することのテスト"""
+        item = self._pdf_item(["a", "b"])
+        llm = FakeLLM()
+        self._pipeline(llm, streaming=False).run([item], "p")
+
+        self.assertEqual(llm.calls, 1)
+        self.assertEqual(item['output'].read_text(encoding="utf-8"), "# a\fb")
+
+    def test_iter_pages(self):
+        """ページの区切りの行でMarkdownを分割することのテスト"""
+        lines = ["前書き\n", "<!-- page: 1 -->\n", "\n", "一\n", "<!-- page: 3 -->\n", "三\n"]
+        self.assertEqual(list(iter_pages(lines)), [(None, "前書き\n"), (1, "\n一\n"), (3, "三\n")])
+        self.assertEqual(list(iter_pages(["本文のみ\n"])), [(None, "本文のみ\n")])
+        self.assertEqual(list(iter_pages([])), [])
+
+    def test_llm_skip_reason(self):
+        """拡張子と構造化された行の割合による整形の省略の判定のテスト"""
+        table = "\n".join(["# 見出し"] + [f"| {i} | 値 |" for i in range(6)])
+        prose = "\n".join(f"これは{i}番目の段落です。" for i in range(6))
+        self.assertIsNotNone(llm_skip_reason("data.JSON", "{}", {".json"}, 0.6))
+        self.assertIsNotNone(llm_skip_reason("doc.pdf", table, {".json"}, 0.6))
+        self.assertIsNone(llm_skip_reason("doc.pdf", prose, {".json"}, 0.6))
+        self.assertIsNone(llm_skip_reason("doc.pdf", table, {".json"}, 0))
+
+    def test_changed_settings_are_not_resumed(self):
+        """変換時の設定が変わった場合は再利用しないことのテスト"""
+        state = ConversionState(self.state_path)
+        item = self.items[0]
+        item['output'].parent.mkdir(parents=True, exist_ok=True)
+        item['output'].write_text("old", encoding="utf-8")
+        stat = item['path'].stat()
+        state.mark_done(str(item['path'].resolve()), {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}, "p",
+                        str(item['output']))
+
+        reloaded = ConversionState(self.state_path)
+        self.assertEqual(reloaded.completed_output(str(item['path'].resolve()), item['path'], "p"), str(item['output']))
+        self.assertIsNone(reloaded.completed_output(str(item['path'].resolve()), item['path'], "q"))
+
+
+if __name__ == "__main__":
+    unittest.main()
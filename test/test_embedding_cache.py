@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+embedding_cache.pyのテストモジュール
+
+エンベディングキャッシュの保存、取得、サイズ上限による削除をテストします。
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.utils.embedding_cache import EmbeddingCache
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """EmbeddingCacheクラスのテスト"""
+
+    def setUp(self):
+        """テストの前準備"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = EmbeddingCache(path=os.path.join(self.temp_dir, "cache.sqlite3"))
+
+    def tearDown(self):
+        """テストの後処理"""
+        self.cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_put_and_get(self):
+        """保存したエンベディングを取得できることのテスト"""
+        self.cache.put_many("model-a", "v1", {"テキスト1": [0.5, 0.25], "テキスト2": [1.0, 0.0]})
+        found = self.cache.get_many("model-a", "v1", ["テキスト1", "テキスト2", "テキスト3"])
+        self.assertEqual({text: vector.tolist() for text, vector in found.items()},
+                         {"テキスト1": [0.5, 0.25], "テキスト2": [1.0, 0.0]})
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_key_includes_model_and_version(self):
+        """モデル名と前処理バージョンが異なる場合はヒットしないことのテスト"""
+        self.cache.put_many("model-a", "v1", {"テキスト": [0.5]})
+        self.assertEqual(self.cache.get_many("model-b", "v1", ["テキスト"]), {})
+        self.assertEqual(self.cache.get_many("model-a", "v2", ["テキスト"]), {})
+
+    def test_duplicate_texts(self):
+        """同じテキストが複数含まれていても取得できることのテスト"""
+        self.cache.put_many("model-a", "v1", {"テキスト": [0.5]})
+        found = self.cache.get_many("model-a", "v1", ["テキスト", "テキスト"])
+        self.assertEqual({text: vector.tolist() for text, vector in found.items()}, {"テキスト": [0.5]})
+
+    def test_evicts_least_recently_used(self):
+        """上限を超えた場合に古いエントリが削除されることのテスト"""
+        # 1エントリ4バイト（float32 1個）で、上限は3エントリ分
+        self.cache.max_bytes = 12
+        self.cache.EVICTION_CHECK_INTERVAL = 1
+        self.cache.put_many("model-a", "v1", {"a": [1.0]})
+        self.cache.put_many("model-a", "v1", {"b": [2.0]})
+        self.cache.put_many("model-a", "v1", {"c": [3.0]})
+        self.cache.get_many("model-a", "v1", ["a"])
+        self.cache.put_many("model-a", "v1", {"d": [4.0]})
+        found = self.cache.get_many("model-a", "v1", ["a", "b", "c", "d"])
+        self.assertIn("a", found)
+        self.assertNotIn("b", found)
+        self.assertIn("d", found)
+
+
+if __name__ == '__main__':
+    unittest.main()
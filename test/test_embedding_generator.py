@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+embedding_generator.pyのテストモジュール
+
+トークン数によるバッチ分割と、バッチ処理後に元の順序へ並べ直す処理をテストします。
+実際のモデルは読み込まず、モックを使用してテストします。
+"""
+
+import os
+import sys
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.utils.embedding_generator import EmbeddingGenerator, build_token_batches
+
+
+class TestBuildTokenBatches(unittest.TestCase):
+    """build_token_batches関数のテスト"""
+
+    def test_respects_token_budget(self):
+        """バッチ内の最大トークン数×件数が上限を超えないことのテスト"""
+        lengths = [10, 500, 20, 480, 30]
+        batches = build_token_batches(lengths, token_budget=1000)
+        for batch in batches:
+            self.assertLessEqual(max(lengths[i] for i in batch) * len(batch), 1000)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(len(lengths))))
+
+    def test_longest_first(self):
+        """最も長いテキストが最初のバッチに含まれることのテスト"""
+        batches = build_token_batches([10, 500, 20], token_budget=1000)
+        self.assertIn(1, batches[0])
+
+    def test_max_batch_size(self):
+        """最大件数を超えないことのテスト"""
+        batches = build_token_batches([5] * 10, token_budget=10000, max_batch_size=3)
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 3, 1])
+
+    def test_oversized_text(self):
+        """上限を超えるテキストも単独のバッチになることのテスト"""
+        self.assertEqual(build_token_batches([2000, 3], token_budget=1000), [[0], [1]])
+
+
+class TestGenerateEmbeddings(unittest.TestCase):
+    """EmbeddingGenerator.generate_embeddingsのテスト"""
+
+    def setUp(self):
+        """テストの前準備（モデルを読み込まずにインスタンスを作成する）"""
+        self.generator = EmbeddingGenerator.__new__(EmbeddingGenerator)
+        self.generator.logger = MagicMock()
+        self.generator.model_name = "test-model"
+        self.generator.embedding_cache = None
+        self.generator.token_budget = 8
+        self.generator.max_batch_size = 128
+        self.generator._encode_lock = threading.Lock()
+        self.generator.model = MagicMock()
+        self.generator.model.max_seq_length = 512
+        # トークン数は文字数とする
+        self.generator.model.tokenizer.side_effect = lambda texts, **kwargs: {"input_ids": [list(t) for t in texts]}
+        # エンベディングはテキストの長さを値とする
+        self.generator.model.encode.side_effect = lambda texts, **kwargs: np.array([[float(len(t))] for t in texts])
+
+    def test_restores_original_order(self):
+        """バッチ分割後も元の順序で返されることのテスト"""
+        texts = ["a", "query: bbbb", "query: cc", "a"]
+        embeddings = self.generator.generate_embeddings(texts)
+        expected = [[float(len("query: a"))], [float(len(texts[1]))], [float(len(texts[2]))], [float(len("query: a"))]]
+        self.assertEqual(embeddings.tolist(), expected)
+        self.assertGreater(self.generator.model.encode.call_count, 1)
+
+
+    def test_returns_float32_array(self):
+        """エンベディングがfloat32の2次元配列として返されることのテスト"""
+        embeddings = self.generator.generate_embeddings(["a", "bb", "a"])
+        self.assertIsInstance(embeddings, np.ndarray)
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertEqual(embeddings.shape, (3, 1))
+        self.assertTrue(embeddings.flags['C_CONTIGUOUS'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+embedding_migrator.pyのテストモジュール
+
+データベースの代わりにメモリ上のテスト用RAGデータベースを使用して、
+バージョン登録、埋め込みの追いつき、カットオーバーをテストします。
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.rag.embedding_migrator import EmbeddingMigrator
+
+
+class FakeRAGDatabase:
+    """チャンクとバージョンをメモリ上に保持するテスト用のRAGデータベース"""
+
+    def __init__(self, texts):
+        self.chunks = {doc_id: {'text': text} for doc_id, text in enumerate(texts, 1)}
+        self.versions = {}
+        self.indexed_columns = []
+        self.active_version_id = None
+
+    def add_chunk(self, text):
+        self.chunks[max(self.chunks) + 1] = {'text': text}
+
+    def create_version_table(self):
+        pass
+
+    def get_embedding_version(self, model_name):
+        for version in self.versions.values():
+            if version['model_name'] == model_name:
+                return dict(version)
+        return None
+
+    def register_embedding_version(self, model_name, dimension):
+        version_id = len(self.versions) + 1
+        self.versions[version_id] = {'version_id': version_id, 'model_name': model_name,
+                                     'column_name': f"embedding_v{version_id}", 'dimension': dimension,
+                                     'status': 'building'}
+        return dict(self.versions[version_id])
+
+    def fetch_unembedded_chunks(self, column_name, batch_size=64):
+        rows = [(doc_id, chunk['text']) for doc_id, chunk in sorted(self.chunks.items()) if column_name not in chunk]
+        return rows[:batch_size]
+
+    def count_unembedded_chunks(self, column_name):
+        return sum(1 for chunk in self.chunks.values() if column_name not in chunk)
+
+    def update_version_embeddings(self, column_name, rows):
+        for doc_id, embedding in rows:
+            self.chunks[doc_id][column_name] = embedding
+        return len(rows)
+
+    def create_search_index(self, column_name):
+        self.indexed_columns.append(column_name)
+        return True
+
+    def set_embedding_version_status(self, version_id, status):
+        self.versions[version_id]['status'] = status
+        return True
+
+    def activate_embedding_version(self, version_id):
+        if self.versions[version_id]['status'] != 'ready':
+            return False
+        self.active_version_id = version_id
+        self.versions[version_id]['status'] = 'active'
+        return True
+
+
+class TestEmbeddingMigrator(unittest.TestCase):
+    """EmbeddingMigratorクラスのテスト"""
+
+    def setUp(self):
+        self.rag_db = FakeRAGDatabase(["a", "bb", "ccc", "dddd", "eeeee"])
+        self.generator = MagicMock(dimension=8)
+        self.registry = MagicMock()
+        self.registry.acquire.return_value = self.generator
+
+        patchers = [
+            patch('src.rag.embedding_migrator.get_model_registry', return_value=self.registry),
+            patch('src.rag.embedding_migrator.generate_bulk_embeddings',
+                  side_effect=lambda generator, texts: [[float(len(text))] for text in texts]),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _migrator(self, **kwargs):
+        return EmbeddingMigrator(self.rag_db, "new-model", batch_size=2, throttle_seconds=0, **kwargs)
+
+    def test_migrate_with_cutover(self):
+        """全チャンクの埋め込み、インデックス作成、カットオーバーが順に行われることのテスト"""
+        migrator = self._migrator()
+        self.assertTrue(migrator.migrate(cutover=True))
+
+        self.assertEqual(self.rag_db.count_unembedded_chunks("embedding_v1"), 0)
+        self.assertEqual(self.rag_db.chunks[3]["embedding_v1"], [3.0])
+        self.assertEqual(self.rag_db.indexed_columns, ["embedding_v1"])
+        self.assertEqual(self.rag_db.active_version_id, 1)
+        self.assertEqual(migrator.version['status'], 'active')
+
+        # レジストリから取得した埋め込み生成器は全て解放される
+        self.assertEqual(self.registry.acquire.call_count, self.registry.release.call_count)
+
+    def test_fill_resumes_from_remaining_chunks(self):
+        """バッチ数を制限した場合、次回は未生成のチャンクから再開することのテスト"""
+        migrator = self._migrator()
+        self.assertEqual(migrator.fill(max_batches=1), 2)
+        self.assertFalse(migrator.finalize())
+        self.assertEqual(self.rag_db.versions[1]['status'], 'building')
+
+        resumed = self._migrator()
+        self.assertEqual(resumed.fill(), 3)
+        self.assertTrue(resumed.finalize())
+        self.assertEqual(self.rag_db.versions[1]['status'], 'ready')
+
+    def test_cutover_catches_up_new_chunks(self):
+        """準備後に追加されたチャンクを、カットオーバーの直前に埋め込むことのテスト"""
+        migrator = self._migrator()
+        self.assertTrue(migrator.migrate())
+        self.rag_db.add_chunk("ffffff")
+
+        self.assertTrue(self._migrator().cutover())
+        self.assertEqual(self.rag_db.chunks[6]["embedding_v1"], [6.0])
+        self.assertEqual(self.rag_db.active_version_id, 1)
+        # インデックスは最初の準備時にだけ作成される
+        self.assertEqual(self.rag_db.indexed_columns, ["embedding_v1"])
+
+    def test_stop_leaves_version_building(self):
+        """停止された場合はカットオーバーせず、バージョンがbuildingのまま残ることのテスト"""
+        migrator = self._migrator()
+        migrator._stop_event.set()
+        self.assertFalse(migrator.migrate(cutover=True))
+        self.assertEqual(self.rag_db.versions[1]['status'], 'building')
+        self.assertIsNone(self.rag_db.active_version_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
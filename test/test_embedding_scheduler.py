@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+embedding_scheduler.pyのテストモジュール
+
+要求のバッチ化、優先度による順序、エラーの伝播をテストします。
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.utils.embedding_scheduler import EmbeddingScheduler, PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+class FakeGenerator:
+    """テキストの長さをエンベディングとして返すテスト用の生成器"""
+
+    def __init__(self, block: threading.Event = None):
+        self.calls = []
+        self.use_cache = []
+        self.block = block
+        self.started = threading.Event()
+
+    def generate_embeddings(self, texts, use_cache=True):
+        self.started.set()
+        if self.block is not None:
+            self.block.wait(5)
+        self.calls.append(list(texts))
+        self.use_cache.append(use_cache)
+        if any(text == "error" for text in texts):
+            raise ValueError("encode failed")
+        return [[float(len(text))] for text in texts]
+
+
+class TestEmbeddingScheduler(unittest.TestCase):
+    """EmbeddingSchedulerクラスのテスト"""
+
+    def test_concurrent_requests_are_batched(self):
+        """待ち時間内に届いた要求が1つのバッチにまとめられることのテスト"""
+        generator = FakeGenerator()
+        scheduler = EmbeddingScheduler(generator, max_wait_ms=200, max_batch_size=3)
+        futures = [scheduler.submit([text]) for text in ["a", "bb", "ccc"]]
+        self.assertEqual([future.result(5).tolist() for future in futures], [[[1.0]], [[2.0]], [[3.0]]])
+        self.assertEqual(generator.calls, [["a", "bb", "ccc"]])
+        scheduler.close()
+
+    def test_interactive_requests_jump_ahead(self):
+        """対話的な要求が一括取り込みの要求より先に処理されることのテスト"""
+        block = threading.Event()
+        generator = FakeGenerator(block)
+        scheduler = EmbeddingScheduler(generator, max_wait_ms=0, max_batch_size=2)
+
+        # 最初のバッチの処理中に要求を積む
+        first = scheduler.submit(["first"], PRIORITY_BULK)
+        self.assertTrue(generator.started.wait(5))
+        bulk = scheduler.submit(["b1", "b2", "b3", "b4"], PRIORITY_BULK)
+        query = scheduler.submit(["q"], PRIORITY_INTERACTIVE)
+        block.set()
+
+        self.assertEqual(query.result(5).tolist(), [[1.0]])
+        self.assertEqual(bulk.result(5).tolist(), [[2.0], [2.0], [2.0], [2.0]])
+        first.result(5)
+        self.assertEqual(generator.calls[1], ["q"])
+        self.assertEqual(generator.calls[2:], [["b1", "b2"], ["b3", "b4"]])
+        scheduler.close()
+
+    def test_interactive_requests_skip_cache(self):
+        """対話的な要求はキャッシュを使用せず、一括取り込みの要求と同じバッチにまとめられないことのテスト"""
+        block = threading.Event()
+        generator = FakeGenerator(block)
+        scheduler = EmbeddingScheduler(generator, max_wait_ms=0, max_batch_size=8)
+
+        first = scheduler.submit(["first"], PRIORITY_BULK)
+        self.assertTrue(generator.started.wait(5))
+        query = scheduler.submit(["q"], PRIORITY_INTERACTIVE)
+        bulk = scheduler.submit(["b1", "b2"], PRIORITY_BULK)
+        block.set()
+
+        query.result(5)
+        bulk.result(5)
+        first.result(5)
+        self.assertEqual(generator.calls, [["first"], ["q"], ["b1", "b2"]])
+        self.assertEqual(generator.use_cache, [True, False, True])
+        scheduler.close()
+
+    def test_error_is_propagated(self):
+        """エンコードのエラーが要求元に伝わることのテスト"""
+        scheduler = EmbeddingScheduler(FakeGenerator(), max_wait_ms=0)
+        with self.assertRaises(ValueError):
+            scheduler.submit(["error"]).result(5)
+        self.assertEqual(scheduler.generate_embedding("abcd").tolist(), [4.0])
+        scheduler.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
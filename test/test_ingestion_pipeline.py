@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ingestion_pipeline.pyのテストモジュール
+
+取り込みパイプラインのバッチ化、ページ単位の受け渡し、コミットの区切り、エラー処理をテストします。
+"""
+
+import os
+import sys
+import unittest
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.rag.ingestion_pipeline import IngestionPipeline
+
+
+class FakeGenerator:
+    """テキストの長さを埋め込みベクトルとして返す生成器"""
+
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    def generate_embeddings(self, texts):
+        if self.fail:
+            raise RuntimeError("encode failed")
+        self.batches.append(len(texts))
+        return [[float(len(text))] for text in texts]
+
+
+class FakeVectorDatabase:
+    """挿入した行とコミットの時点を記録するデータベース"""
+
+    def __init__(self):
+        self.rows = []
+        self.committed_rows = 0
+        self.commits = []
+        self.rollbacks = 0
+
+    def insert_chunk_rows(self, chunks, commit=True):
+        ids = []
+        for chunk in chunks:
+            self.rows.append(chunk)
+            ids.append(len(self.rows))
+        return ids
+
+    def commit(self):
+        self.committed_rows = len(self.rows)
+        self.commits.append(len(self.rows))
+
+    def delete_chunk_rows(self, ids, commit=True):
+        for doc_id in ids:
+            self.rows[doc_id - 1] = None
+
+    def rollback(self):
+        del self.rows[self.committed_rows:]
+        self.rollbacks += 1
+
+
+def prepare(file_path):
+    """ファイル名の数字の数だけチャンクを作り、2個ずつ（1ページ分として）返す"""
+    if file_path == "broken":
+        raise IOError("cannot read")
+    broken_after = None
+    if file_path.startswith("broken-"):
+        # 途中のページで読み込みに失敗するファイル
+        file_path = file_path[len("broken-"):]
+        broken_after = 2
+    count = int(file_path)
+    for start in range(0, count, 2):
+        if broken_after is not None and start >= broken_after:
+            raise IOError("cannot read")
+        yield [{'chunk_text': f"{file_path}-{i}", 'filepath': file_path, 'chunk_index': i}
+               for i in range(start, min(start + 2, count))]
+
+
+class TestIngestionPipeline(unittest.TestCase):
+    """IngestionPipelineクラスのテスト"""
+
+    def test_ingests_all_chunks(self):
+        """全てのチャンクが埋め込みベクトル付きで格納されることのテスト"""
+        generator = FakeGenerator()
+        db = FakeVectorDatabase()
+        done = {}
+        pipeline = IngestionPipeline(prepare, generator, db, io_workers=3, embed_batch_size=4, commit_rows=5, queue_size=2)
+        stats = pipeline.run(["3", "0", "7", "2"], on_file_done=lambda path, ids: done.__setitem__(path, ids))
+
+        self.assertEqual(stats['files'], 4)
+        self.assertEqual(stats['chunks'], 12)
+        self.assertEqual(stats['failed'], 0)
+        self.assertTrue(all(size <= 4 for size in generator.batches))
+        self.assertEqual(sum(generator.batches), 12)
+        for row in db.rows:
+            self.assertEqual(row['embedding'], [float(len(row['chunk_text']))])
+        # ページごとに渡されたチャンクが1つの埋め込みバッチにまとめられる
+        self.assertEqual(generator.batches[0], 4)
+        self.assertEqual(sorted(done), ["0", "2", "3", "7"])
+        self.assertEqual([db.rows[i - 1]['chunk_index'] for i in done["7"]], list(range(7)))
+
+    def test_commits_at_file_boundaries(self):
+        """ファイルの途中ではコミットしないことのテスト"""
+        db = FakeVectorDatabase()
+        pipeline = IngestionPipeline(prepare, FakeGenerator(), db, io_workers=1, embed_batch_size=2, commit_rows=1)
+        pipeline.run(["3", "5", "2"])
+
+        self.assertEqual(db.commits[-1], 10)
+        boundaries = {0, 3, 8, 10}
+        self.assertTrue(set(db.commits) <= boundaries)
+
+    def test_failed_file_is_skipped(self):
+        """読み込みに失敗したファイルを飛ばして続行することのテスト"""
+        db = FakeVectorDatabase()
+        pipeline = IngestionPipeline(prepare, FakeGenerator(), db, io_workers=2)
+        stats = pipeline.run(["2", "broken", "1"])
+
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['files'], 2)
+        self.assertEqual(len(db.rows), 3)
+
+    def test_file_failing_midway_is_removed(self):
+        """途中のページで読み込みに失敗したファイルの行を取り消し、他のファイルは格納することのテスト"""
+        db = FakeVectorDatabase()
+        done = {}
+        pipeline = IngestionPipeline(prepare, FakeGenerator(), db, io_workers=1, embed_batch_size=1)
+        stats = pipeline.run(["3", "broken-5", "1"], on_file_done=lambda path, ids: done.__setitem__(path, ids))
+
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['files'], 2)
+        self.assertEqual(stats['chunks'], 4)
+        self.assertEqual(sorted(done), ["1", "3"])
+        self.assertEqual(sorted(row['chunk_text'] for row in db.rows if row is not None),
+                         ["1-0", "3-0", "3-1", "3-2"])
+
+    def test_embedding_error_rolls_back(self):
+        """埋め込みベクトルの生成に失敗した場合に例外を送出し、ロールバックすることのテスト"""
+        db = FakeVectorDatabase()
+        pipeline = IngestionPipeline(prepare, FakeGenerator(fail=True), db, io_workers=2)
+        with self.assertRaises(RuntimeError):
+            pipeline.run(["2", "3"])
+        self.assertEqual(db.rollbacks, 1)
+        self.assertEqual(db.rows, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
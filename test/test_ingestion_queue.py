@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ingestion_queue.pyのテストモジュール
+
+データベースの接続を置き換えて、ジョブの取得・期限切れジョブの回収と、
+ワーカーによる完了・失敗の記録をテストします。
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.rag.ingestion_queue import IngestionQueue, IngestionWorker
+
+
+class TestIngestionQueue(unittest.TestCase):
+    """IngestionQueueクラスのテスト"""
+
+    def setUp(self):
+        self.queue = IngestionQueue({'dbname': 'vector_db'}, max_attempts=3)
+        self.queue.connection = MagicMock()
+        self.cursor = self.queue.connection.cursor.return_value.__enter__.return_value
+
+    def test_claim_returns_leased_job(self):
+        """pendingまたはリース期限切れのジョブを、他のワーカーと重複せずに取得することのテスト"""
+        self.cursor.fetchone.return_value = (7, "docs/a.md", 2)
+
+        job = self.queue.claim("host:1", lease_seconds=60)
+
+        self.assertEqual(job, {'id': 7, 'relative_path': "docs/a.md", 'attempts': 2})
+        query, params = self.cursor.execute.call_args.args
+        self.assertIn("FOR UPDATE SKIP LOCKED", query)
+        self.assertIn("state = 'running' AND lease_expires_at < CURRENT_TIMESTAMP", query)
+        self.assertIn("attempts < max_attempts", query)
+        self.assertEqual(params, ("host:1", 60))
+        self.queue.connection.commit.assert_called_once()
+
+    def test_claim_without_jobs(self):
+        """取得できるジョブがない場合にNoneを返すことのテスト"""
+        self.cursor.fetchone.return_value = None
+        self.assertIsNone(self.queue.claim("host:1"))
+
+    def test_claim_rolls_back_on_error(self):
+        """ジョブの取得に失敗した場合にロールバックして例外を伝播することのテスト"""
+        self.cursor.execute.side_effect = RuntimeError("connection lost")
+        with self.assertRaises(RuntimeError):
+            self.queue.claim("host:1")
+        self.queue.connection.rollback.assert_called_once()
+        self.queue.connection.commit.assert_not_called()
+
+    def test_reap_expired_only_fails_exhausted_jobs(self):
+        """リース期限が切れ、試行回数も上限に達したジョブだけをfailedにすることのテスト"""
+        self.cursor.fetchall.return_value = [(1,), (4,)]
+
+        self.assertEqual(self.queue.reap_expired(), 2)
+
+        query = self.cursor.execute.call_args.args[0]
+        self.assertIn("SET state = 'failed'", query)
+        self.assertIn("lease_expires_at < CURRENT_TIMESTAMP AND attempts >= max_attempts", query)
+
+    def test_complete_requires_lease(self):
+        """リースを失ったジョブは完了にできないことのテスト"""
+        self.cursor.fetchall.return_value = []
+        self.assertFalse(self.queue.complete(7, "host:1"))
+        self.assertEqual(self.cursor.execute.call_args.args[1], (7, "host:1"))
+
+
+class FakeQueue:
+    """ジョブのリストを順に返すテスト用の取り込みキュー"""
+
+    def __init__(self, jobs, lease_held=True):
+        self.jobs = list(jobs)
+        self.lease_held = lease_held
+        self.completed = []
+        self.failed = []
+        self.reaped = 0
+
+    def claim(self, worker_id, lease_seconds=300):
+        return self.jobs.pop(0) if self.jobs else None
+
+    def reap_expired(self):
+        self.reaped += 1
+        return 0
+
+    def has_unfinished_jobs(self):
+        return bool(self.jobs)
+
+    def extend_lease(self, job_id, worker_id, lease_seconds=300):
+        return self.lease_held
+
+    def complete(self, job_id, worker_id):
+        if self.lease_held:
+            self.completed.append(job_id)
+        return self.lease_held
+
+    def fail(self, job_id, worker_id, error):
+        self.failed.append((job_id, error))
+
+
+class TestIngestionWorker(unittest.TestCase):
+    """IngestionWorkerクラスのテスト"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.temp_dir.name, "a.md"), "w", encoding="utf-8") as f:
+            f.write("# a")
+        self.vector_db = MagicMock(markdown_dir=self.temp_dir.name)
+        self.vector_db.update_file_chunks.return_value = [1, 2, 3]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _job(self, job_id, relative_path):
+        return {'id': job_id, 'relative_path': relative_path, 'attempts': 1}
+
+    def test_run_completes_and_fails_jobs(self):
+        """成功したジョブを完了にし、失敗したジョブを記録して、ジョブがなくなったら終了することのテスト"""
+        queue = FakeQueue([self._job(1, "a.md"), self._job(2, "missing.md")])
+        worker = IngestionWorker(queue, self.vector_db, worker_id="host:1")
+
+        self.assertEqual(worker.run(poll_interval=0, exit_when_empty=True), 2)
+
+        self.assertEqual(queue.completed, [1])
+        self.assertEqual([job_id for job_id, _ in queue.failed], [2])
+        self.assertIn("missing.md", queue.failed[0][1])
+        self.assertEqual(queue.reaped, 1)
+        self.vector_db.update_file_chunks.assert_called_once_with(os.path.join(self.temp_dir.name, "a.md"))
+
+    def test_run_does_not_complete_after_losing_lease(self):
+        """処理中にリースを失ったジョブは完了として記録されないことのテスト"""
+        queue = FakeQueue([self._job(1, "a.md")], lease_held=False)
+        worker = IngestionWorker(queue, self.vector_db, worker_id="host:1")
+
+        self.assertEqual(worker.run(poll_interval=0, exit_when_empty=True), 1)
+        self.assertEqual(queue.completed, [])
+        self.assertEqual(queue.failed, [])
+
+    def test_run_respects_max_jobs(self):
+        """max_jobsで指定した件数を処理したら終了することのテスト"""
+        queue = FakeQueue([self._job(1, "a.md"), self._job(2, "a.md")])
+        worker = IngestionWorker(queue, self.vector_db, worker_id="host:1")
+
+        self.assertEqual(worker.run(poll_interval=0, max_jobs=1), 1)
+        self.assertEqual(queue.completed, [1])
+        self.assertEqual(len(queue.jobs), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+llm_cache.pyのテストモジュール
+
+LLM出力キャッシュの保存と取得、キーの区別、節約した時間の集計をテストします。
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.utils.llm_cache import LLMOutputCache
+
+
+class TestLLMOutputCache(unittest.TestCase):
+    """LLMOutputCacheクラスのテスト"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "llm_cache.sqlite3")
+        self.cache = LLMOutputCache(path=self.path)
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_put_and_get(self):
+        """保存した出力を取得でき、ヒット数と節約した時間が集計されることのテスト"""
+        self.assertIsNone(self.cache.get("gemma3:12b", "temperature=0.0", "1", "入力"))
+        self.cache.put("gemma3:12b", "temperature=0.0", "1", "入力", "出力", 12.5)
+        self.assertEqual(self.cache.get("gemma3:12b", "temperature=0.0", "1", "入力"), "出力")
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'saved_seconds': 12.5})
+
+    def test_keys_are_distinct(self):
+        """モデル、設定、プロンプトのバージョンが異なる場合はヒットしないことのテスト"""
+        self.cache.put("gemma3:12b", "temperature=0.0", "1", "入力", "出力", 1.0)
+        self.assertIsNone(self.cache.get("gemma3:4b", "temperature=0.0", "1", "入力"))
+        self.assertIsNone(self.cache.get("gemma3:12b", "temperature=0.5", "1", "入力"))
+        self.assertIsNone(self.cache.get("gemma3:12b", "temperature=0.0", "2", "入力"))
+
+    def test_persists_across_instances(self):
+        """別のインスタンスから保存した出力を取得できることのテスト"""
+        self.cache.put("gemma3:12b", "temperature=0.0", "1", "入力", "出力", 1.0)
+        other = LLMOutputCache(path=self.path)
+        try:
+            self.assertEqual(other.get("gemma3:12b", "temperature=0.0", "1", "入力"), "出力")
+        finally:
+            other.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
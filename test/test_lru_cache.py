@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+lru_cache.pyのテストモジュール
+
+LRUキャッシュの格納、取得、削除順序をテストします。
+"""
+
+import os
+import sys
+import unittest
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.utils.lru_cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """LRUCacheクラスのテスト"""
+
+    def test_get_and_put(self):
+        """格納した値を取得できることのテスト"""
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_evicts_least_recently_used(self):
+        """最も長く参照されていないエントリが削除されることのテスト"""
+        cache = LRUCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_get_many(self):
+        """複数のキーをまとめて取得できることのテスト"""
+        cache = LRUCache(max_size=10)
+        cache.put_many({1: "x", 2: "y"})
+        self.assertEqual(cache.get_many([1, 2, 3]), {1: "x", 2: "y"})
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 1)
+
+    def test_disabled_cache(self):
+        """最大件数が0の場合はキャッシュしないことのテスト"""
+        cache = LRUCache(max_size=0)
+        cache.put("a", 1)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
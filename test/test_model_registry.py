@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+model_registry.pyのテストモジュール
+
+モデルの共有、参照カウント、解放、読み込み失敗時の後始末をテストします。
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.utils.model_registry import ModelRegistry
+
+
+class TestModelRegistry(unittest.TestCase):
+    """ModelRegistryクラスのテスト"""
+
+    def setUp(self):
+        # シングルトンを差し替え、テストごとに空のレジストリを使用する
+        self._saved_instance = ModelRegistry._instance
+        ModelRegistry._instance = None
+        self.registry = ModelRegistry()
+
+        patchers = [
+            patch.object(ModelRegistry, '_resolve_key',
+                         staticmethod(lambda model_name, device, backend: (model_name, device or "cpu", "sentence-transformers"))),
+            patch('src.utils.model_registry.EmbeddingGenerator'),
+            patch('src.utils.model_registry.release_embedding_scheduler'),
+        ]
+        _, self.generator_class, self.release_scheduler = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        self.generator_class.side_effect = lambda **kwargs: MagicMock(name=kwargs['model_name'])
+
+    def tearDown(self):
+        ModelRegistry._instance = self._saved_instance
+
+    def _ref_count(self, model_name):
+        for stats in self.registry.get_stats():
+            if stats['model_name'] == model_name:
+                return stats['ref_count']
+        return None
+
+    def test_acquire_shares_generator(self):
+        """同じモデルの取得で読み込みが1回だけ行われ、参照カウントが増えることのテスト"""
+        first = self.registry.acquire("model-a")
+        second = self.registry.acquire("model-a")
+        other = self.registry.acquire("model-b")
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+        self.assertEqual(self.generator_class.call_count, 2)
+        self.assertEqual(self._ref_count("model-a"), 2)
+
+    def test_release_keeps_model_loaded(self):
+        """参照カウントが0になってもモデルが保持され、再利用されることのテスト"""
+        generator = self.registry.acquire("model-a")
+        self.registry.release(generator)
+        self.registry.release(generator)
+        self.assertEqual(self._ref_count("model-a"), 0)
+
+        self.assertIs(self.registry.acquire("model-a"), generator)
+        self.assertEqual(self.generator_class.call_count, 1)
+
+        # 登録されていない生成器やNoneの解放は無視される
+        self.registry.release(MagicMock())
+        self.registry.release(None)
+        self.assertEqual(self._ref_count("model-a"), 1)
+
+    def test_unload_skips_referenced_models(self):
+        """参照中のモデルはforceを指定しない限り解放されないことのテスト"""
+        generator = self.registry.acquire("model-a")
+        self.assertEqual(self.registry.unload("model-a"), 0)
+        self.release_scheduler.assert_not_called()
+
+        self.registry.release(generator)
+        self.assertEqual(self.registry.unload("model-a"), 1)
+        self.release_scheduler.assert_called_once_with(generator)
+        self.assertEqual(self.registry.get_stats(), [])
+
+        # 解放後は再度読み込まれる
+        self.assertIsNot(self.registry.acquire("model-a"), generator)
+
+    def test_unload_all_releases_referenced_models(self):
+        """unload_allが参照中のモデルも解放することのテスト"""
+        self.registry.acquire("model-a")
+        self.registry.acquire("model-b")
+        self.assertEqual(self.registry.unload_all(), 2)
+        self.assertEqual(self.release_scheduler.call_count, 2)
+        self.assertEqual(self.registry.get_stats(), [])
+
+    def test_load_failure_removes_entry(self):
+        """読み込みに失敗した場合、例外が伝播しエントリが残らないことのテスト"""
+        self.generator_class.side_effect = RuntimeError("load failed")
+        with self.assertRaises(RuntimeError):
+            self.registry.acquire("model-a")
+        self.assertEqual(self.registry.get_stats(), [])
+
+        # 次の取得では改めて読み込みを行う
+        self.generator_class.side_effect = lambda **kwargs: MagicMock(name=kwargs['model_name'])
+        self.registry.acquire("model-a")
+        self.assertEqual(self._ref_count("model-a"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
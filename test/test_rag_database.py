@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+rag_database.pyのテストモジュール
+
+データベースに接続せず、execute_queryを置き換えて発行されるクエリをテストします。
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.rag.rag_database import RAGDatabase
+
+
+class TestRAGDatabaseDelta(unittest.TestCase):
+    """差分テーブルとトゥームストーンの扱いのテスト"""
+
+    def setUp(self):
+        self.db = RAGDatabase({'dbname': 'rag_db'}, dimension=4, vector_db_config={})
+        self.db.execute_query = MagicMock(return_value=[(2,)])
+
+    def _queries(self):
+        return [call.args[0].strip() for call in self.db.execute_query.call_args_list]
+
+    def test_reset_drops_delta_before_main_table(self):
+        """差分テーブルの作成後でも、差分テーブルとトゥームストーンをメインテーブルより先に削除することのテスト"""
+        self.db._delta_table_exists = True
+        self.db.create_table = MagicMock()
+
+        self.assertTrue(self.db.reset_table())
+
+        drops = [query for query in self._queries() if query.startswith("DROP TABLE")]
+        self.assertEqual(drops, [
+            "DROP TABLE IF EXISTS rag_documents_delta;",
+            "DROP TABLE IF EXISTS rag_tombstones;",
+            "DROP TABLE IF EXISTS rag_documents;",
+        ])
+        self.db.create_table.assert_called_once()
+        self.assertIsNone(self.db._delta_table_exists)
+
+    def test_has_delta_table_rechecks_after_ttl(self):
+        """差分テーブルの存在確認の結果が、キャッシュの期限切れ後に再確認されることのテスト"""
+        self.db.planner_stats_ttl = 30
+        self.db.execute_query.return_value = [(0,)]
+
+        with patch('src.rag.rag_database.time.monotonic', return_value=100.0):
+            self.assertFalse(self.db._has_delta_table())
+
+        # 他のプロセスが差分テーブルを作成した
+        self.db.execute_query.return_value = [(2,)]
+        with patch('src.rag.rag_database.time.monotonic', return_value=110.0):
+            self.assertFalse(self.db._has_delta_table())
+        with patch('src.rag.rag_database.time.monotonic', return_value=131.0):
+            self.assertTrue(self.db._has_delta_table())
+        self.assertEqual(self.db.execute_query.call_count, 2)
+
+    def test_merged_query_excludes_tombstones(self):
+        """差分テーブルがある場合、トゥームストーンを除外したメインテーブルと差分テーブルの結果をマージすることのテスト"""
+        self.db._delta_table_exists = True
+        self.db._delta_table_checked_at = float('inf')
+
+        query = self.db._build_merged_search_query("id", "embedding", "'[0,0,0,1]'", 0.5, 10)
+
+        self.assertIn("UNION ALL", query)
+        self.assertIn("FROM rag_documents_delta", query)
+        self.assertIn("NOT EXISTS (SELECT 1 FROM rag_tombstones t WHERE t.doc_id = rag_documents.id)", query)
+        self.assertIn("LIMIT 10", query)
+
+    def test_query_without_delta_table(self):
+        """差分テーブルがない場合、メインテーブルのみを検索することのテスト"""
+        self.db._delta_table_exists = False
+        self.db._delta_table_checked_at = float('inf')
+
+        query = self.db._build_merged_search_query("id", "embedding", "'[0,0,0,1]'", None, 5)
+
+        self.assertNotIn("UNION ALL", query)
+        self.assertNotIn("rag_tombstones", query)
+
+
+class TestRAGDatabasePlanner(unittest.TestCase):
+    """検索プランナーのテスト"""
+
+    def setUp(self):
+        self.db = RAGDatabase({'dbname': 'rag_db'}, dimension=4, vector_db_config={})
+        self.db.exact_scan_max_rows = 20000
+        self.db.default_recall_target = 0.9
+        self.stats = {'row_count': 50000, 'delta_rows': 3, 'lists': 100, 'has_original_filepath': True, 'loaded_at': 0.0}
+        self.db._get_planner_stats = MagicMock(side_effect=lambda column: self.stats)
+
+    def test_estimate_probes(self):
+        """再現率と行数に応じてprobesが増え、クラスタ数を超えないことのテスト"""
+        self.assertEqual(RAGDatabase._estimate_probes(100, 50000, 0.9), 10)
+        self.assertEqual(RAGDatabase._estimate_probes(100, 50000, 0.95), 20)
+        self.assertEqual(RAGDatabase._estimate_probes(100, 50000, 0.99), 40)
+        self.assertEqual(RAGDatabase._estimate_probes(16, 200000, 0.9), 16)
+        self.assertEqual(RAGDatabase._estimate_probes(1, 10, 0.99), 1)
+
+    def test_plan_exact_without_index(self):
+        """インデックスがない場合は全件検索になることのテスト"""
+        self.stats['lists'] = None
+        self.assertEqual(self.db.plan_search("embedding")['strategy'], "exact")
+        self.assertEqual(self.db.plan_search("embedding", strategy="ann")['strategy'], "exact")
+
+    def test_plan_exact_for_small_table(self):
+        """行数が閾値以下の場合は全件検索になることのテスト"""
+        self.stats['row_count'] = 20000
+        plan = self.db.plan_search("embedding")
+        self.assertEqual(plan['strategy'], "exact")
+        self.assertIsNone(plan['probes'])
+
+    def test_plan_ann_with_estimated_probes(self):
+        """行数が多い場合はprobesを見積もったインデックス検索になることのテスト"""
+        plan = self.db.plan_search("embedding")
+        self.assertEqual(plan['strategy'], "ann")
+        self.assertEqual(plan['probes'], 10)
+        self.assertEqual(plan['delta_rows'], 3)
+
+    def test_plan_exact_for_high_recall(self):
+        """必要なprobesがクラスタ数の半分以上になる場合は全件検索になることのテスト"""
+        self.stats['lists'] = 64
+        self.assertEqual(self.db.plan_search("embedding", recall_target=0.9)['strategy'], "ann")
+        plan = self.db.plan_search("embedding", recall_target=0.99)
+        self.assertEqual(plan['strategy'], "exact")
+
+    def test_plan_respects_explicit_strategy(self):
+        """呼び出し元が指定した検索方式とprobesが使われることのテスト"""
+        self.stats['row_count'] = 10
+        plan = self.db.plan_search("embedding", strategy="ann", probes=7)
+        self.assertEqual((plan['strategy'], plan['probes']), ("ann", 7))
+        self.assertEqual(self.db.plan_search("embedding", strategy="exact")['strategy'], "exact")
+        with self.assertRaises(ValueError):
+            self.db.plan_search("embedding", strategy="fast")
+
+
+class TestRAGDatabasePayloadCache(unittest.TestCase):
+    """ペイロードキャッシュのキーのテスト"""
+
+    def setUp(self):
+        self.db = RAGDatabase({'dbname': 'rag_db'}, dimension=4, vector_db_config={})
+        self.db.execute_query = MagicMock(return_value=[(1234,)])
+
+    def _oid_queries(self):
+        return [call for call in self.db.execute_query.call_args_list if "to_regclass" in call.args[0]]
+
+    def test_table_oid_is_cached(self):
+        """テーブルのOIDを1回だけ問い合わせることのテスト"""
+        self.assertEqual(self.db._payload_cache_prefix(), ('rag_db', 1234))
+        self.assertEqual(self.db._payload_cache_prefix(), ('rag_db', 1234))
+        self.assertEqual(len(self._oid_queries()), 1)
+
+    def test_reset_refreshes_table_oid(self):
+        """テーブルを再作成した後はOIDを取得し直すことのテスト"""
+        self.db._payload_cache_prefix()
+        self.db.create_table = MagicMock()
+        self.db.reset_table()
+
+        self.db.execute_query.return_value = [(5678,)]
+        self.assertEqual(self.db._payload_cache_prefix(), ('rag_db', 5678))
+        self.assertEqual(len(self._oid_queries()), 2)
+
+
+class TestRAGDatabasePageNumber(unittest.TestCase):
+    """ページ番号の格納と取得のテスト"""
+
+    def setUp(self):
+        self.db = RAGDatabase({'dbname': 'rag_db'}, dimension=4, vector_db_config={})
+        self.db.execute_query = MagicMock(return_value=[])
+        self.db._delta_table_exists = False
+        self.db._delta_table_checked_at = float('inf')
+        self.db._embed_for_versions = MagicMock(side_effect=lambda texts, embeddings: {'embedding': list(embeddings)})
+        self.stats = {'row_count': 10, 'delta_rows': 0, 'lists': None, 'has_original_filepath': True,
+                      'has_page_number': True, 'loaded_at': 0.0}
+        self.db._get_planner_stats = MagicMock(side_effect=lambda column: self.stats)
+        # テスト間でキャッシュされたペイロードが共有されないよう、存在しないOIDを使用する
+        self.db._table_oid = id(self)
+
+    def test_build_insert_includes_page_number(self):
+        """挿入するカラムとパラメータの末尾にページ番号が含まれることのテスト"""
+        query, params = self.db._build_insert("rag_documents", [("text", [1.0], "a.md", "/a.md", None, 0, 5, 3)])
+
+        self.assertIn("source_id, page_number)", query)
+        self.assertEqual(query.count("%s"), 8)
+        self.assertEqual(params, [("text", [1.0], "a.md", "/a.md", None, 0, 5, 3)])
+
+    def test_hydrate_payloads_returns_page_number(self):
+        """ペイロードの末尾にページ番号が含まれることのテスト"""
+        self.db.execute_query.return_value = [(1, "text", "a.md", "/a.md", "/a.pdf", 0, 2)]
+
+        payloads = self.db.hydrate_payloads([1])
+
+        self.assertEqual(payloads, {1: ("text", "a.md", "/a.md", "/a.pdf", 0, 2)})
+        self.assertIn("chunk_index, page_number FROM", self.db.execute_query.call_args.args[0])
+
+    def test_hydrate_payloads_without_page_number_column(self):
+        """page_numberカラムがない古いテーブルではNULLを取得することのテスト"""
+        self.stats['has_page_number'] = False
+        self.db.execute_query.return_value = [(1, "text", "a.md", "/a.md", None, 0, None)]
+
+        payloads = self.db.hydrate_payloads([1])
+
+        self.assertEqual(payloads[1][-1], None)
+        query = self.db.execute_query.call_args.args[0]
+        self.assertIn("chunk_index, NULL FROM", query)
+        self.assertNotIn("page_number", query)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+source_index.pyのテストモジュール
+
+ソースファイル索引の検索、更新日時による作り直し、ビルドマニフェストへの保存をテストします。
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.rag.build_manifest import BuildManifest
+from src.rag.source_index import SourceIndex, persist_source_index
+
+
+class TestSourceIndex(unittest.TestCase):
+    """SourceIndexクラスのテスト"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = os.path.join(self.temp_dir.name, "source")
+        for relative_path in ["markdown/guide.md", "docs/guide.pdf", "docs/sub/report.docx", "top.txt"]:
+            self._touch(relative_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _touch(self, relative_path):
+        path = os.path.join(self.source_dir, *relative_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("x")
+
+    def _path(self, relative_path):
+        return os.path.join(self.source_dir, *relative_path.split("/"))
+
+    def test_lookups(self):
+        """相対パス、ファイル名、拡張子を除いた名前で検索できることのテスト"""
+        index = SourceIndex(self.source_dir, check_interval=0)
+        self.assertTrue(index.exists("markdown/guide.md"))
+        self.assertFalse(index.exists("markdown/missing.md"))
+        self.assertEqual(index.find_by_name("report.docx"), self._path("docs/sub/report.docx"))
+        self.assertEqual(index.find_by_stem("guide"), self._path("docs/guide.pdf"))
+        self.assertEqual(index.find_by_stem("guide", directory="markdown"), self._path("markdown/guide.md"))
+        self.assertEqual(index.find_by_stem("top", directory=""), self._path("top.txt"))
+        self.assertEqual(index.find_by_relative_stem("docs/guide", [".txt", ".pdf"]), self._path("docs/guide.pdf"))
+        self.assertIsNone(index.find_by_relative_stem("docs/guide", [".txt"]))
+        self.assertEqual(index.builds, 1)
+
+    def test_rebuilds_when_directory_changes(self):
+        """ファイルが追加された場合だけ作り直すことのテスト"""
+        index = SourceIndex(self.source_dir, check_interval=0)
+        self.assertIsNone(index.find_by_name("new.txt"))
+        self.assertIsNone(index.find_by_name("new.txt"))
+        self.assertEqual(index.builds, 1)
+
+        self._touch("docs/sub/new.txt")
+        os.utime(os.path.join(self.source_dir, "docs", "sub"), ns=(1, 1))
+        self.assertEqual(index.find_by_name("new.txt"), self._path("docs/sub/new.txt"))
+        self.assertEqual(index.builds, 2)
+
+    def test_persist_and_load(self):
+        """ビルドマニフェストに保存した索引を再利用できることのテスト"""
+        manifest_path = os.path.join(self.temp_dir.name, "manifest.json")
+        index = SourceIndex(self.source_dir, check_interval=0)
+        index.refresh()
+        manifest = BuildManifest(manifest_path)
+        persist_source_index(index, manifest)
+        manifest.save()
+
+        loaded = SourceIndex(self.source_dir, check_interval=0)
+        self.assertTrue(loaded.load(BuildManifest(manifest_path).source_indexes.get(loaded.source_dir)))
+        self.assertEqual(loaded.find_by_name("top.txt"), self._path("top.txt"))
+        self.assertEqual(loaded.builds, 0)
+
+        self._touch("added.txt")
+        os.utime(self.source_dir, ns=(1, 1))
+        stale = SourceIndex(self.source_dir, check_interval=0)
+        self.assertFalse(stale.load(BuildManifest(manifest_path).source_indexes.get(stale.source_dir)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+text_window.pyのテストモジュール
+
+長いテキストのウィンドウへの分割と、ウィンドウごとの出力の連結をテストします。
+"""
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.utils.text_window import estimate_tokens, split_windows, stitch_outputs
+from src.utils.chunk_processor import organize_text_with_llm, organize_windows
+
+
+class TestTextWindow(unittest.TestCase):
+    """テキストウィンドウのテスト"""
+
+    def setUp(self):
+        self.japanese = "".join(f"これは{i}番目の文です。" for i in range(200))
+        self.english = " ".join(f"This is sentence number {i} of the document." for i in range(300))
+
+    def test_estimate_tokens(self):
+        """日本語は1文字1トークン、ASCII文字は4文字1トークンとして推定することのテスト"""
+        self.assertEqual(estimate_tokens("日本語"), 3)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_tokens(""), 0)
+
+    def test_short_text_is_single_window(self):
+        """上限に収まるテキストは分割しないことのテスト"""
+        self.assertEqual(split_windows("短い文です。", 100, 10), ["短い文です。"])
+
+    def test_windows_fit_budget_and_overlap(self):
+        """ウィンドウが上限に収まり、隣り合うウィンドウが重なることのテスト"""
+        windows = split_windows(self.japanese, 100, 40)
+        self.assertGreater(len(windows), 1)
+        self.assertTrue(all(estimate_tokens(window) <= 100 for window in windows))
+        for previous, current in zip(windows, windows[1:]):
+            first_sentence = current[:current.index("。") + 1]
+            self.assertIn(first_sentence, previous[len(previous) // 2:])
+
+    def test_long_sentence_is_split(self):
+        """上限を超える1つの文は文字数で分割することのテスト"""
+        windows = split_windows("あ" * 250, 100)
+        self.assertEqual("".join(windows), "あ" * 250)
+        self.assertTrue(all(estimate_tokens(window) <= 100 for window in windows))
+
+    def test_stitch_removes_overlap(self):
+        """重なりを除いて元のテキストに戻ることのテスト"""
+        for text in (self.japanese, self.english):
+            windows = split_windows(text, 100, 40)
+            self.assertEqual(stitch_outputs(windows), text)
+
+    def test_stitch_without_overlap(self):
+        """重なりがない出力は改行を挟んで連結することのテスト"""
+        self.assertEqual(stitch_outputs(["前半の出力", "", "後半の出力"]), "前半の出力\n\n後半の出力")
+
+
+class TestOrganizeWindows(unittest.TestCase):
+    """organize_text_with_llmのウィンドウごとの整形のテスト"""
+
+    def test_windows_are_organized_in_caller_thread(self):
+        """ウィンドウを内部でスレッドを作成せずに順に整形し、元の順番で連結することのテスト"""
+        text = "".join(f"これは{i}番目の文です。" for i in range(300))
+        threads = []
+
+        def run(window):
+            threads.append(threading.get_ident())
+            return window
+
+        with mock.patch('src.utils.chunk_processor.Ollama'), \
+                mock.patch('src.utils.chunk_processor.LLMChain') as chain_class:
+            chain_class.return_value.run.side_effect = run
+            output = organize_text_with_llm(text, num_ctx=1024, num_predict=256, windowed=True)
+
+        windows = organize_windows(text, 1024, 256, True)
+        self.assertGreater(len(windows), 1)
+        self.assertEqual(threads, [threading.get_ident()] * len(windows))
+        self.assertEqual(output, stitch_outputs(windows))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+token_chunker.pyのテストモジュール
+
+トークン数の上限、文の区切り、重なり、長い文の分割をテストします。
+"""
+
+import os
+import sys
+import unittest
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.utils.token_chunker import TokenChunker
+
+
+class CharTokenizer:
+    """1文字を1トークンとする高速トークナイザーの代わり（特殊トークンは前後に1つずつ）"""
+
+    is_fast = True
+
+    def __init__(self, model_max_length=512):
+        self.model_max_length = model_max_length
+        self.calls = 0
+
+    def __call__(self, texts, add_special_tokens=True, return_offsets_mapping=False):
+        self.calls += 1
+        single = isinstance(texts, str)
+        batch = [texts] if single else texts
+        special = 2 if add_special_tokens else 0
+        input_ids = [[0] * (len(text) + special) for text in batch]
+        result = {"input_ids": input_ids[0] if single else input_ids}
+        if return_offsets_mapping:
+            offsets = [[(i, i + 1) for i in range(len(text))] for text in batch]
+            result["offset_mapping"] = offsets[0] if single else offsets
+        return result
+
+
+class TestTokenChunker(unittest.TestCase):
+    """TokenChunkerクラスのテスト"""
+
+    def test_chunks_fit_budget_and_end_at_sentences(self):
+        """チャンクが上限以下で、文の区切りで分かれることのテスト"""
+        sentences = [f"これは{i}番目の文です。" for i in range(40)]
+        text = "".join(sentences)
+        chunker = TokenChunker(CharTokenizer(), chunk_tokens=50, overlap_tokens=0)
+        chunks = chunker.split(text)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 50)
+            self.assertTrue(chunk.endswith("。"))
+        self.assertEqual("".join(chunks), text)
+
+    def test_fullwidth_period_is_boundary(self):
+        """全角ピリオド（．）でも分割されることのテスト"""
+        text = "あ" * 30 + "．" + "い" * 30 + "．"
+        chunker = TokenChunker(CharTokenizer(), chunk_tokens=40, overlap_tokens=0)
+        self.assertEqual(chunker.split(text), ["あ" * 30 + "．", "い" * 30 + "．"])
+
+    def test_overlap_repeats_last_sentences(self):
+        """次のチャンクの先頭に前のチャンクの末尾の文が含まれることのテスト"""
+        sentences = [f"文{i:02d}の内容。" for i in range(30)]
+        chunker = TokenChunker(CharTokenizer(), chunk_tokens=40, overlap_tokens=8)
+        chunks = chunker.split("".join(sentences))
+
+        for previous, current in zip(chunks, chunks[1:]):
+            last_sentence = previous.split("。")[-2] + "。"
+            self.assertTrue(current.startswith(last_sentence))
+
+    def test_long_sentence_is_split_by_tokens(self):
+        """上限を超える文がトークンの位置で分割されることのテスト"""
+        text = "長" * 125
+        chunker = TokenChunker(CharTokenizer(), chunk_tokens=50, overlap_tokens=0)
+        chunks = chunker.split(text)
+
+        self.assertEqual([len(chunk) for chunk in chunks], [50, 50, 25])
+        self.assertEqual("".join(chunks), text)
+
+    def test_budget_is_limited_by_model_max_length(self):
+        """上限がモデルの最大長から特殊トークンとプレフィックスの分を引いた値になることのテスト"""
+        chunker = TokenChunker(CharTokenizer(model_max_length=128), chunk_tokens=500, overlap_tokens=100)
+        # "query: "の7トークンと特殊トークン2つを差し引く
+        self.assertEqual(chunker.max_tokens, 119)
+        self.assertEqual(chunker.chunk_tokens, 119)
+        self.assertEqual(chunker.overlap_tokens, 59)
+        for chunk in chunker.split("あいうえお。" * 200):
+            self.assertLessEqual(len(chunk), 119)
+
+    def test_sentences_are_tokenized_in_one_batch(self):
+        """文のトークン数をまとめて1回で数えることのテスト"""
+        tokenizer = CharTokenizer()
+        chunker = TokenChunker(tokenizer, chunk_tokens=30, overlap_tokens=5)
+        calls = tokenizer.calls
+        chunker.split("短い文です。" * 1000)
+        # 文のトークン数と、完成したチャンクの確認の2回だけ呼び出す
+        self.assertEqual(tokenizer.calls - calls, 2)
+
+    def test_without_tokenizer_uses_estimate(self):
+        """トークナイザーがない場合に推定トークン数で分割することのテスト"""
+        chunker = TokenChunker(None, chunk_tokens=20, overlap_tokens=0)
+        chunks = chunker.split("日本語の文です。" * 10 + "x" * 100)
+        self.assertEqual("".join(chunks), "日本語の文です。" * 10 + "x" * 100)
+        self.assertTrue(all(chunk.strip() for chunk in chunks))
+        self.assertEqual(chunker.split(""), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
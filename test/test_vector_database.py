@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+vector_database.pyのテストモジュール
+
+データベースの接続を置き換えて、ファイルのチャンクの差分反映をテストします。
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+# 親ディレクトリをパスに追加して、srcモジュールをインポートできるようにする
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テスト対象のモジュールをインポート
+from src.rag.vector_database import VectorDatabase
+from src.utils.chunk_processor import chunk_hash
+
+
+class TestUpdateFileChunks(unittest.TestCase):
+    """VectorDatabase.update_file_chunksのテスト"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.markdown_dir = os.path.join(self.temp_dir.name, "markdowns")
+        os.makedirs(self.markdown_dir)
+        self.file_path = os.path.join(self.markdown_dir, "a.md")
+
+        self.db = VectorDatabase({'dbname': 'vector_db'}, markdown_dir=self.markdown_dir, chunker="character")
+        self.db.connection = MagicMock()
+        self.cursor = self.db.connection.cursor.return_value.__enter__.return_value
+        self.db.execute_query = MagicMock(return_value=[])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _chunks(self, texts, pages=None):
+        pages = pages or [None] * len(texts)
+        return [{'chunk_text': text, 'filename': "a.md", 'filepath': self.file_path, 'chunk_index': index,
+                 'page_number': page, 'original_filepath': None, 'chunk_hash': chunk_hash(text)}
+                for index, (text, page) in enumerate(zip(texts, pages))]
+
+    def _update(self, texts, existing, pages=None, reuse_embeddings=True, page_size=None):
+        """チャンクの分割と埋め込みの生成を置き換えてupdate_file_chunksを実行します"""
+        self.db.execute_query.return_value = existing
+        chunks = self._chunks(texts, pages)
+        page_size = page_size or max(1, len(chunks))
+        self.db._iter_markdown_chunks = MagicMock(
+            return_value=iter([chunks[i:i + page_size] for i in range(0, len(chunks), page_size)]))
+        self.db._init_embedding_generator = MagicMock()
+        self.cursor.fetchone.side_effect = [(doc_id,) for doc_id in range(100, 100 + len(texts))]
+        with patch('src.rag.vector_database.generate_bulk_embeddings',
+                   side_effect=lambda generator, texts: [[float(len(text))] for text in texts]) as embed, \
+                patch('src.rag.vector_database.execute_batch') as batch:
+            ids = self.db.update_file_chunks(self.file_path, reuse_embeddings=reuse_embeddings)
+        return ids, embed, batch
+
+    def _executed(self, prefix):
+        return [call.args for call in self.cursor.execute.call_args_list if call.args[0].strip().startswith(prefix)]
+
+    def _batched(self, batch, prefix):
+        return [call.args[2] for call in batch.call_args_list if call.args[1].strip().startswith(prefix)]
+
+    def test_unchanged_file_keeps_rows(self):
+        """内容が変わっていない場合、埋め込みの生成も行の変更も行わないことのテスト"""
+        existing = [(1, 0, chunk_hash("a"), "a", None), (2, 1, chunk_hash("b"), "b", None)]
+        ids, embed, batch = self._update(["a", "b"], existing)
+
+        self.assertEqual(ids, [1, 2])
+        embed.assert_not_called()
+        batch.assert_not_called()
+        self.assertEqual(self._executed("DELETE"), [])
+        self.assertEqual(self._executed("INSERT"), [])
+
+    def test_diff_keeps_moves_inserts_and_deletes(self):
+        """同じ内容のチャンクは位置だけ更新し、新しいチャンクだけ挿入し、なくなったチャンクを削除することのテスト"""
+        existing = [
+            (1, 0, chunk_hash("a"), "a", 1),
+            (2, 1, chunk_hash("b"), "b", 1),
+            (3, 2, chunk_hash("c"), "c", 2),
+        ]
+        # "b"が削除され、先頭に"x"が追加され、"c"のページが変わった
+        ids, embed, batch = self._update(["x", "a", "c"], existing, pages=[1, 1, 3])
+
+        self.assertEqual(ids, [100, 1, 3])
+        embed.assert_called_once()
+        self.assertEqual(embed.call_args.args[1], ["x"])
+        self.assertEqual(self._executed("DELETE")[0][1], ([2],))
+        inserts = self._executed("INSERT")
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(inserts[0][1][0], "x")
+        self.assertEqual(sorted(self._batched(batch, "UPDATE")[0]), [(1, 1, 1), (2, 3, 3)])
+        self.db.connection.commit.assert_called()
+
+    def test_duplicate_chunks_are_matched_once(self):
+        """同じ内容のチャンクが複数ある場合、格納済みの行を1つずつ対応させることのテスト"""
+        existing = [(1, 0, chunk_hash("a"), "a", None)]
+        ids, embed, _ = self._update(["a", "a"], existing)
+
+        self.assertEqual(ids, [1, 100])
+        self.assertEqual(embed.call_args.args[1], ["a"])
+        self.assertEqual(self._executed("DELETE"), [])
+
+    def test_missing_hashes_are_backfilled(self):
+        """ハッシュが未設定の古い行は本文から照合し、ハッシュを記録することのテスト"""
+        existing = [(1, 0, None, "a", None)]
+        ids, embed, batch = self._update(["a"], existing)
+
+        self.assertEqual(ids, [1])
+        embed.assert_not_called()
+        self.assertEqual(self._batched(batch, "UPDATE")[0], [(chunk_hash("a"), 1)])
+
+    def test_without_reuse_replaces_all_rows(self):
+        """reuse_embeddingsがFalseの場合、全てのチャンクの埋め込みを生成し直すことのテスト"""
+        existing = [(1, 0, chunk_hash("a"), "a", None), (2, 1, chunk_hash("b"), "b", None)]
+        ids, embed, _ = self._update(["a", "b"], existing, reuse_embeddings=False)
+
+        self.assertEqual(ids, [100, 101])
+        self.assertEqual(embed.call_args.args[1], ["a", "b"])
+        self.assertEqual(self._executed("DELETE")[0][1], ([1, 2],))
+
+    def test_new_chunks_are_embedded_in_batches(self):
+        """新しいチャンクをファイル全体ではなくバッチごとに埋め込んで挿入することのテスト"""
+        with patch.dict(os.environ, {'INGESTION_EMBED_BATCH_SIZE': '2'}):
+            ids, embed, _ = self._update(["a", "b", "c", "d", "e"], [(1, 2, chunk_hash("c"), "c", None)], page_size=1)
+
+        self.assertEqual(ids, [100, 101, 1, 102, 103])
+        self.assertEqual([call.args[1] for call in embed.call_args_list], [["a", "b"], ["d", "e"]])
+
+    def test_write_error_rolls_back(self):
+        """書き込みに失敗した場合、ロールバックして例外を伝播することのテスト"""
+        self.cursor.execute.side_effect = RuntimeError("write failed")
+        with self.assertRaises(RuntimeError):
+            self._update(["x"], [(1, 0, chunk_hash("a"), "a", None)])
+        self.db.connection.rollback.assert_called_once()
+        # 格納済みのチャンクを読み込んだ後のコミットだけが行われる
+        self.assertEqual(self.db.connection.commit.call_count, 1)
+
+    def test_iter_markdown_chunks_by_page(self):
+        """ページごとにチャンクを返し、chunk_indexがファイル全体の通し番号になることのテスト"""
+        with open(self.file_path, "w", encoding="utf-8") as f:
+            f.write("<!-- page: 1 -->\n一ページ目\n<!-- page: 2 -->\n\n<!-- page: 3 -->\n三ページ目\n")
+
+        groups = list(self.db._iter_markdown_chunks(self.file_path))
+
+        self.assertEqual([[chunk['page_number'] for chunk in chunks] for chunks in groups], [[1], [3]])
+        self.assertEqual([chunk['chunk_index'] for chunks in groups for chunk in chunks], [0, 1])
+        self.assertEqual(groups[1][0]['chunk_text'], "三ページ目")
+        self.assertEqual(self.db._split_markdown_file(self.file_path), [chunk for chunks in groups for chunk in chunks])
+
+    def test_read_error_keeps_stored_chunks(self):
+        """ファイルを読み込めない場合、例外を伝播し格納済みのチャンクを削除しないことのテスト"""
+        with open(self.file_path, "wb") as f:
+            f.write(b"\xff\xfe invalid utf-8")
+        self.db.execute_query.return_value = [(1, 0, "hash", "text", None)]
+
+        with self.assertRaises(UnicodeError):
+            self.db.update_file_chunks(self.file_path)
+
+        self.cursor.execute.assert_not_called()
+        self.db.connection.rollback.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()